@@ -137,8 +137,33 @@ def ensure_default_config():
         print(f"⚠️  Error config: {e}")
 
 
+def ensure_clientes_index():
+    # Índice de clientes en memoria y grupos de duplicados: la preparación
+    # corre una sola vez por proceso (preparar_directorio); después solo se
+    # recarga el índice si venció o se invalidó
+    try:
+        from database.cliente_index import ClienteIndex, preparar_directorio
+        preparar_directorio()
+        ClienteIndex.asegurar_cargado()
+    except Exception as e:
+        print(f"⚠️  Error índice clientes: {e}")
+
+
+def ensure_desgloses():
+    # Desglose de costos guardado para las cotizaciones anteriores a la columna
+    # (solo revisa filas con desglose NULL; una vez por proceso)
+    try:
+        from database.migrations import backfill_quote_desglose
+        if backfill_quote_desglose.pendiente():
+            backfill_quote_desglose.run_migration()
+    except Exception as e:
+        print(f"⚠️  Error desglose de cotizaciones: {e}")
+
+
 ensure_admin_user()
 ensure_default_config()
+ensure_clientes_index()
+ensure_desgloses()
 
 
 # ── MAIN ───────────────────────────────────────────────────────────────────
@@ -0,0 +1,386 @@
+# ─────────────────────────────────────────────────────────────────────────────
+# MÓDULO: cliente_duplicados.py
+# Detección de clientes duplicados (exactos y aproximados)
+# Compatible con PostgreSQL (producción) y SQLite (desarrollo local)
+# ─────────────────────────────────────────────────────────────────────────────
+"""
+Motor de detección de duplicados del directorio de clientes.
+
+Cómo funciona:
+  1. BLOQUEO: solo se comparan clientes que comparten al menos una clave
+     (teléfono normalizado, cédula normalizada, nombre fonético completo o
+     primera + última palabra fonética). Los bloques salen del índice en
+     memoria (ClienteIndex), así que no se recorre la tabla en cada cálculo.
+  2. COMPARACIÓN: dentro de cada bloque se evalúa cada par con comparar():
+     números iguales + nombre parecido, o nombre casi idéntico sin números
+     en conflicto. Así 'Jose Perez' y 'José Pérez R.' quedan agrupados.
+  3. AGRUPACIÓN: union-find sobre los pares duplicados (A≈B y B≈C → un grupo).
+  4. PERSISTENCIA: los grupos se guardan en 'client_duplicate_groups'. El panel
+     admin lee esa tabla; nunca recalcula al renderizar.
+
+Funciones:
+  - init_duplicados_table()        → Crea la tabla si no existe
+  - comparar(a, b)                 → (motivo, puntaje) si a y b son duplicados
+  - recalcular_duplicados()        → Recalcula todos los grupos (arranque / botón admin)
+  - actualizar_duplicados(ids)     → Recalcula solo el vecindario de los IDs dados
+  - get_grupos_duplicados()        → Grupos guardados, listos para mostrar
+"""
+
+from difflib import SequenceMatcher
+
+from database.db_manager import DBManager, valor_fila
+from database.cliente_manager import normalizar_numero, tokens_significativos
+
+# Umbrales de similitud de nombre (0..1) según la evidencia adicional.
+_UMBRAL_CON_CEDULA   = 0.50   # Misma cédula: basta un nombre algo parecido
+_UMBRAL_CON_TELEFONO = 0.70   # Mismo teléfono: puede ser un familiar, exigir más
+_UMBRAL_SOLO_NOMBRE  = 0.90   # Sin números en común: nombre casi idéntico
+
+# Bloques más grandes se ignoran (nombres muy comunes, teléfonos de oficina)
+_MAX_BLOQUE = 500
+
+# Cédulas/teléfonos más cortos no se consideran claves fiables
+_MIN_DIGITOS = 5
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BLOQUE 1: INICIALIZACIÓN DE TABLA
+# ─────────────────────────────────────────────────────────────────────────────
+
+def init_duplicados_table():
+    """
+    Crea la tabla 'client_duplicate_groups' si no existe.
+    Una fila por cliente que pertenece a algún grupo; grupo_id es el menor
+    ID de cliente del grupo.
+    """
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS client_duplicate_groups (
+                cliente_id     INTEGER PRIMARY KEY,
+                grupo_id       INTEGER NOT NULL,
+                motivo         TEXT,
+                puntaje        REAL DEFAULT 0,
+                actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_client_dup_grupo ON client_duplicate_groups (grupo_id)"
+        )
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"❌ Error creando tabla client_duplicate_groups: {e}")
+        if conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return False
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BLOQUE 2: COMPARACIÓN DE PARES
+# ─────────────────────────────────────────────────────────────────────────────
+
+def similitud_nombres(nombre_a: str, nombre_b: str) -> float:
+    """
+    Similitud 0..1 entre dos nombres, sin acentos ni iniciales sueltas.
+    Toma el mayor entre:
+      - parecido de caracteres (SequenceMatcher), que tolera errores de tipeo;
+      - contención de palabras, para 'Jose Perez' vs 'Jose Perez Rodriguez'.
+    """
+    tokens_a = tokens_significativos(nombre_a)
+    tokens_b = tokens_significativos(nombre_b)
+    if not tokens_a or not tokens_b:
+        return 0.0
+    ratio = SequenceMatcher(None, ' '.join(tokens_a), ' '.join(tokens_b)).ratio()
+    menor = min(len(tokens_a), len(tokens_b))
+    if menor >= 2:
+        comunes = len(set(tokens_a) & set(tokens_b))
+        ratio = max(ratio, 0.95 * comunes / menor)
+    return ratio
+
+
+def _clave_numero(valor: str) -> str:
+    """normalizar_numero(), descartando valores demasiado cortos para ser fiables."""
+    v = normalizar_numero(valor or '')
+    return v if len(v) >= _MIN_DIGITOS else ''
+
+
+def comparar(a: dict, b: dict):
+    """
+    Decide si dos clientes son el mismo.
+    Retorna (motivo, puntaje) si lo son, o None.
+
+    Reglas:
+      - Cédula Y teléfono iguales              → duplicado seguro (1.0)
+      - Cédulas distintas                       → personas distintas
+      - Misma cédula y nombre parecido          → 'cédula'
+      - Mismo teléfono y nombre parecido        → 'teléfono'
+      - Nombre casi idéntico, sin teléfonos distintos → 'nombre'
+    """
+    ci_a,  ci_b  = _clave_numero(a.get('ci_rif')),   _clave_numero(b.get('ci_rif'))
+    tel_a, tel_b = _clave_numero(a.get('telefono')), _clave_numero(b.get('telefono'))
+    misma_ci  = bool(ci_a)  and ci_a  == ci_b
+    mismo_tel = bool(tel_a) and tel_a == tel_b
+
+    if misma_ci and mismo_tel:
+        return ('cédula y teléfono', 1.0)
+    if ci_a and ci_b and not misma_ci:
+        return None
+
+    sim = similitud_nombres(a.get('nombre', ''), b.get('nombre', ''))
+    if misma_ci and sim >= _UMBRAL_CON_CEDULA:
+        return ('cédula', round(sim, 3))
+    if mismo_tel and sim >= _UMBRAL_CON_TELEFONO:
+        return ('teléfono', round(sim, 3))
+    telefonos_distintos = tel_a and tel_b and not mismo_tel
+    if not telefonos_distintos and sim >= _UMBRAL_SOLO_NOMBRE:
+        return ('nombre', round(sim, 3))
+    return None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BLOQUE 3: AGRUPACIÓN (UNION-FIND)
+# ─────────────────────────────────────────────────────────────────────────────
+
+class _UnionFind:
+    """Conjuntos disjuntos con compresión de caminos."""
+
+    def __init__(self):
+        self.padre = {}
+
+    def buscar(self, x):
+        self.padre.setdefault(x, x)
+        raiz = x
+        while self.padre[raiz] != raiz:
+            raiz = self.padre[raiz]
+        while self.padre[x] != raiz:
+            self.padre[x], x = raiz, self.padre[x]
+        return raiz
+
+    def unir(self, a, b):
+        ra, rb = self.buscar(a), self.buscar(b)
+        if ra != rb:
+            # El menor ID queda como raíz → grupo_id estable
+            if rb < ra:
+                ra, rb = rb, ra
+            self.padre[rb] = ra
+
+
+def _agrupar(clientes: dict, bloques) -> dict:
+    """
+    Compara los pares de cada bloque y agrupa los duplicados.
+    Retorna {cliente_id: (grupo_id, motivo, puntaje)} solo para clientes
+    que forman parte de un grupo de 2 o más.
+    """
+    uf = _UnionFind()
+    mejor = {}            # cliente_id → (puntaje, motivo) más fuerte visto
+    comparados = set()
+    for bloque in bloques:
+        ids = sorted(i for i in bloque if i in clientes)
+        for pos, id_a in enumerate(ids):
+            for id_b in ids[pos + 1:]:
+                if (id_a, id_b) in comparados:
+                    continue
+                comparados.add((id_a, id_b))
+                resultado = comparar(clientes[id_a], clientes[id_b])
+                if not resultado:
+                    continue
+                motivo, puntaje = resultado
+                uf.unir(id_a, id_b)
+                for cid in (id_a, id_b):
+                    if puntaje > mejor.get(cid, (-1, ''))[0]:
+                        mejor[cid] = (puntaje, motivo)
+
+    return {
+        cid: (uf.buscar(cid), motivo, puntaje)
+        for cid, (puntaje, motivo) in mejor.items()
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BLOQUE 4: RECÁLCULO COMPLETO E INCREMENTAL
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _guardar(cursor, borrar_ids, asignaciones: dict):
+    """
+    Reemplaza las filas de la tabla: borra las de borrar_ids (None = todas)
+    e inserta las asignaciones {cliente_id: (grupo_id, motivo, puntaje)}.
+    """
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    if borrar_ids is None:
+        cursor.execute("DELETE FROM client_duplicate_groups")
+    else:
+        cursor.executemany(
+            f"DELETE FROM client_duplicate_groups WHERE cliente_id = {ph}",
+            [(cid,) for cid in borrar_ids]
+        )
+    if asignaciones:
+        cursor.executemany(
+            f"""
+            INSERT INTO client_duplicate_groups (cliente_id, grupo_id, motivo, puntaje)
+            VALUES ({ph}, {ph}, {ph}, {ph})
+            """,
+            [(cid, g, m, p) for cid, (g, m, p) in asignaciones.items()]
+        )
+
+
+def recalcular_duplicados() -> int:
+    """
+    Recalcula todos los grupos a partir del índice en memoria y reescribe la
+    tabla en una sola transacción. Pensado para el arranque del proceso, tras
+    migraciones masivas y para el botón "Recalcular" del panel admin.
+    Retorna el número de clientes en algún grupo (-1 si hubo error).
+    """
+    from database.cliente_index import ClienteIndex
+    init_duplicados_table()
+    clientes = ClienteIndex.todos()
+    asignaciones = _agrupar(clientes, ClienteIndex.bloques(_MAX_BLOQUE))
+
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        _guardar(cursor, None, asignaciones)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return len(asignaciones)
+    except Exception as e:
+        print(f"❌ Error guardando grupos de duplicados: {e}")
+        if conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return -1
+
+
+def actualizar_duplicados(cliente_ids) -> bool:
+    """
+    Recalcula solo los grupos afectados por cambios en cliente_ids (alta,
+    edición o eliminación). El vecindario recalculado incluye:
+      - los clientes dados y los que comparten alguna clave de bloqueo;
+      - todos los miembros de los grupos guardados a los que pertenecen,
+        para que al separarse un grupo no queden filas huérfanas.
+    """
+    from database.cliente_index import ClienteIndex
+    cliente_ids = [cid for cid in cliente_ids if cid is not None]
+    if not cliente_ids:
+        return True
+
+    ClienteIndex.asegurar_cargado()
+    locales = set(cliente_ids)
+    for cid in cliente_ids:
+        locales |= ClienteIndex.vecinos(cid, _MAX_BLOQUE)
+
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+
+        # Miembros de los grupos guardados que tocan el vecindario
+        marcadores = ', '.join([ph] * len(locales))
+        cursor.execute(
+            f"""
+            SELECT cliente_id FROM client_duplicate_groups
+            WHERE grupo_id IN (
+                SELECT grupo_id FROM client_duplicate_groups
+                WHERE cliente_id IN ({marcadores})
+            )
+            """,
+            tuple(locales)
+        )
+        locales |= {valor_fila(r, 'cliente_id', 0) for r in cursor.fetchall()}
+
+        # Solo los datos del vecindario (los IDs ya eliminados se omiten)
+        clientes = ClienteIndex.datos(locales)
+        # Cada cliente local contra sus vecinos que también son locales
+        bloques = [
+            ({cid} | ClienteIndex.vecinos(cid, _MAX_BLOQUE)) & set(clientes)
+            for cid in clientes
+        ]
+        asignaciones = _agrupar(clientes, bloques)
+
+        _guardar(cursor, locales, asignaciones)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"❌ Error actualizando grupos de duplicados: {e}")
+        if conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return False
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BLOQUE 5: CONSULTA PARA LOS PANELES
+# ─────────────────────────────────────────────────────────────────────────────
+
+def get_grupos_duplicados() -> list:
+    """
+    Lee los grupos precalculados de 'client_duplicate_groups'.
+
+    Retorna lista de grupos; cada grupo es una lista de dicts con:
+      id, nombre, telefono, direccion, ci_rif, motivo, puntaje
+    Ej: [ [cliente_A, cliente_B], [cliente_C, cliente_D, cliente_E] ]
+    """
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT c.id, c.nombre, c.telefono, c.direccion, c.ci_rif,
+                   g.grupo_id, g.motivo, g.puntaje
+            FROM client_duplicate_groups g
+            JOIN clientes c ON c.id = g.cliente_id
+            ORDER BY g.grupo_id, c.id
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+
+        grupos = {}
+        for row in rows:
+            grupos.setdefault(valor_fila(row, 'grupo_id', 5), []).append({
+                'id':        valor_fila(row, 'id', 0),
+                'nombre':    valor_fila(row, 'nombre', 1) or '',
+                'telefono':  valor_fila(row, 'telefono', 2) or '',
+                'direccion': valor_fila(row, 'direccion', 3) or '',
+                'ci_rif':    valor_fila(row, 'ci_rif', 4) or '',
+                'motivo':    valor_fila(row, 'motivo', 6) or '',
+                'puntaje':   valor_fila(row, 'puntaje', 7) or 0,
+            })
+        return [grupo for grupo in grupos.values() if len(grupo) > 1]
+
+    except Exception as e:
+        print(f"❌ Error leyendo grupos de duplicados: {e}")
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return []
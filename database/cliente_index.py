@@ -0,0 +1,469 @@
+# ─────────────────────────────────────────────────────────────────────────────
+# MÓDULO: cliente_index.py
+# Índice en memoria del directorio de clientes (autocompletado del analista)
+# Compatible con PostgreSQL (producción) y SQLite (desarrollo local)
+# ─────────────────────────────────────────────────────────────────────────────
+"""
+El campo "Nombre del Cliente" del panel de analista busca en cada rerun de
+Streamlit (cada tecla). En lugar de ir a la BD con ILIKE en cada búsqueda,
+se mantiene un índice único por proceso, compartido por todas las sesiones:
+
+  - Nombres normalizados (sin acentos, minúsculas) por ID de cliente.
+  - Trigramas del nombre normalizado → IDs (búsqueda por prefijo e infijo).
+  - Teléfono y cédula normalizados (normalizar_numero) → IDs.
+  - Claves de bloqueo del nombre (fonética completa y primera/última
+    palabra fonética) → IDs, usadas por el detector de duplicados.
+
+El índice se construye una vez desde la BD y luego se actualiza de forma
+incremental desde guardar_o_actualizar / actualizar_cliente / eliminar_cliente.
+La BD solo se vuelve a leer al refrescar (por antigüedad o manualmente),
+para recoger cambios hechos por otros procesos o por migraciones. Las altas
+y bajas que llegan mientras un refresco lee la BD se anotan y se vuelven a
+aplicar sobre el índice nuevo al publicarlo, así ninguna se pierde.
+
+Funciones públicas (métodos de clase de ClienteIndex):
+  - asegurar_cargado()      → Construye el índice si no existe o está vencido
+  - refrescar()             → Reconstruye el índice desde la BD
+  - invalidar()             → Fuerza la recarga en la próxima búsqueda
+  - buscar(query, limite)   → Búsqueda por nombre o número, con ranking
+  - buscar_ids(query)       → Todos los IDs que coinciden, en orden de ranking
+  - buscar_por_numero(tel, ci) → IDs por teléfono o cédula normalizados
+  - todos() / vecinos(id) / bloques() → Datos para cliente_duplicados.py
+  - datos(ids)              → Datos indexados de un conjunto de IDs
+  - registrar(cliente)      → Alta/modificación incremental
+  - quitar(cliente_id)      → Baja incremental
+
+preparar_directorio() corre al arrancar el proceso (app.py) las
+migraciones del directorio, la carga del índice y el cálculo completo de
+duplicados, una sola vez aunque el índice se invalide después.
+"""
+
+import threading
+import time
+from typing import Optional, List, Dict, Any
+
+from database.db_manager import DBManager, valor_fila
+from database.cliente_manager import normalizar, normalizar_numero, clave_fonetica
+
+
+# Longitud de los n-gramas. Coincide con el mínimo de 3 caracteres que exige
+# el autocompletado, así cualquier consulta válida tiene al menos un trigrama.
+_N = 3
+
+# Antigüedad máxima del índice antes de releerlo completo desde la BD.
+# Cubre altas hechas por otros procesos (réplicas, migraciones, scripts).
+_REFRESCO_SEGUNDOS = 600
+
+
+# Preparación de arranque ya completada en este proceso (ver preparar_directorio)
+_preparado = False
+_lock_preparacion = threading.Lock()
+
+
+def _ngramas(texto: str) -> set:
+    """Trigramas de un texto normalizado. Ej: 'jose' → {'jos', 'ose'}"""
+    if len(texto) < _N:
+        return {texto} if texto else set()
+    return {texto[i:i + _N] for i in range(len(texto) - _N + 1)}
+
+
+def _tiene_letras(texto: str) -> bool:
+    """True si el texto contiene al menos una letra (no es un número puro)."""
+    return any(c.isalpha() for c in texto)
+
+
+class ClienteIndex:
+    """
+    Índice de clientes compartido por todo el proceso.
+    Todos los accesos a las estructuras se hacen bajo _lock: Streamlit atiende
+    cada sesión en su propio hilo.
+    """
+
+    _lock = threading.RLock()
+    _lock_refresco = threading.Lock()       # un solo refresco a la vez
+    _cargado_en: Optional[float] = None
+    _cambios: Optional[list] = None         # registrar/quitar durante un refresco
+
+    _clientes: Dict[int, Dict[str, Any]] = {}   # id → datos del cliente
+    _nombres: Dict[int, str] = {}               # id → nombre normalizado
+    _ngramas: Dict[str, set] = {}               # trigrama → {ids}
+    _telefonos: Dict[str, set] = {}             # teléfono normalizado → {ids}
+    _cedulas: Dict[str, set] = {}               # cédula normalizada → {ids}
+    _bloques: Dict[str, set] = {}               # clave fonética del nombre → {ids}
+
+    # ── Carga desde BD ─────────────────────────────────────────────────────
+
+    @classmethod
+    def asegurar_cargado(cls) -> bool:
+        """
+        Construye el índice si aún no existe o si superó _REFRESCO_SEGUNDOS.
+        Es barato llamarlo en cada rerun: solo consulta la BD cuando toca.
+        Si varias sesiones lo encuentran vencido a la vez, refresca solo una.
+        """
+        if cls._vigente():
+            return True
+        with cls._lock_refresco:
+            if cls._vigente():
+                return True
+            return cls._refrescar()
+
+    @classmethod
+    def _vigente(cls) -> bool:
+        cargado_en = cls._cargado_en
+        return cargado_en is not None and time.monotonic() - cargado_en < _REFRESCO_SEGUNDOS
+
+    @classmethod
+    def refrescar(cls) -> bool:
+        """Relee la tabla 'clientes' completa y reemplaza el índice."""
+        with cls._lock_refresco:
+            return cls._refrescar()
+
+    @classmethod
+    def _refrescar(cls) -> bool:
+        """
+        Las estructuras nuevas se construyen fuera del lock y se publican de
+        una vez, así las búsquedas concurrentes nunca ven un índice a medias.
+        registrar()/quitar() que ocurran desde antes del SELECT hasta la
+        publicación quedan en _cambios y se reaplican al publicar.
+        Llamar con _lock_refresco tomado.
+        """
+        with cls._lock:
+            cls._cambios = []
+        conn = None
+        try:
+            conn = DBManager.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, nombre, telefono, direccion, ci_rif FROM clientes"
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+            DBManager.release_connection(conn)
+            conn = None
+        except Exception as e:
+            print(f"❌ Error cargando índice de clientes: {e}")
+            if conn:
+                try:
+                    DBManager.release_connection(conn)
+                except Exception:
+                    pass
+            with cls._lock:
+                cls._cambios = None
+            return False
+
+        clientes, nombres, ngramas, telefonos, cedulas, bloques = {}, {}, {}, {}, {}, {}
+        for row in rows:
+            cliente = {
+                'id':        valor_fila(row, 'id', 0),
+                'nombre':    valor_fila(row, 'nombre', 1) or '',
+                'telefono':  valor_fila(row, 'telefono', 2) or '',
+                'direccion': valor_fila(row, 'direccion', 3) or '',
+                'ci_rif':    valor_fila(row, 'ci_rif', 4) or '',
+            }
+            cls._indexar(cliente, clientes, nombres, ngramas, telefonos, cedulas, bloques)
+
+        with cls._lock:
+            cls._clientes = clientes
+            cls._nombres = nombres
+            cls._ngramas = ngramas
+            cls._telefonos = telefonos
+            cls._cedulas = cedulas
+            cls._bloques = bloques
+            # Escrituras confirmadas mientras se leía la BD (pueden o no estar
+            # en el SELECT; reaplicarlas es idempotente)
+            cambios, cls._cambios = cls._cambios or [], None
+            for accion, dato in cambios:
+                cls._desindexar(dato['id'] if accion == 'registrar' else dato)
+                if accion == 'registrar':
+                    cls._indexar_actual(dato)
+            cls._cargado_en = time.monotonic()
+        print(f"[ClienteIndex] Índice de clientes cargado ({len(clientes)} registros)")
+        return True
+
+    @classmethod
+    def esta_cargado(cls) -> bool:
+        """True si el índice ya se construyó al menos una vez y sigue vigente."""
+        return cls._cargado_en is not None
+
+    @classmethod
+    def invalidar(cls):
+        """Marca el índice como vencido; la próxima búsqueda lo recarga."""
+        with cls._lock:
+            cls._cargado_en = None
+
+    # ── Mantenimiento incremental ──────────────────────────────────────────
+
+    @staticmethod
+    def _claves_nombre(nombre: str) -> List[str]:
+        """
+        Claves de bloqueo del nombre: fonética completa y, si hay más de una
+        palabra, primera + última palabra fonética.
+        Ej: 'José Pérez R.' → ['fon:jose peres', 'pu:jose|peres']
+        """
+        fonetica = clave_fonetica(nombre)
+        if not fonetica:
+            return []
+        claves = [f'fon:{fonetica}']
+        palabras = fonetica.split(' ')
+        if len(palabras) > 1:
+            claves.append(f'pu:{palabras[0]}|{palabras[-1]}')
+        return claves
+
+    @staticmethod
+    def _indexar(cliente, clientes, nombres, ngramas, telefonos, cedulas, bloques):
+        """Agrega un cliente a las estructuras recibidas."""
+        cid = cliente['id']
+        nombre_norm = normalizar(cliente['nombre'])
+        clientes[cid] = cliente
+        nombres[cid] = nombre_norm
+        for g in _ngramas(nombre_norm):
+            ngramas.setdefault(g, set()).add(cid)
+        tel = normalizar_numero(cliente['telefono'])
+        if tel:
+            telefonos.setdefault(tel, set()).add(cid)
+        ci = normalizar_numero(cliente['ci_rif'])
+        if ci:
+            cedulas.setdefault(ci, set()).add(cid)
+        for clave in ClienteIndex._claves_nombre(cliente['nombre']):
+            bloques.setdefault(clave, set()).add(cid)
+
+    @classmethod
+    def _indexar_actual(cls, cliente: dict):
+        """Agrega un cliente al índice publicado. Llamar bajo _lock."""
+        cls._indexar(cliente, cls._clientes, cls._nombres, cls._ngramas,
+                     cls._telefonos, cls._cedulas, cls._bloques)
+
+    @classmethod
+    def _desindexar(cls, cliente_id: int):
+        """Retira un cliente de todas las estructuras. Llamar bajo _lock."""
+        cliente = cls._clientes.pop(cliente_id, None)
+        nombre_norm = cls._nombres.pop(cliente_id, None)
+        if cliente is None:
+            return
+        for g in _ngramas(nombre_norm or ''):
+            ids = cls._ngramas.get(g)
+            if ids is not None:
+                ids.discard(cliente_id)
+                if not ids:
+                    del cls._ngramas[g]
+        pares = [
+            (normalizar_numero(cliente['telefono']), cls._telefonos),
+            (normalizar_numero(cliente['ci_rif']), cls._cedulas),
+        ] + [(clave, cls._bloques) for clave in cls._claves_nombre(cliente['nombre'])]
+        for clave, mapa in pares:
+            ids = mapa.get(clave)
+            if ids is not None:
+                ids.discard(cliente_id)
+                if not ids:
+                    del mapa[clave]
+
+    @classmethod
+    def registrar(cls, cliente: dict):
+        """
+        Alta o modificación de un cliente tras escribirlo en la BD.
+        Si el índice aún no se ha cargado solo se anota para el refresco en
+        curso (si lo hay): la carga ya leerá el registro desde la BD o lo
+        reaplicará al publicar.
+        """
+        if not cliente or cliente.get('id') is None:
+            return
+        datos = {
+            'id':        cliente['id'],
+            'nombre':    (cliente.get('nombre') or '').strip(),
+            'telefono':  (cliente.get('telefono') or '').strip(),
+            'direccion': (cliente.get('direccion') or '').strip(),
+            'ci_rif':    (cliente.get('ci_rif') or '').strip(),
+        }
+        with cls._lock:
+            if cls._cambios is not None:
+                cls._cambios.append(('registrar', datos))
+            if cls._cargado_en is None:
+                return
+            cls._desindexar(datos['id'])
+            cls._indexar_actual(datos)
+
+    @classmethod
+    def quitar(cls, cliente_id: int):
+        """Baja de un cliente tras eliminarlo de la BD."""
+        with cls._lock:
+            if cls._cambios is not None:
+                cls._cambios.append(('quitar', cliente_id))
+            if cls._cargado_en is None:
+                return
+            cls._desindexar(cliente_id)
+
+    # ── Consultas ──────────────────────────────────────────────────────────
+
+    @classmethod
+    def buscar_por_numero(cls, telefono: str = '', ci_rif: str = '') -> List[int]:
+        """IDs de clientes con el mismo teléfono o la misma cédula normalizados."""
+        tel = normalizar_numero(telefono) if telefono else ''
+        ci  = normalizar_numero(ci_rif) if ci_rif else ''
+        with cls._lock:
+            ids = set()
+            if tel:
+                ids |= cls._telefonos.get(tel, set())
+            if ci:
+                ids |= cls._cedulas.get(ci, set())
+            return sorted(ids)
+
+    @classmethod
+    def todos(cls) -> Dict[int, Dict[str, Any]]:
+        """Copia de todos los clientes indexados (id → datos)."""
+        cls.asegurar_cargado()
+        with cls._lock:
+            return {cid: dict(c) for cid, c in cls._clientes.items()}
+
+    @classmethod
+    def datos(cls, ids) -> Dict[int, Dict[str, Any]]:
+        """Datos indexados de los IDs pedidos (los que no existen se omiten)."""
+        with cls._lock:
+            return {cid: dict(cls._clientes[cid]) for cid in ids if cid in cls._clientes}
+
+    @classmethod
+    def _grupos_de(cls, cliente: dict) -> List[set]:
+        """Conjuntos de IDs que comparten alguna clave de bloqueo con el cliente."""
+        grupos = []
+        tel = normalizar_numero(cliente['telefono'])
+        ci = normalizar_numero(cliente['ci_rif'])
+        if tel:
+            grupos.append(cls._telefonos.get(tel, set()))
+        if ci:
+            grupos.append(cls._cedulas.get(ci, set()))
+        for clave in cls._claves_nombre(cliente['nombre']):
+            grupos.append(cls._bloques.get(clave, set()))
+        return grupos
+
+    @classmethod
+    def vecinos(cls, cliente_id: int, max_bloque: int = 500) -> set:
+        """
+        IDs que comparten al menos una clave de bloqueo (teléfono, cédula o
+        nombre fonético) con el cliente. Ignora bloques mayores a max_bloque
+        (nombres muy comunes) para acotar el trabajo.
+        """
+        with cls._lock:
+            cliente = cls._clientes.get(cliente_id)
+            if cliente is None:
+                return set()
+            ids = set()
+            for grupo in cls._grupos_de(cliente):
+                if len(grupo) <= max_bloque:
+                    ids |= grupo
+            ids.discard(cliente_id)
+            return ids
+
+    @classmethod
+    def bloques(cls, max_bloque: int = 500) -> List[set]:
+        """
+        Todos los bloques con 2..max_bloque clientes: cada uno agrupa los IDs
+        que comparten teléfono, cédula o clave fonética de nombre.
+        """
+        cls.asegurar_cargado()
+        with cls._lock:
+            return [
+                set(ids)
+                for mapa in (cls._telefonos, cls._cedulas, cls._bloques)
+                for ids in mapa.values()
+                if 2 <= len(ids) <= max_bloque
+            ]
+
+    @classmethod
+    def buscar(cls, query: str, limite: int = 10) -> List[Dict[str, Any]]:
+        """
+        Busca clientes por nombre (prefijo o infijo, sin acentos) o por número.
+        Retorna hasta 'limite' dicts en el orden de buscar_ids().
+        """
+        ids = cls.buscar_ids(query)[:limite]
+        with cls._lock:
+            return [dict(cls._clientes[cid]) for cid in ids if cid in cls._clientes]
+
+    @classmethod
+    def buscar_ids(cls, query: str) -> List[int]:
+        """
+        IDs de todos los clientes que coinciden con la consulta, ordenados.
+
+        Ranking (menor es mejor):
+          0 → nombre completo idéntico
+          1 → el nombre empieza por la consulta
+          2 → alguna palabra del nombre empieza por la consulta
+          3 → la consulta aparece dentro del nombre
+        A igual rango se ordena alfabéticamente por nombre normalizado.
+        Si la consulta es un número (teléfono o cédula), se resuelve por las
+        claves normalizadas y esos clientes van primero.
+        """
+        query_norm = normalizar(query)
+        if len(query_norm) < _N:
+            return []
+        cls.asegurar_cargado()
+
+        with cls._lock:
+            numericos = []
+            digitos = normalizar_numero(query)
+            if len(digitos) >= 7 and not _tiene_letras(query_norm):
+                numericos = sorted(
+                    cls._telefonos.get(digitos, set()) | cls._cedulas.get(digitos, set())
+                )
+
+            # Intersección de las listas de trigramas, empezando por la más corta
+            listas = sorted(
+                (cls._ngramas.get(g, set()) for g in _ngramas(query_norm)),
+                key=len
+            )
+            candidatos = set(listas[0]) if listas else set()
+            for ids in listas[1:]:
+                if not candidatos:
+                    break
+                candidatos &= ids
+
+            puntuados = []
+            for cid in candidatos:
+                nombre_norm = cls._nombres[cid]
+                if nombre_norm == query_norm:
+                    rango = 0
+                elif nombre_norm.startswith(query_norm):
+                    rango = 1
+                elif (' ' + query_norm) in nombre_norm:
+                    rango = 2
+                elif query_norm in nombre_norm:
+                    rango = 3
+                else:
+                    continue  # Trigramas presentes pero no contiguos
+                puntuados.append((rango, nombre_norm, cid))
+
+            puntuados.sort()
+            return numericos + [cid for _, _, cid in puntuados if cid not in numericos]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ARRANQUE DEL PROCESO
+# ─────────────────────────────────────────────────────────────────────────────
+def preparar_directorio() -> bool:
+    """
+    Una vez por proceso: rellena telefono_norm/ci_rif_norm y quotes.cliente_id
+    pendientes, carga el índice y calcula todos los grupos de duplicados
+    (después se mantienen de forma incremental en cada escritura).
+
+    El control es propio y no depende de ClienteIndex.esta_cargado():
+    invalidar() solo hace que el índice se recargue. Si dos sesiones llegan
+    a la vez, la segunda espera y no repite nada. Retorna True si esta
+    llamada hizo la preparación.
+    """
+    global _preparado
+    if _preparado:
+        return False
+    with _lock_preparacion:
+        if _preparado:
+            return False
+        from database.migrations.backfill_clientes_norm import run_migration
+        from database.migrations.backfill_quotes_cliente_id import (
+            run_migration as vincular_cotizaciones
+        )
+        from database.cliente_duplicados import recalcular_duplicados
+        # Crea la tabla/columnas y rellena telefono_norm/ci_rif_norm pendientes
+        run_migration()
+        # quotes.cliente_id para el histórico (solo revisa cotizaciones nuevas)
+        vincular_cotizaciones()
+        ClienteIndex.asegurar_cargado()
+        recalcular_duplicados()
+        _preparado = True
+        return True
@@ -9,41 +9,60 @@ Funciones:
   - es_nombre_real(texto)        → True si el texto es un nombre (solo letras)
   - normalizar(texto)            → Elimina acentos para comparación
   - buscar_clientes(query)       → Búsqueda por nombre/apellido sin distinción de acentos
+                                   (índice en memoria, ver cliente_index.py)
   - guardar_o_actualizar(datos)  → Crea o actualiza un cliente
-  - get_todos_los_clientes()     → Lista completa para el panel admin
+  - get_todos_los_clientes()     → Lista completa (exportaciones, scripts)
+  - get_clientes_pagina(...)     → Página filtrada/ordenada para el panel admin
   - get_cliente_por_id(id)       → Un cliente por su ID
+  - get_clientes_por_ids(ids)    → Varios clientes en una consulta (listados)
   - actualizar_cliente(id, datos)→ Edita un cliente existente
   - eliminar_cliente(id)         → Elimina un cliente
-  - detectar_duplicados()        → Clientes con misma cédula Y mismo teléfono
+  - detectar_duplicados()        → Grupos de duplicados precalculados (cliente_duplicados.py)
 """
 
+import sqlite3
 import unicodedata
 import re
-from database.db_manager import DBManager
+
+import psycopg2
+
+from database.db_manager import DBManager, valor_fila
+
+# Violación del índice único de nombre_norm (alta concurrente del mismo cliente)
+_ERRORES_INTEGRIDAD = (sqlite3.IntegrityError, psycopg2.IntegrityError)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# BLOQUE 0: UTILIDAD INTERNA — Acceso a filas compatible PG + SQLite
+# BLOQUE 0: UTILIDAD INTERNA — Propagación al índice y a los duplicados
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _row(row, key: str, index: int):
+def _tras_guardar(cliente: dict):
     """
-    Accede a un campo de una fila de BD de forma compatible con:
-    - PostgreSQL (psycopg2 RealDictRow) → acceso por nombre: row[key]
-    - SQLite (sqlite3.Row / tuple)       → acceso por índice: row[index]
-
-    Uso: _row(row, 'nombre', 1)
+    Propaga un alta/edición al índice en memoria (ClienteIndex) y a los
+    grupos de duplicados precalculados (cliente_duplicados).
+    Nunca interrumpe la escritura: si el índice falla, se invalida y se
+    reconstruye desde la BD en la próxima búsqueda.
     """
+    from database.cliente_index import ClienteIndex
+    from database.cliente_duplicados import actualizar_duplicados
     try:
-        # Intenta acceso por nombre (PostgreSQL RealDictRow o sqlite3.Row con factory)
-        return row[key]
-    except (KeyError, TypeError, IndexError):
-        pass
+        ClienteIndex.registrar(cliente)
+    except Exception as e:
+        print(f"⚠️ Índice de clientes invalidado: {e}")
+        ClienteIndex.invalidar()
+    actualizar_duplicados([cliente.get('id')])
+
+
+def _tras_eliminar(cliente_id: int):
+    """Propaga una eliminación al índice en memoria y a los grupos de duplicados."""
+    from database.cliente_index import ClienteIndex
+    from database.cliente_duplicados import actualizar_duplicados
     try:
-        # Fallback: acceso por índice (tuple, list, sqlite3.Row sin factory)
-        return row[index]
-    except (IndexError, TypeError):
-        return None
+        ClienteIndex.quitar(cliente_id)
+    except Exception as e:
+        print(f"⚠️ Índice de clientes invalidado: {e}")
+        ClienteIndex.invalidar()
+    actualizar_duplicados([cliente_id])
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -93,6 +112,55 @@ def init_clientes_table():
                 "CREATE INDEX IF NOT EXISTS idx_clientes_nombre ON clientes (nombre)"
             )
 
+        # Migración: claves normalizadas de nombre (ver normalizar), teléfono y
+        # cédula (ver normalizar_numero). Se guardan al escribir para que la
+        # búsqueda anti-duplicado sea una igualdad indexada en lugar de
+        # recorrer toda la tabla en Python. El índice de nombre_norm lo crea
+        # crear_indice_nombre_norm() una vez rellenada la columna.
+        if is_postgres:
+            cursor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_name = 'clientes'
+                  AND column_name IN ('nombre_norm', 'telefono_norm', 'ci_rif_norm')
+            """)
+            existentes = {row['column_name'] for row in cursor.fetchall()}
+        else:
+            cursor.execute("PRAGMA table_info(clientes)")
+            existentes = {row[1] for row in cursor.fetchall()}
+        for col in ('nombre_norm', 'telefono_norm', 'ci_rif_norm'):
+            if col not in existentes:
+                cursor.execute(f"ALTER TABLE clientes ADD COLUMN {col} TEXT")
+                print(f"✅ Migración: Columna '{col}' agregada a tabla 'clientes'")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_clientes_telefono_norm ON clientes (telefono_norm)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_clientes_ci_rif_norm ON clientes (ci_rif_norm)"
+        )
+
+        # Migración: quotes.cliente_id → clientes.id. Se asigna al guardar la
+        # cotización (y por backfill_quotes_cliente_id para el histórico), de
+        # modo que las vistas leen el directorio con un JOIN en lugar de
+        # volver a resolver el cliente por nombre en cada lectura.
+        if is_postgres:
+            cursor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_name = 'quotes' AND column_name = 'cliente_id'
+            """)
+            tiene_fk = cursor.fetchone() is not None
+        else:
+            cursor.execute("PRAGMA table_info(quotes)")
+            tiene_fk = any(row[1] == 'cliente_id' for row in cursor.fetchall())
+        if not tiene_fk:
+            cursor.execute(
+                "ALTER TABLE quotes ADD COLUMN cliente_id INTEGER "
+                "REFERENCES clientes(id) ON DELETE SET NULL"
+            )
+            print("✅ Migración: Columna 'cliente_id' agregada a tabla 'quotes'")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_quotes_cliente_id ON quotes (cliente_id)"
+        )
+
         conn.commit()
         cursor.close()
         conn.close()
@@ -112,6 +180,52 @@ def init_clientes_table():
         return False
 
 
+def crear_indice_nombre_norm() -> bool:
+    """
+    Índice sobre clientes.nombre_norm. Se intenta ÚNICO (parcial, sin los
+    nombres vacíos): así dos procesos que dan de alta el mismo cliente a la
+    vez no pueden crear dos filas. Si el directorio ya tiene nombres
+    repetidos, queda un índice normal hasta que se fusionen los duplicados.
+
+    Llamar después de rellenar nombre_norm (backfill_clientes_norm).
+    Retorna True si el índice único existe.
+    """
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT nombre_norm FROM clientes
+            WHERE nombre_norm IS NOT NULL AND nombre_norm <> ''
+            GROUP BY nombre_norm HAVING COUNT(*) > 1
+            LIMIT 1
+        """)
+        repetido = cursor.fetchone()
+        if repetido:
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_clientes_nombre_norm ON clientes (nombre_norm)"
+            )
+            print(f"⚠️ clientes.nombre_norm tiene nombres repetidos "
+                  f"('{valor_fila(repetido, 'nombre_norm', 0)}', …): índice no único")
+        else:
+            cursor.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_clientes_nombre_norm_unico "
+                "ON clientes (nombre_norm) WHERE nombre_norm <> ''"
+            )
+            cursor.execute("DROP INDEX IF EXISTS idx_clientes_nombre_norm")
+        conn.commit()
+        cursor.close()
+        return not repetido
+    except Exception as e:
+        print(f"❌ Error creando índice de nombre_norm: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # BLOQUE 2: UTILIDADES DE TEXTO
 # ─────────────────────────────────────────────────────────────────────────────
@@ -186,6 +300,47 @@ def es_nombre_real(texto: str) -> bool:
     return len(letras) >= 2
 
 
+def tokens_significativos(texto: str) -> list:
+    """
+    Palabras del nombre normalizado, sin puntuación ni iniciales sueltas.
+    Ej: 'José Pérez R.' → ['jose', 'perez']
+    """
+    return [t for t in re.split(r'[^a-z0-9ñ]+', normalizar(texto)) if len(t) >= 2]
+
+
+# Reglas fonéticas del español, aplicadas en orden sobre el texto normalizado.
+# Igualan grafías que suenan igual: Peres/Pérez, Yusmary/Llusmary, Vega/Bega.
+_REGLAS_FONETICAS = [
+    (r'ch', 'x'),
+    (r'll', 'y'),
+    (r'qu', 'k'),
+    (r'g(?=[ei])', 'j'),
+    (r'gu(?=[ei])', 'g'),
+    (r'c(?=[ei])', 's'),
+    (r'c', 'k'),
+    (r'z', 's'),
+    (r'v', 'b'),
+    (r'w', 'b'),
+    (r'h', ''),
+    (r'y$', 'i'),
+    (r'(.)\1+', r'\1'),
+]
+
+
+def clave_fonetica(texto: str) -> str:
+    """
+    Clave fonética de un nombre (palabra por palabra).
+    Ej: 'José Pérez' → 'jose peres', 'Jose Peres' → 'jose peres'
+    """
+    claves = []
+    for token in tokens_significativos(texto):
+        for patron, reemplazo in _REGLAS_FONETICAS:
+            token = re.sub(patron, reemplazo, token)
+        if token:
+            claves.append(token)
+    return ' '.join(claves)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # BLOQUE 3: BÚSQUEDA DE CLIENTES (AUTOCOMPLETADO)
 # ─────────────────────────────────────────────────────────────────────────────
@@ -194,134 +349,23 @@ def buscar_clientes(query: str, limite: int = 10) -> list:
     """
     Busca clientes cuyo nombre contenga el texto 'query'.
     - Insensible a acentos: 'Maria' encuentra 'María'
-    - Busca en nombre completo (nombre y apellido)
+    - Busca en nombre completo (nombre y apellido), por prefijo o infijo
+    - Si 'query' es un teléfono o cédula, busca también por esas claves
     - Requiere al menos 3 caracteres para buscar.
     - Retorna lista de dicts con: id, nombre, telefono, direccion, ci_rif
 
-    IMPLEMENTACIÓN: Usa LIKE en SQL para buscar en TODA la tabla sin límite
-    de registros. La búsqueda por nombre normalizado (sin acentos) se hace
-    en Python sobre los resultados del LIKE, que ya filtra la mayoría.
-    Esto garantiza que ningún cliente quede excluido por estar más allá
-    del registro #500 en orden alfabético.
+    IMPLEMENTACIÓN: Consulta el índice en memoria del proceso (ClienteIndex),
+    que se construye una vez desde la BD y se mantiene al día con cada
+    guardado, edición o eliminación. No toca la BD en cada tecla.
+    Orden: nombre exacto, luego prefijo, luego palabra, luego infijo.
     """
     if not query or len(query.strip()) < 3:
         return []
-    query_norm = normalizar(query)
-    conn = None
+    from database.cliente_index import ClienteIndex
     try:
-        conn = DBManager.get_connection()
-        cursor = conn.cursor()
-        is_postgres = DBManager.USE_POSTGRES
-        # Usar LIKE en SQL para pre-filtrar eficientemente en toda la tabla
-        # El % en ambos lados permite encontrar el texto en cualquier posición del nombre
-        patron = f'%{query.strip()}%'
-        if is_postgres:
-            cursor.execute(
-                """
-                SELECT id, nombre, telefono, direccion, ci_rif
-                FROM clientes
-                WHERE nombre ILIKE %s
-                ORDER BY nombre ASC
-                LIMIT 100
-                """,
-                (patron,)
-            )
-        else:
-            cursor.execute(
-                """
-                SELECT id, nombre, telefono, direccion, ci_rif
-                FROM clientes
-                WHERE LOWER(nombre) LIKE LOWER(?)
-                ORDER BY nombre ASC
-                LIMIT 100
-                """,
-                (patron,)
-            )
-        rows = cursor.fetchall()
-        cursor.close()
-        DBManager.release_connection(conn)
-        conn = None
-        # Segunda pasada: filtrar por nombre normalizado (sin acentos)
-        # Esto captura casos como 'Maria' encontrando 'María'
-        resultados = []
-        for row in rows:
-            nombre_val = _row(row, 'nombre', 1) or ''
-            nombre_norm = normalizar(nombre_val)
-            if query_norm in nombre_norm:
-                resultados.append({
-                    'id':        _row(row, 'id', 0),
-                    'nombre':    nombre_val,
-                    'telefono':  _row(row, 'telefono', 2) or '',
-                    'direccion': _row(row, 'direccion', 3) or '',
-                    'ci_rif':    _row(row, 'ci_rif', 4) or '',
-                })
-            if len(resultados) >= limite:
-                break
-        # Si el LIKE no encontró nada (posible diferencia de acentos), hacer
-        # búsqueda de respaldo usando ILIKE con la versión sin acentos del query
-        # NOTA: conn ya fue liberada al pool arriba (conn = None), por lo que
-        # debemos abrir una nueva conexión para esta búsqueda de respaldo.
-        if not resultados:
-            conn2 = None
-            try:
-                # Construir patrón alternativo sin acentos para capturar 'Maria' → 'María'
-                patron_norm = f'%{query_norm}%'
-                conn2 = DBManager.get_connection()
-                cursor2 = conn2.cursor()
-                if DBManager.USE_POSTGRES:
-                    cursor2.execute(
-                        """
-                        SELECT id, nombre, telefono, direccion, ci_rif
-                        FROM clientes
-                        WHERE unaccent(LOWER(nombre)) ILIKE unaccent(LOWER(%s))
-                        ORDER BY nombre ASC
-                        LIMIT 100
-                        """,
-                        (patron_norm,)
-                    )
-                else:
-                    cursor2.execute(
-                        """
-                        SELECT id, nombre, telefono, direccion, ci_rif
-                        FROM clientes
-                        WHERE LOWER(nombre) LIKE LOWER(?)
-                        ORDER BY nombre ASC
-                        LIMIT 100
-                        """,
-                        (patron_norm,)
-                    )
-                all_rows = cursor2.fetchall()
-                cursor2.close()
-                DBManager.release_connection(conn2)
-                conn2 = None
-                for row in all_rows:
-                    nombre_val = _row(row, 'nombre', 1) or ''
-                    nombre_norm2 = normalizar(nombre_val)
-                    if query_norm in nombre_norm2:
-                        resultados.append({
-                            'id':        _row(row, 'id', 0),
-                            'nombre':    nombre_val,
-                            'telefono':  _row(row, 'telefono', 2) or '',
-                            'direccion': _row(row, 'direccion', 3) or '',
-                            'ci_rif':    _row(row, 'ci_rif', 4) or '',
-                        })
-                    if len(resultados) >= limite:
-                        break
-            except Exception as e2:
-                print(f"❌ Error en búsqueda de respaldo: {e2}")
-                if conn2:
-                    try:
-                        DBManager.release_connection(conn2)
-                    except Exception:
-                        pass
-        return resultados
+        return ClienteIndex.buscar(query, limite=limite)
     except Exception as e:
         print(f"❌ Error buscando clientes: {e}")
-        if conn:
-            try:
-                DBManager.release_connection(conn)
-            except Exception:
-                pass
         return []
 
 
@@ -334,6 +378,9 @@ def buscar_por_telefono_o_cedula(telefono: str = '', ci_rif: str = '') -> list:
     Busca clientes que tengan el mismo teléfono O la misma cédula/RIF.
     Usado para prevenir duplicados antes de crear un nuevo cliente.
     Retorna lista de dicts con: id, nombre, telefono, direccion, ci_rif, coincide_por
+
+    La comparación es por igualdad sobre las columnas indexadas telefono_norm
+    y ci_rif_norm, que guardan normalizar_numero() del valor original.
     """
     # Usar normalizar_numero para comparación robusta (ignora puntos, guiones, cero inicial)
     tel_norm = normalizar_numero(telefono) if telefono else ''
@@ -344,30 +391,23 @@ def buscar_por_telefono_o_cedula(telefono: str = '', ci_rif: str = '') -> list:
     try:
         conn = DBManager.get_connection()
         cursor = conn.cursor()
-        # Cargar TODA la tabla (sin LIMIT) para no perder clientes en posición 501+
-        # La comparación se hace con normalizar_numero para ignorar puntos/guiones/cero
-        cursor.execute(
-            "SELECT id, nombre, telefono, direccion, ci_rif FROM clientes"
-        )
+        sql, params = _sql_por_numero(tel_norm, ci_norm)
+        cursor.execute(sql + " ORDER BY id ASC", params)
         rows = cursor.fetchall()
         cursor.close()
         DBManager.release_connection(conn)
         conn = None
         resultados = []
         for row in rows:
-            tel_bd = normalizar_numero(_row(row, 'telefono', 2) or '')
-            ci_bd  = normalizar_numero(_row(row, 'ci_rif', 4)  or '')
-            coincide_tel = tel_norm and tel_bd and tel_norm == tel_bd
-            coincide_ci  = ci_norm  and ci_bd  and ci_norm  == ci_bd
-            if coincide_tel or coincide_ci:
-                resultados.append({
-                    'id':          _row(row, 'id', 0),
-                    'nombre':      _row(row, 'nombre', 1) or '',
-                    'telefono':    _row(row, 'telefono', 2) or '',
-                    'direccion':   _row(row, 'direccion', 3) or '',
-                    'ci_rif':      _row(row, 'ci_rif', 4) or '',
-                    'coincide_por': 'teléfono' if coincide_tel else 'cédula/RIF',
-                })
+            coincide_tel = tel_norm and valor_fila(row, 'telefono_norm', 5) == tel_norm
+            resultados.append({
+                'id':          valor_fila(row, 'id', 0),
+                'nombre':      valor_fila(row, 'nombre', 1) or '',
+                'telefono':    valor_fila(row, 'telefono', 2) or '',
+                'direccion':   valor_fila(row, 'direccion', 3) or '',
+                'ci_rif':      valor_fila(row, 'ci_rif', 4) or '',
+                'coincide_por': 'teléfono' if coincide_tel else 'cédula/RIF',
+            })
         return resultados
     except Exception as e:
         print(f"❌ Error en buscar_por_telefono_o_cedula: {e}")
@@ -379,17 +419,59 @@ def buscar_por_telefono_o_cedula(telefono: str = '', ci_rif: str = '') -> list:
         return []
 
 
+def _sql_por_numero(tel_norm: str, ci_norm: str) -> tuple:
+    """
+    Construye el SELECT por igualdad sobre telefono_norm / ci_rif_norm.
+    Solo incluye las condiciones cuyas claves no están vacías.
+    """
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    condiciones, params = [], []
+    if tel_norm:
+        condiciones.append(f"telefono_norm = {ph}")
+        params.append(tel_norm)
+    if ci_norm:
+        condiciones.append(f"ci_rif_norm = {ph}")
+        params.append(ci_norm)
+    sql = (
+        "SELECT id, nombre, telefono, direccion, ci_rif, telefono_norm, ci_rif_norm "
+        "FROM clientes WHERE " + " OR ".join(condiciones)
+    )
+    return sql, tuple(params)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # BLOQUE 4: GUARDAR O ACTUALIZAR CLIENTE
 # ─────────────────────────────────────────────────────────────────────────────
 
+def _buscar_por_nombre_norm(cursor, nombre_norm: str):
+    """Cliente más antiguo con ese nombre normalizado (dict) o None."""
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    cursor.execute(f"""
+        SELECT id, nombre, telefono, direccion, ci_rif
+        FROM clientes WHERE nombre_norm = {ph}
+        ORDER BY id ASC LIMIT 1
+    """, (nombre_norm,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return {
+        'id':        valor_fila(row, 'id', 0),
+        'nombre':    valor_fila(row, 'nombre', 1) or '',
+        'telefono':  valor_fila(row, 'telefono', 2) or '',
+        'direccion': valor_fila(row, 'direccion', 3) or '',
+        'ci_rif':    valor_fila(row, 'ci_rif', 4) or '',
+    }
+
+
 def guardar_o_actualizar(datos: dict) -> dict:
     """
     Guarda un cliente nuevo o actualiza uno existente.
 
     Lógica:
     1. Si el nombre no es real (tiene números, @, etc.) → no hace nada.
-    2. Busca si ya existe un cliente con el mismo nombre normalizado.
+    2. Busca en la BD si ya existe un cliente con el mismo nombre
+       normalizado (clientes.nombre_norm, indexado): la BD es la fuente de
+       verdad, el índice en memoria de cada proceso puede estar atrasado.
        - Si existe → actualiza teléfono, dirección y ci_rif (solo si los nuevos
          valores no están vacíos, para no borrar datos existentes).
        - Si no existe → crea un registro nuevo.
@@ -420,59 +502,81 @@ def guardar_o_actualizar(datos: dict) -> dict:
         cursor = conn.cursor()
         is_postgres = DBManager.USE_POSTGRES
 
-        cliente_existente = None
-
-        # Paso 1: buscar por nombre normalizado usando SQL directo (sin LIMIT)
-        # Esto garantiza que clientes en posición 501+ sean encontrados
-        if is_postgres:
-            cursor.execute(
-                "SELECT id, nombre, telefono, direccion, ci_rif FROM clientes WHERE nombre ILIKE %s ORDER BY id ASC",
-                (f'%{nombre.strip()}%',)
-            )
-        else:
-            cursor.execute(
-                "SELECT id, nombre, telefono, direccion, ci_rif FROM clientes WHERE LOWER(nombre) LIKE LOWER(?) ORDER BY id ASC",
-                (f'%{nombre.strip()}%',)
-            )
-        rows_nombre = cursor.fetchall()
-        for row in rows_nombre:
-            nombre_bd = _row(row, 'nombre', 1) or ''
-            if normalizar(nombre_bd) == nombre_norm:
-                cliente_existente = {
-                    'id':        _row(row, 'id', 0),
-                    'nombre':    nombre_bd,
-                    'telefono':  _row(row, 'telefono', 2) or '',
-                    'direccion': _row(row, 'direccion', 3) or '',
-                    'ci_rif':    _row(row, 'ci_rif', 4) or '',
-                }
-                break
+        # Paso 1: buscar por nombre normalizado ('Jose Perez' encuentra a
+        # 'José Pérez'), igualdad indexada sobre nombre_norm
+        cliente_existente = _buscar_por_nombre_norm(cursor, nombre_norm)
 
-        # Paso 2: si no encontró por nombre, buscar por teléfono o cédula (SQL directo, sin LIMIT)
-        # Usa normalizar_numero para ignorar puntos, guiones y cero inicial
+        # Paso 2: si no encontró por nombre, buscar por teléfono o cédula
+        # Igualdad indexada sobre telefono_norm / ci_rif_norm (normalizar_numero)
         if not cliente_existente and (telefono or ci_rif):
             tel_norm_local = normalizar_numero(telefono) if telefono else ''
             ci_norm_local  = normalizar_numero(ci_rif)   if ci_rif   else ''
-            # Cargar solo los registros que tengan teléfono o cédula no vacíos
-            cursor.execute(
-                "SELECT id, nombre, telefono, direccion, ci_rif FROM clientes WHERE (telefono IS NOT NULL AND telefono != '') OR (ci_rif IS NOT NULL AND ci_rif != '')"
-            )
-            rows_tel = cursor.fetchall()
-            for row in rows_tel:
-                tel_bd = normalizar_numero(_row(row, 'telefono', 2) or '')
-                ci_bd  = normalizar_numero(_row(row, 'ci_rif', 4)  or '')
-                coincide_tel = tel_norm_local and tel_bd and tel_norm_local == tel_bd
-                coincide_ci  = ci_norm_local  and ci_bd  and ci_norm_local  == ci_bd
-                if coincide_tel or coincide_ci:
-                    nombre_bd = _row(row, 'nombre', 1) or ''
+            if tel_norm_local or ci_norm_local:
+                sql, params = _sql_por_numero(tel_norm_local, ci_norm_local)
+                cursor.execute(sql + " ORDER BY id ASC LIMIT 1", params)
+                row = cursor.fetchone()
+                if row:
+                    coincide_tel = tel_norm_local and valor_fila(row, 'telefono_norm', 5) == tel_norm_local
+                    nombre_bd = valor_fila(row, 'nombre', 1) or ''
                     cliente_existente = {
-                        'id':        _row(row, 'id', 0),
+                        'id':        valor_fila(row, 'id', 0),
                         'nombre':    nombre_bd,
-                        'telefono':  _row(row, 'telefono', 2) or '',
-                        'direccion': _row(row, 'direccion', 3) or '',
-                        'ci_rif':    _row(row, 'ci_rif', 4) or '',
+                        'telefono':  valor_fila(row, 'telefono', 2) or '',
+                        'direccion': valor_fila(row, 'direccion', 3) or '',
+                        'ci_rif':    valor_fila(row, 'ci_rif', 4) or '',
                     }
                     print(f"⚠️ Duplicado prevenido: cliente encontrado por {'teléfono' if coincide_tel else 'cédula'} — '{nombre_bd}' se actualizará en lugar de crear nuevo registro.")
-                    break
+
+        if not cliente_existente:
+            # Crear nuevo cliente
+            try:
+                if is_postgres:
+                    cursor.execute(
+                        """
+                        INSERT INTO clientes (nombre, telefono, direccion, ci_rif,
+                                              nombre_norm, telefono_norm, ci_rif_norm)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        RETURNING id
+                        """,
+                        (nombre, telefono, direccion, ci_rif, nombre_norm,
+                         normalizar_numero(telefono), normalizar_numero(ci_rif))
+                    )
+                    nuevo_id_row = cursor.fetchone()
+                    nuevo_id = valor_fila(nuevo_id_row, 'id', 0)
+                else:
+                    cursor.execute(
+                        """
+                        INSERT INTO clientes (nombre, telefono, direccion, ci_rif,
+                                              nombre_norm, telefono_norm, ci_rif_norm)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (nombre, telefono, direccion, ci_rif, nombre_norm,
+                         normalizar_numero(telefono), normalizar_numero(ci_rif))
+                    )
+                    nuevo_id = cursor.lastrowid
+                conn.commit()
+            except _ERRORES_INTEGRIDAD:
+                # Otro proceso registró el mismo nombre entre la búsqueda y el
+                # INSERT (índice único de nombre_norm): se actualiza ese
+                conn.rollback()
+                cliente_existente = _buscar_por_nombre_norm(cursor, nombre_norm)
+                if not cliente_existente:
+                    raise
+            else:
+                cursor.close()
+                conn.close()
+                _tras_guardar({
+                    'id':        nuevo_id,
+                    'nombre':    nombre,
+                    'telefono':  telefono,
+                    'direccion': direccion,
+                    'ci_rif':    ci_rif,
+                })
+                return {
+                    'accion': 'creado',
+                    'cliente_id': nuevo_id,
+                    'mensaje': f'Cliente "{nombre}" registrado en la base de datos.'
+                }
 
         if cliente_existente:
             # Actualizar solo los campos que traen datos nuevos
@@ -485,63 +589,44 @@ def guardar_o_actualizar(datos: dict) -> dict:
                     """
                     UPDATE clientes
                     SET telefono = %s, direccion = %s, ci_rif = %s,
+                        telefono_norm = %s, ci_rif_norm = %s,
                         actualizado_en = NOW()
                     WHERE id = %s
                     """,
-                    (nuevo_tel, nuevo_dir, nuevo_ci, cliente_existente['id'])
+                    (nuevo_tel, nuevo_dir, nuevo_ci,
+                     normalizar_numero(nuevo_tel), normalizar_numero(nuevo_ci),
+                     cliente_existente['id'])
                 )
             else:
                 cursor.execute(
                     """
                     UPDATE clientes
                     SET telefono = ?, direccion = ?, ci_rif = ?,
+                        telefono_norm = ?, ci_rif_norm = ?,
                         actualizado_en = CURRENT_TIMESTAMP
                     WHERE id = ?
                     """,
-                    (nuevo_tel, nuevo_dir, nuevo_ci, cliente_existente['id'])
+                    (nuevo_tel, nuevo_dir, nuevo_ci,
+                     normalizar_numero(nuevo_tel), normalizar_numero(nuevo_ci),
+                     cliente_existente['id'])
                 )
 
             conn.commit()
             cursor.close()
             conn.close()
+            _tras_guardar({
+                'id':        cliente_existente['id'],
+                'nombre':    cliente_existente['nombre'],
+                'telefono':  nuevo_tel,
+                'direccion': nuevo_dir,
+                'ci_rif':    nuevo_ci,
+            })
             return {
                 'accion': 'actualizado',
                 'cliente_id': cliente_existente['id'],
                 'mensaje': f'Cliente "{nombre}" actualizado correctamente.'
             }
 
-        else:
-            # Crear nuevo cliente
-            if is_postgres:
-                cursor.execute(
-                    """
-                    INSERT INTO clientes (nombre, telefono, direccion, ci_rif)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id
-                    """,
-                    (nombre, telefono, direccion, ci_rif)
-                )
-                nuevo_id_row = cursor.fetchone()
-                nuevo_id = _row(nuevo_id_row, 'id', 0)
-            else:
-                cursor.execute(
-                    """
-                    INSERT INTO clientes (nombre, telefono, direccion, ci_rif)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    (nombre, telefono, direccion, ci_rif)
-                )
-                nuevo_id = cursor.lastrowid
-
-            conn.commit()
-            cursor.close()
-            conn.close()
-            return {
-                'accion': 'creado',
-                'cliente_id': nuevo_id,
-                'mensaje': f'Cliente "{nombre}" registrado en la base de datos.'
-            }
-
     except Exception as e:
         print(f"❌ Error guardando cliente: {e}")
         if conn:
@@ -583,13 +668,13 @@ def get_todos_los_clientes() -> list:
         conn.close()
         return [
             {
-                'id':             _row(row, 'id', 0),
-                'nombre':         _row(row, 'nombre', 1) or '',
-                'telefono':       _row(row, 'telefono', 2) or '',
-                'direccion':      _row(row, 'direccion', 3) or '',
-                'ci_rif':         _row(row, 'ci_rif', 4) or '',
-                'creado_en':      _row(row, 'creado_en', 5),
-                'actualizado_en': _row(row, 'actualizado_en', 6),
+                'id':             valor_fila(row, 'id', 0),
+                'nombre':         valor_fila(row, 'nombre', 1) or '',
+                'telefono':       valor_fila(row, 'telefono', 2) or '',
+                'direccion':      valor_fila(row, 'direccion', 3) or '',
+                'ci_rif':         valor_fila(row, 'ci_rif', 4) or '',
+                'creado_en':      valor_fila(row, 'creado_en', 5),
+                'actualizado_en': valor_fila(row, 'actualizado_en', 6),
             }
             for row in rows
         ]
@@ -603,6 +688,155 @@ def get_todos_los_clientes() -> list:
         return []
 
 
+# Columnas por las que el directorio del panel admin permite ordenar
+_ORDEN_PERMITIDO = ('nombre', 'telefono', 'ci_rif', 'direccion', 'actualizado_en', 'id')
+
+
+def _siguiente_prefijo(prefijo: str) -> str:
+    """
+    Menor cadena de dígitos mayor que todas las que empiezan por 'prefijo'
+    ('0414' → '0415', '0419' → '042'); '' si no hay (todo nueves).
+    """
+    p = prefijo.rstrip('9')
+    if not p:
+        return ''
+    return p[:-1] + str(int(p[-1]) + 1)
+
+
+def get_clientes_pagina(pagina: int = 1, por_pagina: int = 50, filtro: str = '',
+                        orden: str = 'nombre', descendente: bool = False) -> dict:
+    """
+    Una página del directorio de clientes para el panel admin.
+    Solo se leen y devuelven las filas de la página pedida.
+
+    Filtro:
+      - Vacío o < 3 caracteres → sin filtro.
+      - Solo dígitos/puntuación → prefijo sobre telefono_norm / ci_rif_norm
+        (rango sobre columnas indexadas; '0414' también encuentra '414...').
+      - Texto → nombre sin acentos, prefijo o infijo, vía ClienteIndex.
+
+    Retorna dict con:
+      'clientes': list — dicts con id, nombre, telefono, direccion, ci_rif,
+                         creado_en, actualizado_en
+      'total':    int  — total de clientes que cumplen el filtro
+      'pagina':   int  — página efectiva (ajustada al rango válido)
+      'paginas':  int  — número total de páginas
+    """
+    if orden not in _ORDEN_PERMITIDO:
+        orden = 'nombre'
+    direccion_orden = 'DESC' if descendente else 'ASC'
+    por_pagina = max(1, int(por_pagina))
+    filtro = (filtro or '').strip()
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    columnas = "id, nombre, telefono, direccion, ci_rif, creado_en, actualizado_en"
+
+    where, params, ids_filtrados = '', [], None
+    if len(filtro) >= 3:
+        digitos = re.sub(r'[^0-9]', '', normalizar_numero(filtro))
+        if digitos and not re.search(r'[A-Za-zÀ-ÿ]{2,}', filtro):
+            prefijos = {digitos, digitos.lstrip('0') or digitos}
+            condiciones = []
+            for pref in sorted(prefijos):
+                # Rango en lugar de LIKE 'pref%': usa el índice btree también
+                # en PostgreSQL con collation distinta de C
+                siguiente = _siguiente_prefijo(pref)
+                for col in ('telefono_norm', 'ci_rif_norm'):
+                    if siguiente:
+                        condiciones.append(f"({col} >= {ph} AND {col} < {ph})")
+                        params += [pref, siguiente]
+                    else:
+                        condiciones.append(f"{col} >= {ph}")
+                        params.append(pref)
+            where = "WHERE " + " OR ".join(condiciones)
+        else:
+            from database.cliente_index import ClienteIndex
+            ids_filtrados = ClienteIndex.buscar_ids(filtro)
+
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+
+        if ids_filtrados is not None:
+            total = len(ids_filtrados)
+        else:
+            cursor.execute(f"SELECT COUNT(*) AS total FROM clientes {where}", tuple(params))
+            total = valor_fila(cursor.fetchone(), 'total', 0) or 0
+
+        paginas = max(1, -(-total // por_pagina))
+        pagina = min(max(1, int(pagina)), paginas)
+        offset = (pagina - 1) * por_pagina
+
+        if ids_filtrados is not None:
+            # Orden y corte de página en memoria con los datos del índice;
+            # a la BD solo se piden las filas de la página.
+            from database.cliente_index import ClienteIndex
+            if orden == 'actualizado_en':
+                # Dato que no vive en el índice: ordenar en SQL por lotes de IDs
+                fechas = {}
+                for i in range(0, len(ids_filtrados), 1000):
+                    lote = ids_filtrados[i:i + 1000]
+                    cursor.execute(
+                        f"SELECT id, actualizado_en FROM clientes "
+                        f"WHERE id IN ({', '.join([ph] * len(lote))})",
+                        tuple(lote)
+                    )
+                    for r in cursor.fetchall():
+                        fechas[valor_fila(r, 'id', 0)] = str(valor_fila(r, 'actualizado_en', 1) or '')
+                clave = lambda cid: fechas.get(cid, '')
+            else:
+                datos = ClienteIndex.datos(ids_filtrados)
+                clave = lambda cid: (
+                    cid if orden == 'id'
+                    else normalizar(str(datos.get(cid, {}).get(orden) or ''))
+                )
+            ids_pagina = sorted(ids_filtrados, key=clave, reverse=descendente)[offset:offset + por_pagina]
+            rows = []
+            if ids_pagina:
+                cursor.execute(
+                    f"SELECT {columnas} FROM clientes "
+                    f"WHERE id IN ({', '.join([ph] * len(ids_pagina))})",
+                    tuple(ids_pagina)
+                )
+                por_id = {valor_fila(r, 'id', 0): r for r in cursor.fetchall()}
+                rows = [por_id[cid] for cid in ids_pagina if cid in por_id]
+        else:
+            cursor.execute(
+                f"SELECT {columnas} FROM clientes {where} "
+                f"ORDER BY {orden} {direccion_orden}, id ASC LIMIT {ph} OFFSET {ph}",
+                tuple(params) + (por_pagina, offset)
+            )
+            rows = cursor.fetchall()
+
+        cursor.close()
+        conn.close()
+        return {
+            'clientes': [
+                {
+                    'id':             valor_fila(row, 'id', 0),
+                    'nombre':         valor_fila(row, 'nombre', 1) or '',
+                    'telefono':       valor_fila(row, 'telefono', 2) or '',
+                    'direccion':      valor_fila(row, 'direccion', 3) or '',
+                    'ci_rif':         valor_fila(row, 'ci_rif', 4) or '',
+                    'creado_en':      valor_fila(row, 'creado_en', 5),
+                    'actualizado_en': valor_fila(row, 'actualizado_en', 6),
+                }
+                for row in rows
+            ],
+            'total':   total,
+            'pagina':  pagina,
+            'paginas': paginas,
+        }
+    except Exception as e:
+        print(f"❌ Error obteniendo página de clientes: {e}")
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return {'clientes': [], 'total': 0, 'pagina': 1, 'paginas': 1}
+
+
 def get_cliente_por_id(cliente_id: int) -> dict:
     """Retorna un cliente por su ID."""
     is_postgres = DBManager.USE_POSTGRES
@@ -625,11 +859,11 @@ def get_cliente_por_id(cliente_id: int) -> dict:
         conn.close()
         if row:
             return {
-                'id':        _row(row, 'id', 0),
-                'nombre':    _row(row, 'nombre', 1) or '',
-                'telefono':  _row(row, 'telefono', 2) or '',
-                'direccion': _row(row, 'direccion', 3) or '',
-                'ci_rif':    _row(row, 'ci_rif', 4) or '',
+                'id':        valor_fila(row, 'id', 0),
+                'nombre':    valor_fila(row, 'nombre', 1) or '',
+                'telefono':  valor_fila(row, 'telefono', 2) or '',
+                'direccion': valor_fila(row, 'direccion', 3) or '',
+                'ci_rif':    valor_fila(row, 'ci_rif', 4) or '',
             }
         return {}
     except Exception as e:
@@ -642,9 +876,56 @@ def get_cliente_por_id(cliente_id: int) -> dict:
         return {}
 
 
+def get_clientes_por_ids(ids) -> dict:
+    """
+    Carga en lote los clientes indicados: {id: cliente}.
+    Una sola consulta por cada 1000 IDs (listados de cotizaciones), en vez
+    de un get_cliente_por_id() por fila.
+    """
+    ids = sorted({int(i) for i in ids if i})
+    if not ids:
+        return {}
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    resultado = {}
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        for inicio in range(0, len(ids), 1000):
+            lote = ids[inicio:inicio + 1000]
+            cursor.execute(
+                "SELECT id, nombre, telefono, direccion, ci_rif FROM clientes "
+                f"WHERE id IN ({', '.join([ph] * len(lote))})",
+                tuple(lote)
+            )
+            for row in cursor.fetchall():
+                cid = valor_fila(row, 'id', 0)
+                resultado[cid] = {
+                    'id':        cid,
+                    'nombre':    valor_fila(row, 'nombre', 1) or '',
+                    'telefono':  valor_fila(row, 'telefono', 2) or '',
+                    'direccion': valor_fila(row, 'direccion', 3) or '',
+                    'ci_rif':    valor_fila(row, 'ci_rif', 4) or '',
+                }
+        cursor.close()
+        conn.close()
+        return resultado
+    except Exception as e:
+        print(f"❌ Error obteniendo clientes por lote: {e}")
+        if conn:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return {}
+
+
 def actualizar_cliente(cliente_id: int, datos: dict) -> bool:
     """Actualiza todos los campos de un cliente. Usado desde el panel admin."""
     is_postgres = DBManager.USE_POSTGRES
+    nombre   = (datos.get('nombre')   or '').strip()
+    telefono = (datos.get('telefono') or '').strip()
+    ci_rif   = (datos.get('ci_rif')   or '').strip()
     conn = None
     try:
         conn = DBManager.get_connection()
@@ -654,14 +935,18 @@ def actualizar_cliente(cliente_id: int, datos: dict) -> bool:
                 """
                 UPDATE clientes
                 SET nombre = %s, telefono = %s, direccion = %s, ci_rif = %s,
+                    nombre_norm = %s, telefono_norm = %s, ci_rif_norm = %s,
                     actualizado_en = NOW()
                 WHERE id = %s
                 """,
                 (
-                    (datos.get('nombre')    or '').strip(),
-                    (datos.get('telefono')  or '').strip(),
+                    nombre,
+                    telefono,
                     (datos.get('direccion') or '').strip(),
-                    (datos.get('ci_rif')    or '').strip(),
+                    ci_rif,
+                    normalizar(nombre),
+                    normalizar_numero(telefono),
+                    normalizar_numero(ci_rif),
                     cliente_id
                 )
             )
@@ -670,20 +955,25 @@ def actualizar_cliente(cliente_id: int, datos: dict) -> bool:
                 """
                 UPDATE clientes
                 SET nombre = ?, telefono = ?, direccion = ?, ci_rif = ?,
+                    nombre_norm = ?, telefono_norm = ?, ci_rif_norm = ?,
                     actualizado_en = CURRENT_TIMESTAMP
                 WHERE id = ?
                 """,
                 (
-                    (datos.get('nombre')    or '').strip(),
-                    (datos.get('telefono')  or '').strip(),
+                    nombre,
+                    telefono,
                     (datos.get('direccion') or '').strip(),
-                    (datos.get('ci_rif')    or '').strip(),
+                    ci_rif,
+                    normalizar(nombre),
+                    normalizar_numero(telefono),
+                    normalizar_numero(ci_rif),
                     cliente_id
                 )
             )
         conn.commit()
         cursor.close()
         conn.close()
+        _tras_guardar(dict(datos, id=cliente_id))
         return True
     except Exception as e:
         print(f"❌ Error actualizando cliente {cliente_id}: {e}")
@@ -706,13 +996,15 @@ def eliminar_cliente(cliente_id: int) -> bool:
     try:
         conn = DBManager.get_connection()
         cursor = conn.cursor()
-        if is_postgres:
-            cursor.execute("DELETE FROM clientes WHERE id = %s", (cliente_id,))
-        else:
-            cursor.execute("DELETE FROM clientes WHERE id = ?", (cliente_id,))
+        ph = '%s' if is_postgres else '?'
+        # SQLite no aplica ON DELETE SET NULL sin PRAGMA foreign_keys:
+        # se desvinculan las cotizaciones explícitamente en ambos motores.
+        cursor.execute(f"UPDATE quotes SET cliente_id = NULL WHERE cliente_id = {ph}", (cliente_id,))
+        cursor.execute(f"DELETE FROM clientes WHERE id = {ph}", (cliente_id,))
         conn.commit()
         cursor.close()
         conn.close()
+        _tras_eliminar(cliente_id)
         return True
     except Exception as e:
         print(f"❌ Error eliminando cliente {cliente_id}: {e}")
@@ -734,177 +1026,109 @@ def eliminar_cliente(cliente_id: int) -> bool:
 
 def detectar_duplicados() -> list:
     """
-    Detecta clientes duplicados: misma cédula (ci_rif) Y mismo teléfono.
-    Solo se consideran duplicados si ambos campos coinciden y no están vacíos.
-
-    Retorna lista de grupos, cada grupo es una lista de clientes duplicados.
+    Retorna los grupos de clientes duplicados precalculados por
+    cliente_duplicados.py (misma cédula y teléfono, o coincidencias
+    aproximadas de nombre respaldadas por número o nombre casi idéntico).
+    No recalcula nada: solo lee la tabla 'client_duplicate_groups', que se
+    mantiene al día con cada alta/edición/eliminación.
+
+    Retorna lista de grupos, cada grupo es una lista de clientes duplicados
+    (cada cliente incluye además 'motivo' y 'puntaje').
     Ej: [ [cliente_A, cliente_B], [cliente_C, cliente_D, cliente_E] ]
     """
-    conn = None
-    try:
-        conn = DBManager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT id, nombre, telefono, direccion, ci_rif
-            FROM clientes
-            WHERE ci_rif IS NOT NULL AND ci_rif != ''
-              AND telefono IS NOT NULL AND telefono != ''
-            ORDER BY ci_rif, telefono, nombre
-            """
-        )
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
-        # Agrupar por (ci_rif normalizado, telefono normalizado)
-        # Usa normalizar_numero para que '6.220.606' y '6220606' sean la misma clave
-        grupos = {}
-        for row in rows:
-            ci_val  = _row(row, 'ci_rif', 4) or ''
-            tel_val = _row(row, 'telefono', 2) or ''
-            clave = (normalizar_numero(ci_val), normalizar_numero(tel_val))
-            if clave not in grupos:
-                grupos[clave] = []
-            grupos[clave].append({
-                'id':        _row(row, 'id', 0),
-                'nombre':    _row(row, 'nombre', 1) or '',
-                'telefono':  tel_val,
-                'direccion': _row(row, 'direccion', 3) or '',
-                'ci_rif':    ci_val,
-            })
-
-        # Solo retornar grupos con más de 1 cliente
-        return [grupo for grupo in grupos.values() if len(grupo) > 1]
-
-    except Exception as e:
-        print(f"❌ Error detectando duplicados: {e}")
-        if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
-        return []
+    from database.cliente_duplicados import get_grupos_duplicados
+    return get_grupos_duplicados()
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # BLOQUE 7: SINCRONIZACIÓN CLIENTE → COTIZACIÓN
 # ─────────────────────────────────────────────────────────────────────────────
 
-def sincronizar_datos_cliente_en_cotizacion(quote: dict) -> dict:
+# Campos que pueden sincronizarse desde el directorio:
+# (campo en clientes, columna del JOIN en get_quote_by_id, campo en quotes)
+_CAMPOS_SYNC = [
+    ('ci_rif',    'cliente_dir_ci_rif',    'client_cedula'),
+    ('direccion', 'cliente_dir_direccion', 'client_address'),
+    ('telefono',  'cliente_dir_telefono',  'client_phone'),
+]
+
+
+def sincronizar_clientes_en_cotizaciones(quotes: list) -> list:
     """
-    Enriquece los datos de una cotización con la información más actualizada
-    del directorio de clientes (tabla 'clientes').
+    Enriquece una lista de cotizaciones con los datos del directorio de
+    clientes, siguiendo la clave foránea quotes.cliente_id.
 
     Lógica:
-    - Busca en 'clientes' un registro cuyo nombre normalizado coincida con
-      el nombre del cliente de la cotización.
-    - Si lo encuentra, completa los campos vacíos (client_cedula, client_address,
-      client_phone, client_email) con los valores del directorio.
-    - Si los campos ya tienen valor en la cotización, NO los sobreescribe.
-    - También actualiza la tabla 'quotes' en BD para que la cotización quede
-      sincronizada de forma permanente.
-    - Retorna el dict 'quote' enriquecido (nunca falla: en caso de error
-      devuelve el quote original sin modificar).
-
-    Args:
-        quote: dict con los datos de la cotización (resultado de get_quote_by_id)
-
-    Returns:
-        dict con los datos de la cotización, potencialmente enriquecidos.
+    - Si la cotización ya trae las columnas del directorio (LEFT JOIN de
+      get_quote_by_id) se usan tal cual; el resto de cotizaciones con
+      cliente_id se resuelve con UNA consulta por lote (get_clientes_por_ids).
+    - Completa los campos vacíos (client_cedula, client_address, client_phone)
+      con los valores del directorio. Si ya tienen valor, NO los sobreescribe.
+    - Persiste lo completado en 'quotes' (una transacción para todo el lote)
+      para que la cotización quede sincronizada de forma permanente.
+    - Las cotizaciones sin cliente_id se devuelven sin tocar: la asignación
+      ocurre al guardar y en backfill_quotes_cliente_id, no al leer.
+    - Nunca falla: en caso de error devuelve la lista original.
     """
-    if not quote:
-        return quote
-
-    nombre_cot = (quote.get('client_name') or '').strip()
-    if not nombre_cot or len(nombre_cot) < 3:
-        return quote
-
-    # Campos que pueden sincronizarse desde el directorio
-    CAMPOS_SYNC = [
-        ('ci_rif',    'client_cedula'),   # (campo en clientes, campo en quotes)
-        ('direccion', 'client_address'),
-        ('telefono',  'client_phone'),
-    ]
-
-    conn = None
-    try:
-        conn = DBManager.get_connection()
-        cursor = conn.cursor()
-        is_postgres = DBManager.USE_POSTGRES
-
-        # Buscar cliente por nombre normalizado usando SQL directo (sin LIMIT)
-        # Esto garantiza que clientes en posición 501+ sean encontrados
-        nombre_norm = normalizar(nombre_cot)
-        if is_postgres:
-            cursor.execute(
-                "SELECT id, nombre, telefono, direccion, ci_rif FROM clientes WHERE nombre ILIKE %s ORDER BY id ASC",
-                (f'%{nombre_cot.strip()}%',)
-            )
-        else:
-            cursor.execute(
-                "SELECT id, nombre, telefono, direccion, ci_rif FROM clientes WHERE LOWER(nombre) LIKE LOWER(?) ORDER BY id ASC",
-                (f'%{nombre_cot.strip()}%',)
-            )
-        rows = cursor.fetchall()
-
-        cliente_encontrado = None
-        for row in rows:
-            nombre_val = _row(row, 'nombre', 1) or ''
-            if normalizar(nombre_val) == nombre_norm:
-                cliente_encontrado = {
-                    'id':        _row(row, 'id', 0),
-                    'nombre':    nombre_val,
-                    'telefono':  _row(row, 'telefono', 2) or '',
-                    'direccion': _row(row, 'direccion', 3) or '',
-                    'ci_rif':    _row(row, 'ci_rif', 4) or '',
-                }
-                break
-
-        if not cliente_encontrado:
-            cursor.close()
-            conn.close()
-            return quote
-
-        # Determinar qué campos necesitan actualizarse en la cotización
+    if not quotes:
+        return quotes
+
+    pendientes = {
+        q.get('cliente_id') for q in quotes
+        if q and q.get('cliente_id') and 'cliente_dir_ci_rif' not in q
+    }
+    directorio = get_clientes_por_ids(pendientes) if pendientes else {}
+
+    resultado = []
+    cambios = []   # (quote_id, {campo: valor})
+    for quote in quotes:
+        if not quote or not quote.get('cliente_id'):
+            resultado.append(quote)
+            continue
+        cliente = directorio.get(quote.get('cliente_id'))
         campos_a_actualizar = {}
-        for campo_cli, campo_quote in CAMPOS_SYNC:
-            valor_cli   = (cliente_encontrado.get(campo_cli) or '').strip()
+        for campo_cli, campo_join, campo_quote in _CAMPOS_SYNC:
+            if campo_join in quote:
+                valor_cli = quote.get(campo_join) or ''
+            elif cliente:
+                valor_cli = cliente.get(campo_cli) or ''
+            else:
+                continue
+            valor_cli   = str(valor_cli).strip()
             valor_quote = (quote.get(campo_quote) or '').strip()
             # Solo actualizar si el directorio tiene el dato y la cotización no lo tiene
             if valor_cli and not valor_quote:
                 campos_a_actualizar[campo_quote] = valor_cli
-
-        if not campos_a_actualizar:
-            cursor.close()
-            conn.close()
-            return quote  # Nada que sincronizar
-
-        # Actualizar la cotización en BD
-        quote_id = quote.get('id')
-        if quote_id:
-            set_clauses = ', '.join(
-                f"{col} = {'%s' if is_postgres else '?'}"
-                for col in campos_a_actualizar.keys()
+        if campos_a_actualizar:
+            # Enriquecer el dict en memoria para que la validación lo vea de inmediato
+            quote = dict(quote)
+            quote.update(campos_a_actualizar)
+            if quote.get('id'):
+                cambios.append((quote['id'], campos_a_actualizar))
+        resultado.append(quote)
+
+    if not cambios:
+        return resultado
+
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        for quote_id, campos in cambios:
+            set_clauses = ', '.join(f"{col} = {ph}" for col in campos)
+            cursor.execute(
+                f"UPDATE quotes SET {set_clauses} WHERE id = {ph}",
+                list(campos.values()) + [quote_id]
             )
-            valores = list(campos_a_actualizar.values()) + [quote_id]
-            sql = f"UPDATE quotes SET {set_clauses} WHERE id = {'%s' if is_postgres else '?'}"
-            cursor.execute(sql, valores)
-            conn.commit()
-            print(f"✅ Cotización ID={quote_id} sincronizada con cliente '{nombre_cot}': {list(campos_a_actualizar.keys())}")
-
+        conn.commit()
         cursor.close()
         conn.close()
-
-        # Enriquecer el dict en memoria para que la validación lo vea de inmediato
-        quote = dict(quote)
-        for campo_quote, valor in campos_a_actualizar.items():
-            quote[campo_quote] = valor
-
-        return quote
+        print(f"✅ {len(cambios)} cotización(es) sincronizada(s) con el directorio de clientes")
+        return resultado
 
     except Exception as e:
-        print(f"⚠️ Error en sincronizar_datos_cliente_en_cotizacion: {e}")
+        print(f"⚠️ Error en sincronizar_clientes_en_cotizaciones: {e}")
         if conn:
             try:
                 conn.rollback()
@@ -914,4 +1138,16 @@ def sincronizar_datos_cliente_en_cotizacion(quote: dict) -> dict:
                 conn.close()
             except Exception:
                 pass
-        return quote  # Devolver el original sin modificar
+        return quotes  # Devolver los originales sin modificar
+
+
+def sincronizar_datos_cliente_en_cotizacion(quote: dict) -> dict:
+    """
+    Versión de una sola cotización de sincronizar_clientes_en_cotizaciones()
+    (vista de solo lectura y flujo de aprobación). Con el resultado de
+    get_quote_by_id no hace ninguna consulta extra salvo el UPDATE de los
+    campos que falten.
+    """
+    if not quote:
+        return quote
+    return sincronizar_clientes_en_cotizaciones([quote])[0]
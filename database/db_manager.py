@@ -22,6 +22,26 @@ from typing import Optional, List, Dict, Any
 import bcrypt
 
 
+def valor_fila(row, key: str, index: int):
+    """
+    Accede a un campo de una fila de BD de forma compatible con:
+    - PostgreSQL (psycopg2 RealDictRow) → acceso por nombre: row[key]
+    - SQLite (sqlite3.Row / tuple)       → acceso por índice: row[index]
+
+    Uso: valor_fila(row, 'nombre', 1)
+    """
+    try:
+        # Intenta acceso por nombre (PostgreSQL RealDictRow o sqlite3.Row con factory)
+        return row[key]
+    except (KeyError, TypeError, IndexError):
+        pass
+    try:
+        # Fallback: acceso por índice (tuple, list, sqlite3.Row sin factory)
+        return row[index]
+    except (IndexError, TypeError):
+        return None
+
+
 class PooledConnection:
     """
     Wrapper sobre psycopg2.connection que redirige close() a putconn().
@@ -758,6 +778,77 @@ class DBManager:
             except Exception:
                 pass
 
+        # ── Migración: Historial de vigencias de tarifas de flete ──
+        # freight_rates guarda solo la tarifa actual; cada cambio queda aquí con
+        # su fecha de entrada en vigor (ver services/pricing/freight.py).
+        try:
+            id_type_local = "SERIAL PRIMARY KEY" if is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS freight_rate_history (
+                    id {id_type_local},
+                    origin TEXT NOT NULL,
+                    shipping_type TEXT NOT NULL,
+                    rate REAL NOT NULL,
+                    unit TEXT NOT NULL,
+                    effective_from TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_by INTEGER
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_freight_rate_history_vigencia "
+                "ON freight_rate_history (origin, shipping_type, effective_from)"
+            )
+            # Sembrar con las tarifas vigentes la primera vez
+            cursor.execute("SELECT COUNT(*) FROM freight_rate_history")
+            res = cursor.fetchone()
+            cnt = res['count'] if is_postgres else res[0]
+            if cnt == 0:
+                cursor.execute("""
+                    INSERT INTO freight_rate_history (origin, shipping_type, rate, unit, effective_from, updated_by)
+                    SELECT origin, shipping_type, rate, unit, COALESCE(updated_at, CURRENT_TIMESTAMP), updated_by
+                    FROM freight_rates
+                """)
+            conn.commit()
+        except Exception as e:
+            print(f'⚠️ Migración historial de tarifas de flete: {e}')
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+
+        # ── Migración: Desglose de costos guardado (quote_items.desglose, quotes.desglose) ──
+        # Resultado del motor de precios congelado al guardar; los documentos y las
+        # vistas lo leen tal cual (ver services/pricing/desglose.py).
+        try:
+            tipo_desglose = "JSONB" if is_postgres else "TEXT"
+            for tabla in ('quote_items', 'quotes'):
+                if is_postgres:
+                    cursor.execute(
+                        f"ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS desglose {tipo_desglose}"
+                    )
+                else:
+                    cursor.execute(f"PRAGMA table_info({tabla})")
+                    if 'desglose' not in [row[1] for row in cursor.fetchall()]:
+                        cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN desglose {tipo_desglose}")
+            conn.commit()
+        except Exception as e:
+            print(f'⚠️ Migración desglose de costos: {e}')
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+
+        # ── Índice: Caché de análisis IA (purga LRU por last_used, ver services/ai_cache.py) ──
+        try:
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_used ON cache(last_used)")
+            conn.commit()
+        except Exception as e:
+            print(f'⚠️ Índice caché IA: {e}')
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+
         # ── Migración de datos: sincronizar precio_usd con total_cost ──────────────
         # REGLA: precio_usd y total_cost deben ser siempre idénticos en BD.
         # Corrige registros donde divergieron por el bug del guardado anterior.
@@ -1138,6 +1229,7 @@ class DBManager:
             for tbl, col in [
                 ('system_config',  'updated_by'),
                 ('freight_rates',  'updated_by'),
+                ('freight_rate_history', 'updated_by'),
             ]:
                 try:
                     cursor.execute(f"UPDATE {tbl} SET {col} = NULL WHERE {col} = {ph}", (user_id,))
@@ -1483,9 +1575,22 @@ class DBManager:
                     VALUES (?, ?, ?, ?, ?)
                 """, (origin, shipping_type, rate, unit, updated_by))
             
+            # Vigencia: la nueva tarifa rige desde ahora
+            cursor.execute("""
+                INSERT INTO freight_rate_history (origin, shipping_type, rate, unit, updated_by)
+                VALUES (%s, %s, %s, %s, %s)
+            """ if is_postgres else """
+                INSERT INTO freight_rate_history (origin, shipping_type, rate, unit, updated_by)
+                VALUES (?, ?, ?, ?, ?)
+            """, (origin, shipping_type, rate, unit, updated_by))
+            
             conn.commit()
             cursor.close()
             conn.close()
+            
+            # La tabla de tarifas en memoria se recarga en la próxima consulta
+            from services.pricing.freight import TarifasFlete
+            TarifasFlete.invalidar()
             return True
         except Exception as e:
             print(f"Error al establecer tarifa de flete: {e}")
@@ -1880,6 +1985,8 @@ class DBManager:
                 - status: Estado (draft/sent/approved/rejected)
                 - pdf_path: Ruta del archivo PDF
                 - jpeg_path: Ruta del archivo PNG/JPEG
+                - cliente_id: ID en el directorio 'clientes' (opcional)
+                - desglose: totales del motor de precios (desglose_totales, opcional)
         
         Returns:
             ID de la cotización guardada o None si hay error
@@ -1909,6 +2016,9 @@ class DBManager:
             status = quote_data.get('status', 'draft')
             pdf_path = quote_data.get('pdf_path', '')
             jpeg_path = quote_data.get('jpeg_path', '')
+            cliente_id = quote_data.get('cliente_id') or None
+            from services.pricing.desglose import serializar
+            desglose = serializar(quote_data.get('desglose'))
             
             # Validar campos obligatorios
             if not quote_number or not analyst_id:
@@ -1961,14 +2071,16 @@ class DBManager:
                         quote_number, analyst_id, client_name, client_phone, client_email,
                         client_cedula, client_address, client_vehicle, client_year, client_vin,
                         total_amount, sub_total, iva_total, abona_ya, en_entrega,
-                        terms_conditions, status, pdf_path, jpeg_path, created_at
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        terms_conditions, status, pdf_path, jpeg_path, created_at, cliente_id,
+                        desglose
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                     RETURNING id
                 """, (
                     quote_number, analyst_id, client_name, client_phone, client_email,
                     client_cedula, client_address, client_vehicle, client_year, client_vin,
                     total_amount, sub_total, iva_total, abona_ya, en_entrega,
-                    terms_conditions, status, pdf_path, jpeg_path, created_at_caracas
+                    terms_conditions, status, pdf_path, jpeg_path, created_at_caracas, cliente_id,
+                    desglose
                 ))
                 quote_id = cursor.fetchone()['id']
             else:
@@ -1977,13 +2089,15 @@ class DBManager:
                         quote_number, analyst_id, client_name, client_phone, client_email,
                         client_cedula, client_address, client_vehicle, client_year, client_vin,
                         total_amount, sub_total, iva_total, abona_ya, en_entrega,
-                        terms_conditions, status, pdf_path, jpeg_path, created_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        terms_conditions, status, pdf_path, jpeg_path, created_at, cliente_id,
+                        desglose
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
                     quote_number, analyst_id, client_name, client_phone, client_email,
                     client_cedula, client_address, client_vehicle, client_year, client_vin,
                     total_amount, sub_total, iva_total, abona_ya, en_entrega,
-                    terms_conditions, status, pdf_path, jpeg_path, created_at_caracas
+                    terms_conditions, status, pdf_path, jpeg_path, created_at_caracas, cliente_id,
+                    desglose
                 ))
                 quote_id = cursor.lastrowid
             
@@ -2045,6 +2159,8 @@ class DBManager:
             cursor = conn.cursor()
             is_postgres = DBManager.USE_POSTGRES
 
+            from services.pricing.desglose import desglose_item as desglose_item_de, serializar
+
             # ══ CAPA 3: PROTECCIÓN CONTRA SOBREESCRITURA ══════════════════════════════
             # Verificar que la cotización exista y que su estado sea 'draft'.
             # Si ya fue aprobada o cancelada, rechazar la inserción de ítems.
@@ -2116,6 +2232,8 @@ class DBManager:
                 diferencial_val_item = float(item.get('diferencial_valor', 0.0) or 0.0)
                 fob_total_item       = float(item.get('fob_total', 0.0) or 0.0)
                 precio_bs_item       = float(item.get('precio_bs', 0.0) or item.get('costo_total_bs', 0.0) or 0.0)
+                # Desglose completo del motor de precios: lo que leen los documentos
+                desglose_item        = serializar(desglose_item_de(item))
 
                 if is_postgres:
                     cursor.execute("""
@@ -2127,8 +2245,8 @@ class DBManager:
                             tax_percentage, profit_factor,
                             aplicar_iva, iva_porcentaje, iva_valor,
                             utilidad_valor, diferencial_porcentaje, diferencial_valor,
-                            fob_total, precio_usd, precio_bs
-                        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                            fob_total, precio_usd, precio_bs, desglose
+                        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
                     """, (
                         quote_id, description, part_number, marca, garantia,
                         quantity, unit_cost, total_cost, envio_tipo, origen,
@@ -2137,7 +2255,7 @@ class DBManager:
                         impuesto_porcentaje, factor_utilidad,
                         aplicar_iva, iva_porcentaje, iva_valor,
                         utilidad_valor, diferencial_pct_item, diferencial_val_item,
-                        fob_total_item, precio_usd_item, precio_bs_item
+                        fob_total_item, precio_usd_item, precio_bs_item, desglose_item
                     ))
                 else:
                     cursor.execute("""
@@ -2149,8 +2267,8 @@ class DBManager:
                             tax_percentage, profit_factor,
                             aplicar_iva, iva_porcentaje, iva_valor,
                             utilidad_valor, diferencial_porcentaje, diferencial_valor,
-                            fob_total, precio_usd, precio_bs
-                        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                            fob_total, precio_usd, precio_bs, desglose
+                        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
                     """, (
                         quote_id, description, part_number, marca, garantia,
                         quantity, unit_cost, total_cost, envio_tipo, origen,
@@ -2159,7 +2277,7 @@ class DBManager:
                         impuesto_porcentaje, factor_utilidad,
                         aplicar_iva, iva_porcentaje, iva_valor,
                         utilidad_valor, diferencial_pct_item, diferencial_val_item,
-                        fob_total_item, precio_usd_item, precio_bs_item
+                        fob_total_item, precio_usd_item, precio_bs_item, desglose_item
                     ))
             
             conn.commit()
@@ -2264,6 +2382,9 @@ class DBManager:
     def get_quote_by_id(quote_id: int) -> Optional[Dict[str, Any]]:
         """
         Obtiene una cotización específica por su ID.
+        Incluye los datos actuales del directorio de clientes (LEFT JOIN por
+        cliente_id) como cliente_dir_telefono / cliente_dir_direccion /
+        cliente_dir_ci_rif, para sincronizar sin consultas adicionales.
         
         Args:
             quote_id: ID de la cotización
@@ -2278,16 +2399,24 @@ class DBManager:
             
             if is_postgres:
                 cursor.execute("""
-                    SELECT q.*, u.full_name as analyst_name
+                    SELECT q.*, u.full_name as analyst_name,
+                           c.telefono  as cliente_dir_telefono,
+                           c.direccion as cliente_dir_direccion,
+                           c.ci_rif    as cliente_dir_ci_rif
                     FROM quotes q
                     JOIN users u ON q.analyst_id = u.id
+                    LEFT JOIN clientes c ON c.id = q.cliente_id
                     WHERE q.id = %s
                 """, (quote_id,))
             else:
                 cursor.execute("""
-                    SELECT q.*, u.full_name as analyst_name
+                    SELECT q.*, u.full_name as analyst_name,
+                           c.telefono  as cliente_dir_telefono,
+                           c.direccion as cliente_dir_direccion,
+                           c.ci_rif    as cliente_dir_ci_rif
                     FROM quotes q
                     JOIN users u ON q.analyst_id = u.id
+                    LEFT JOIN clientes c ON c.id = q.cliente_id
                     WHERE q.id = ?
                 """, (quote_id,))
             
@@ -2598,7 +2727,7 @@ class DBManager:
                 'client_name', 'client_phone', 'client_email', 'client_cedula',
                 'client_address', 'client_vehicle', 'client_year', 'client_vin',
                 'total_amount', 'sub_total', 'iva_total', 'abona_ya', 'en_entrega',
-                'terms_conditions', 'pdf_path', 'jpeg_path',
+                'terms_conditions', 'pdf_path', 'jpeg_path', 'cliente_id', 'desglose',
             ]
             _set_clauses = []
             _set_values  = []
@@ -2606,7 +2735,11 @@ class DBManager:
             for _field in _updatable_fields:
                 if _field in quote_data:  # Solo actualizar campos presentes en el dict
                     _set_clauses.append(f"{_field} = {_ph}")
-                    _set_values.append(quote_data[_field])
+                    if _field == 'desglose':
+                        from services.pricing.desglose import serializar
+                        _set_values.append(serializar(quote_data[_field]))
+                    else:
+                        _set_values.append(quote_data[_field])
             if _set_clauses:
                 _set_values.append(quote_id)
                 _update_sql = f"UPDATE quotes SET {', '.join(_set_clauses)} WHERE id = {_ph}"
@@ -2675,6 +2808,8 @@ class DBManager:
             old_count = cursor.fetchone()
             old_count = old_count['count'] if is_postgres else old_count[0]
             
+            from services.pricing.desglose import desglose_item, serializar
+
             # Eliminar ítems antiguos
             cursor.execute("""
                 DELETE FROM quote_items WHERE quote_id = %s
@@ -2716,8 +2851,8 @@ class DBManager:
                         tax_percentage, profit_factor,
                         aplicar_iva, iva_porcentaje, iva_valor,
                         utilidad_valor, diferencial_porcentaje, diferencial_valor,
-                        fob_total, precio_usd, precio_bs
-                    ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                        fob_total, precio_usd, precio_bs, desglose
+                    ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
                 """ if is_postgres else """
                     INSERT INTO quote_items (
                         quote_id, description, part_number, marca, garantia,
@@ -2727,8 +2862,8 @@ class DBManager:
                         tax_percentage, profit_factor,
                         aplicar_iva, iva_porcentaje, iva_valor,
                         utilidad_valor, diferencial_porcentaje, diferencial_valor,
-                        fob_total, precio_usd, precio_bs
-                    ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                        fob_total, precio_usd, precio_bs, desglose
+                    ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
                 """, (
                     quote_id,
                     item.get('descripcion') or item.get('description', ''),
@@ -2757,6 +2892,7 @@ class DBManager:
                     fob_total,
                     precio_usd_item,
                     precio_bs_item,
+                    serializar(desglose_item({**item, 'iva_valor': iva_valor})),
                 ))
             
             # Registrar cambio en el historial
@@ -3470,6 +3606,10 @@ class DBManager:
                 'pdf_path': None,   # Invalidar PDF anterior
                 'jpeg_path': None,  # Invalidar PNG anterior
             }
+            # Vínculo con el directorio de clientes: solo si el panel lo resolvió
+            # (guardar_o_actualizar); si no, se conserva el cliente_id existente.
+            if cliente_datos.get('cliente_id'):
+                quote_data['cliente_id'] = cliente_datos['cliente_id']
             
             # Actualizar datos del cliente
             success_cliente = DBManager.update_quote(quote_id, quote_data, user_id)
@@ -3488,68 +3628,22 @@ class DBManager:
             # en la tabla quotes y NO se actualizan en update_quote_items. Si no los
             # recalculamos aquí, el PNG/PDF generado después de editar mostrará los
             # valores financieros originales (ej. IVA = $0 aunque se haya activado).
-            recalc_sub_total      = 0.0
-            recalc_iva_total      = 0.0
-            recalc_abona_ya       = 0.0
-            recalc_total_usd      = 0.0
-
-            for item in items:
-                # Sub-Total: todos los costos sin IVA
-                sub_item = (
-                    item.get('fob_total', 0) +
-                    item.get('costo_handling', 0) +
-                    item.get('costo_manejo', 0) +
-                    item.get('costo_impuesto', 0) +
-                    item.get('utilidad_valor', 0) +
-                    item.get('costo_envio', 0) +
-                    item.get('costo_tax', 0) +
-                    item.get('diferencial_valor', 0)
-                )
-                recalc_sub_total += sub_item
-
-                # IVA (solo si el ítem lo tiene activado)
-                if item.get('aplicar_iva', False):
-                    iva_val = item.get('iva_valor', 0.0)
-                    # Si iva_valor no está calculado, calcularlo desde precio_usd
-                    if not iva_val:
-                        precio_item = item.get('precio_usd', 0.0) or item.get('total', 0.0) or item.get('total_cost', 0.0)
-                        iva_pct     = item.get('iva_porcentaje', 16.0)
-                        iva_val     = round(float(precio_item) * (float(iva_pct) / 100), 2)
-                    recalc_iva_total += iva_val
-
-                # Abona Ya: costos base × (1 + diferencial%)
-                costos_base = (
-                    item.get('fob_total', 0) +
-                    item.get('costo_handling', 0) +
-                    item.get('costo_manejo', 0) +
-                    item.get('costo_impuesto', 0) +
-                    item.get('utilidad_valor', 0) +
-                    item.get('costo_tax', 0)
-                )
-                dif_factor = item.get('diferencial_porcentaje', 0) / 100
-                recalc_abona_ya += costos_base * (1 + dif_factor)
-
-                # Total USD Divisas (sin diferencial)
-                recalc_total_usd += (
-                    item.get('fob_total', 0) +
-                    item.get('costo_handling', 0) +
-                    item.get('costo_manejo', 0) +
-                    item.get('costo_impuesto', 0) +
-                    item.get('utilidad_valor', 0) +
-                    item.get('costo_envio', 0) +
-                    item.get('costo_tax', 0)
-                )
-
-            recalc_total_a_pagar = recalc_sub_total + recalc_iva_total
-            recalc_en_entrega    = recalc_total_a_pagar - recalc_abona_ya
+            # Mismo motor de precios que el formulario de cotización.
+            from services.pricing import totales_cotizacion
+            from services.pricing.desglose import desglose_totales
+            totales = totales_cotizacion(items)
+            recalc_sub_total     = totales['sub_total']
+            recalc_iva_total     = totales['iva_total']
+            recalc_total_a_pagar = totales['total_a_pagar']
 
             # Guardar totales recalculados en la tabla quotes
             financials_data = {
                 'sub_total':      recalc_sub_total,
                 'iva_total':      recalc_iva_total,
-                'total_amount':   recalc_total_usd,
-                'abona_ya':       recalc_abona_ya,
-                'en_entrega':     recalc_en_entrega,
+                'total_amount':   totales['total_usd'],
+                'abona_ya':       totales['abona_ya'],
+                'en_entrega':     totales['y_en_entrega'],
+                'desglose':       desglose_totales(totales),
                 'pdf_path':       None,  # Ya invalidado en el paso anterior
                 'jpeg_path':      None,  # Ya invalidado en el paso anterior
             }
@@ -1,53 +1,199 @@
 # ─────────────────────────────────────────────────────────────────────────────
 # MÓDULO: migrar_clientes.py
-# Migración única de clientes históricos desde la tabla 'quotes' → 'clientes'
+# Migración de clientes históricos desde la tabla 'quotes' → 'clientes'
 # ─────────────────────────────────────────────────────────────────────────────
 """
-Lógica de migración:
-  1. Lee todas las cotizaciones que tengan los 4 campos completos:
+Lógica de migración (streaming, reanudable):
+  1. Recorre las cotizaciones que tengan los 4 campos completos
        client_name, client_phone, client_address, client_cedula
+     de la MÁS RECIENTE a la más antigua (id DESC), en lotes de LOTE filas
+     con fetchmany() — en PostgreSQL sobre un cursor con nombre (server-side),
+     así nunca se carga el histórico completo en memoria.
   2. Filtra solo las que tienen nombre real (sin números ni alias).
-  3. Agrupa por nombre normalizado (sin acentos, sin mayúsculas).
-  4. De cada grupo, toma la cotización MÁS RECIENTE (datos más actualizados).
-  5. Inserta un solo registro por cliente en la tabla 'clientes'.
-  6. Retorna un reporte detallado del resultado.
+  3. Deduplica en memoria por nombre normalizado (sin acentos, sin mayúsculas):
+     como se recorre de la más reciente a la más antigua, la primera
+     cotización vista de cada cliente es la de datos más actualizados.
+  4. Inserta en bloque los clientes nuevos de cada lote y guarda el avance
+     en 'client_migration_checkpoint' en la MISMA transacción.
+  5. Vincula con el directorio (quotes.cliente_id) las cotizaciones que
+     quedaron sin cliente, incluidas las de los clientes recién creados.
+  6. Retorna un reporte detallado del resultado, con estadísticas de
+     rendimiento (filas leídas, lotes, segundos, filas/segundo).
 
-Esta función es idempotente: si se llama más de una vez, no crea duplicados
-porque verifica si el cliente ya existe antes de insertar.
+Reanudación y re-ejecución:
+  - Si una ejecución se interrumpe, la siguiente continúa desde el último
+    lote confirmado (no vuelve a leer lo ya procesado).
+  - Al terminar se registra el id más alto procesado: al volver a ejecutarla
+    (p. ej. tras importar cotizaciones del sistema anterior) solo se leen
+    las cotizaciones nuevas. No requiere ventana de mantenimiento: cada lote
+    vuelve a consultar los clientes creados mientras tanto desde el panel.
+  - Es idempotente: nunca inserta un nombre que ya exista en 'clientes'.
+
+Modo simulación (dry_run=True): recorre y deduplica igual, pero no inserta
+ni mueve el checkpoint; sirve para estimar el resultado y el rendimiento.
 """
 
+import time
 import traceback as _traceback
-from database.db_manager import DBManager
+from database.db_manager import DBManager, valor_fila
 from database.cliente_manager import (
-    init_clientes_table, normalizar, es_nombre_real
+    init_clientes_table, normalizar, normalizar_numero, es_nombre_real
 )
 
+# Filas leídas por fetchmany() y confirmadas por transacción
+LOTE = 1000
+
+# Identificador de este proceso en la tabla de checkpoints
+PROCESO = 'clientes_desde_quotes'
+
+# Máximo de líneas por cliente en el detalle del reporte (el resto solo cuenta)
+DETALLE_MAX = 300
+
+
+def init_checkpoint_table():
+    """
+    Crea la tabla 'client_migration_checkpoint' si no existe.
+
+    Columnas:
+      completado_hasta → id más alto de quotes cubierto por ejecuciones terminadas
+      tope             → id más alto de la ejecución en curso (NULL si no hay)
+      siguiente        → próximo id a procesar de la ejecución en curso (DESC)
+    """
+    conn = DBManager.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS client_migration_checkpoint (
+                proceso          TEXT PRIMARY KEY,
+                completado_hasta INTEGER NOT NULL DEFAULT 0,
+                tope             INTEGER,
+                siguiente        INTEGER,
+                procesadas       INTEGER NOT NULL DEFAULT 0,
+                actualizado_en   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _leer_checkpoint(cursor, ph: str) -> dict:
+    cursor.execute(
+        f"SELECT completado_hasta, tope, siguiente, procesadas "
+        f"FROM client_migration_checkpoint WHERE proceso = {ph}",
+        (PROCESO,)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return {'completado_hasta': 0, 'tope': None, 'siguiente': None, 'procesadas': 0}
+    return {
+        'completado_hasta': valor_fila(row, 'completado_hasta', 0) or 0,
+        'tope':             valor_fila(row, 'tope', 1),
+        'siguiente':        valor_fila(row, 'siguiente', 2),
+        'procesadas':       valor_fila(row, 'procesadas', 3) or 0,
+    }
+
+
+def _guardar_checkpoint(cursor, ph: str, cp: dict):
+    """UPSERT del checkpoint (sin commit: lo confirma el lote que lo acompaña)."""
+    valores = (cp['completado_hasta'], cp['tope'], cp['siguiente'], cp['procesadas'], PROCESO)
+    cursor.execute(f"""
+        UPDATE client_migration_checkpoint
+        SET completado_hasta = {ph}, tope = {ph}, siguiente = {ph}, procesadas = {ph},
+            actualizado_en = CURRENT_TIMESTAMP
+        WHERE proceso = {ph}
+    """, valores)
+    if cursor.rowcount == 0:
+        cursor.execute(f"""
+            INSERT INTO client_migration_checkpoint
+                (completado_hasta, tope, siguiente, procesadas, proceso)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
+        """, valores)
 
-def migrar_clientes_desde_quotes() -> dict:
+
+def _cargar_nombres(cursor, ph: str, desde_id: int, nombres: set) -> int:
+    """
+    Agrega a 'nombres' los nombres normalizados de clientes con id > desde_id.
+    Retorna el id más alto visto (para la siguiente llamada incremental).
     """
-    Ejecuta la migración completa de clientes históricos.
+    cursor.execute(
+        f"SELECT id, nombre FROM clientes WHERE id > {ph} ORDER BY id ASC",
+        (desde_id,)
+    )
+    ultimo = desde_id
+    for row in cursor.fetchall():
+        nombres.add(normalizar(valor_fila(row, 'nombre', 1) or ''))
+        ultimo = valor_fila(row, 'id', 0)
+    return ultimo
+
+
+def _insertar_lote(cursor, nuevos: list):
+    """INSERT masivo de un lote de clientes (execute_values en PostgreSQL)."""
+    filas = [
+        (d['nombre'], d['telefono'], d['direccion'], d['ci_rif'], normalizar(d['nombre']),
+         normalizar_numero(d['telefono']), normalizar_numero(d['ci_rif']))
+        for d in nuevos
+    ]
+    if DBManager.USE_POSTGRES:
+        from psycopg2.extras import execute_values
+        execute_values(cursor, """
+            INSERT INTO clientes (nombre, telefono, direccion, ci_rif,
+                                  nombre_norm, telefono_norm, ci_rif_norm)
+            VALUES %s
+        """, filas, page_size=LOTE)
+    else:
+        cursor.executemany("""
+            INSERT INTO clientes (nombre, telefono, direccion, ci_rif,
+                                  nombre_norm, telefono_norm, ci_rif_norm)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, filas)
+
+
+def migrar_clientes_desde_quotes(dry_run: bool = False) -> dict:
+    """
+    Ejecuta (o continúa) la migración de clientes históricos.
+
+    Args:
+        dry_run: si es True no inserta nada ni mueve el checkpoint.
 
     Retorna dict con:
-      'migrados':  int  — clientes nuevos insertados
-      'omitidos':  int  — cotizaciones saltadas por datos incompletos o alias
+      'migrados':  int  — clientes nuevos insertados (o que se insertarían)
+      'omitidos':  int  — cotizaciones saltadas por alias/números
       'ya_existian': int — clientes que ya estaban en la tabla (no duplicados)
-      'errores':   int  — filas con error inesperado
+      'vinculadas': int — cotizaciones a las que se asignó cliente_id
+      'errores':   int  — lotes con error inesperado
+      'leidas':    int  — cotizaciones leídas en esta ejecución
+      'lotes':     int  — lotes procesados
+      'segundos':  float — duración de la ejecución
+      'filas_por_segundo': float
+      'dry_run':   bool
       'detalle':   list — lista de mensajes para mostrar en el reporte
     """
     reporte = {
         'migrados':    0,
         'omitidos':    0,
         'ya_existian': 0,
+        'vinculadas':  0,
         'errores':     0,
+        'leidas':      0,
+        'lotes':       0,
+        'segundos':    0.0,
+        'filas_por_segundo': 0.0,
+        'dry_run':     dry_run,
         'detalle':     []
     }
 
     is_postgres = DBManager.USE_POSTGRES
+    ph = '%s' if is_postgres else '?'
+    inicio = time.perf_counter()
 
-    # ── PASO 1: Asegurar que la tabla clientes existe ─────────────────────────
+    # ── PASO 1: Asegurar que las tablas existen ───────────────────────────────
     init_clientes_table()
+    init_checkpoint_table()
 
     conn = None
+    lector = None
     try:
         conn = DBManager.get_connection()
         cursor = conn.cursor()
@@ -88,147 +234,186 @@ def migrar_clientes_desde_quotes() -> dict:
         else:
             select_cols  += ", '' AS client_cedula"
 
-        select_cols += ", created_at"
+        # ── PASO 3: Rango pendiente según el checkpoint ───────────────────────
+        cp = _leer_checkpoint(cursor, ph)
+        if cp['tope'] is None:
+            # Ejecución nueva: cubrir todo lo posterior a la última terminada
+            cursor.execute("SELECT MAX(id) AS max_id FROM quotes")
+            cp['tope'] = valor_fila(cursor.fetchone(), 'max_id', 0) or 0
+            cp['siguiente'] = cp['tope']
+        else:
+            reporte['detalle'].append(
+                f"↩️  Reanudando ejecución interrumpida en la cotización ID {cp['siguiente']}"
+            )
+        hasta = cp['siguiente'] if cp['siguiente'] is not None else cp['tope']
 
+        if hasta <= cp['completado_hasta']:
+            reporte['detalle'].append(
+                f"📋 No hay cotizaciones nuevas desde la última migración "
+                f"(ID {cp['completado_hasta']})"
+            )
+            return reporte
+
+        reporte['detalle'].append(
+            f"📋 Cotizaciones a revisar: IDs {cp['completado_hasta'] + 1} a {hasta}"
+            + (" (simulación)" if dry_run else "")
+        )
+
+        # ── PASO 4: Clientes ya existentes (se refresca en cada lote) ─────────
+        nombres_existentes = set()
+        ultimo_cliente_id = _cargar_nombres(cursor, ph, 0, nombres_existentes)
+        conn.commit()
+        vistos = set()   # nombres ya contados en esta ejecución
+
+        # ── PASO 5: Lectura en streaming ──────────────────────────────────────
         sql_quotes = f"""
             SELECT {select_cols}
             FROM quotes
-            WHERE client_name  IS NOT NULL AND TRIM(client_name)  != ''
+            WHERE id > {ph} AND id <= {ph}
+              AND client_name  IS NOT NULL AND TRIM(client_name)  != ''
               AND client_phone IS NOT NULL AND TRIM(client_phone) != ''
               {where_extras}
-            ORDER BY created_at ASC
+            ORDER BY id DESC
         """
+        if is_postgres:
+            # Cursor con nombre (server-side) en una conexión aparte: los
+            # commits de cada lote en 'conn' no lo cierran
+            lector = DBManager.get_connection()
+            cursor_lectura = lector.cursor(name='migrar_clientes_stream')
+        else:
+            cursor_lectura = conn.cursor()
+        cursor_lectura.execute(sql_quotes, (cp['completado_hasta'], hasta))
 
-        cursor.execute(sql_quotes)
-        filas = cursor.fetchall()
-        total_candidatos = len(filas)
-        reporte['detalle'].append(
-            f"📋 Cotizaciones con los 4 campos completos: {total_candidatos}"
-        )
+        while True:
+            filas = cursor_lectura.fetchmany(LOTE)
+            if not filas:
+                break
+            reporte['lotes'] += 1
+            reporte['leidas'] += len(filas)
 
-        # ── PASO 3: Filtrar nombres reales y agrupar por nombre normalizado ───
-        # Estructura: { nombre_norm: {datos más recientes} }
-        grupos = {}
-
-        for fila in filas:
-            # Acceso por nombre de columna para compatibilidad con PostgreSQL (RealDictRow)
-            # y SQLite (Row/tuple). Usamos dict() para normalizar ambos.
-            if not isinstance(fila, dict):
-                fila = dict(zip(
-                    ['id', 'client_name', 'client_phone', 'client_address',
-                     'client_cedula', 'created_at'],
-                    fila
-                ))
-            quote_id  = fila.get('id')
-            nombre    = fila.get('client_name', '')
-            telefono  = fila.get('client_phone', '')
-            direccion = fila.get('client_address', '')
-            ci_rif    = fila.get('client_cedula', '')
-            created_at = fila.get('created_at')
-
-            nombre = (nombre or '').strip()
-            telefono  = (telefono  or '').strip()
-            direccion = (direccion or '').strip()
-            ci_rif    = (ci_rif    or '').strip()
-
-            # Filtrar nombres que no son reales (números, alias, etc.)
-            if not es_nombre_real(nombre):
-                reporte['omitidos'] += 1
-                reporte['detalle'].append(
-                    f"  ⏭️  Omitido (alias/número): '{nombre}'"
-                )
-                continue
-
-            nombre_norm = normalizar(nombre)
-
-            # Guardar la cotización más reciente por cliente
-            # Como ordenamos por created_at ASC, cada nueva fila sobreescribe
-            # la anterior → al final tenemos la MÁS RECIENTE de cada cliente
-            grupos[nombre_norm] = {
-                'nombre':    nombre,
-                'telefono':  telefono,
-                'direccion': direccion,
-                'ci_rif':    ci_rif,
-            }
+            # Clientes creados desde el panel mientras corre la migración
+            ultimo_cliente_id = _cargar_nombres(
+                cursor, ph, ultimo_cliente_id, nombres_existentes
+            )
 
-        reporte['detalle'].append(
-            f"👥 Clientes únicos con nombre real: {len(grupos)}"
-        )
+            nuevos = []
+            for fila in filas:
+                nombre    = (valor_fila(fila, 'client_name', 1)    or '').strip()
+                telefono  = (valor_fila(fila, 'client_phone', 2)   or '').strip()
+                direccion = (valor_fila(fila, 'client_address', 3) or '').strip()
+                ci_rif    = (valor_fila(fila, 'client_cedula', 4)  or '').strip()
 
-        # ── PASO 4: Cargar clientes ya existentes en la tabla clientes ────────
-        cursor.execute(
-            "SELECT nombre FROM clientes"
-        )
-        existentes_rows = cursor.fetchall()
-        existentes_norm = {
-            normalizar((r['nombre'] if isinstance(r, dict) else r[0]) or '')
-            for r in existentes_rows
-        }
-
-        # ── PASO 5: Insertar los que no existen aún ───────────────────────────
-        for nombre_norm, datos in grupos.items():
-            if nombre_norm in existentes_norm:
-                reporte['ya_existian'] += 1
-                reporte['detalle'].append(
-                    f"  ✅ Ya existe: '{datos['nombre']}'"
-                )
-                continue
+                # Filtrar nombres que no son reales (números, alias, etc.)
+                if not es_nombre_real(nombre):
+                    reporte['omitidos'] += 1
+                    if reporte['omitidos'] <= DETALLE_MAX:
+                        reporte['detalle'].append(
+                            f"  ⏭️  Omitido (alias/número): '{nombre}'"
+                        )
+                    continue
 
-            try:
-                if is_postgres:
-                    cursor.execute(
-                        """
-                        INSERT INTO clientes (nombre, telefono, direccion, ci_rif)
-                        VALUES (%s, %s, %s, %s)
-                        """,
-                        (datos['nombre'], datos['telefono'],
-                         datos['direccion'], datos['ci_rif'])
-                    )
-                else:
-                    cursor.execute(
-                        """
-                        INSERT INTO clientes (nombre, telefono, direccion, ci_rif)
-                        VALUES (?, ?, ?, ?)
-                        """,
-                        (datos['nombre'], datos['telefono'],
-                         datos['direccion'], datos['ci_rif'])
+                nombre_norm = normalizar(nombre)
+                if nombre_norm in vistos:
+                    continue   # ya visto en una cotización más reciente
+                vistos.add(nombre_norm)
+
+                if nombre_norm in nombres_existentes:
+                    reporte['ya_existian'] += 1
+                    continue
+
+                nuevos.append({
+                    'nombre':    nombre,
+                    'telefono':  telefono,
+                    'direccion': direccion,
+                    'ci_rif':    ci_rif,
+                })
+
+            menor_id = valor_fila(filas[-1], 'id', 0)
+            cp['siguiente'] = menor_id - 1
+            cp['procesadas'] += len(filas)
+
+            if not dry_run:
+                try:
+                    if nuevos:
+                        _insertar_lote(cursor, nuevos)
+                    _guardar_checkpoint(cursor, ph, cp)
+                    conn.commit()
+                except Exception as e_lote:
+                    conn.rollback()
+                    reporte['detalle'].append(
+                        f"  ❌ Error en el lote que termina en ID {menor_id}: {e_lote}"
                     )
+                    raise
+
+            for datos in nuevos:
+                nombres_existentes.add(normalizar(datos['nombre']))
                 reporte['migrados'] += 1
-                reporte['detalle'].append(
-                    f"  ➕ Migrado: '{datos['nombre']}' | "
-                    f"Tel: {datos['telefono']} | CI: {datos['ci_rif']}"
-                )
-            except Exception as e_ins:
-                reporte['errores'] += 1
-                reporte['detalle'].append(
-                    f"  ❌ Error insertando '{datos['nombre']}': {e_ins}"
-                )
+                if reporte['migrados'] <= DETALLE_MAX:
+                    reporte['detalle'].append(
+                        f"  ➕ {'Se migraría' if dry_run else 'Migrado'}: '{datos['nombre']}' | "
+                        f"Tel: {datos['telefono']} | CI: {datos['ci_rif']}"
+                    )
 
-        conn.commit()
+        cursor_lectura.close()
+
+        # ── PASO 6: Cerrar la ejecución ───────────────────────────────────────
+        if not dry_run:
+            cp['completado_hasta'] = cp['tope']
+            cp['tope'] = None
+            cp['siguiente'] = None
+            _guardar_checkpoint(cursor, ph, cp)
+            conn.commit()
         cursor.close()
-        conn.close()
 
-        reporte['detalle'].append(
-            f"\n📊 RESUMEN FINAL:\n"
-            f"   ➕ Migrados:      {reporte['migrados']}\n"
-            f"   ✅ Ya existían:   {reporte['ya_existian']}\n"
-            f"   ⏭️  Omitidos:      {reporte['omitidos']}\n"
-            f"   ❌ Errores:       {reporte['errores']}"
-        )
+        if reporte['migrados'] and not dry_run:
+            # Los INSERT de arriba no pasan por cliente_manager: vincular las
+            # cotizaciones de los clientes creados, recargar el índice y
+            # recalcular los grupos de duplicados
+            from database.migrations.backfill_quotes_cliente_id import migrate as vincular_cotizaciones
+            reporte['vinculadas'] = vincular_cotizaciones()
+            reporte['detalle'].append(
+                f"🔗 Cotizaciones vinculadas a su cliente: {reporte['vinculadas']}"
+            )
+            from database.cliente_index import ClienteIndex
+            from database.cliente_duplicados import recalcular_duplicados
+            ClienteIndex.invalidar()
+            recalcular_duplicados()
+
         return reporte
 
     except Exception as e:
         reporte['errores'] += 1
         tb_completo = _traceback.format_exc()
         reporte['detalle'].append(f"❌ Error general en migración: {e}")
+        reporte['detalle'].append(
+            "↩️  Los lotes confirmados se conservan: al volver a ejecutarla "
+            "continúa desde el último checkpoint."
+        )
         reporte['detalle'].append(f"TRACEBACK:\n{tb_completo}")
         if conn:
             try:
                 conn.rollback()
             except Exception:
                 pass
-            try:
-                conn.close()
-            except Exception:
-                pass
         return reporte
+
+    finally:
+        for c in (lector, conn):
+            if c:
+                try:
+                    c.close()
+                except Exception:
+                    pass
+        reporte['segundos'] = round(time.perf_counter() - inicio, 2)
+        if reporte['segundos'] > 0:
+            reporte['filas_por_segundo'] = round(reporte['leidas'] / reporte['segundos'], 1)
+        reporte['detalle'].append(
+            f"\n📊 RESUMEN FINAL{' (SIMULACIÓN)' if dry_run else ''}:\n"
+            f"   ➕ Migrados:      {reporte['migrados']}\n"
+            f"   ✅ Ya existían:   {reporte['ya_existian']}\n"
+            f"   ⏭️  Omitidos:      {reporte['omitidos']}\n"
+            f"   ❌ Errores:       {reporte['errores']}\n"
+            f"   📥 Leídas:        {reporte['leidas']} en {reporte['lotes']} lote(s)\n"
+            f"   ⏱️  Duración:      {reporte['segundos']} s "
+            f"({reporte['filas_por_segundo']} filas/s)"
+        )
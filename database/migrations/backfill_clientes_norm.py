@@ -0,0 +1,88 @@
+# database/migrations/backfill_clientes_norm.py
+# Migración única: rellena clientes.nombre_norm / telefono_norm / ci_rif_norm
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from database.db_manager import DBManager, valor_fila
+from database.cliente_manager import (
+    crear_indice_nombre_norm, init_clientes_table, normalizar, normalizar_numero,
+)
+
+# Filas procesadas por lote (un SELECT + un UPDATE masivo + commit por lote)
+LOTE = 1000
+
+
+def migrate() -> int:
+    """
+    Calcula normalizar() del nombre y normalizar_numero() de telefono y
+    ci_rif para los clientes creados antes de que existieran las columnas
+    normalizadas; al terminar crea el índice de nombre_norm
+    (crear_indice_nombre_norm), que necesita la columna completa.
+
+    - Solo toca filas con alguna columna normalizada en NULL, así que
+      volver a ejecutarla es barato y no modifica nada ya migrado.
+    - Los valores vacíos se guardan como '' (no NULL) para que la fila
+      no vuelva a seleccionarse.
+    - Confirma cada lote por separado: si se interrumpe, la siguiente
+      ejecución continúa donde quedó.
+
+    Retorna el número de clientes actualizados.
+    """
+    init_clientes_table()
+    is_postgres = DBManager.USE_POSTGRES
+    ph = '%s' if is_postgres else '?'
+    total = 0
+
+    conn = DBManager.get_connection()
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute(f"""
+                SELECT id, nombre, telefono, ci_rif
+                FROM clientes
+                WHERE nombre_norm IS NULL OR telefono_norm IS NULL OR ci_rif_norm IS NULL
+                ORDER BY id ASC
+                LIMIT {ph}
+            """, (LOTE,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            cambios = [
+                (
+                    normalizar(valor_fila(row, 'nombre', 1) or ''),
+                    normalizar_numero(valor_fila(row, 'telefono', 2) or ''),
+                    normalizar_numero(valor_fila(row, 'ci_rif', 3) or ''),
+                    valor_fila(row, 'id', 0),
+                )
+                for row in rows
+            ]
+            cursor.executemany(
+                f"UPDATE clientes SET nombre_norm = {ph}, telefono_norm = {ph}, ci_rif_norm = {ph} "
+                f"WHERE id = {ph}",
+                cambios
+            )
+            conn.commit()
+            total += len(cambios)
+
+        if total:
+            print(f"✅ Migración: {total} clientes con nombre/teléfono/cédula normalizados")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error en migración de claves normalizadas de clientes: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    crear_indice_nombre_norm()
+    return total
+
+
+# Alias para compatibilidad
+run_migration = migrate
+
+if __name__ == "__main__":
+    migrate()
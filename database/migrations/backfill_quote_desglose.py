@@ -0,0 +1,119 @@
+# database/migrations/backfill_quote_desglose.py
+# Migración: congela el desglose de costos de las cotizaciones guardadas sin él
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from database.db_manager import DBManager, valor_fila
+from services.pricing import desglose
+
+# Filas procesadas por lote (un SELECT + un UPDATE masivo + commit por lote)
+LOTE = 1000
+
+# Ya se completó en este proceso (app.py la consulta en cada rerun)
+_completada = False
+
+
+def pendiente() -> bool:
+    """True si la migración todavía no corrió en este proceso."""
+    return not _completada
+
+
+def _columnas(cursor) -> list:
+    return [c[0] for c in cursor.description]
+
+
+def _filas(cursor) -> list:
+    columnas = _columnas(cursor)
+    return [{c: valor_fila(r, c, i) for i, c in enumerate(columnas)} for r in cursor.fetchall()]
+
+
+def _items(conn, cursor, ph: str) -> int:
+    """quote_items.desglose de los ítems que no lo tienen (lógica de respaldo)."""
+    total, desde = 0, 0
+    while True:
+        cursor.execute(f"""
+            SELECT * FROM quote_items
+            WHERE desglose IS NULL AND id > {ph}
+            ORDER BY id LIMIT {ph}
+        """, (desde, LOTE))
+        filas = _filas(cursor)
+        if not filas:
+            return total
+        cursor.executemany(
+            f"UPDATE quote_items SET desglose = {ph} WHERE id = {ph}",
+            [(desglose.serializar(desglose.item_legado(f)), f['id']) for f in filas]
+        )
+        conn.commit()
+        total += len(filas)
+        desde = filas[-1]['id']
+
+
+def _cotizaciones(conn, cursor, ph: str) -> int:
+    """quotes.desglose desde su cabecera y los desgloses de sus ítems."""
+    total, desde = 0, 0
+    while True:
+        cursor.execute(f"""
+            SELECT * FROM quotes
+            WHERE desglose IS NULL AND id > {ph}
+            ORDER BY id LIMIT {ph}
+        """, (desde, LOTE))
+        quotes = _filas(cursor)
+        if not quotes:
+            return total
+        ids = [q['id'] for q in quotes]
+        cursor.execute(f"""
+            SELECT * FROM quote_items
+            WHERE quote_id IN ({', '.join([ph] * len(ids))})
+            ORDER BY quote_id, id
+        """, ids)
+        por_quote = {}
+        for item in _filas(cursor):
+            por_quote.setdefault(item['quote_id'], []).append(desglose.del_item(item))
+        cursor.executemany(
+            f"UPDATE quotes SET desglose = {ph} WHERE id = {ph}",
+            [(desglose.serializar(desglose.totales_legado(q, por_quote.get(q['id'], []))), q['id'])
+             for q in quotes]
+        )
+        conn.commit()
+        total += len(quotes)
+        desde = ids[-1]
+
+
+def migrate() -> int:
+    """
+    Guarda quote_items.desglose y quotes.desglose de las cotizaciones que
+    no lo tienen (guardadas antes de que existiera la columna, o cuya
+    cabecera corrigió la conciliación). Los valores son los mismos que los
+    documentos mostraban hasta ahora; de aquí en adelante se leen tal cual.
+
+    Solo toca filas con desglose NULL, así que volver a ejecutarla es
+    barato. Retorna el número de filas (ítems + cotizaciones) completadas.
+    """
+    global _completada
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    conn = DBManager.get_connection()
+    cursor = conn.cursor()
+    try:
+        # Los ítems primero: el desglose de la cotización suma los de sus ítems
+        items = _items(conn, cursor, ph)
+        cotizaciones = _cotizaciones(conn, cursor, ph)
+        if items or cotizaciones:
+            print(f"✅ Migración: desglose guardado para {items} ítems y {cotizaciones} cotizaciones")
+        _completada = True
+        return items + cotizaciones
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error completando desgloses de cotizaciones: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# Alias para compatibilidad
+run_migration = migrate
+
+if __name__ == "__main__":
+    migrate()
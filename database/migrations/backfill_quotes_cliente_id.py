@@ -0,0 +1,119 @@
+# database/migrations/backfill_quotes_cliente_id.py
+# Migración: vincula las cotizaciones históricas con el directorio (quotes.cliente_id)
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from database.db_manager import DBManager, valor_fila
+from database.cliente_manager import (
+    init_clientes_table, normalizar, normalizar_numero
+)
+
+# Cotizaciones procesadas por lote (un SELECT + un UPDATE masivo + commit por lote)
+LOTE = 1000
+
+
+def _cargar_directorio(cursor) -> tuple:
+    """
+    Lee el directorio de clientes una sola vez y arma tres mapas de búsqueda:
+    nombre normalizado, cédula normalizada y teléfono normalizado → id.
+    Ante varios candidatos gana el id más antiguo (mismo criterio que
+    guardar_o_actualizar).
+    """
+    cursor.execute("""
+        SELECT id, nombre, telefono_norm, ci_rif_norm
+        FROM clientes
+        ORDER BY id ASC
+    """)
+    por_nombre, por_ci, por_tel = {}, {}, {}
+    for row in cursor.fetchall():
+        cid = valor_fila(row, 'id', 0)
+        nombre = normalizar(valor_fila(row, 'nombre', 1) or '')
+        tel = valor_fila(row, 'telefono_norm', 2) or ''
+        ci = valor_fila(row, 'ci_rif_norm', 3) or ''
+        if nombre:
+            por_nombre.setdefault(nombre, cid)
+        if ci:
+            por_ci.setdefault(ci, cid)
+        if tel:
+            por_tel.setdefault(tel, cid)
+    return por_nombre, por_ci, por_tel
+
+
+def migrate() -> int:
+    """
+    Asigna quotes.cliente_id a las cotizaciones guardadas antes de que
+    existiera la columna.
+
+    - Coincidencia por nombre normalizado; si no, por cédula y luego por
+      teléfono normalizados (normalizar_numero).
+    - Recorre en lotes por id solo las cotizaciones con cliente_id NULL
+      (columna indexada). No guarda avance entre ejecuciones: una
+      cotización sin cliente hoy se vincula en una ejecución posterior, en
+      cuanto su cliente exista en el directorio.
+    - Las que no coinciden con ningún cliente quedan con cliente_id NULL.
+
+    Retorna el número de cotizaciones vinculadas.
+    """
+    init_clientes_table()
+    is_postgres = DBManager.USE_POSTGRES
+    ph = '%s' if is_postgres else '?'
+    total = 0
+    desde = 0   # paginación por id dentro de esta ejecución
+
+    conn = DBManager.get_connection()
+    cursor = conn.cursor()
+    try:
+        por_nombre, por_ci, por_tel = _cargar_directorio(cursor)
+        if not por_nombre:
+            return 0
+
+        while True:
+            cursor.execute(f"""
+                SELECT id, client_name, client_cedula, client_phone
+                FROM quotes
+                WHERE id > {ph} AND cliente_id IS NULL
+                ORDER BY id ASC
+                LIMIT {ph}
+            """, (desde, LOTE))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            cambios = []
+            for row in rows:
+                cid = (
+                    por_nombre.get(normalizar(valor_fila(row, 'client_name', 1) or ''))
+                    or por_ci.get(normalizar_numero(valor_fila(row, 'client_cedula', 2) or ''))
+                    or por_tel.get(normalizar_numero(valor_fila(row, 'client_phone', 3) or ''))
+                )
+                if cid:
+                    cambios.append((cid, valor_fila(row, 'id', 0)))
+            if cambios:
+                cursor.executemany(
+                    f"UPDATE quotes SET cliente_id = {ph} WHERE id = {ph}",
+                    cambios
+                )
+            conn.commit()
+            total += len(cambios)
+            desde = valor_fila(rows[-1], 'id', 0)
+
+        if total:
+            print(f"✅ Migración: {total} cotizaciones vinculadas al directorio de clientes")
+        return total
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error vinculando cotizaciones con clientes: {e}")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# Alias para compatibilidad
+run_migration = migrate
+
+if __name__ == "__main__":
+    migrate()
@@ -3,6 +3,10 @@ Prompt "Omni-Parts Expert & Logistics" para LogiPartVE v7.5
 Sistema integrado de especialistas en autopartes y logística internacional
 """
 
+# Versión del prompt: subirla al cambiar el formato de respuesta esperado
+# (forma parte de la clave de services/ai_cache.py)
+PROMPT_VERSION = "7.5"
+
 OMNI_PARTS_SYSTEM_PROMPT = """
 ERES UN SISTEMA INTEGRADO DE ESPECIALISTAS EN AUTOPARTES "OMNI-PARTS EXPERT & LOGISTICS" con 4 perfiles de élite trabajando en perfecta sincronía:
 
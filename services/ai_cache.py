@@ -0,0 +1,317 @@
+# services/ai_cache.py
+# Caché de análisis de repuestos con IA: evita repetir consultas a Gemini/OpenAI
+"""
+Guarda en la tabla `cache` cada análisis exitoso de AIService: la respuesta
+cruda del proveedor y su versión estructurada (AIParser.parse_response).
+
+La clave (cache.part_number) es un hash de la solicitud normalizada:
+vehículo, repuesto, número de parte, URL, origen, envío y la versión del
+prompt. Mayúsculas, acentos, espacios, separadores del número de parte y
+parámetros de rastreo de la URL no generan entradas distintas; cambiar el
+prompt (texto o PROMPT_VERSION) invalida todo lo anterior sin borrar nada.
+
+Dos niveles:
+  - Memoria del proceso (LRU de MAX_MEMORIA entradas): respuesta inmediata
+    para los repuestos frecuentes, sin tocar la BD.
+  - Tabla `cache`: compartida entre procesos y reinicios. Las entradas
+    vencen a los TTL_SEGUNDOS de creadas y, por encima de MAX_FILAS, se
+    descartan las de last_used más antiguo.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from database.db_manager import DBManager, valor_fila
+
+# Prefijo de las claves en cache.part_number (la tabla podría compartirse)
+PREFIJO = 'ia:'
+
+# Vigencia de un análisis guardado (30 días)
+TTL_SEGUNDOS = 30 * 24 * 3600
+
+# Entradas máximas en la tabla y en la memoria del proceso
+MAX_FILAS = 5000
+MAX_MEMORIA = 256
+
+# Cada cuántas escrituras se purga la tabla (vencidas + exceso de filas)
+PURGAR_CADA = 50
+
+# last_used de un acierto en memoria se escribe a lo sumo cada tantos segundos
+TOQUE_SEGUNDOS = 600
+
+# Parámetros de URL que no cambian el producto
+_PARAMETROS_RASTREO = re.compile(r'^(utm_\w+|gclid|fbclid|mc_\w+|ref|ref_|_ga)$', re.IGNORECASE)
+
+
+def _ahora_bd() -> datetime:
+    """Marca para last_used: UTC sin zona, igual en PostgreSQL y SQLite."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# NORMALIZACIÓN DE LA CLAVE
+# ─────────────────────────────────────────────────────────────────────────────
+def _texto(valor) -> str:
+    """Minúsculas, sin acentos y con los espacios colapsados."""
+    texto = unicodedata.normalize('NFKD', str(valor or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+def _numero_parte(valor) -> str:
+    """Solo letras y dígitos en mayúsculas: '12-345 ab' y '12345AB' son el mismo."""
+    return re.sub(r'[^0-9A-Z]', '', _texto(valor).upper())
+
+
+def _url(valor) -> str:
+    """URL sin fragmento, sin parámetros de rastreo y con los demás ordenados."""
+    url = str(valor or '').strip()
+    if not url:
+        return ''
+    try:
+        partes = urlsplit(url if '://' in url else f'https://{url}')
+    except ValueError:
+        return url.lower()
+    parametros = sorted((k, v) for k, v in parse_qsl(partes.query, keep_blank_values=True)
+                        if not _PARAMETROS_RASTREO.match(k))
+    host = partes.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return urlunsplit(('https', host, partes.path.rstrip('/') or '/', urlencode(parametros), ''))
+
+
+def version_prompt() -> str:
+    """
+    PROMPT_VERSION más un hash del texto fijo del prompt y la lista blanca:
+    editar el prompt invalida la caché aunque nadie suba la versión.
+    """
+    from prompts import omni_parts_prompt as p
+    texto = p.OMNI_PARTS_SYSTEM_PROMPT + p.format_whitelist_for_prompt()
+    return f"{p.PROMPT_VERSION}:{hashlib.sha1(texto.encode('utf-8')).hexdigest()[:10]}"
+
+
+def clave(vehiculo: str, repuesto: str, numero_parte: str, url: Optional[str],
+          origen: str, envio: str) -> str:
+    """Clave de caché de una solicitud de análisis (con o sin URL)."""
+    partes = [_texto(vehiculo), _texto(repuesto), _numero_parte(numero_parte),
+              _url(url), _texto(origen), _texto(envio), version_prompt()]
+    return PREFIJO + hashlib.sha256('\x1f'.join(partes).encode('utf-8')).hexdigest()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CACHÉ
+# ─────────────────────────────────────────────────────────────────────────────
+class CacheIA:
+    """
+    Caché de análisis de IA compartida por todo el proceso. La memoria es
+    un OrderedDict (LRU) protegido por un lock; la BD es la fuente común.
+    """
+
+    _lock = threading.RLock()
+    _memoria: 'OrderedDict[str, dict]' = OrderedDict()
+    _escrituras = 0
+    _estadisticas = {'memoria': 0, 'bd': 0, 'fallos': 0, 'guardados': 0}
+
+    # ── Memoria del proceso ────────────────────────────────────────────────
+
+    @classmethod
+    def _de_memoria(cls, k: str) -> Optional[dict]:
+        with cls._lock:
+            entrada = cls._memoria.get(k)
+            if entrada is None:
+                return None
+            if time.time() - entrada['creado'] > TTL_SEGUNDOS:
+                del cls._memoria[k]
+                return None
+            cls._memoria.move_to_end(k)
+            tocar = time.monotonic() - entrada.get('_tocado', 0) > TOQUE_SEGUNDOS
+            if tocar:
+                entrada['_tocado'] = time.monotonic()
+        if tocar:
+            cls._tocar(k)
+        return entrada
+
+    @classmethod
+    def _a_memoria(cls, k: str, entrada: dict):
+        with cls._lock:
+            cls._memoria[k] = {**entrada, '_tocado': time.monotonic()}
+            cls._memoria.move_to_end(k)
+            while len(cls._memoria) > MAX_MEMORIA:
+                cls._memoria.popitem(last=False)
+
+    @classmethod
+    def invalidar(cls):
+        """Vacía la memoria del proceso (la tabla se conserva)."""
+        with cls._lock:
+            cls._memoria.clear()
+
+    # ── Tabla cache ────────────────────────────────────────────────────────
+
+    @classmethod
+    def _tocar(cls, k: str):
+        """Actualiza last_used (orden LRU de la tabla)."""
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        conn = None
+        try:
+            conn = DBManager.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"UPDATE cache SET last_used = {ph} WHERE part_number = {ph}",
+                           (_ahora_bd(), k))
+            conn.commit()
+            cursor.close()
+        except Exception as e:
+            print(f"⚠️ Caché IA: no se pudo actualizar last_used: {e}")
+        finally:
+            if conn:
+                conn.close()
+
+    @classmethod
+    def _de_bd(cls, k: str) -> Optional[dict]:
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        conn = None
+        try:
+            conn = DBManager.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT description FROM cache WHERE part_number = {ph}", (k,))
+            fila = cursor.fetchone()
+            if not fila:
+                cursor.close()
+                return None
+            try:
+                entrada = json.loads(valor_fila(fila, 'description', 0) or '')
+            except (ValueError, TypeError):
+                entrada = None
+            if (not isinstance(entrada, dict) or 'response' not in entrada
+                    or time.time() - float(entrada.get('creado') or 0) > TTL_SEGUNDOS):
+                # Vencida o ilegible: se descarta
+                cursor.execute(f"DELETE FROM cache WHERE part_number = {ph}", (k,))
+                entrada = None
+            else:
+                cursor.execute(f"UPDATE cache SET last_used = {ph} WHERE part_number = {ph}",
+                               (_ahora_bd(), k))
+            conn.commit()
+            cursor.close()
+            return entrada
+        except Exception as e:
+            print(f"❌ Error leyendo caché IA: {e}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    @classmethod
+    def _a_bd(cls, k: str, entrada: dict):
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        texto = json.dumps(entrada, ensure_ascii=False, separators=(',', ':'))
+        conn = None
+        try:
+            conn = DBManager.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                INSERT INTO cache (part_number, description, source, last_used)
+                VALUES ({ph}, {ph}, {ph}, {ph})
+                ON CONFLICT (part_number) DO UPDATE SET
+                    description = excluded.description,
+                    source = excluded.source,
+                    last_used = excluded.last_used
+            """, (k, texto, entrada.get('provider'), _ahora_bd()))
+            conn.commit()
+            cursor.close()
+        except Exception as e:
+            print(f"❌ Error guardando caché IA: {e}")
+            return
+        finally:
+            if conn:
+                conn.close()
+        with cls._lock:
+            cls._escrituras += 1
+            purgar = cls._escrituras % PURGAR_CADA == 1
+        if purgar:
+            cls.purgar()
+
+    @classmethod
+    def purgar(cls) -> int:
+        """
+        Borra de la tabla las entradas sin uso por más de TTL_SEGUNDOS y, si
+        quedan más de MAX_FILAS, las de last_used más antiguo. Retorna el
+        número de filas borradas.
+        """
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        # Sin uso desde hace más del TTL implica creada hace más del TTL
+        limite = _ahora_bd() - timedelta(seconds=TTL_SEGUNDOS)
+        sobrantes = "OFFSET {ph}" if DBManager.USE_POSTGRES else "LIMIT -1 OFFSET {ph}"
+        conn = None
+        try:
+            conn = DBManager.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                DELETE FROM cache
+                WHERE part_number LIKE {ph} AND last_used < {ph}
+            """, (PREFIJO + '%', limite))
+            borradas = cursor.rowcount or 0
+            cursor.execute(f"""
+                DELETE FROM cache WHERE id IN (
+                    SELECT id FROM cache WHERE part_number LIKE {ph}
+                    ORDER BY last_used DESC, id DESC {sobrantes.format(ph=ph)}
+                )
+            """, (PREFIJO + '%', MAX_FILAS))
+            borradas += cursor.rowcount or 0
+            conn.commit()
+            cursor.close()
+            return borradas
+        except Exception as e:
+            print(f"❌ Error purgando caché IA: {e}")
+            return 0
+        finally:
+            if conn:
+                conn.close()
+
+    # ── API ────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def obtener(cls, k: str) -> Optional[dict]:
+        """
+        Entrada guardada ({'response', 'parsed', 'provider', 'creado'}) o
+        None si no hay o venció. Primero la memoria, luego la tabla. Se
+        devuelve una copia: el llamador puede modificarla.
+        """
+        entrada = cls._de_memoria(k)
+        if entrada is not None:
+            with cls._lock:
+                cls._estadisticas['memoria'] += 1
+        else:
+            entrada = cls._de_bd(k)
+            with cls._lock:
+                cls._estadisticas['bd' if entrada else 'fallos'] += 1
+            if not entrada:
+                return None
+            cls._a_memoria(k, entrada)
+        return {**entrada, 'parsed': {**(entrada.get('parsed') or {}),
+                                      'raw_response': entrada['response']}}
+
+    @classmethod
+    def guardar(cls, k: str, response: str, parsed: dict, provider: str) -> dict:
+        """Guarda un análisis exitoso en la memoria y en la tabla."""
+        # raw_response repite response: no se guarda dos veces
+        parsed = {c: v for c, v in (parsed or {}).items() if c != 'raw_response'}
+        entrada = {'response': response, 'parsed': parsed, 'provider': provider,
+                   'creado': time.time()}
+        cls._a_memoria(k, entrada)
+        cls._a_bd(k, entrada)
+        with cls._lock:
+            cls._estadisticas['guardados'] += 1
+        return entrada
+
+    @classmethod
+    def estadisticas(cls) -> dict:
+        """Aciertos (memoria / BD), fallos y guardados desde que arrancó el proceso."""
+        with cls._lock:
+            return {**cls._estadisticas, 'en_memoria': len(cls._memoria)}
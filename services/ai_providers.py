@@ -0,0 +1,435 @@
+# services/ai_providers.py
+# Proveedores de IA en paralelo: solicitud cubierta, timeouts, circuitos y latencias
+"""
+AIService ya no espera a que Gemini falle para probar con OpenAI. Cada
+solicitud se resuelve así (ProveedoresIA.generar):
+
+  1. Se lanza el primer proveedor disponible en un pool de hilos.
+  2. Si a los ESPERA_COBERTURA segundos no respondió, se lanza también el
+     siguiente (la "cobertura"); si falla antes, el siguiente sale de
+     inmediato, sin esperar.
+  3. Gana la primera respuesta válida. A los demás se les avisa que se
+     cancelen y su resultado, si llega, se descarta.
+  4. Cada proveedor tiene su timeout: pasado ese tiempo se da por fallado
+     aunque el hilo siga ocupado en la llamada HTTP.
+
+Por proveedor se lleva un circuito (tras FALLOS_APERTURA fallos seguidos
+deja de recibir solicitudes por ENFRIAMIENTO_SEGUNDOS, y luego se prueba
+con una sola) y un histograma de latencias por resultado (ok, error,
+timeout, descartado), ver ProveedoresIA.estadisticas().
+
+ProveedorSimulado responde sin red con latencia y errores configurables,
+para probar la cobertura, los timeouts y los circuitos sin gastar cuota:
+
+    AIService(proveedores=[ProveedorSimulado('lento', latencia=(4, 6)),
+                           ProveedorSimulado('rapido', latencia=(0.2, 0.4))],
+              espera_cobertura=1.0)
+"""
+
+import abc
+import bisect
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Sistema del prompt enviado a OpenAI
+SISTEMA_OPENAI = "Eres un experto en repuestos automotrices y logística."
+
+
+class Cancelado(Exception):
+    """La solicitud ya se resolvió con otro proveedor (o venció)."""
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# PROVEEDORES
+# ─────────────────────────────────────────────────────────────────────────────
+class Proveedor(abc.ABC):
+    """
+    Un proveedor de IA. generar() retorna el texto de la respuesta o lanza
+    una excepción; `cancelado` se activa cuando su resultado ya no sirve
+    (las SDK no lo consultan, pero los proveedores que pueden, sí).
+    Es abstracto: una subclase sin generar() falla al crearse.
+    """
+
+    nombre = 'base'
+    TIMEOUT_SEGUNDOS = float(os.environ.get('AI_TIMEOUT', '30'))
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = float(timeout or self.TIMEOUT_SEGUNDOS)
+
+    @abc.abstractmethod
+    def generar(self, prompt: str, cancelado: threading.Event) -> str:
+        """Texto de la respuesta del modelo para `prompt`."""
+
+
+class ProveedorGemini(Proveedor):
+    nombre = 'gemini'
+    TIMEOUT_SEGUNDOS = float(os.environ.get('AI_TIMEOUT_GEMINI', '25'))
+
+    def __init__(self, model, timeout: Optional[float] = None):
+        super().__init__(timeout)
+        self.model = model
+
+    def generar(self, prompt: str, cancelado: threading.Event) -> str:
+        response = self.model.generate_content(
+            prompt, request_options={'timeout': self.timeout}
+        )
+        return response.text
+
+
+class ProveedorOpenAI(Proveedor):
+    nombre = 'openai'
+    TIMEOUT_SEGUNDOS = float(os.environ.get('AI_TIMEOUT_OPENAI', '30'))
+
+    def __init__(self, client, modelo: str = "gpt-4o-mini", timeout: Optional[float] = None):
+        super().__init__(timeout)
+        self.client = client
+        self.modelo = modelo
+
+    def generar(self, prompt: str, cancelado: threading.Event) -> str:
+        response = self.client.chat.completions.create(
+            model=self.modelo,
+            messages=[
+                {"role": "system", "content": SISTEMA_OPENAI},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=2000,
+            timeout=self.timeout
+        )
+        return response.choices[0].message.content
+
+
+class ProveedorSimulado(Proveedor):
+    """
+    Proveedor local para pruebas sin red: espera una latencia al azar dentro
+    de `latencia` (segundos, o un rango) y falla con probabilidad
+    `tasa_error`. Respeta la cancelación: deja de esperar en cuanto se le avisa.
+    """
+
+    def __init__(self, nombre: str = 'simulado', latencia=(0.1, 0.3),
+                 tasa_error: float = 0.0, respuesta: Optional[str] = None,
+                 timeout: Optional[float] = None, semilla: Optional[int] = None):
+        super().__init__(timeout)
+        self.nombre = nombre
+        self.latencia = latencia if isinstance(latencia, (tuple, list)) else (latencia, latencia)
+        self.tasa_error = tasa_error
+        self.respuesta = respuesta
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.llamadas = 0
+
+    def generar(self, prompt: str, cancelado: threading.Event) -> str:
+        with self._lock:
+            self.llamadas += 1
+            espera = self._azar.uniform(*self.latencia)
+            falla = self._azar.random() < self.tasa_error
+        if cancelado.wait(espera):
+            raise Cancelado(f"{self.nombre} cancelado")
+        if falla:
+            raise RuntimeError(f"{self.nombre}: error simulado")
+        if self.respuesta is not None:
+            return self.respuesta
+        return f"DESCRIPCIÓN: respuesta simulada de {self.nombre}\n{prompt[-200:]}"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CIRCUITO Y LATENCIAS
+# ─────────────────────────────────────────────────────────────────────────────
+class Circuito:
+    """
+    Circuito de un proveedor: cerrado (normal) → abierto tras
+    FALLOS_APERTURA fallos seguidos → semiabierto pasado el enfriamiento,
+    con una sola solicitud de prueba que lo cierra o lo vuelve a abrir.
+    """
+
+    FALLOS_APERTURA = int(os.environ.get('AI_CIRCUIT_FAILURES', '3'))
+    ENFRIAMIENTO_SEGUNDOS = float(os.environ.get('AI_CIRCUIT_COOLDOWN', '60'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.estado = 'cerrado'
+        self.fallos = 0
+        self._abierto_en = 0.0
+        self._en_prueba = False
+
+    def permite(self) -> bool:
+        with self._lock:
+            if self.estado == 'cerrado':
+                return True
+            if self.estado == 'abierto':
+                if time.monotonic() - self._abierto_en < self.ENFRIAMIENTO_SEGUNDOS:
+                    return False
+                self.estado = 'semiabierto'
+            if self._en_prueba:
+                return False
+            self._en_prueba = True
+            return True
+
+    def exito(self):
+        with self._lock:
+            self.estado = 'cerrado'
+            self.fallos = 0
+            self._en_prueba = False
+
+    def fallo(self):
+        with self._lock:
+            self.fallos += 1
+            self._en_prueba = False
+            if self.estado == 'semiabierto' or self.fallos >= self.FALLOS_APERTURA:
+                self.estado = 'abierto'
+                self._abierto_en = time.monotonic()
+
+    def liberar(self):
+        """La solicitud de prueba terminó sin veredicto (fue descartada)."""
+        with self._lock:
+            self._en_prueba = False
+
+
+class Histograma:
+    """Conteo de latencias por cubetas (límites superiores en ms)."""
+
+    LIMITES_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+    def __init__(self):
+        self.cubetas = [0] * (len(self.LIMITES_MS) + 1)
+        self.n = 0
+        self.suma_ms = 0.0
+
+    def registrar(self, ms: float):
+        self.cubetas[bisect.bisect_left(self.LIMITES_MS, ms)] += 1
+        self.n += 1
+        self.suma_ms += ms
+
+    def percentil(self, p: float) -> Optional[float]:
+        """Límite superior de la cubeta del percentil p (None = sin datos o > último límite)."""
+        if not self.n:
+            return None
+        objetivo, acumulado = p / 100 * self.n, 0
+        for i, cuenta in enumerate(self.cubetas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return float(self.LIMITES_MS[i]) if i < len(self.LIMITES_MS) else None
+        return None
+
+    def resumen(self) -> dict:
+        etiquetas = [f"≤{l}" for l in self.LIMITES_MS] + [f">{self.LIMITES_MS[-1]}"]
+        return {
+            'n': self.n,
+            'promedio_ms': round(self.suma_ms / self.n, 1) if self.n else None,
+            'p50_ms': self.percentil(50),
+            'p95_ms': self.percentil(95),
+            'cubetas': dict(zip(etiquetas, self.cubetas)),
+        }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SOLICITUD CUBIERTA
+# ─────────────────────────────────────────────────────────────────────────────
+class _Llamada:
+    """
+    Una llamada a un proveedor dentro de una solicitud. Su desenlace lo fija
+    una sola vez quien llegue primero: el hilo del pool ('ok' / 'error') o
+    generar() ('timeout' si venció, 'descartado' si ganó otro proveedor).
+    Así la latencia y el veredicto del circuito se cuentan una sola vez.
+    """
+
+    def __init__(self, proveedor: Proveedor):
+        self.proveedor = proveedor
+        self.cancelado = threading.Event()
+        self.lanzada_en = time.monotonic()
+        self.desenlace: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def cerrar(self, desenlace: str) -> bool:
+        """Fija el desenlace si aún no tenía; True si esta llamada lo fijó."""
+        with self._lock:
+            if self.desenlace is not None:
+                return False
+            self.desenlace = desenlace
+            return True
+
+
+class ProveedoresIA:
+    """Pool de hilos, circuitos e histogramas compartidos por todo el proceso."""
+
+    WORKERS = int(os.environ.get('AI_WORKERS', '8'))
+    ESPERA_COBERTURA = float(os.environ.get('AI_HEDGE_DELAY', '3'))
+
+    _lock = threading.RLock()
+    _pool: Optional[ThreadPoolExecutor] = None
+    _circuitos: Dict[str, Circuito] = {}
+    _histogramas: Dict[Tuple[str, str], Histograma] = {}
+
+    @classmethod
+    def _ejecutor(cls) -> ThreadPoolExecutor:
+        with cls._lock:
+            if cls._pool is None:
+                cls._pool = ThreadPoolExecutor(max_workers=cls.WORKERS, thread_name_prefix='ia')
+            return cls._pool
+
+    @classmethod
+    def circuito(cls, nombre: str) -> Circuito:
+        with cls._lock:
+            if nombre not in cls._circuitos:
+                cls._circuitos[nombre] = Circuito()
+            return cls._circuitos[nombre]
+
+    @classmethod
+    def _registrar(cls, nombre: str, resultado: str, segundos: float):
+        with cls._lock:
+            histograma = cls._histogramas.setdefault((nombre, resultado), Histograma())
+            histograma.registrar(segundos * 1000)
+
+    @classmethod
+    def _ejecutar(cls, llamada: _Llamada, prompt: str,
+                  valida: Callable[[str], bool]) -> Tuple[bool, str, str]:
+        """
+        Corre en un hilo del pool. Registra su latencia y el veredicto del
+        circuito si es quien cierra la llamada. Si la solicitud ya se había
+        resuelto con otro proveedor, el resultado cuenta como 'descartado';
+        si la llamada ya venció, generar() la contó como timeout y fallo, y
+        aquí no se registra nada más.
+        """
+        proveedor = llamada.proveedor
+        circuito = cls.circuito(proveedor.nombre)
+        inicio = time.monotonic()
+        try:
+            texto = proveedor.generar(prompt, llamada.cancelado)
+            ok, error = bool(texto and valida(texto)), ''
+            if not ok:
+                error = 'respuesta vacía o inválida'
+        except Exception as e:
+            texto, ok, error = '', False, str(e) or type(e).__name__
+        segundos = time.monotonic() - inicio
+
+        if llamada.cerrar('ok' if ok else 'error'):
+            cls._registrar(proveedor.nombre, llamada.desenlace, segundos)
+            if ok:
+                circuito.exito()
+            else:
+                circuito.fallo()
+        elif llamada.desenlace == 'descartado':
+            cls._registrar(proveedor.nombre, 'descartado', segundos)
+            if ok:
+                circuito.exito()
+            else:
+                circuito.liberar()
+        return ok, texto, error
+
+    @classmethod
+    def generar(cls, prompt: str, proveedores: List[Proveedor],
+                espera_cobertura: Optional[float] = None,
+                valida: Optional[Callable[[str], bool]] = None) -> dict:
+        """
+        Resuelve el prompt con el primer proveedor que dé una respuesta
+        válida (ver el docstring del módulo). Retorna el mismo dict que
+        AIService._generate_response, más 'latencia_ms'.
+        """
+        espera = cls.ESPERA_COBERTURA if espera_cobertura is None else float(espera_cobertura)
+        valida = valida or (lambda texto: bool(texto.strip()))
+        inicio = time.monotonic()
+        cola = list(proveedores)
+        pendientes: Dict = {}   # futuro -> _Llamada
+        errores = []
+
+        def lanzar_siguiente() -> bool:
+            while cola:
+                proveedor = cola.pop(0)
+                if not cls.circuito(proveedor.nombre).permite():
+                    errores.append(f"{proveedor.nombre}: circuito abierto")
+                    continue
+                llamada = _Llamada(proveedor)
+                pendientes[cls._ejecutor().submit(cls._ejecutar, llamada, prompt, valida)] = llamada
+                return True
+            return False
+
+        def descartar_pendientes():
+            for futuro, llamada in pendientes.items():
+                llamada.cerrar('descartado')
+                llamada.cancelado.set()
+                futuro.cancel()
+            pendientes.clear()
+
+        lanzar_siguiente()
+        proxima_cobertura = time.monotonic() + espera
+        while pendientes:
+            ahora = time.monotonic()
+            limite = min(ll.lanzada_en + ll.proveedor.timeout for ll in pendientes.values())
+            if cola:
+                limite = min(limite, proxima_cobertura)
+            hechos, _ = wait(list(pendientes), timeout=max(0.0, limite - ahora),
+                             return_when=FIRST_COMPLETED)
+
+            for futuro in hechos:
+                proveedor = pendientes.pop(futuro).proveedor
+                ok, texto, error = futuro.result()
+                if ok:
+                    descartar_pendientes()
+                    return {
+                        'success': True,
+                        'response': texto,
+                        'provider': proveedor.nombre,
+                        'latencia_ms': round((time.monotonic() - inicio) * 1000, 1)
+                    }
+                errores.append(f"{proveedor.nombre}: {error}")
+                print(f"Error con {proveedor.nombre}: {error}")
+                # Falló: el siguiente no espera a la cobertura
+                if lanzar_siguiente():
+                    proxima_cobertura = time.monotonic() + espera
+
+            ahora = time.monotonic()
+            for futuro, llamada in list(pendientes.items()):
+                proveedor = llamada.proveedor
+                if ahora - llamada.lanzada_en < proveedor.timeout:
+                    continue
+                if not llamada.cerrar('timeout'):
+                    # Terminó justo ahora: su resultado se toma en la próxima vuelta
+                    continue
+                del pendientes[futuro]
+                llamada.cancelado.set()
+                futuro.cancel()
+                cls._registrar(proveedor.nombre, 'timeout', ahora - llamada.lanzada_en)
+                cls.circuito(proveedor.nombre).fallo()
+                errores.append(f"{proveedor.nombre}: sin respuesta en {proveedor.timeout:g}s")
+                print(f"Timeout con {proveedor.nombre} ({proveedor.timeout:g}s)")
+                if lanzar_siguiente():
+                    proxima_cobertura = time.monotonic() + espera
+
+            if cola and (not pendientes or ahora >= proxima_cobertura):
+                if lanzar_siguiente():
+                    proxima_cobertura = time.monotonic() + espera
+
+        return {
+            'success': False,
+            'response': '',
+            'provider': 'none',
+            'error': '; '.join(errores) or 'No hay servicios de IA configurados',
+            'latencia_ms': round((time.monotonic() - inicio) * 1000, 1)
+        }
+
+    @classmethod
+    def estadisticas(cls) -> dict:
+        """Estado del circuito e histogramas de latencia de cada proveedor."""
+        with cls._lock:
+            nombres = sorted(set(cls._circuitos) | {n for n, _ in cls._histogramas})
+            return {
+                nombre: {
+                    'circuito': cls._circuitos[nombre].estado if nombre in cls._circuitos else 'cerrado',
+                    'fallos_seguidos': cls._circuitos[nombre].fallos if nombre in cls._circuitos else 0,
+                    'latencias': {resultado: h.resumen()
+                                  for (n, resultado), h in sorted(cls._histogramas.items())
+                                  if n == nombre},
+                }
+                for nombre in nombres
+            }
+
+    @classmethod
+    def reiniciar(cls):
+        """Cierra los circuitos y borra los histogramas."""
+        with cls._lock:
+            cls._circuitos = {}
+            cls._histogramas = {}
@@ -1,6 +1,6 @@
 """
 Servicio de IA para análisis de repuestos
-Integra Gemini (primario) y OpenAI (fallback)
+Integra Gemini (primario) y OpenAI (cobertura en paralelo, ver services/ai_providers.py)
 """
 import os
 
@@ -22,14 +22,31 @@ from prompts.omni_parts_prompt import (
     get_omni_parts_prompt_with_url,
     get_omni_parts_prompt_without_url
 )
+from services import ai_cache
+from services.ai_parser import AIParser
+from services.ai_providers import ProveedorGemini, ProveedorOpenAI, ProveedoresIA
 
 
 class AIService:
-    """Servicio de IA con Gemini y OpenAI fallback"""
+    """Servicio de IA con Gemini y OpenAI en cobertura"""
     
-    def __init__(self):
-        # Configurar Gemini
+    def __init__(self, proveedores: list = None, espera_cobertura: float = None):
+        """
+        Args:
+            proveedores: Proveedores en orden de preferencia (por defecto
+                Gemini y OpenAI según las API keys; ver ProveedorSimulado
+                para probar sin red)
+            espera_cobertura: Segundos antes de lanzar el siguiente proveedor
+                (por defecto ProveedoresIA.ESPERA_COBERTURA, AI_HEDGE_DELAY)
+        """
+        self.espera_cobertura = espera_cobertura
+        self.openai_client = None
         self.gemini_model = None
+        if proveedores is not None:
+            self.proveedores = list(proveedores)
+            return
+        
+        # Configurar Gemini
         if GEMINI_AVAILABLE:
             self.gemini_api_key = os.getenv('GEMINI_API_KEY')
             if self.gemini_api_key:
@@ -40,7 +57,6 @@ class AIService:
                     print(f"Error configurando Gemini: {str(e)}")
         
         # Configurar OpenAI
-        self.openai_client = None
         if OPENAI_AVAILABLE:
             self.openai_api_key = os.getenv('OPENAI_API_KEY')
             if self.openai_api_key:
@@ -48,10 +64,16 @@ class AIService:
                     self.openai_client = OpenAI(api_key=self.openai_api_key)
                 except Exception as e:
                     print(f"Error configurando OpenAI: {str(e)}")
+        
+        self.proveedores = []
+        if self.gemini_model:
+            self.proveedores.append(ProveedorGemini(self.gemini_model))
+        if self.openai_client:
+            self.proveedores.append(ProveedorOpenAI(self.openai_client))
     
     def analyze_part_with_url(self, vehiculo: str, repuesto: str, 
                              numero_parte: str, url: str, 
-                             origen: str, envio: str) -> dict:
+                             origen: str, envio: str, usar_cache: bool = True) -> dict:
         """
         Analiza un repuesto con URL proporcionada
         
@@ -62,24 +84,26 @@ class AIService:
             url: URL del producto
             origen: Puerto de origen
             envio: Tipo de envío
+            usar_cache: False fuerza una consulta nueva (y reemplaza la guardada)
         
         Returns:
             dict: {
                 'success': bool,
                 'response': str,
                 'provider': str,  # 'gemini' o 'openai'
+                'parsed': dict,   # AIParser.parse_response(response)
+                'cached': bool,   # True si vino de la caché
                 'error': str (opcional)
             }
         """
-        prompt = get_omni_parts_prompt_with_url(
+        clave = ai_cache.clave(vehiculo, repuesto, numero_parte, url, origen, envio)
+        return self._analizar(clave, usar_cache, lambda: get_omni_parts_prompt_with_url(
             vehiculo, repuesto, numero_parte, url, origen, envio
-        )
-        
-        return self._generate_response(prompt)
+        ))
     
     def analyze_part_without_url(self, vehiculo: str, repuesto: str,
                                  numero_parte: str, origen: str, 
-                                 envio: str) -> dict:
+                                 envio: str, usar_cache: bool = True) -> dict:
         """
         Analiza un repuesto sin URL (búsqueda en lista blanca)
         
@@ -89,24 +113,57 @@ class AIService:
             numero_parte: Número de parte
             origen: Puerto de origen
             envio: Tipo de envío
+            usar_cache: False fuerza una consulta nueva (y reemplaza la guardada)
         
         Returns:
             dict: {
                 'success': bool,
                 'response': str,
                 'provider': str,
+                'parsed': dict,
+                'cached': bool,
                 'error': str (opcional)
             }
         """
-        prompt = get_omni_parts_prompt_without_url(
+        clave = ai_cache.clave(vehiculo, repuesto, numero_parte, None, origen, envio)
+        return self._analizar(clave, usar_cache, lambda: get_omni_parts_prompt_without_url(
             vehiculo, repuesto, numero_parte, origen, envio
-        )
+        ))
+    
+    def _analizar(self, clave: str, usar_cache: bool, armar_prompt) -> dict:
+        """
+        Responde desde la caché de análisis si la solicitud ya se hizo; si
+        no, consulta a la IA y guarda la respuesta exitosa con su parseo.
+        """
+        if usar_cache:
+            entrada = ai_cache.CacheIA.obtener(clave)
+            if entrada:
+                return {
+                    'success': True,
+                    'response': entrada['response'],
+                    'provider': entrada.get('provider') or 'cache',
+                    'parsed': entrada.get('parsed') or {},
+                    'cached': True
+                }
         
-        return self._generate_response(prompt)
+        resultado = self._generate_response(armar_prompt())
+        resultado['cached'] = False
+        if resultado.get('success') and resultado.get('response'):
+            try:
+                resultado['parsed'] = AIParser().parse_response(resultado['response'])
+            except Exception as e:
+                print(f"Error parseando respuesta de IA: {str(e)}")
+                return resultado
+            ai_cache.CacheIA.guardar(
+                clave, resultado['response'], resultado['parsed'], resultado['provider']
+            )
+        return resultado
     
     def _generate_response(self, prompt: str) -> dict:
         """
-        Genera respuesta usando Gemini o OpenAI
+        Genera respuesta con el primer proveedor que responda: Gemini sale
+        de inmediato y OpenAI si Gemini falla o tarda más que la espera de
+        cobertura (cada uno con su timeout y su circuito).
         
         Args:
             prompt: Prompt completo para la IA
@@ -114,47 +171,12 @@ class AIService:
         Returns:
             dict: Resultado de la generación
         """
-        # Intentar con Gemini primero
-        if self.gemini_model:
-            try:
-                response = self.gemini_model.generate_content(prompt)
-                return {
-                    'success': True,
-                    'response': response.text,
-                    'provider': 'gemini'
-                }
-            except Exception as e:
-                print(f"Error con Gemini: {str(e)}")
-                # Continuar con OpenAI
-        
-        # Fallback a OpenAI
-        if self.openai_client:
-            try:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": "Eres un experto en repuestos automotrices y logística."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7,
-                    max_tokens=2000
-                )
-                return {
-                    'success': True,
-                    'response': response.choices[0].message.content,
-                    'provider': 'openai'
-                }
-            except Exception as e:
-                return {
-                    'success': False,
-                    'response': '',
-                    'provider': 'none',
-                    'error': f"Error con OpenAI: {str(e)}"
-                }
+        if not self.proveedores:
+            return {
+                'success': False,
+                'response': '',
+                'provider': 'none',
+                'error': 'No hay servicios de IA configurados'
+            }
         
-        return {
-            'success': False,
-            'response': '',
-            'provider': 'none',
-            'error': 'No hay servicios de IA configurados'
-        }
+        return ProveedoresIA.generar(prompt, self.proveedores, self.espera_cobertura)
@@ -1,7 +1,8 @@
 """
 Servicio de cálculos de flete y peso volumétrico
+(fachada del motor de flete de services/pricing/freight.py)
 """
-from database.db_manager import DBManager
+from services.pricing.freight import DIVISOR_VOLUMETRICO, TarifasFlete
 
 
 class CalculationService:
@@ -21,14 +22,14 @@ class CalculationService:
         Returns:
             float: Peso volumétrico en kg
         """
-        return (length_cm * width_cm * height_cm) / 5000
+        return (length_cm * width_cm * height_cm) / DIVISOR_VOLUMETRICO
     
     def get_freight_rate(self, origin: str, shipping_type: str) -> dict:
         """
-        Obtiene tarifa de flete desde base de datos
+        Obtiene la tarifa de flete vigente (tabla de tarifas en memoria)
         
         Args:
-            origin: Puerto de origen (Miami, Madrid, Dubai)
+            origin: Puerto de origen (Miami, Madrid)
             shipping_type: Tipo de envío (Aéreo, Marítimo)
         
         Returns:
@@ -39,9 +40,10 @@ class CalculationService:
                 'shipping_type': str
             }
         """
-        rate = DBManager.get_freight_rate(origin, shipping_type)
+        unit = next((u for o, t, u in TarifasFlete.combinaciones()
+                     if o == origin and t == shipping_type), None)
         
-        if not rate:
+        if unit is None:
             return {
                 'rate': 0,
                 'unit': '',
@@ -50,14 +52,8 @@ class CalculationService:
                 'error': 'Tarifa no encontrada'
             }
         
-        # Determinar unidad según origen y tipo
-        if shipping_type == "Aéreo":
-            unit = "$/lb" if origin == "Miami" else "$/kg"
-        else:  # Marítimo
-            unit = "$/ft³"
-        
         return {
-            'rate': rate,
+            'rate': TarifasFlete.tarifa(origin, shipping_type),
             'unit': unit,
             'origin': origin,
             'shipping_type': shipping_type
@@ -73,7 +69,9 @@ class CalculationService:
             origin: Puerto de origen
             shipping_type: Tipo de envío
             actual_weight_kg: Peso real en kg
-            volumetric_weight_kg: Peso volumétrico en kg
+            volumetric_weight_kg: Peso volumétrico en kg (se recalcula
+                                  desde las dimensiones; se conserva por
+                                  compatibilidad)
             length_cm: Largo en cm
             width_cm: Ancho en cm
             height_cm: Alto en cm
@@ -85,50 +83,35 @@ class CalculationService:
                 'weight_type': str,
                 'rate': float,
                 'unit': str,
+                'is_minimum': bool,
                 'calculation_details': str
             }
         """
-        rate_info = self.get_freight_rate(origin, shipping_type)
+        res = TarifasFlete.cotizar(length_cm, width_cm, height_cm, actual_weight_kg,
+                                   origin, shipping_type)
         
-        if 'error' in rate_info:
+        if res['costo'] is None:
             return {
                 'freight_cost': 0,
-                'error': rate_info['error']
+                'error': 'Tarifa no encontrada'
             }
         
-        rate = rate_info['rate']
-        unit = rate_info['unit']
-        
-        # Determinar qué peso usar
-        if shipping_type == "Aéreo":
-            # Aéreo: usar el mayor entre peso real y volumétrico
-            weight_used = max(actual_weight_kg, volumetric_weight_kg)
-            weight_type = "Volumétrico" if volumetric_weight_kg > actual_weight_kg else "Real"
-            
-            if origin == "Miami":
-                # Miami Aéreo: $/lb
-                weight_lb = weight_used * 2.20462
-                freight_cost = weight_lb * rate
-                calculation = f"{weight_lb:.2f} lb × ${rate}/lb = ${freight_cost:.2f}"
-            else:
-                # Madrid Aéreo: $/kg
-                freight_cost = weight_used * rate
-                calculation = f"{weight_used:.2f} kg × ${rate}/kg = ${freight_cost:.2f}"
-        
-        else:  # Marítimo
-            # Marítimo: usar pies cúbicos
-            volume_m3 = (length_cm * width_cm * height_cm) / 1000000
-            volume_ft3 = volume_m3 * 35.3147
-            freight_cost = volume_ft3 * rate
-            weight_used = volume_ft3
+        if res['unidad'] == 'ft³':
             weight_type = "Volumen"
-            calculation = f"{volume_ft3:.2f} ft³ × ${rate}/ft³ = ${freight_cost:.2f}"
+        else:
+            weight_type = "Volumétrico" if res['peso_volumetrico'] > actual_weight_kg else "Real"
+        
+        calculation = (f"{res['facturable']:.2f} {res['unidad']} × ${res['tarifa']}/{res['unidad']}"
+                       f" = ${res['costo']:.2f}")
+        if res['es_minimo']:
+            calculation += " (tarifa mínima)"
         
         return {
-            'freight_cost': round(freight_cost, 2),
-            'weight_used': round(weight_used, 2),
+            'freight_cost': res['costo'],
+            'weight_used': round(res['facturable'], 2),
             'weight_type': weight_type,
-            'rate': rate,
-            'unit': unit,
+            'rate': res['tarifa'],
+            'unit': res['unidad_tarifa'],
+            'is_minimum': res['es_minimo'],
             'calculation_details': calculation
         }
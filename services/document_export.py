@@ -0,0 +1,569 @@
+# services/document_export.py
+# Exportación masiva de documentos: ZIP de PDFs/PNGs por rango de fechas, analista o estado
+"""
+Contabilidad pide los documentos de muchas cotizaciones a la vez. En lugar de
+abrirlas una por una en "Mis Cotizaciones", un trabajo de exportación:
+
+  - Recorre las cotizaciones que cumplen el filtro sin cargarlas todas:
+    cursor del lado del servidor en PostgreSQL (named cursor) y lotes por
+    clave (id > último) en SQLite, donde un cursor abierto durante toda la
+    exportación bloquearía las escrituras de los demás usuarios.
+  - Reutiliza lo ya generado: DocumentCache local, y si no, la versión
+    publicada en DocumentStore (se descarga, no se renderiza). Solo lo que
+    falta va a un pool de procesos propio, separado del de RenderQueue para
+    que una exportación grande no deje sin workers a los analistas.
+  - Escribe el ZIP en streaming (cada página se copia por bloques desde el
+    caché) y lo publica en el backend durable. Como mucho VENTANA documentos
+    están en vuelo a la vez: la memoria no depende del tamaño de la exportación.
+  - Registra el avance en la tabla export_jobs (queued → running → done |
+    failed | cancelled); la UI la consulta para mostrar el progreso.
+
+Se ejecuta una exportación a la vez por proceso; iniciar() devuelve None si
+ya hay una en curso.
+"""
+
+import csv
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+
+from database.db_manager import DBManager, valor_fila
+from services.render_queue import (
+    MINUTOS_VENCIMIENTO, clave_documento, datos_para, precargar_worker, render_documento,
+)
+
+# Documentos que se pueden exportar y su nombre dentro del ZIP
+TIPOS_EXPORTABLES = {
+    'pdf_bcv':       'PDF (Bs BCV)',
+    'pdf_divisas':   'PDF Precio Optimizado (USD)',
+    'png':           'Imagen para mensajería',
+    'cuadro_costos': 'Cuadro de Costos',
+}
+_BASE_ARCHIVO = {
+    'pdf_bcv':       'cotizacion_{n}',
+    'pdf_divisas':   'cotizacion_{n}_divisas',
+    'png':           'cotizacion_{n}',
+    'cuadro_costos': 'cuadro_costos_{n}',
+}
+
+# Prefijo de los ZIP en el backend de DocumentStore
+PREFIJO_EXPORTACIONES = 'exportaciones'
+
+
+def init_export_jobs_table():
+    """
+    Crea la tabla 'export_jobs' si no existe.
+    Compatible con PostgreSQL y SQLite. Idempotente.
+    """
+    is_postgres = DBManager.USE_POSTGRES
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        if is_postgres:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS export_jobs (
+                    id             SERIAL PRIMARY KEY,
+                    creado_por     INTEGER,
+                    filtros        TEXT NOT NULL,
+                    estado         TEXT NOT NULL DEFAULT 'queued',
+                    total          INTEGER DEFAULT 0,
+                    procesadas     INTEGER DEFAULT 0,
+                    documentos     INTEGER DEFAULT 0,
+                    errores        INTEGER DEFAULT 0,
+                    referencia     TEXT,
+                    bytes          BIGINT DEFAULT 0,
+                    error          TEXT,
+                    creado_en      TIMESTAMP DEFAULT NOW(),
+                    actualizado_en TIMESTAMP DEFAULT NOW()
+                )
+            """)
+        else:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS export_jobs (
+                    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+                    creado_por     INTEGER,
+                    filtros        TEXT NOT NULL,
+                    estado         TEXT NOT NULL DEFAULT 'queued',
+                    total          INTEGER DEFAULT 0,
+                    procesadas     INTEGER DEFAULT 0,
+                    documentos     INTEGER DEFAULT 0,
+                    errores        INTEGER DEFAULT 0,
+                    referencia     TEXT,
+                    bytes          INTEGER DEFAULT 0,
+                    error          TEXT,
+                    creado_en      TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        # Filtro por rango de fechas de la exportación (ver _where)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_quotes_created_at ON quotes (created_at)"
+        )
+        conn.commit()
+        cursor.close()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"❌ Error creando tabla export_jobs: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SELECCIÓN DE COTIZACIONES
+# ─────────────────────────────────────────────────────────────────────────────
+def _dia(valor) -> date:
+    """Fecha de un filtro ('YYYY-MM-DD', como se guarda en export_jobs.filtros)."""
+    return valor if isinstance(valor, date) else date.fromisoformat(str(valor)[:10])
+
+
+def _where(filtros: dict, ph: str, alias: str = '') -> tuple:
+    """Cláusula WHERE (sin la palabra) y parámetros para los filtros de la exportación."""
+    condiciones, params = [], []
+    if filtros.get('fecha_desde'):
+        condiciones.append(f"{alias}created_at >= {ph}")
+        params.append(_dia(filtros['fecha_desde']).isoformat())
+    if filtros.get('fecha_hasta'):
+        # Rango semiabierto [desde, hasta + 1 día): usa idx_quotes_created_at,
+        # que DATE(created_at) no puede aprovechar
+        condiciones.append(f"{alias}created_at < {ph}")
+        params.append((_dia(filtros['fecha_hasta']) + timedelta(days=1)).isoformat())
+    if filtros.get('analyst_id'):
+        condiciones.append(f"{alias}analyst_id = {ph}")
+        params.append(filtros['analyst_id'])
+    if filtros.get('status'):
+        condiciones.append(f"{alias}status = {ph}")
+        params.append(filtros['status'])
+    return (' AND '.join(condiciones) or '1=1'), params
+
+
+def contar_cotizaciones(filtros: dict) -> int:
+    """Cantidad de cotizaciones que cumplen los filtros (0 si hay error)."""
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    where, params = _where(filtros, ph)
+    conn = DBManager.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) AS total FROM quotes WHERE {where}", params)
+        row = cursor.fetchone()
+        cursor.close()
+        return int(valor_fila(row, 'total', 0) or 0)
+    except Exception as e:
+        print(f"❌ Error contando cotizaciones a exportar: {e}")
+        return 0
+    finally:
+        conn.close()
+
+
+_COLUMNAS = "q.id, q.quote_number, q.client_name, q.status, q.created_at, q.total_amount, u.full_name"
+
+
+def _fila(row) -> dict:
+    return {
+        'id':           valor_fila(row, 'id', 0),
+        'quote_number': valor_fila(row, 'quote_number', 1),
+        'client_name':  valor_fila(row, 'client_name', 2),
+        'status':       valor_fila(row, 'status', 3),
+        'created_at':   valor_fila(row, 'created_at', 4),
+        'total_amount': valor_fila(row, 'total_amount', 5),
+        'analista':     valor_fila(row, 'full_name', 6),
+    }
+
+
+def iterar_cotizaciones(filtros: dict, lote: int = 200):
+    """
+    Genera las cotizaciones del filtro (dicts con los campos del índice) en
+    orden de id, de a `lote` filas por viaje a la BD.
+    """
+    is_postgres = DBManager.USE_POSTGRES
+    ph = '%s' if is_postgres else '?'
+    where, params = _where(filtros, ph, alias='q.')
+    sql = f"""
+        SELECT {_COLUMNAS}
+        FROM quotes q LEFT JOIN users u ON u.id = q.analyst_id
+        WHERE {where}
+    """
+
+    if is_postgres:
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor(name='export_cotizaciones')
+            cursor.itersize = lote
+            cursor.execute(sql + " ORDER BY q.id", params)
+            while True:
+                filas = cursor.fetchmany(lote)
+                if not filas:
+                    break
+                for row in filas:
+                    yield _fila(row)
+            cursor.close()
+        finally:
+            conn.close()
+        return
+
+    ultimo = 0
+    while True:
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql + f" AND q.id > {ph} ORDER BY q.id LIMIT {ph}",
+                           params + [ultimo, lote])
+            filas = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        if not filas:
+            return
+        for row in filas:
+            yield _fila(row)
+        ultimo = valor_fila(filas[-1], 'id', 0)
+
+
+# Columnas de indice.csv: una fila por documento pedido
+COLUMNAS_INDICE = ['cotizacion', 'cliente', 'analista', 'fecha', 'estado', 'total',
+                   'documento', 'archivos', 'error']
+
+
+def _fila_indice(cot: dict, tipo: str, archivos: int, error: str = '') -> list:
+    return [cot['quote_number'], cot['client_name'], cot['analista'] or '',
+            str(cot['created_at'] or '')[:10], cot['status'], cot['total_amount'] or 0,
+            TIPOS_EXPORTABLES[tipo], archivos, error]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# EXPORTADOR
+# ─────────────────────────────────────────────────────────────────────────────
+class DocumentExport:
+    """Trabajo de exportación en segundo plano (uno a la vez por proceso)."""
+
+    WORKERS = int(os.environ.get('EXPORT_WORKERS', '2'))
+    # Documentos en vuelo (renderizándose o esperando turno para el ZIP)
+    VENTANA = WORKERS * 4
+    # Cada cuántas cotizaciones se guarda el avance en export_jobs
+    CADA = 10
+    TIMEOUT_SEGUNDOS = 300
+    DIRECTORIO = os.path.join(tempfile.gettempdir(), 'logipartve_docs', 'exports')
+
+    _lock = threading.RLock()
+    _hilo = None
+    _tabla_lista = False
+
+    @classmethod
+    def _preparar_tabla(cls):
+        with cls._lock:
+            if not cls._tabla_lista:
+                init_export_jobs_table()
+                cls._tabla_lista = True
+
+    @classmethod
+    def _nuevo_pool(cls):
+        return ProcessPoolExecutor(
+            max_workers=cls.WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=precargar_worker,
+        )
+
+    # ── BD ───────────────────────────────────────────────────────────────────
+    @classmethod
+    def _actualizar(cls, job_id: int, **campos) -> bool:
+        """
+        Actualiza campos del trabajo mientras siga activo. Retorna False si el
+        trabajo ya no está queued/running (p. ej. lo cancelaron desde la UI).
+        """
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        asignaciones = ', '.join(f"{campo} = {ph}" for campo in campos)
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE export_jobs
+                SET {asignaciones}, actualizado_en = CURRENT_TIMESTAMP
+                WHERE id = {ph} AND estado IN ('queued', 'running')
+            """, list(campos.values()) + [job_id])
+            activo = cursor.rowcount > 0
+            conn.commit()
+            cursor.close()
+            return activo
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error actualizando export_jobs {job_id}: {e}")
+            return True
+        finally:
+            conn.close()
+
+    @classmethod
+    def _vencer_pendientes(cls):
+        """Marca como failed las exportaciones sin avance reciente (proceso reiniciado)."""
+        is_postgres = DBManager.USE_POSTGRES
+        limite = (f"NOW() - INTERVAL '{MINUTOS_VENCIMIENTO} minutes'" if is_postgres
+                  else f"datetime('now', '-{MINUTOS_VENCIMIENTO} minutes')")
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE export_jobs
+                SET estado = 'failed', error = 'Exportación interrumpida (proceso reiniciado)',
+                    actualizado_en = CURRENT_TIMESTAMP
+                WHERE estado IN ('queued', 'running') AND actualizado_en < {limite}
+            """)
+            conn.commit()
+            cursor.close()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error venciendo export_jobs: {e}")
+        finally:
+            conn.close()
+
+    # ── Documentos ───────────────────────────────────────────────────────────
+    @staticmethod
+    def _reutilizar(tipo: str, datos: dict, quote_number: str):
+        """
+        Rutas locales del documento si ya existe (caché local o versión
+        publicada en DocumentStore); None si hay que renderizarlo.
+        """
+        from services.document_generation.document_cache import DocumentCache
+        from services.document_generation.document_storage import DocumentStore
+
+        clave = clave_documento(tipo, datos)
+        manifiesto = DocumentCache.obtener(clave)
+        if manifiesto:
+            return manifiesto['rutas']
+        referencia = DocumentStore.referencia(quote_number, clave)
+        if DocumentStore.publicado(referencia):
+            return DocumentStore.paginas(referencia) or None
+        return None
+
+    @classmethod
+    def _escribir(cls, archivo_zip, indice, pendiente) -> int:
+        """
+        Espera (si hace falta) un documento en vuelo y copia sus páginas al
+        ZIP. Retorna la cantidad de archivos agregados.
+        """
+        from services.document_generation.document_storage import DocumentStore
+
+        cot, tipo, rutas, futuro = pendiente
+        numero = re.sub(r'[^A-Za-z0-9_-]', '_', str(cot['quote_number'] or cot['id']))
+        try:
+            if rutas is None:
+                rutas = DocumentStore.paginas(futuro.result(timeout=cls.TIMEOUT_SEGUNDOS))
+            if not rutas:
+                raise RuntimeError("el documento no quedó disponible" if futuro
+                                   else "sin datos para generar")
+            base = _BASE_ARCHIVO[tipo].format(n=numero)
+            for i, ruta in enumerate(rutas, 1):
+                extension = os.path.splitext(ruta)[1]
+                nombre = f"{base}{extension}" if len(rutas) == 1 else f"{base}_p{i}{extension}"
+                archivo_zip.write(ruta, f"{numero}/{nombre}")
+            indice.writerow(_fila_indice(cot, tipo, len(rutas)))
+            return len(rutas)
+        except Exception as e:
+            indice.writerow(_fila_indice(cot, tipo, 0, str(e)[:300]))
+            return 0
+
+    # ── Ejecución ────────────────────────────────────────────────────────────
+    @classmethod
+    def _ejecutar(cls, job_id: int, filtros: dict):
+        """Cuerpo del hilo de exportación."""
+        from services.document_generation.document_storage import DocumentStore
+
+        tipos = [t for t in filtros.get('tipos', ['pdf_bcv']) if t in TIPOS_EXPORTABLES]
+        os.makedirs(cls.DIRECTORIO, exist_ok=True)
+        ruta_zip = os.path.join(cls.DIRECTORIO, f"exportacion_{job_id}.zip")
+        fd, ruta_indice = tempfile.mkstemp(suffix='.csv', dir=cls.DIRECTORIO)
+        pool = None
+        try:
+            total = contar_cotizaciones(filtros)
+            if not cls._actualizar(job_id, estado='running', total=total):
+                return
+
+            pool = cls._nuevo_pool()
+            procesadas = documentos = errores = 0
+            en_vuelo = deque()
+            cancelada = False
+
+            # Los PDF/PNG ya vienen comprimidos: ZIP_STORED evita recomprimirlos
+            with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f_indice, \
+                    zipfile.ZipFile(ruta_zip, 'w', zipfile.ZIP_STORED) as archivo_zip:
+                indice = csv.writer(f_indice)
+                indice.writerow(COLUMNAS_INDICE)
+
+                def vaciar(hasta: int):
+                    nonlocal documentos, errores
+                    while len(en_vuelo) > hasta:
+                        agregados = cls._escribir(archivo_zip, indice, en_vuelo.popleft())
+                        documentos += agregados
+                        errores += 0 if agregados else 1
+
+                for cot in iterar_cotizaciones(filtros):
+                    datos = datos_para(cot['id'], tipos)
+                    for tipo in tipos:
+                        if tipo not in datos:
+                            # Pasa por la ventana igual que los demás: el índice queda en orden
+                            en_vuelo.append((cot, tipo, [], None))
+                            continue
+                        rutas = cls._reutilizar(tipo, datos[tipo], cot['quote_number'])
+                        futuro = None
+                        if rutas is None:
+                            try:
+                                futuro = pool.submit(render_documento, tipo, datos[tipo])
+                            except BrokenProcessPool:
+                                pool.shutdown(wait=False, cancel_futures=True)
+                                pool = cls._nuevo_pool()
+                                futuro = pool.submit(render_documento, tipo, datos[tipo])
+                        en_vuelo.append((cot, tipo, rutas, futuro))
+                        vaciar(cls.VENTANA)
+
+                    procesadas += 1
+                    if procesadas % cls.CADA == 0:
+                        if not cls._actualizar(job_id, procesadas=procesadas,
+                                               documentos=documentos, errores=errores):
+                            cancelada = True
+                            break
+                if not cancelada:
+                    vaciar(0)
+                    archivo_zip.write(ruta_indice, 'indice.csv')
+
+            if cancelada:
+                return
+
+            # Publicar en el backend durable (subida por bloques)
+            nombre = f"exportacion_{job_id}_{filtros.get('fecha_desde') or 'inicio'}_" \
+                     f"{filtros.get('fecha_hasta') or 'hoy'}.zip"
+            referencia = f"{PREFIJO_EXPORTACIONES}/{nombre}"
+            with open(ruta_zip, 'rb') as f:
+                DocumentStore.backend().escribir(referencia, f)
+            cls._actualizar(job_id, estado='done', procesadas=procesadas,
+                            documentos=documentos, errores=errores,
+                            referencia=referencia, bytes=os.path.getsize(ruta_zip))
+        except Exception as e:
+            print(f"❌ Error en exportación {job_id}: {e}")
+            cls._actualizar(job_id, estado='failed', error=str(e)[:500])
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+            for ruta in (ruta_zip, ruta_indice):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+    # ── API ──────────────────────────────────────────────────────────────────
+    @classmethod
+    def iniciar(cls, filtros: dict, creado_por: int = None):
+        """
+        Crea y lanza una exportación. `filtros`: fecha_desde / fecha_hasta
+        ('YYYY-MM-DD'), analyst_id, status y tipos (claves de TIPOS_EXPORTABLES).
+
+        Retorna el ID del trabajo, o None si ya hay una exportación en curso
+        en este proceso o no se pudo registrar.
+        """
+        cls._preparar_tabla()
+        is_postgres = DBManager.USE_POSTGRES
+        ph = '%s' if is_postgres else '?'
+        with cls._lock:
+            if cls._hilo is not None and cls._hilo.is_alive():
+                return None
+            cls._vencer_pendientes()
+
+            conn = DBManager.get_connection()
+            try:
+                cursor = conn.cursor()
+                sql = f"INSERT INTO export_jobs (creado_por, filtros) VALUES ({ph}, {ph})"
+                valores = (creado_por, json.dumps(filtros, ensure_ascii=False))
+                if is_postgres:
+                    cursor.execute(sql + " RETURNING id", valores)
+                    job_id = cursor.fetchone()['id']
+                else:
+                    cursor.execute(sql, valores)
+                    job_id = cursor.lastrowid
+                conn.commit()
+                cursor.close()
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Error registrando exportación: {e}")
+                return None
+            finally:
+                conn.close()
+
+            cls._hilo = threading.Thread(target=cls._ejecutar, args=(job_id, filtros),
+                                         name=f'export-{job_id}', daemon=True)
+            cls._hilo.start()
+            return job_id
+
+    @classmethod
+    def cancelar(cls, job_id: int) -> bool:
+        """Pide detener la exportación; el hilo se detiene en el siguiente guardado de avance."""
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE export_jobs SET estado = 'cancelled', actualizado_en = CURRENT_TIMESTAMP
+                WHERE id = {ph} AND estado IN ('queued', 'running')
+            """, (job_id,))
+            cancelada = cursor.rowcount > 0
+            conn.commit()
+            cursor.close()
+            return cancelada
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error cancelando exportación {job_id}: {e}")
+            return False
+        finally:
+            conn.close()
+
+    @classmethod
+    def recientes(cls, limite: int = 10) -> list:
+        """Últimas exportaciones, más reciente primero (lista de dicts)."""
+        cls._preparar_tabla()
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, filtros, estado, total, procesadas, documentos, errores,
+                       referencia, bytes, error, creado_en
+                FROM export_jobs
+                ORDER BY id DESC
+                LIMIT {ph}
+            """, (limite,))
+            rows = cursor.fetchall()
+            cursor.close()
+        except Exception as e:
+            print(f"❌ Error consultando export_jobs: {e}")
+            rows = []
+        finally:
+            conn.close()
+
+        campos = ('id', 'filtros', 'estado', 'total', 'procesadas', 'documentos',
+                  'errores', 'referencia', 'bytes', 'error', 'creado_en')
+        trabajos = []
+        for row in rows:
+            trabajo = {campo: valor_fila(row, campo, i) for i, campo in enumerate(campos)}
+            try:
+                trabajo['filtros'] = json.loads(trabajo['filtros'] or '{}')
+            except ValueError:
+                trabajo['filtros'] = {}
+            trabajos.append(trabajo)
+        return trabajos
+
+    @classmethod
+    def en_curso(cls) -> bool:
+        with cls._lock:
+            return cls._hilo is not None and cls._hilo.is_alive()
+
+    @staticmethod
+    def abrir(referencia: str):
+        """Stream de lectura del ZIP publicado; el llamador debe cerrarlo."""
+        from services.document_generation.document_storage import DocumentStore
+        return DocumentStore.backend().abrir(referencia)
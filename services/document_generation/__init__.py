@@ -5,5 +5,8 @@ Módulo de generación de documentos para LogiPartVE Pro
 
 from .pdf_generator import PDFQuoteGenerator, clean_text
 from .png_generator import PNGQuoteGenerator
+from .document_cache import DocumentCache
+from .document_storage import DocumentStore
+from .assets import DocumentAssets
 
-__all__ = ['PDFQuoteGenerator', 'PNGQuoteGenerator', 'clean_text']
+__all__ = ['PDFQuoteGenerator', 'PNGQuoteGenerator', 'DocumentCache', 'DocumentStore', 'DocumentAssets', 'clean_text']
@@ -0,0 +1,179 @@
+# services/document_generation/assets.py
+"""
+Registro de recursos de los generadores de documentos, compartido por todo
+el proceso.
+
+Fuentes, logos y estilos no cambian entre cotizaciones: se resuelven y
+decodifican una sola vez por proceso y cada documento solo los referencia.
+
+- Fuentes TrueType (ImageFont) por tamaño/peso, para el Cuadro de Costos.
+- Logos decodificados y pre-escalados al tamaño en que se dibujan
+  (ImageReader para ReportLab, RGBA de Pillow para el Cuadro de Costos).
+  Los originales miden hasta 1.2 MB; incrustarlos a tamaño completo en cada
+  PDF era la mayor parte del tiempo de generación.
+- Iconos pre-escalados escritos en disco: el marcado <img src="..."/> de
+  Paragraph solo acepta rutas.
+- Cualquier otro objeto costoso de construir (estilos) vía obtener().
+"""
+
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from PIL import Image, ImageFont
+
+
+# Resolución a la que se pre-escalan los logos del PDF: la misma del PNG de
+# la cotización, así que la imagen rasterizada no pierde calidad.
+DPI_LOGOS = 300
+
+FUENTES_BOLD = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
+    "/usr/share/fonts/truetype/freefont/FreeSansBold.ttf",
+]
+FUENTES_REGULAR = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
+]
+
+
+def _buscar_logo(nombre_archivo: str):
+    """Busca el logo en las ubicaciones posibles. None si no existe."""
+    posibles = [
+        Path(__file__).parent.parent.parent / "assets" / "logos" / nombre_archivo,
+        Path("/app/assets/logos") / nombre_archivo,
+        Path("/tmp/logipartve-v7/assets/logos") / nombre_archivo,
+        Path.cwd() / "assets" / "logos" / nombre_archivo,
+    ]
+    for ruta in posibles:
+        if ruta.exists():
+            return str(ruta)
+    return None
+
+
+class DocumentAssets:
+    """Caché de recursos por proceso. Todo se crea bajo demanda y se reutiliza."""
+
+    DIRECTORIO = os.path.join(tempfile.gettempdir(), 'logipartve_docs', 'assets')
+
+    _lock = threading.RLock()
+    _objetos = {}
+
+    @classmethod
+    def obtener(cls, clave, fabrica):
+        """Retorna el objeto registrado bajo `clave`, construyéndolo con fabrica() la primera vez."""
+        try:
+            return cls._objetos[clave]
+        except KeyError:
+            pass
+        with cls._lock:
+            if clave not in cls._objetos:
+                cls._objetos[clave] = fabrica()
+            return cls._objetos[clave]
+
+    # ── Fuentes ──────────────────────────────────────────────────────────────
+    @classmethod
+    def fuente(cls, size: int, bold: bool = False):
+        """ImageFont del sistema (o la de Pillow por defecto) para tamaño y peso."""
+        def cargar():
+            for ruta in (FUENTES_BOLD if bold else FUENTES_REGULAR):
+                if os.path.exists(ruta):
+                    try:
+                        return ImageFont.truetype(ruta, size)
+                    except Exception:
+                        continue
+            return ImageFont.load_default()
+        return cls.obtener(('fuente', size, bold), cargar)
+
+    # ── Logos ────────────────────────────────────────────────────────────────
+    @classmethod
+    def ruta_logo(cls, nombre_archivo: str):
+        """Ruta del logo original, resuelta una vez por proceso."""
+        return cls.obtener(('ruta', nombre_archivo), lambda: _buscar_logo(nombre_archivo))
+
+    @classmethod
+    def _escalar(cls, nombre_archivo: str, ancho: int, alto: int):
+        """Logo original en RGBA reducido a (ancho, alto) píxeles. None si no existe."""
+        ruta = cls.ruta_logo(nombre_archivo)
+        if not ruta:
+            return None
+        with Image.open(ruta) as original:
+            imagen = original.convert('RGBA')
+        if imagen.width > ancho or imagen.height > alto:
+            imagen = imagen.resize((ancho, alto), Image.LANCZOS)
+        return imagen
+
+    @staticmethod
+    def _pixeles(puntos: float) -> int:
+        return max(1, round(puntos / 72.0 * DPI_LOGOS))
+
+    @classmethod
+    def logo_pdf(cls, nombre_archivo: str, ancho_pt: float, alto_pt: float):
+        """
+        ImageReader del logo pre-escalado a DPI_LOGOS para dibujarlo en
+        ancho_pt × alto_pt puntos. None si el logo no existe.
+        """
+        from reportlab.lib.utils import ImageReader
+
+        def cargar():
+            imagen = cls._escalar(nombre_archivo, cls._pixeles(ancho_pt), cls._pixeles(alto_pt))
+            if imagen is None:
+                return None
+            lector = ImageReader(imagen)
+            lector.getRGBData()  # decodifica ahora, no en el primer documento
+            return lector
+        return cls.obtener(('logo_pdf', nombre_archivo, ancho_pt, alto_pt), cargar)
+
+    @classmethod
+    def icono_pdf(cls, nombre_archivo: str, lado_pt: float):
+        """
+        Ruta de una copia pre-escalada del icono (cuadrado de lado_pt puntos)
+        para usar en <img src="..."/>. None si el icono no existe.
+        """
+        def cargar():
+            lado = cls._pixeles(lado_pt)
+            imagen = cls._escalar(nombre_archivo, lado, lado)
+            if imagen is None:
+                return None
+            base = os.path.splitext(nombre_archivo)[0]
+            ruta = os.path.join(cls.DIRECTORIO, f"{base}_{lado}px.png")
+            if not os.path.exists(ruta):
+                os.makedirs(cls.DIRECTORIO, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=cls.DIRECTORIO, prefix='.tmp-')
+                with os.fdopen(fd, 'wb') as f:
+                    imagen.save(f, 'PNG')
+                os.replace(tmp, ruta)
+            return ruta
+        return cls.obtener(('icono_pdf', nombre_archivo, lado_pt), cargar)
+
+    @classmethod
+    def logo_png(cls, nombre_archivo: str, alto: int):
+        """Logo RGBA de Pillow a `alto` píxeles (ancho proporcional). None si no existe."""
+        def cargar():
+            ruta = cls.ruta_logo(nombre_archivo)
+            if not ruta:
+                return None
+            with Image.open(ruta) as original:
+                imagen = original.convert('RGBA')
+            ancho = int(imagen.width * alto / imagen.height)
+            return imagen.resize((ancho, alto), Image.LANCZOS)
+        return cls.obtener(('logo_png', nombre_archivo, alto), cargar)
+
+    # ── Precarga ─────────────────────────────────────────────────────────────
+    @classmethod
+    def precargar(cls):
+        """
+        Calienta el registro con los recursos de todas las plantillas. Se usa
+        como initializer de los procesos de render: el primer documento de
+        cada worker ya no paga la carga.
+        """
+        try:
+            from .pdf_generator import precargar_recursos as precargar_pdf
+            from .cuadro_costos_generator import precargar_recursos as precargar_cuadro
+            precargar_pdf()
+            precargar_cuadro()
+        except Exception as e:
+            print(f"❌ Error precargando recursos de documentos: {e}")
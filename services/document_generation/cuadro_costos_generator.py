@@ -3,10 +3,18 @@ Generador del CUADRO DE COSTOS para LogiPartVE Pro
 Formato HORIZONTAL: conceptos en filas, ítems en columnas.
 Genera un PNG de alta calidad para uso interno administrativo
 (envío por WhatsApp al grupo admin).
+
+Los anchos de columna salen de las métricas del texto (cacheadas por
+fuente y texto) y, si los ítems no caben en ANCHO_MAX, el cuadro se
+reparte en varias hojas/imágenes.
 """
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+import io
+import math
 import os
+from functools import lru_cache
+from .assets import DocumentAssets
 from datetime import datetime
 try:
     import sys as _sys, os as _os2
@@ -34,24 +42,21 @@ COLOR_TOTAL_BG    = (0,   80,  160)   # fondo celda TOTAL COMPRA en header
 
 
 def _get_font(size: int, bold: bool = False):
-    """Carga una fuente del sistema o usa la fuente por defecto de Pillow."""
-    paths_bold = [
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-        "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
-        "/usr/share/fonts/truetype/freefont/FreeSansBold.ttf",
-    ]
-    paths_reg = [
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-        "/usr/share/fonts/truetype/freefont/FreeSans.ttf",
-    ]
-    for path in (paths_bold if bold else paths_reg):
-        if os.path.exists(path):
-            try:
-                return ImageFont.truetype(path, size)
-            except Exception:
-                continue
-    return ImageFont.load_default()
+    """Fuente del sistema (o la de Pillow por defecto), cargada una vez por proceso."""
+    return DocumentAssets.fuente(size, bold)
+
+
+# Fuentes y logo que usa el cuadro (ver precargar_recursos)
+FUENTES_CUADRO = [(26, True), (17, True), (16, True), (13, True), (12, True), (12, False), (10, False)]
+LOGO_CUADRO = "LOGOLogiPartVE.png"
+ALTO_LOGO = 65
+
+
+def precargar_recursos():
+    """Carga en DocumentAssets las fuentes y el logo del Cuadro de Costos."""
+    for size, bold in FUENTES_CUADRO:
+        _get_font(size, bold)
+    DocumentAssets.logo_png(LOGO_CUADRO, ALTO_LOGO)
 
 
 def _fmt_usd(valor) -> str:
@@ -68,9 +73,68 @@ def _fmt_pct(valor) -> str:
         return "0.0%"
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# DIMENSIONES Y CONCEPTOS
+# ─────────────────────────────────────────────────────────────────────────────
+MARGEN        = 36
+ALTO_FILA     = 28
+ALTO_HEADER_T = 44    # fila de encabezado de ítems (nombres de columna)
+COL0_W        = 260   # ancho mínimo de la columna de conceptos
+COL_ITEM_W    = 160   # ancho mínimo de cada columna de ítem
+ALTO_CABECERA = 175   # altura del bloque de encabezado superior
+ALTO_PIE      = 44
+ANCHO_MIN     = 900
+PADDING_CELDA = 8
+
+# Presupuesto de ancho de cada imagen. Con columnas de COL_ITEM_W caben 12
+# ítems; las cotizaciones más grandes se reparten en varias hojas (una
+# imagen por hoja, todas con la columna de conceptos) en lugar de producir
+# una sola imagen de miles de píxeles que WhatsApp reduce hasta ser ilegible.
+ANCHO_MAX = 2400
+
+# Nivel zlib del PNG: optimize=True costaba más que dibujar la hoja entera
+COMPRESION_PNG = 6
+
+# Conceptos de costo (etiqueta, clave_valor, es_total)
+# clave_valor se usa para extraer el dato del dict del ítem
+CONCEPTOS = [
+    ("Cantidad de Repuestos",        "cantidad",          False),
+    ("Costo FOB Unitario",            "costo_fob",         False),
+    ("Costo FOB Total",               "fob_total",         False),
+    ("Handling (Internacional)",      "costo_handling",    False),
+    ("Manejo (Nacional)",             "costo_manejo",      False),
+    ("Impuesto Internacional",        "costo_impuesto",    False),
+    ("Utilidad",                      "utilidad_valor",    False),
+    ("Envío",                         "costo_envio",       False),
+    ("TAX",                           "costo_tax",         False),
+    ("Diferencial de Cambio",         "diferencial_valor", False),
+    ("Precio USD (Pago en Dólares)",  "precio_usd",        True),
+    ("VE Precio Bs",                  "precio_bs",         True),
+]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# MÉTRICAS DE TEXTO
+# ─────────────────────────────────────────────────────────────────────────────
+@lru_cache(maxsize=8192)
+def _medir(font, texto: str) -> tuple:
+    """
+    Caja (x0, y0, x1, y1) de `texto` dibujado con `font`, igual que
+    draw.textbbox((0, 0), ...). Las fuentes son únicas por proceso
+    (DocumentAssets), así que la fuente sirve de clave junto al texto: las
+    etiquetas, encabezados y montos repetidos se miden una sola vez.
+    """
+    return font.getbbox(texto)
+
+
+def _ancho_texto(font, texto: str) -> int:
+    x0, _, x1, _ = _medir(font, texto)
+    return x1 - x0
+
+
 def _draw_text_centered(draw, text, x, y, w, h, font, color):
     """Dibuja texto centrado dentro de un rectángulo (x, y, x+w, y+h)."""
-    bbox = draw.textbbox((0, 0), text, font=font)
+    bbox = _medir(font, text)
     tw = bbox[2] - bbox[0]
     th = bbox[3] - bbox[1]
     tx = x + (w - tw) // 2
@@ -80,32 +144,326 @@ def _draw_text_centered(draw, text, x, y, w, h, font, color):
 
 def _draw_text_right(draw, text, x, y, w, h, font, color):
     """Dibuja texto alineado a la derecha dentro de un rectángulo."""
-    bbox = draw.textbbox((0, 0), text, font=font)
+    bbox = _medir(font, text)
     tw = bbox[2] - bbox[0]
     th = bbox[3] - bbox[1]
-    tx = x + w - tw - 8
+    tx = x + w - tw - PADDING_CELDA
     ty = y + (h - th) // 2
     draw.text((tx, ty), text, font=font, fill=color)
 
 
 def _draw_text_left(draw, text, x, y, w, h, font, color):
     """Dibuja texto alineado a la izquierda dentro de un rectángulo."""
-    bbox = draw.textbbox((0, 0), text, font=font)
+    bbox = _medir(font, text)
     th = bbox[3] - bbox[1]
     ty = y + (h - th) // 2
-    draw.text((x + 8, ty), text, font=font, fill=color)
+    draw.text((x + PADDING_CELDA, ty), text, font=font, fill=color)
+
+
+_DIBUJAR = {'centro': _draw_text_centered, 'derecha': _draw_text_right, 'izquierda': _draw_text_left}
+
+
+def _etiqueta_concepto(concepto: str, clave: str, items: list) -> str:
+    """Etiqueta de la columna 0, con el porcentaje/factor del primer ítem si aplica."""
+    if not items:
+        return concepto
+    if clave == "costo_impuesto":
+        return f"{concepto} ({_fmt_pct(items[0].get('impuesto_porcentaje', 0))})"
+    if clave == "costo_tax":
+        return f"{concepto} ({_fmt_pct(items[0].get('tax_porcentaje', 7.0))})"
+    if clave == "diferencial_valor":
+        return f"{concepto} ({_fmt_pct(items[0].get('diferencial_porcentaje', 0))})"
+    if clave == "utilidad_valor":
+        return f"{concepto} (Factor {float(items[0].get('factor_utilidad', 1.0)):.4f})"
+    if clave == "precio_bs":
+        return f"{concepto} ({'con IVA' if items[0].get('aplicar_iva', False) else 'sin IVA'})"
+    return concepto
+
+
+def _total_compra(items: list) -> float:
+    # CORRECCIÓN (orden 2026-70865-D): usar el campo 'precio_usd' (total_cost guardado
+    # en BD) como fuente de verdad, en lugar de recalcular sumando los componentes
+    # individuales. Esto garantiza que el Cuadro de Costos muestre exactamente el mismo
+    # valor que el Mensaje USD y el PNG Precio Optimizado, que también usan total_cost.
+    #
+    # ANTES: suma fob+handling+manejo+impuesto+utilidad+envio+tax → podía diferir
+    #        del total_cost guardado por diferencias de redondeo en componentes.
+    # AHORA: suma directa de precio_usd (= total_cost ya redondeado al ×5 en BD)
+    #        → siempre igual al precio que el cliente aprobó.
+    total = 0.0
+    for item in items:
+        # precio_usd es el campo que guarda analyst_panel al crear el ítem:
+        # precio_usd_total_redondeado = ceil(fob+handling+...+tax / 5) * 5
+        # Es la fuente de verdad: el precio que se le cotizó al cliente.
+        pv = float(item.get('precio_usd', 0) or 0)
+        if pv == 0:
+            # Fallback para ítems antiguos sin precio_usd: recalcular desde componentes
+            pv = (
+                float(item.get('fob_total',       0) or 0) +
+                float(item.get('costo_handling',  0) or 0) +
+                float(item.get('costo_manejo',    0) or 0) +
+                float(item.get('costo_impuesto',  0) or 0) +
+                float(item.get('utilidad_valor',  0) or 0) +
+                float(item.get('costo_envio',     0) or 0) +
+                float(item.get('costo_tax',       0) or 0)
+            )
+        total += pv
+    # Redondear al múltiplo de 5 (precio_usd ya viene redondeado, pero por si acaso)
+    return math.ceil(total / 5) * 5 if total > 0 else 0.0
 
 
-def generar_cuadro_costos_png(quote_data: dict, items: list, output_path: str) -> str:
+# ─────────────────────────────────────────────────────────────────────────────
+# LAYOUT
+# ─────────────────────────────────────────────────────────────────────────────
+def _paginar_columnas(col0_w: int, anchos: list) -> list:
+    """
+    Reparte las columnas de ítems en hojas que respeten ANCHO_MAX.
+    Retorna [(inicio, fin), ...] (fin exclusivo), con al menos un ítem por
+    hoja. Las hojas se equilibran: 13 ítems son 7 + 6, no 12 + 1.
+    """
+    disponible = ANCHO_MAX - MARGEN * 2 - col0_w
+
+    def repartir(max_por_hoja):
+        hojas, inicio, usado = [], 0, 0
+        for i, ancho in enumerate(anchos):
+            if i > inicio and (usado + ancho > disponible or i - inicio >= max_por_hoja):
+                hojas.append((inicio, i))
+                inicio, usado = i, 0
+            usado += ancho
+        hojas.append((inicio, len(anchos)))
+        return hojas
+
+    hojas = repartir(len(anchos) or 1)
+    if len(hojas) > 1:
+        equilibradas = repartir(math.ceil(len(anchos) / len(hojas)))
+        if len(equilibradas) == len(hojas):
+            hojas = equilibradas
+    return hojas
+
+
+def _layout_cuadro(items: list, fuentes: dict) -> dict:
+    """
+    Textos, fuentes y anchos de la tabla, calculados una vez para todas las
+    hojas. Cada columna mide lo que su texto más ancho (con las métricas
+    cacheadas de _medir), nunca menos que COL0_W / COL_ITEM_W.
     """
-    Genera el PNG del Cuadro de Costos en formato HORIZONTAL.
+    filas = []
+    col0_w = COL0_W
+    for concepto, clave, es_total in CONCEPTOS:
+        label = _etiqueta_concepto(concepto, clave, items)
+        font = fuentes['valor_b'] if es_total else fuentes['concepto']
+        col0_w = max(col0_w, _ancho_texto(font, label) + PADDING_CELDA * 2)
+        filas.append({
+            'label': label, 'clave': clave, 'es_total': es_total,
+            'font': font, 'color': COLOR_VERDE if es_total else COLOR_GRIS_OSC,
+        })
+
+    encabezados, celdas, anchos = [], [], []
+    for idx, item in enumerate(items):
+        titulo = f"ÍTEM #{idx+1}"
+        desc = item.get('descripcion', item.get('description', f'Ítem #{idx+1}'))
+        # Truncar descripción si es muy larga
+        if len(desc) > 18:
+            desc = desc[:16] + "…"
+        encabezados.append((titulo, desc))
+
+        ancho = max(COL_ITEM_W, _ancho_texto(fuentes['th'], titulo) + PADDING_CELDA * 2)
+        columna = []
+        for fila in filas:
+            raw = item.get(fila['clave'], 0) or 0
+            font = fuentes['valor_b'] if fila['es_total'] else fuentes['valor']
+            if fila['clave'] == "cantidad":
+                txt, alineacion = str(int(float(raw))), 'centro'
+                color = COLOR_VERDE if fila['es_total'] else COLOR_GRIS_OSC
+            else:
+                txt, alineacion = _fmt_usd(raw), 'derecha'
+                color = COLOR_VERDE if fila['es_total'] else COLOR_AZUL
+            ancho = max(ancho, _ancho_texto(font, txt) + PADDING_CELDA * 2)
+            columna.append((txt, alineacion, font, color))
+        celdas.append(columna)
+        anchos.append(ancho)
+
+    return {
+        'filas': filas, 'encabezados': encabezados, 'celdas': celdas,
+        'col0_w': col0_w, 'anchos': anchos,
+        'hojas': _paginar_columnas(col0_w, anchos),
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# DIBUJO DE UNA HOJA
+# ─────────────────────────────────────────────────────────────────────────────
+def _dibujar_hoja(cabecera: dict, layout: dict, fuentes: dict, hoja: int):
+    """Imagen Pillow de la hoja `hoja` (base 0) del Cuadro de Costos."""
+    inicio, fin = layout['hojas'][hoja]
+    n_hojas  = len(layout['hojas'])
+    col0_w   = layout['col0_w']
+    anchos   = layout['anchos'][inicio:fin]
+    n_filas  = len(layout['filas'])
+
+    # ── Ancho total de la imagen ─────────────────────────────────────────────
+    TABLA_W  = col0_w + sum(anchos)
+    ANCHO    = max(MARGEN * 2 + TABLA_W, ANCHO_MIN)
+    # Centrar la tabla si la imagen es más ancha
+    tabla_x  = (ANCHO - TABLA_W) // 2
+
+    # ── Alto total de la imagen ──────────────────────────────────────────────
+    ALTO_TABLA = ALTO_HEADER_T + n_filas * ALTO_FILA
+    ALTO       = ALTO_CABECERA + ALTO_TABLA + ALTO_PIE + 20
+
+    # Borde izquierdo de cada columna de ítem de esta hoja
+    xs = []
+    x = tabla_x + col0_w
+    for ancho in anchos:
+        xs.append(x)
+        x += ancho
+
+    # ── Crear imagen ─────────────────────────────────────────────────────────
+    img  = Image.new("RGB", (ANCHO, ALTO), COLOR_BLANCO)
+    draw = ImageDraw.Draw(img)
+
+    # ════════════════════════════════════════════════════════════════════════
+    # BLOQUE CABECERA
+    # ════════════════════════════════════════════════════════════════════════
+
+    # Banda azul oscuro superior
+    draw.rectangle([(0, 0), (ANCHO, 85)], fill=COLOR_AZUL)
+
+    # Logo
+    try:
+        logo = DocumentAssets.logo_png(LOGO_CUADRO, ALTO_LOGO)
+        if logo is not None:
+            img.paste(logo, (MARGEN, 10), logo)
+    except Exception:
+        pass
+
+    # Título centrado en la banda
+    subtitulo = f"COTIZACIÓN: {cabecera['quote_number']}"
+    if n_hojas > 1:
+        subtitulo += f"  •  HOJA {hoja + 1} DE {n_hojas}"
+    _draw_text_centered(draw, "CUADRO DE COSTOS",
+                        0, 8, ANCHO, 38, fuentes['titulo'], COLOR_BLANCO)
+    _draw_text_centered(draw, subtitulo,
+                        0, 50, ANCHO, 30, fuentes['subtitulo'], COLOR_NARANJA)
+
+    # Banda naranja delgada
+    draw.rectangle([(0, 85), (ANCHO, 91)], fill=COLOR_NARANJA)
+
+    # ── Fila de info: CLIENTE | VEHÍCULO | FECHA | TOTAL COMPRA ──────────────
+    y_info = 98
+    H_INFO = 70
+
+    # Dividir en 4 bloques: los 3 primeros iguales, el 4to más ancho
+    bloque_w = (ANCHO - MARGEN * 2) // 4
+
+    campos = [
+        ("CLIENTE:",   cabecera['client_name']),
+        ("VEHÍCULO:",  cabecera['client_vehicle'] or "—"),
+        ("FECHA:",     cabecera['fecha']),
+    ]
+    for i, (lbl, val) in enumerate(campos):
+        bx = MARGEN + i * bloque_w
+        draw.text((bx, y_info),      lbl, font=fuentes['info_lbl'], fill=COLOR_AZUL)
+        draw.text((bx, y_info + 20), val, font=fuentes['info_val'], fill=COLOR_GRIS_OSC)
+
+    # Bloque TOTAL COMPRA (esquina superior derecha): total de la cotización
+    # completa, también en las hojas que solo muestran parte de los ítems
+    tc_x = MARGEN + bloque_w * 3
+    tc_w = ANCHO - MARGEN - tc_x
+    # Fondo destacado
+    draw.rectangle([(tc_x - 8, y_info - 6), (ANCHO - MARGEN + 8, y_info + H_INFO - 10)],
+                   fill=COLOR_TOTAL_BG, outline=COLOR_NARANJA, width=2)
+    _draw_text_centered(draw, "TOTAL COMPRA",
+                        tc_x - 8, y_info - 6, tc_w + 16, 24, fuentes['total_lbl'], COLOR_NARANJA)
+    _draw_text_centered(draw, _fmt_usd(cabecera['total_compra']),
+                        tc_x - 8, y_info + 18, tc_w + 16, 36, fuentes['total_val'], COLOR_BLANCO)
+
+    # Línea separadora
+    y_sep = y_info + H_INFO
+    draw.rectangle([(MARGEN, y_sep), (ANCHO - MARGEN, y_sep + 2)], fill=COLOR_AZUL_MED)
+
+    # ════════════════════════════════════════════════════════════════════════
+    # TABLA HORIZONTAL
+    # ════════════════════════════════════════════════════════════════════════
+    # Fondos y líneas van en primitivas de tabla completa (un rectángulo por
+    # fila, una línea por columna) en lugar de una por celda; el resultado es
+    # el mismo que con celdas sueltas.
+    y_tabla = y_sep + 10
+    y_datos = y_tabla + ALTO_HEADER_T
+    y_fin   = y_datos + n_filas * ALTO_FILA
+
+    # ── Fila de encabezado de ítems ──────────────────────────────────────────
+    draw.rectangle([(tabla_x, y_tabla), (tabla_x + col0_w, y_datos)], fill=COLOR_AZUL)
+    if anchos:
+        draw.rectangle([(xs[0], y_tabla), (tabla_x + TABLA_W, y_datos)], fill=COLOR_AZUL_MED)
+    _draw_text_centered(draw, "CONCEPTO / ÍTEM",
+                        tabla_x, y_tabla, col0_w, ALTO_HEADER_T,
+                        fuentes['th'], COLOR_BLANCO)
+    for cx, ancho, (titulo, desc) in zip(xs, anchos, layout['encabezados'][inicio:fin]):
+        # Número de ítem y descripción truncada
+        _draw_text_centered(draw, titulo,
+                            cx, y_tabla, ancho, 20, fuentes['th'], COLOR_BLANCO)
+        _draw_text_centered(draw, desc,
+                            cx, y_tabla + 20, ancho, ALTO_HEADER_T - 20,
+                            fuentes['desc'], COLOR_BLANCO)
+
+    # Borde inferior del encabezado
+    draw.line([(tabla_x, y_datos), (tabla_x + TABLA_W, y_datos)],
+              fill=COLOR_BLANCO, width=2)
+
+    # ── Filas de datos ───────────────────────────────────────────────────────
+    for fila_idx, fila in enumerate(layout['filas']):
+        y_fila = y_datos + fila_idx * ALTO_FILA
+        if fila['es_total']:
+            bg = COLOR_VERDE_SUAVE
+        elif fila_idx % 2 == 0:
+            bg = COLOR_FILA_PAR
+        else:
+            bg = COLOR_FILA_IMPAR
+        draw.rectangle([(tabla_x, y_fila), (tabla_x + TABLA_W, y_fila + ALTO_FILA)], fill=bg)
+
+    # Línea divisoria col 0 / datos y separadores verticales entre ítems
+    for x_linea in [tabla_x + col0_w] + [cx + ancho for cx, ancho in zip(xs, anchos)]:
+        draw.line([(x_linea, y_datos), (x_linea, y_fin)], fill=COLOR_GRIS_CLARO, width=1)
+    # Línea horizontal inferior (las de las demás filas las cubre el fondo
+    # de la fila siguiente)
+    draw.line([(tabla_x, y_fin), (tabla_x + TABLA_W, y_fin)], fill=COLOR_GRIS_CLARO, width=1)
+
+    # ── Textos: col 0 (concepto) y valores por ítem ──────────────────────────
+    for fila_idx, fila in enumerate(layout['filas']):
+        y_fila = y_datos + fila_idx * ALTO_FILA
+        _draw_text_left(draw, fila['label'],
+                        tabla_x, y_fila, col0_w, ALTO_FILA, fila['font'], fila['color'])
+        for cx, ancho, columna in zip(xs, anchos, layout['celdas'][inicio:fin]):
+            txt, alineacion, font, color = columna[fila_idx]
+            _DIBUJAR[alineacion](draw, txt, cx, y_fila, ancho, ALTO_FILA, font, color)
+
+    # ── Borde exterior de la tabla ───────────────────────────────────────────
+    draw.rectangle([(tabla_x, y_tabla), (tabla_x + TABLA_W, y_fin)],
+                   outline=COLOR_AZUL_MED, width=2)
+
+    # ════════════════════════════════════════════════════════════════════════
+    # PIE DE PÁGINA
+    # ════════════════════════════════════════════════════════════════════════
+    y_pie = ALTO - ALTO_PIE
+    draw.rectangle([(0, y_pie), (ANCHO, ALTO)], fill=COLOR_AZUL)
+    _draw_text_centered(draw, cabecera['pie'], 0, y_pie, ANCHO, ALTO_PIE,
+                        fuentes['pie'], COLOR_BLANCO)
+    return img
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# API
+# ─────────────────────────────────────────────────────────────────────────────
+def render_cuadro_costos_paginas(quote_data: dict, items: list) -> list:
+    """
+    Genera el Cuadro de Costos en formato HORIZONTAL, en memoria.
 
     Layout:
       - Encabezado: logo | título | número cotización | info cliente/vehículo/fecha | TOTAL COMPRA
       - Tabla:
           Columna 0 (fija): nombre del concepto
           Columnas 1..N:    valores por ítem
-          Columna N+1:      (vacía / reservada para futuro)
 
     Filas de conceptos (en orden):
       1  Cantidad de Repuestos
@@ -120,311 +478,72 @@ def generar_cuadro_costos_png(quote_data: dict, items: list, output_path: str) -
       10 Diferencial de Cambio (X%)
       11 Precio USD (Pago en Dólares)       ← verde, negrita
       12 VE Precio Bs (con/sin IVA)         ← verde, negrita
-    """
-    try:
-        # ── Fuentes ──────────────────────────────────────────────────────────
-        f_titulo    = _get_font(26, bold=True)
-        f_subtitulo = _get_font(17, bold=True)
-        f_info_lbl  = _get_font(12, bold=True)
-        f_info_val  = _get_font(12)
-        f_th        = _get_font(12, bold=True)   # encabezado columna ítem
-        f_concepto  = _get_font(12)              # etiqueta de concepto (col 0)
-        f_valor     = _get_font(12)              # valor normal
-        f_valor_b   = _get_font(12, bold=True)   # valor destacado (totales)
-        f_total_lbl = _get_font(13, bold=True)
-        f_total_val = _get_font(16, bold=True)
-        f_pie       = _get_font(10)
-
-        # ── Datos generales ──────────────────────────────────────────────────
-        quote_number   = quote_data.get('quote_number', 'N/A')
-        client_name    = quote_data.get('client_name', 'N/A')
-        client_vehicle = quote_data.get('client_vehicle', '—')
-        created_at     = quote_data.get('created_at', '')
-        try:
-            fecha_str = datetime.fromisoformat(str(created_at)).strftime("%d/%m/%Y")
-        except Exception:
-            fecha_str = _now_ven().strftime("%d/%m/%Y")
-
-        n_items = len(items)
-
-        # ── Dimensiones de la tabla ──────────────────────────────────────────
-        MARGEN        = 36
-        ALTO_FILA     = 28
-        ALTO_HEADER_T = 44    # fila de encabezado de ítems (nombres de columna)
-        COL0_W        = 260   # ancho columna de conceptos
-        COL_ITEM_W    = 160   # ancho de cada columna de ítem
-        ALTO_CABECERA = 175   # altura del bloque de encabezado superior
-        ALTO_PIE      = 44
-
-        # Conceptos de costo (etiqueta, clave_valor, es_total)
-        # clave_valor se usa para extraer el dato del dict del ítem
-        CONCEPTOS = [
-            ("Cantidad de Repuestos",        "cantidad",          False),
-            ("Costo FOB Unitario",            "costo_fob",         False),
-            ("Costo FOB Total",               "fob_total",         False),
-            ("Handling (Internacional)",      "costo_handling",    False),
-            ("Manejo (Nacional)",             "costo_manejo",      False),
-            ("Impuesto Internacional",        "costo_impuesto",    False),
-            ("Utilidad",                      "utilidad_valor",    False),
-            ("Envío",                         "costo_envio",       False),
-            ("TAX",                           "costo_tax",         False),
-            ("Diferencial de Cambio",         "diferencial_valor", False),
-            ("Precio USD (Pago en Dólares)",  "precio_usd",        True),
-            ("VE Precio Bs",                  "precio_bs",         True),
-        ]
-        N_FILAS = len(CONCEPTOS)
-
-        # ── Calcular TOTAL COMPRA ─────────────────────────────────────────────
-        # CORRECCIÓN (orden 2026-70865-D): usar el campo 'precio_usd' (total_cost guardado
-        # en BD) como fuente de verdad, en lugar de recalcular sumando los componentes
-        # individuales. Esto garantiza que el Cuadro de Costos muestre exactamente el mismo
-        # valor que el Mensaje USD y el PNG Precio Optimizado, que también usan total_cost.
-        #
-        # ANTES: suma fob+handling+manejo+impuesto+utilidad+envio+tax → podía diferir
-        #        del total_cost guardado por diferencias de redondeo en componentes.
-        # AHORA: suma directa de precio_usd (= total_cost ya redondeado al ×5 en BD)
-        #        → siempre igual al precio que el cliente aprobó.
-        import math as _math_cc
-        _total_compra_raw = 0.0
-        for item in items:
-            # precio_usd es el campo que guarda analyst_panel al crear el ítem:
-            # precio_usd_total_redondeado = ceil(fob+handling+...+tax / 5) * 5
-            # Es la fuente de verdad: el precio que se le cotizó al cliente.
-            _pv = float(item.get('precio_usd', 0) or 0)
-            if _pv == 0:
-                # Fallback para ítems antiguos sin precio_usd: recalcular desde componentes
-                _pv = (
-                    float(item.get('fob_total',       0) or 0) +
-                    float(item.get('costo_handling',  0) or 0) +
-                    float(item.get('costo_manejo',    0) or 0) +
-                    float(item.get('costo_impuesto',  0) or 0) +
-                    float(item.get('utilidad_valor',  0) or 0) +
-                    float(item.get('costo_envio',     0) or 0) +
-                    float(item.get('costo_tax',       0) or 0)
-                )
-            _total_compra_raw += _pv
-        # Redondear al múltiplo de 5 (precio_usd ya viene redondeado, pero por si acaso)
-        total_compra = _math_cc.ceil(_total_compra_raw / 5) * 5 if _total_compra_raw > 0 else 0.0
-
-        # ── Ancho total de la imagen ─────────────────────────────────────────
-        TABLA_W  = COL0_W + COL_ITEM_W * n_items
-        ANCHO    = max(MARGEN * 2 + TABLA_W, 900)
-        # Centrar la tabla si la imagen es más ancha
-        tabla_x  = (ANCHO - TABLA_W) // 2
-
-        # ── Alto total de la imagen ──────────────────────────────────────────
-        ALTO_TABLA = ALTO_HEADER_T + N_FILAS * ALTO_FILA
-        ALTO       = ALTO_CABECERA + ALTO_TABLA + ALTO_PIE + 20
-
-        # ── Crear imagen ─────────────────────────────────────────────────────
-        img  = Image.new("RGB", (ANCHO, ALTO), COLOR_BLANCO)
-        draw = ImageDraw.Draw(img)
-
-        # ════════════════════════════════════════════════════════════════════
-        # BLOQUE CABECERA
-        # ════════════════════════════════════════════════════════════════════
-
-        # Banda azul oscuro superior
-        draw.rectangle([(0, 0), (ANCHO, 85)], fill=COLOR_AZUL)
-
-        # Logo
-        logo_path = os.path.normpath(os.path.join(
-            os.path.dirname(__file__), "..", "..", "assets", "logos", "LOGOLogiPartVE.png"
-        ))
-        if os.path.exists(logo_path):
-            try:
-                logo = Image.open(logo_path).convert("RGBA")
-                lh = 65
-                lw = int(logo.width * lh / logo.height)
-                logo = logo.resize((lw, lh), Image.LANCZOS)
-                img.paste(logo, (MARGEN, 10), logo)
-            except Exception:
-                pass
-
-        # Título centrado en la banda
-        _draw_text_centered(draw, "CUADRO DE COSTOS",
-                            0, 8, ANCHO, 38, f_titulo, COLOR_BLANCO)
-        _draw_text_centered(draw, f"COTIZACIÓN: {quote_number}",
-                            0, 50, ANCHO, 30, f_subtitulo, COLOR_NARANJA)
-
-        # Banda naranja delgada
-        draw.rectangle([(0, 85), (ANCHO, 91)], fill=COLOR_NARANJA)
-
-        # ── Fila de info: CLIENTE | VEHÍCULO | FECHA | TOTAL COMPRA ──────────
-        y_info = 98
-        H_INFO = 70
-
-        # Dividir en 4 bloques: los 3 primeros iguales, el 4to más ancho
-        bloque_w    = (ANCHO - MARGEN * 2) // 4
-        bloque_tc_w = ANCHO - MARGEN * 2 - bloque_w * 3   # puede ser igual o mayor
-
-        campos = [
-            ("CLIENTE:",   client_name),
-            ("VEHÍCULO:",  client_vehicle or "—"),
-            ("FECHA:",     fecha_str),
-        ]
-        for i, (lbl, val) in enumerate(campos):
-            bx = MARGEN + i * bloque_w
-            draw.text((bx, y_info),      lbl, font=f_info_lbl, fill=COLOR_AZUL)
-            draw.text((bx, y_info + 20), val, font=f_info_val, fill=COLOR_GRIS_OSC)
-
-        # Bloque TOTAL COMPRA (esquina superior derecha)
-        tc_x = MARGEN + bloque_w * 3
-        tc_w = ANCHO - MARGEN - tc_x
-        # Fondo destacado
-        draw.rectangle([(tc_x - 8, y_info - 6), (ANCHO - MARGEN + 8, y_info + H_INFO - 10)],
-                       fill=COLOR_TOTAL_BG, outline=COLOR_NARANJA, width=2)
-        _draw_text_centered(draw, "TOTAL COMPRA",
-                            tc_x - 8, y_info - 6, tc_w + 16, 24, f_total_lbl, COLOR_NARANJA)
-        _draw_text_centered(draw, _fmt_usd(total_compra),
-                            tc_x - 8, y_info + 18, tc_w + 16, 36, f_total_val, COLOR_BLANCO)
-
-        # Línea separadora
-        y_sep = y_info + H_INFO
-        draw.rectangle([(MARGEN, y_sep), (ANCHO - MARGEN, y_sep + 2)], fill=COLOR_AZUL_MED)
-
-        # ════════════════════════════════════════════════════════════════════
-        # TABLA HORIZONTAL
-        # ════════════════════════════════════════════════════════════════════
-        y_tabla = y_sep + 10
-
-        # ── Fila de encabezado de ítems ──────────────────────────────────────
-        # Celda vacía col 0
-        draw.rectangle(
-            [(tabla_x, y_tabla), (tabla_x + COL0_W, y_tabla + ALTO_HEADER_T)],
-            fill=COLOR_AZUL
-        )
-        _draw_text_centered(draw, "CONCEPTO / ÍTEM",
-                            tabla_x, y_tabla, COL0_W, ALTO_HEADER_T,
-                            f_th, COLOR_BLANCO)
-
-        # Celdas de encabezado por ítem
-        for idx, item in enumerate(items):
-            cx = tabla_x + COL0_W + idx * COL_ITEM_W
-            desc = item.get('descripcion', item.get('description', f'Ítem #{idx+1}'))
-            # Truncar descripción si es muy larga
-            if len(desc) > 18:
-                desc = desc[:16] + "…"
-            draw.rectangle(
-                [(cx, y_tabla), (cx + COL_ITEM_W, y_tabla + ALTO_HEADER_T)],
-                fill=COLOR_AZUL_MED
-            )
-            # Número de ítem
-            _draw_text_centered(draw, f"ÍTEM #{idx+1}",
-                                cx, y_tabla, COL_ITEM_W, 20, f_th, COLOR_BLANCO)
-            # Descripción truncada
-            _draw_text_centered(draw, desc,
-                                cx, y_tabla + 20, COL_ITEM_W, ALTO_HEADER_T - 20,
-                                _get_font(10), COLOR_BLANCO)
-
-            # Borde derecho
-            draw.line([(cx + COL_ITEM_W, y_tabla),
-                       (cx + COL_ITEM_W, y_tabla + ALTO_HEADER_T)],
-                      fill=COLOR_BLANCO, width=1)
-
-        # Borde inferior del encabezado
-        draw.line([(tabla_x, y_tabla + ALTO_HEADER_T),
-                   (tabla_x + TABLA_W, y_tabla + ALTO_HEADER_T)],
-                  fill=COLOR_BLANCO, width=2)
-
-        # ── Filas de datos ───────────────────────────────────────────────────
-        for fila_idx, (concepto, clave, es_total) in enumerate(CONCEPTOS):
-            y_fila = y_tabla + ALTO_HEADER_T + fila_idx * ALTO_FILA
-
-            # Color de fondo de la fila
-            if es_total:
-                bg = COLOR_VERDE_SUAVE
-            elif fila_idx % 2 == 0:
-                bg = COLOR_FILA_PAR
-            else:
-                bg = COLOR_FILA_IMPAR
 
-            # Fondo completo de la fila
-            draw.rectangle(
-                [(tabla_x, y_fila), (tabla_x + TABLA_W, y_fila + ALTO_FILA)],
-                fill=bg
-            )
+    Si los ítems no caben en ANCHO_MAX se reparten en varias hojas; cada
+    hoja se dibuja, codifica y libera antes de la siguiente.
 
-            # ── Celda col 0: nombre del concepto ────────────────────────────
-            # Agregar porcentaje al concepto si aplica
-            label = concepto
-            if clave == "costo_impuesto" and items:
-                pct = items[0].get('impuesto_porcentaje', 0)
-                label = f"{concepto} ({_fmt_pct(pct)})"
-            elif clave == "costo_tax" and items:
-                pct = items[0].get('tax_porcentaje', 7.0)
-                label = f"{concepto} ({_fmt_pct(pct)})"
-            elif clave == "diferencial_valor" and items:
-                pct = items[0].get('diferencial_porcentaje', 0)
-                label = f"{concepto} ({_fmt_pct(pct)})"
-            elif clave == "utilidad_valor" and items:
-                factor = items[0].get('factor_utilidad', 1.0)
-                label = f"{concepto} (Factor {float(factor):.4f})"
-            elif clave == "precio_bs" and items:
-                aplica_iva = items[0].get('aplicar_iva', False)
-                label = f"{concepto} ({'con IVA' if aplica_iva else 'sin IVA'})"
-
-            fuente_concepto = f_valor_b if es_total else f_concepto
-            color_concepto  = COLOR_VERDE if es_total else COLOR_GRIS_OSC
-            _draw_text_left(draw, label,
-                            tabla_x, y_fila, COL0_W, ALTO_FILA,
-                            fuente_concepto, color_concepto)
-
-            # Línea divisoria col 0 / datos
-            draw.line([(tabla_x + COL0_W, y_fila),
-                       (tabla_x + COL0_W, y_fila + ALTO_FILA)],
-                      fill=COLOR_GRIS_CLARO, width=1)
-
-            # ── Celdas de valores por ítem ───────────────────────────────────
-            for idx, item in enumerate(items):
-                cx = tabla_x + COL0_W + idx * COL_ITEM_W
-                raw = item.get(clave, 0) or 0
-
-                if clave == "cantidad":
-                    txt = str(int(float(raw)))
-                    fuente_val = f_valor_b if es_total else f_valor
-                    color_val  = COLOR_VERDE if es_total else COLOR_GRIS_OSC
-                    _draw_text_centered(draw, txt, cx, y_fila, COL_ITEM_W, ALTO_FILA,
-                                        fuente_val, color_val)
-                else:
-                    txt = _fmt_usd(raw)
-                    fuente_val = f_valor_b if es_total else f_valor
-                    color_val  = COLOR_VERDE if es_total else COLOR_AZUL
-                    _draw_text_right(draw, txt, cx, y_fila, COL_ITEM_W, ALTO_FILA,
-                                     fuente_val, color_val)
-
-                # Separador vertical entre ítems
-                draw.line([(cx + COL_ITEM_W, y_fila),
-                           (cx + COL_ITEM_W, y_fila + ALTO_FILA)],
-                          fill=COLOR_GRIS_CLARO, width=1)
-
-            # Línea horizontal inferior de la fila
-            draw.line([(tabla_x, y_fila + ALTO_FILA),
-                       (tabla_x + TABLA_W, y_fila + ALTO_FILA)],
-                      fill=COLOR_GRIS_CLARO, width=1)
-
-        # ── Borde exterior de la tabla ────────────────────────────────────────
-        draw.rectangle(
-            [(tabla_x, y_tabla),
-             (tabla_x + TABLA_W, y_tabla + ALTO_HEADER_T + N_FILAS * ALTO_FILA)],
-            outline=COLOR_AZUL_MED, width=2
-        )
-
-        # ════════════════════════════════════════════════════════════════════
-        # PIE DE PÁGINA
-        # ════════════════════════════════════════════════════════════════════
-        y_pie = ALTO - ALTO_PIE
-        draw.rectangle([(0, y_pie), (ANCHO, ALTO)], fill=COLOR_AZUL)
-        pie_txt = (
+    Returns:
+        list[bytes]: contenido PNG de cada hoja, en orden.
+    """
+    fuentes = {
+        'titulo':    _get_font(26, bold=True),
+        'subtitulo': _get_font(17, bold=True),
+        'info_lbl':  _get_font(12, bold=True),
+        'info_val':  _get_font(12),
+        'th':        _get_font(12, bold=True),   # encabezado columna ítem
+        'desc':      _get_font(10),              # descripción bajo el encabezado
+        'concepto':  _get_font(12),              # etiqueta de concepto (col 0)
+        'valor':     _get_font(12),              # valor normal
+        'valor_b':   _get_font(12, bold=True),   # valor destacado (totales)
+        'total_lbl': _get_font(13, bold=True),
+        'total_val': _get_font(16, bold=True),
+        'pie':       _get_font(10),
+    }
+
+    # ── Datos generales ──────────────────────────────────────────────────────
+    created_at = quote_data.get('created_at', '')
+    try:
+        fecha_str = datetime.fromisoformat(str(created_at)).strftime("%d/%m/%Y")
+    except Exception:
+        fecha_str = _now_ven().strftime("%d/%m/%Y")
+
+    cabecera = {
+        'quote_number':   quote_data.get('quote_number', 'N/A'),
+        'client_name':    quote_data.get('client_name', 'N/A'),
+        'client_vehicle': quote_data.get('client_vehicle', '—'),
+        'fecha':          fecha_str,
+        'total_compra':   _total_compra(items),
+        'pie': (
             f"LogiPartVE Pro  •  Cuadro de Costos Interno  •  "
             f"{_now_ven().strftime('%d/%m/%Y %H:%M')}  •  USO EXCLUSIVO ADMINISTRATIVO"
-        )
-        _draw_text_centered(draw, pie_txt, 0, y_pie, ANCHO, ALTO_PIE, f_pie, COLOR_BLANCO)
+        ),
+    }
+
+    layout = _layout_cuadro(items, fuentes)
+    paginas = []
+    for hoja in range(len(layout['hojas'])):
+        buffer = io.BytesIO()
+        _dibujar_hoja(cabecera, layout, fuentes, hoja).save(
+            buffer, "PNG", dpi=(150, 150), compress_level=COMPRESION_PNG)
+        paginas.append(buffer.getvalue())
+    return paginas
+
 
-        # ── Guardar ───────────────────────────────────────────────────────────
+def generar_cuadro_costos_png(quote_data: dict, items: list, output_path: str):
+    """
+    Genera el PNG del Cuadro de Costos (ver render_cuadro_costos_paginas).
+
+    Returns:
+        str | list[str] | None:
+            - str       → una sola hoja, en output_path
+            - list[str] → varias hojas, con sufijos _p1, _p2, …
+            - None      → error
+    """
+    try:
+        from .png_generator import PNGQuoteGenerator
+        paginas = render_cuadro_costos_paginas(quote_data, items)
         os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
-        img.save(output_path, "PNG", dpi=(150, 150), optimize=True)
-        return output_path
+        return PNGQuoteGenerator._guardar_paginas(paginas, output_path)
 
     except Exception as e:
         print(f"❌ Error generando Cuadro de Costos PNG: {e}")
@@ -0,0 +1,403 @@
+# services/document_generation/document_cache.py
+"""
+Almacén de documentos direccionado por contenido (PDF y PNG de cotizaciones).
+
+La clave de cada documento es el SHA-256 de la entrada normalizada del
+generador: datos de la cotización, ítems, tipo (pdf/png), modo (BCV o
+divisas), resolución y VERSION_PLANTILLA. Si la cotización no cambió, la
+clave tampoco, y el documento se sirve desde disco sin volver a renderizar.
+
+Estructura en disco (un directorio plano):
+    <clave>.json      → manifiesto (tipo, modo, lista de páginas, bytes)
+    <clave>_p1.png …  → páginas
+
+Las imágenes se guardan por rendición (miniatura, mensaje, png): una
+entrada por rendición, con claves que comparten la base (clave_rendicion).
+
+Escrituras atómicas: cada archivo se escribe en un temporal del mismo
+directorio y se publica con os.replace(); el manifiesto se escribe al
+final, así que una entrada sin manifiesto nunca se considera válida.
+
+Límite de tamaño con desalojo LRU: cada acierto actualiza el mtime del
+manifiesto y, al superar MAX_BYTES, se borran las entradas menos usadas.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+
+# Subir este valor cuando cambie el diseño de los documentos (logos, estilos,
+# layout): invalida todas las entradas cacheadas sin tocar el disco.
+VERSION_PLANTILLA = '2026.10-4'
+
+
+def _normalizar(valor):
+    """
+    Convierte la entrada del generador en una estructura JSON estable:
+    decimales y fechas a texto/float, floats redondeados para que 12.1 y
+    12.100000000001 den la misma clave, y cadenas sin espacios sobrantes.
+    """
+    if isinstance(valor, dict):
+        return {str(k): _normalizar(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_normalizar(v) for v in valor]
+    if isinstance(valor, bool) or valor is None:
+        return valor
+    if isinstance(valor, (int, float, Decimal)):
+        numero = round(float(valor), 6)
+        return 0.0 if numero == 0 else numero
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor).strip()
+
+
+class DocumentCache:
+    """
+    Caché de documentos de cotización compartido por todo el proceso.
+
+    Streamlit re-ejecuta los paneles en cada interacción; el estado (total de
+    bytes, directorio) vive en atributos de clase protegidos por un RLock.
+    """
+
+    DIRECTORIO = os.path.join(tempfile.gettempdir(), 'logipartve_docs', 'cache')
+    MAX_BYTES = int(os.environ.get('LOGIPARTVE_DOC_CACHE_MB', '512')) * 1024 * 1024
+
+    _lock = threading.RLock()
+    _total_bytes = None   # se calcula en el primer uso recorriendo los manifiestos
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # CLAVE
+    # ─────────────────────────────────────────────────────────────────────────
+    @staticmethod
+    def preparar_datos(datos: dict) -> dict:
+        """
+        Copia de los datos con la fecha resuelta. Sin 'fecha' el generador usa
+        la fecha del día, así que esa fecha debe formar parte de la clave
+        (y del documento) para no servir un PDF de ayer como si fuera de hoy.
+        """
+        datos = dict(datos)
+        if datos.get('fecha', 'N/A') in (None, '', 'N/A'):
+            try:
+                from services.timezone_utils import now_caracas_naive
+                datos['fecha'] = now_caracas_naive().strftime('%Y-%m-%d')
+            except Exception:
+                from datetime import timezone, timedelta
+                datos['fecha'] = datetime.now(
+                    tz=timezone(timedelta(hours=-4))).strftime('%Y-%m-%d')
+        return datos
+
+    @staticmethod
+    def clave(datos: dict, tipo: str, modo_divisas: bool = False, dpi: int = None) -> str:
+        """SHA-256 de la entrada normalizada del generador."""
+        entrada = {
+            'version': VERSION_PLANTILLA,
+            'tipo': tipo,
+            'modo': 'divisas' if modo_divisas else 'bcv',
+            'dpi': dpi,
+            'datos': _normalizar(datos),
+        }
+        canonico = json.dumps(entrada, sort_keys=True, ensure_ascii=False,
+                              separators=(',', ':'))
+        return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def clave_rendicion(cls, datos: dict, rendicion: str, modo_divisas: bool = False,
+                        dpi: int = 300) -> str:
+        """
+        Clave de una rendición de imagen (datos ya preparados). Todas las
+        rendiciones de una rasterización comparten la base y difieren en el
+        sufijo: '<sha256>-mensaje-jpg', '<sha256>-png-png', …
+        """
+        from .png_generator import sufijo_rendicion
+        base = cls.clave(datos, 'imagen', modo_divisas, dpi)
+        return f"{base}-{sufijo_rendicion(rendicion)}"
+
+    @classmethod
+    def clave_cuadro_costos(cls, quote: dict, items: list) -> str:
+        """Clave del Cuadro de Costos (su entrada no lleva 'fecha' resuelta)."""
+        return cls.clave(dict(quote, items_cuadro=items), 'cuadro_costos')
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # DISCO
+    # ─────────────────────────────────────────────────────────────────────────
+    @classmethod
+    def _ruta_manifiesto(cls, clave: str) -> str:
+        return os.path.join(cls.DIRECTORIO, f"{clave}.json")
+
+    @classmethod
+    def _escribir_atomico(cls, ruta: str, contenido) -> int:
+        """
+        Escribe en un temporal del mismo directorio y lo publica con os.replace.
+        `contenido` puede ser bytes o un archivo binario (se copia por bloques).
+        Retorna los bytes escritos.
+        """
+        fd, tmp = tempfile.mkstemp(dir=cls.DIRECTORIO, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(contenido, (bytes, bytearray)):
+                    f.write(contenido)
+                else:
+                    shutil.copyfileobj(contenido, f, 1024 * 1024)
+                escritos = f.tell()
+            os.replace(tmp, ruta)
+            return escritos
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def _leer_manifiesto(cls, clave: str):
+        """Manifiesto de la entrada, o None si no existe o le falta alguna página."""
+        try:
+            with open(cls._ruta_manifiesto(clave), 'r', encoding='utf-8') as f:
+                manifiesto = json.load(f)
+        except (OSError, ValueError):
+            return None
+        paginas = [os.path.join(cls.DIRECTORIO, p) for p in manifiesto.get('paginas', [])]
+        if not paginas or not all(os.path.exists(p) for p in paginas):
+            return None
+        manifiesto['rutas'] = paginas
+        return manifiesto
+
+    @classmethod
+    def _calcular_total(cls) -> int:
+        total = 0
+        try:
+            nombres = os.listdir(cls.DIRECTORIO)
+        except OSError:
+            return 0
+        for nombre in nombres:
+            if nombre.endswith('.json'):
+                try:
+                    with open(os.path.join(cls.DIRECTORIO, nombre), 'r', encoding='utf-8') as f:
+                        total += int(json.load(f).get('bytes', 0))
+                except (OSError, ValueError):
+                    pass
+        return total
+
+    @classmethod
+    def _borrar_entrada(cls, clave: str) -> int:
+        """Elimina manifiesto y páginas; retorna los bytes liberados."""
+        ruta = cls._ruta_manifiesto(clave)
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                manifiesto = json.load(f)
+        except (OSError, ValueError):
+            manifiesto = {}
+        # Primero el manifiesto: así la entrada deja de ser válida de inmediato
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+        for pagina in manifiesto.get('paginas', []):
+            try:
+                os.remove(os.path.join(cls.DIRECTORIO, pagina))
+            except OSError:
+                pass
+        return int(manifiesto.get('bytes', 0))
+
+    @classmethod
+    def _desalojar(cls):
+        """Borra las entradas menos usadas (mtime del manifiesto) hasta bajar de MAX_BYTES."""
+        if cls._total_bytes <= cls.MAX_BYTES:
+            return
+        entradas = []
+        for nombre in os.listdir(cls.DIRECTORIO):
+            if nombre.endswith('.json'):
+                try:
+                    mtime = os.path.getmtime(os.path.join(cls.DIRECTORIO, nombre))
+                except OSError:
+                    continue
+                entradas.append((mtime, nombre[:-5]))
+        entradas.sort()
+        for _, clave in entradas:
+            if cls._total_bytes <= cls.MAX_BYTES:
+                break
+            cls._total_bytes -= cls._borrar_entrada(clave)
+        cls._total_bytes = max(cls._total_bytes, 0)
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # API
+    # ─────────────────────────────────────────────────────────────────────────
+    @classmethod
+    def obtener(cls, clave: str):
+        """Manifiesto de una entrada existente (y la marca como usada), o None."""
+        with cls._lock:
+            manifiesto = cls._leer_manifiesto(clave)
+            if manifiesto:
+                try:
+                    os.utime(cls._ruta_manifiesto(clave))
+                except OSError:
+                    pass
+            return manifiesto
+
+    @classmethod
+    def guardar(cls, clave: str, paginas: list, extension: str, **meta) -> dict:
+        """
+        Publica las páginas (bytes o archivos binarios) y su manifiesto;
+        aplica el límite de tamaño.
+        """
+        with cls._lock:
+            os.makedirs(cls.DIRECTORIO, exist_ok=True)
+            if cls._total_bytes is None:
+                cls._total_bytes = cls._calcular_total()
+
+            # Reemplazar una entrada previa con la misma clave (p. ej. incompleta)
+            cls._total_bytes -= cls._borrar_entrada(clave)
+
+            nombres, total = [], 0
+            for i, contenido in enumerate(paginas, 1):
+                nombre = f"{clave}_p{i}.{extension}"
+                total += cls._escribir_atomico(os.path.join(cls.DIRECTORIO, nombre), contenido)
+                nombres.append(nombre)
+
+            manifiesto = dict(meta)
+            manifiesto.update({
+                'clave': clave,
+                'version': VERSION_PLANTILLA,
+                'paginas': nombres,
+                'bytes': total,
+                'creado_en': time.time(),
+            })
+            cls._escribir_atomico(
+                cls._ruta_manifiesto(clave),
+                json.dumps(manifiesto, ensure_ascii=False).encode('utf-8')
+            )
+            cls._total_bytes += manifiesto['bytes']
+            cls._desalojar()
+
+            manifiesto['rutas'] = [os.path.join(cls.DIRECTORIO, n) for n in nombres]
+            return manifiesto
+
+    @classmethod
+    def obtener_o_generar(cls, datos: dict, tipo: str, generar, extension: str,
+                          modo_divisas: bool = False, dpi: int = None,
+                          resolver_fecha: bool = True) -> dict:
+        """
+        Retorna el manifiesto del documento; solo llama a generar(datos) (que
+        debe devolver list[bytes], una entrada por página) si no está en caché.
+        """
+        if resolver_fecha:
+            datos = cls.preparar_datos(datos)
+        clave = cls.clave(datos, tipo, modo_divisas, dpi)
+        manifiesto = cls.obtener(clave)
+        if manifiesto:
+            manifiesto['desde_cache'] = True
+            return manifiesto
+
+        paginas = generar(datos)
+        manifiesto = cls.guardar(
+            clave, paginas, extension,
+            tipo=tipo, modo='divisas' if modo_divisas else 'bcv',
+            quote_number=str(datos.get('quote_number', '')),
+        )
+        manifiesto['desde_cache'] = False
+        return manifiesto
+
+    @classmethod
+    def manifiesto_pdf(cls, datos: dict, modo_divisas: bool = False) -> dict:
+        """Manifiesto del PDF de la cotización (renderiza solo si no está en caché)."""
+        from .pdf_generator import generar_pdf_bytes
+        return cls.obtener_o_generar(
+            datos, 'pdf',
+            lambda d: [generar_pdf_bytes(d, modo_divisas=modo_divisas)],
+            'pdf', modo_divisas=modo_divisas,
+        )
+
+    @classmethod
+    def manifiestos_imagen(cls, datos: dict, modo_divisas: bool = False,
+                           rendiciones=('miniatura', 'mensaje'), dpi: int = 300) -> dict:
+        """
+        Manifiestos de las rendiciones de imagen pedidas: {rendicion: manifiesto}.
+
+        Cada rendición es una entrada propia del caché, pero las que faltan se
+        generan juntas a partir de una sola rasterización.
+        """
+        from .png_generator import PNGQuoteGenerator, extension_rendicion
+
+        datos = cls.preparar_datos(datos)
+        manifiestos, faltan = {}, []
+        for nombre in rendiciones:
+            clave = cls.clave_rendicion(datos, nombre, modo_divisas, dpi)
+            manifiesto = cls.obtener(clave)
+            if manifiesto:
+                manifiesto['desde_cache'] = True
+                manifiestos[nombre] = manifiesto
+            else:
+                faltan.append((nombre, clave))
+
+        if faltan:
+            generador = PNGQuoteGenerator(dpi=dpi)
+            paginas = generador.render_renditions(datos, modo_divisas, [n for n, _ in faltan])
+            for nombre, clave in faltan:
+                manifiesto = cls.guardar(
+                    clave, paginas[nombre], extension_rendicion(nombre),
+                    tipo='imagen', rendicion=nombre,
+                    modo='divisas' if modo_divisas else 'bcv',
+                    quote_number=str(datos.get('quote_number', '')),
+                )
+                manifiesto['desde_cache'] = False
+                manifiestos[nombre] = manifiesto
+        return manifiestos
+
+    @classmethod
+    def manifiesto_png(cls, datos: dict, modo_divisas: bool = False, dpi: int = 300) -> dict:
+        """Manifiesto de las páginas PNG completas de la cotización."""
+        return cls.manifiestos_imagen(datos, modo_divisas, ('png',), dpi)['png']
+
+    @classmethod
+    def manifiesto_cuadro_costos(cls, quote: dict, items: list) -> dict:
+        """
+        Manifiesto de las hojas PNG del Cuadro de Costos. `quote` es la fila de
+        get_quote_by_id() e `items` la salida de items_para_cuadro_costos().
+        """
+        from .cuadro_costos_generator import render_cuadro_costos_paginas
+
+        def generar(d):
+            # Una página por hoja del cuadro (más de una si hay muchos ítems)
+            return render_cuadro_costos_paginas(d, d['items_cuadro'])
+
+        os.makedirs(cls.DIRECTORIO, exist_ok=True)
+        # El cuadro toma la fecha de created_at: no se resuelve 'fecha'
+        return cls.obtener_o_generar(
+            dict(quote, items_cuadro=items), 'cuadro_costos', generar, 'png',
+            resolver_fecha=False,
+        )
+
+    @classmethod
+    def pdf(cls, datos: dict, modo_divisas: bool = False) -> str:
+        """Ruta del PDF de la cotización."""
+        return cls.manifiesto_pdf(datos, modo_divisas)['rutas'][0]
+
+    @classmethod
+    def png(cls, datos: dict, modo_divisas: bool = False, dpi: int = 300) -> list:
+        """Rutas de las páginas PNG de la cotización, en orden."""
+        return cls.manifiesto_png(datos, modo_divisas, dpi)['rutas']
+
+    @classmethod
+    def imagenes(cls, datos: dict, modo_divisas: bool = False, rendicion: str = 'mensaje') -> list:
+        """Rutas de las páginas de una rendición de imagen (por defecto la de WhatsApp/correo)."""
+        return cls.manifiestos_imagen(datos, modo_divisas, (rendicion,))[rendicion]['rutas']
+
+    @classmethod
+    def paginas_de(cls, ruta: str) -> list:
+        """
+        Lista de páginas del documento al que pertenece `ruta` (cualquier
+        página guardada en quotes.jpeg_path / pdf_path), leída del manifiesto.
+        Retorna [] si la ruta no es del caché o la entrada fue desalojada.
+        """
+        if not ruta or os.path.dirname(os.path.abspath(ruta)) != os.path.abspath(cls.DIRECTORIO):
+            return []
+        clave = os.path.basename(ruta).split('_p', 1)[0]
+        manifiesto = cls.obtener(clave)
+        return manifiesto['rutas'] if manifiesto else []
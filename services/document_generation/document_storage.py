@@ -0,0 +1,350 @@
+# services/document_generation/document_storage.py
+"""
+Almacenamiento durable de los documentos generados (PDF/PNG de cotizaciones).
+
+El caché local (DocumentCache) vive en el directorio temporal del contenedor
+y se pierde en cada redeploy o cambio de réplica. Aquí se guarda la copia
+durable y en quotes.pdf_path / jpeg_path se registra una REFERENCIA al
+artefacto, no una ruta del host:
+
+    doc://cotizaciones/<quote_number>/<clave>
+
+<clave> es la clave de contenido de DocumentCache, que actúa como versión del
+documento: cada edición de la cotización produce una clave nueva y las
+versiones anteriores quedan intactas.
+
+Backends (variable de entorno DOCUMENT_STORAGE):
+    filesystem  → directorio local o volumen montado (DOCUMENT_STORAGE_DIR)
+    s3          → bucket S3 o compatible: MinIO, R2… (DOCUMENT_S3_BUCKET,
+                  DOCUMENT_S3_ENDPOINT_URL, DOCUMENT_S3_REGION; credenciales
+                  por la cadena estándar de boto3: AWS_ACCESS_KEY_ID, etc.)
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # solo hace falta con DOCUMENT_STORAGE=s3
+    boto3 = None
+    ClientError = Exception
+
+
+PREFIJO_REFERENCIA = 'doc://'
+
+# Tamaño de bloque para copias en streaming
+BLOQUE = 1024 * 1024
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BACKENDS
+# ─────────────────────────────────────────────────────────────────────────────
+class DocumentStorage:
+    """Interfaz común de los backends. Las claves usan '/' como separador."""
+
+    def escribir(self, clave: str, contenido):
+        """Guarda bytes o un archivo binario (leído por bloques) bajo `clave`."""
+        raise NotImplementedError
+
+    def abrir(self, clave: str):
+        """Stream binario de solo lectura (.read()); el llamador debe cerrarlo."""
+        raise NotImplementedError
+
+    def existe(self, clave: str) -> bool:
+        raise NotImplementedError
+
+    def eliminar(self, clave: str):
+        raise NotImplementedError
+
+    def leer(self, clave: str) -> bytes:
+        stream = self.abrir(clave)
+        try:
+            return stream.read()
+        finally:
+            stream.close()
+
+
+class FileSystemStorage(DocumentStorage):
+    """Backend en disco: pensado para un volumen persistente montado en el contenedor."""
+
+    def __init__(self, raiz: str):
+        self.raiz = os.path.abspath(raiz)
+
+    def _ruta(self, clave: str) -> str:
+        ruta = os.path.abspath(os.path.join(self.raiz, *clave.split('/')))
+        if not ruta.startswith(self.raiz + os.sep):
+            raise ValueError(f"Clave de documento inválida: {clave}")
+        return ruta
+
+    def escribir(self, clave: str, contenido):
+        ruta = self._ruta(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Escritura atómica: temporal en el mismo directorio + os.replace
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(contenido, (bytes, bytearray)):
+                    f.write(contenido)
+                else:
+                    shutil.copyfileobj(contenido, f, BLOQUE)
+            os.replace(tmp, ruta)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def abrir(self, clave: str):
+        return open(self._ruta(clave), 'rb')
+
+    def existe(self, clave: str) -> bool:
+        return os.path.exists(self._ruta(clave))
+
+    def eliminar(self, clave: str):
+        try:
+            os.remove(self._ruta(clave))
+        except FileNotFoundError:
+            pass
+
+
+class S3Storage(DocumentStorage):
+    """
+    Backend S3 o compatible. Con endpoint_url apunta a MinIO/LocalStack o a
+    cualquier servidor con la API de S3 (útil para probar en local).
+    """
+
+    def __init__(self, bucket: str, endpoint_url: str = None, region: str = None,
+                 prefijo: str = '', cliente=None):
+        if cliente is None:
+            if boto3 is None:
+                raise RuntimeError("DOCUMENT_STORAGE=s3 requiere el paquete boto3")
+            cliente = boto3.client('s3', endpoint_url=endpoint_url or None,
+                                   region_name=region or None)
+        self.cliente = cliente
+        self.bucket = bucket
+        self.prefijo = prefijo.strip('/')
+
+    def _clave(self, clave: str) -> str:
+        return f"{self.prefijo}/{clave}" if self.prefijo else clave
+
+    def escribir(self, clave: str, contenido):
+        if isinstance(contenido, (bytes, bytearray)):
+            self.cliente.put_object(Bucket=self.bucket, Key=self._clave(clave),
+                                    Body=bytes(contenido))
+        else:
+            # upload_fileobj sube por partes sin cargar el archivo en memoria
+            self.cliente.upload_fileobj(contenido, self.bucket, self._clave(clave))
+
+    def abrir(self, clave: str):
+        try:
+            respuesta = self.cliente.get_object(Bucket=self.bucket, Key=self._clave(clave))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                raise FileNotFoundError(clave) from e
+            raise
+        return respuesta['Body']
+
+    def existe(self, clave: str) -> bool:
+        try:
+            self.cliente.head_object(Bucket=self.bucket, Key=self._clave(clave))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404', 'NotFound'):
+                return False
+            raise
+
+    def eliminar(self, clave: str):
+        self.cliente.delete_object(Bucket=self.bucket, Key=self._clave(clave))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# FACHADA: CACHÉ LOCAL + ALMACENAMIENTO DURABLE
+# ─────────────────────────────────────────────────────────────────────────────
+class DocumentStore:
+    """
+    Publica las entradas de DocumentCache en el backend durable y resuelve las
+    referencias guardadas en BD a rutas locales, descargándolas al caché si el
+    contenedor es nuevo (sin volver a renderizar).
+    """
+
+    _backend = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def backend(cls) -> DocumentStorage:
+        """Backend configurado por entorno (se crea una sola vez por proceso)."""
+        with cls._lock:
+            if cls._backend is None:
+                tipo = os.environ.get('DOCUMENT_STORAGE', 'filesystem').lower()
+                if tipo == 's3':
+                    cls._backend = S3Storage(
+                        bucket=os.environ['DOCUMENT_S3_BUCKET'],
+                        endpoint_url=os.environ.get('DOCUMENT_S3_ENDPOINT_URL'),
+                        region=os.environ.get('DOCUMENT_S3_REGION'),
+                        prefijo=os.environ.get('DOCUMENT_S3_PREFIX', ''),
+                    )
+                else:
+                    cls._backend = FileSystemStorage(os.environ.get(
+                        'DOCUMENT_STORAGE_DIR', '/home/ubuntu/cotizaciones_guardadas'))
+            return cls._backend
+
+    @classmethod
+    def configurar(cls, backend: DocumentStorage):
+        """Reemplaza el backend (p. ej. para apuntar a un MinIO local)."""
+        with cls._lock:
+            cls._backend = backend
+
+    @staticmethod
+    def es_referencia(valor) -> bool:
+        return bool(valor) and str(valor).startswith(PREFIJO_REFERENCIA)
+
+    @staticmethod
+    def _prefijo(quote_number: str, clave: str) -> str:
+        segura = re.sub(r'[^A-Za-z0-9_-]', '_', str(quote_number or 'sin_numero'))
+        return f"cotizaciones/{segura}/{clave}"
+
+    @classmethod
+    def referencia(cls, quote_number: str, clave: str) -> str:
+        """Referencia doc:// de la versión `clave` del documento (publicada o no)."""
+        return f"{PREFIJO_REFERENCIA}{cls._prefijo(quote_number, clave)}"
+
+    @classmethod
+    def publicado(cls, referencia: str) -> bool:
+        """True si la versión ya está en el backend durable (existe su manifiesto)."""
+        prefijo = referencia[len(PREFIJO_REFERENCIA):].strip('/')
+        try:
+            return cls.backend().existe(f"{prefijo}/manifest.json")
+        except Exception as e:
+            print(f"❌ Error consultando documento {referencia}: {e}")
+            return False
+
+    @classmethod
+    def publicar(cls, manifiesto: dict) -> str:
+        """
+        Copia a almacenamiento durable las páginas de una entrada de
+        DocumentCache y retorna su referencia. El manifiesto se sube al final:
+        sin manifiesto la versión no existe para los lectores. Si la versión ya
+        estaba publicada no se vuelve a subir.
+        """
+        prefijo = cls._prefijo(manifiesto.get('quote_number'), manifiesto['clave'])
+        backend = cls.backend()
+        clave_manifiesto = f"{prefijo}/manifest.json"
+        if not backend.existe(clave_manifiesto):
+            nombres = []
+            for i, ruta in enumerate(manifiesto['rutas'], 1):
+                nombre = f"p{i}{os.path.splitext(ruta)[1]}"
+                with open(ruta, 'rb') as f:
+                    backend.escribir(f"{prefijo}/{nombre}", f)
+                nombres.append(nombre)
+            publico = {k: v for k, v in manifiesto.items()
+                       if k not in ('rutas', 'desde_cache')}
+            publico['paginas'] = nombres
+            backend.escribir(clave_manifiesto,
+                             json.dumps(publico, ensure_ascii=False).encode('utf-8'))
+        return f"{PREFIJO_REFERENCIA}{prefijo}"
+
+    @classmethod
+    def guardar_pdf(cls, datos: dict, modo_divisas: bool = False) -> tuple:
+        """Genera (o toma del caché) el PDF y lo publica. Retorna (referencia, rutas)."""
+        from .document_cache import DocumentCache
+        manifiesto = DocumentCache.manifiesto_pdf(datos, modo_divisas)
+        return cls.publicar(manifiesto), manifiesto['rutas']
+
+    @classmethod
+    def guardar_png(cls, datos: dict, modo_divisas: bool = False) -> tuple:
+        """Genera (o toma del caché) los PNG completos y los publica. Retorna (referencia, rutas)."""
+        from .document_cache import DocumentCache
+        manifiesto = DocumentCache.manifiesto_png(datos, modo_divisas)
+        return cls.publicar(manifiesto), manifiesto['rutas']
+
+    @classmethod
+    def guardar_imagenes(cls, datos: dict, modo_divisas: bool = False,
+                         rendiciones=('miniatura', 'mensaje')) -> dict:
+        """
+        Genera (o toma del caché) las rendiciones de imagen y las publica.
+        Retorna {rendicion: (referencia, rutas)}.
+        """
+        from .document_cache import DocumentCache
+        manifiestos = DocumentCache.manifiestos_imagen(datos, modo_divisas, rendiciones)
+        return {nombre: (cls.publicar(m), m['rutas']) for nombre, m in manifiestos.items()}
+
+    @classmethod
+    def rendicion(cls, referencia: str, nombre: str) -> str:
+        """
+        Referencia de otra rendición de la misma imagen (p. ej. la miniatura a
+        partir de quotes.jpeg_path). Valores antiguos sin rendición se
+        devuelven tal cual. La rendición puede no estar publicada todavía:
+        paginas() devolverá [] en ese caso.
+        """
+        from .png_generator import sufijo_rendicion
+        if not cls.es_referencia(referencia):
+            return referencia
+        prefijo, clave = referencia.rsplit('/', 1)
+        if '-' not in clave:
+            return referencia
+        return f"{prefijo}/{clave.split('-', 1)[0]}-{sufijo_rendicion(nombre)}"
+
+    @classmethod
+    def guardar_cuadro_costos(cls, quote: dict, items: list) -> tuple:
+        """Genera (o toma del caché) el Cuadro de Costos y lo publica. Retorna (referencia, rutas)."""
+        from .document_cache import DocumentCache
+        manifiesto = DocumentCache.manifiesto_cuadro_costos(quote, items)
+        return cls.publicar(manifiesto), manifiesto['rutas']
+
+    @classmethod
+    def paginas(cls, referencia: str) -> list:
+        """
+        Rutas locales de las páginas de una referencia doc://, en orden.
+
+        Sirve desde DocumentCache si la versión está en el contenedor; si no,
+        descarga manifiesto y páginas en streaming al caché. Para valores
+        antiguos (ruta del host) devuelve [ruta] si el archivo aún existe.
+        Retorna [] si el documento no está disponible.
+        """
+        from .document_cache import DocumentCache
+
+        if not cls.es_referencia(referencia):
+            if referencia and os.path.exists(str(referencia)):
+                return DocumentCache.paginas_de(referencia) or [referencia]
+            return []
+
+        prefijo = referencia[len(PREFIJO_REFERENCIA):].strip('/')
+        clave = prefijo.rsplit('/', 1)[-1]
+        manifiesto = DocumentCache.obtener(clave)
+        if manifiesto:
+            return manifiesto['rutas']
+
+        try:
+            backend = cls.backend()
+            manifiesto = json.loads(backend.leer(f"{prefijo}/manifest.json"))
+            streams = [backend.abrir(f"{prefijo}/{nombre}") for nombre in manifiesto['paginas']]
+            try:
+                extension = manifiesto['paginas'][0].rsplit('.', 1)[-1]
+                meta = {k: v for k, v in manifiesto.items()
+                        if k in ('tipo', 'rendicion', 'modo', 'quote_number')}
+                return DocumentCache.guardar(clave, streams, extension, **meta)['rutas']
+            finally:
+                for stream in streams:
+                    stream.close()
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            print(f"❌ Error recuperando documento {referencia}: {e}")
+            return []
+
+    @classmethod
+    def abrir(cls, referencia: str, pagina: int = 1):
+        """
+        Stream de lectura de una página directamente desde el backend, sin
+        pasar por el caché local (descargas grandes, reenvíos).
+        """
+        prefijo = referencia[len(PREFIJO_REFERENCIA):].strip('/')
+        backend = cls.backend()
+        manifiesto = json.loads(backend.leer(f"{prefijo}/manifest.json"))
+        return backend.abrir(f"{prefijo}/{manifiesto['paginas'][pagina - 1]}")
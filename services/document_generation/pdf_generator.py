@@ -2,17 +2,21 @@
 Generador de PDF para Cotizaciones - Diseño International Freight
 Estilo: Documento de carga aérea internacional
 Soporte multi-página: 5 ítems por página, totales solo en la última hoja.
+El documento se construye en una sola pasada (ver _DocumentoCotizacion).
 """
 
 from reportlab.lib.pagesizes import landscape, letter
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak, KeepTogether
+from reportlab.platypus import (
+    BaseDocTemplate, PageTemplate, Frame, Table, TableStyle, Paragraph, Spacer, PageBreak, Flowable
+)
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.pdfgen import canvas
-import os
-from pathlib import Path
+import io
+
+from .assets import DocumentAssets
 
 
 def clean_text(value) -> str:
@@ -42,21 +46,41 @@ def clean_text(value) -> str:
 
 
 def find_logo_path(logo_filename):
-    """Busca el logo en diferentes ubicaciones posibles."""
-    possible_paths = [
-        Path(__file__).parent.parent.parent / "assets" / "logos" / logo_filename,
-        Path("/app/assets/logos") / logo_filename,
-        Path("/tmp/logipartve-v7/assets/logos") / logo_filename,
-        Path.cwd() / "assets" / "logos" / logo_filename,
-    ]
-    for path in possible_paths:
-        if path.exists():
-            return str(path)
-    return None
+    """Busca el logo en diferentes ubicaciones posibles (resuelto una vez por proceso)."""
+    return DocumentAssets.ruta_logo(logo_filename)
+
+
+class _Logo(Flowable):
+    """Logo pre-decodificado (ImageReader de DocumentAssets) dibujado a tamaño fijo."""
+
+    def __init__(self, lector, width, height):
+        super().__init__()
+        self.lector = lector
+        self.drawWidth = width
+        self.drawHeight = height
+        self.hAlign = 'CENTER'
+
+    def wrap(self, availWidth, availHeight):
+        return self.drawWidth, self.drawHeight
+
+    def draw(self):
+        self.canv.drawImage(self.lector, 0, 0, self.drawWidth, self.drawHeight, mask='auto')
+
+
+def _sobre_blanco(r, g, b, alpha):
+    """Color opaco equivalente a (r, g, b) con transparencia `alpha` sobre papel blanco."""
+    return tuple(1 - alpha * (1 - c) for c in (r, g, b))
 
 
 class InternationalFreightBackground:
-    """Clase para dibujar el fondo con marca de agua en cada página."""
+    """
+    Clase para dibujar el fondo con marca de agua en cada página.
+
+    La marca de agua es lo primero que se dibuja sobre la página en blanco,
+    así que sus transparencias se precomponen en colores opacos: se dibuja
+    dentro de un form XObject y ReportLab no declara los ExtGState (alpha)
+    en los recursos de los forms.
+    """
 
     def __init__(self):
         pass
@@ -65,8 +89,8 @@ class InternationalFreightBackground:
         """Dibuja la marca de agua con mapa mundial y rutas aéreas."""
         canvas_obj.saveState()
 
-        canvas_obj.setFillColorRGB(0.9, 0.9, 0.9, alpha=0.15)
-        canvas_obj.setStrokeColorRGB(0.85, 0.85, 0.85, alpha=0.2)
+        canvas_obj.setFillColorRGB(*_sobre_blanco(0.9, 0.9, 0.9, 0.15))
+        canvas_obj.setStrokeColorRGB(*_sobre_blanco(0.85, 0.85, 0.85, 0.2))
         canvas_obj.setLineWidth(0.5)
 
         width = doc.pagesize[0]
@@ -78,17 +102,17 @@ class InternationalFreightBackground:
         for i in range(100, int(width), 60):
             canvas_obj.line(i, 50, i, height - 50)
 
-        canvas_obj.setStrokeColorRGB(0.17, 0.49, 0.62, alpha=0.1)
+        canvas_obj.setStrokeColorRGB(*_sobre_blanco(0.17, 0.49, 0.62, 0.1))
         canvas_obj.setLineWidth(1.5)
         canvas_obj.bezier(150, height - 150, 300, height - 100, 500, height - 120, 650, height - 180)
         canvas_obj.bezier(width - 200, height - 120, width - 350, height - 80, width - 500, height - 150, width - 650, height - 200)
 
-        canvas_obj.setFillColorRGB(0.17, 0.49, 0.62, alpha=0.15)
+        canvas_obj.setFillColorRGB(*_sobre_blanco(0.17, 0.49, 0.62, 0.15))
         canvas_obj.circle(150, height - 150, 8, fill=1)
         canvas_obj.circle(650, height - 180, 8, fill=1)
 
         canvas_obj.setFont("Helvetica-Bold", 60)
-        canvas_obj.setFillColorRGB(0.95, 0.95, 0.95, alpha=0.08)
+        canvas_obj.setFillColorRGB(*_sobre_blanco(0.95, 0.95, 0.95, 0.08))
         canvas_obj.saveState()
         canvas_obj.translate(width / 2, height / 2)
         canvas_obj.rotate(45)
@@ -183,6 +207,32 @@ def _build_styles():
     }
 
 
+def _estilos():
+    """Estilos del documento, construidos una vez por proceso."""
+    return DocumentAssets.obtener('estilos_cotizacion', _build_styles)
+
+
+def _logos():
+    """
+    Logos del encabezado pre-escalados al tamaño en que se dibujan: ImageReader
+    para los logos grandes y rutas de iconos de 12pt para el marcado <img>.
+    """
+    return {
+        'jdae': DocumentAssets.logo_pdf("LOGOJDAEAUTOPARTES.png", 1.2 * inch, 1.2 * inch),
+        'aop':  DocumentAssets.logo_pdf("LogoAutoOnlinePro.png", 1.0 * inch, 1.0 * inch),
+        'fb':   DocumentAssets.icono_pdf("LOGOFACEBOOK.png", 12),
+        'ig':   DocumentAssets.icono_pdf("LOGOINSTAGRAM.png", 12),
+        'tel':  DocumentAssets.icono_pdf("LOGOTELEFONO.png", 12),
+        'wa':   DocumentAssets.icono_pdf("LOGOWHATSAPP.png", 12),
+    }
+
+
+def precargar_recursos():
+    """Carga en DocumentAssets los estilos y logos de la cotización."""
+    _estilos()
+    _logos()
+
+
 def _build_header_block(st, logos):
     """Construye el bloque de encabezado con logos y datos de la empresa."""
     COLOR_AZUL_AVIACION = colors.HexColor('#003D82')
@@ -228,7 +278,7 @@ def _build_header_block(st, logos):
 
     col_izq_data = []
     if logo_jdae_path:
-        col_izq_data.append([Image(logo_jdae_path, width=1.2 * inch, height=1.2 * inch)])
+        col_izq_data.append([_Logo(logo_jdae_path, width=1.2 * inch, height=1.2 * inch)])
     col_izq_data.append([Paragraph("<b>J-5072639-5</b>", st['rif'])])
     tabla_izq = Table(col_izq_data, colWidths=[1.2 * inch])
     tabla_izq.setStyle(TableStyle([
@@ -240,7 +290,7 @@ def _build_header_block(st, logos):
 
     col_der_data = []
     if logo_aop_path:
-        col_der_data.append([Image(logo_aop_path, width=1.0 * inch, height=1.0 * inch)])
+        col_der_data.append([_Logo(logo_aop_path, width=1.0 * inch, height=1.0 * inch)])
     col_der_data.append([Paragraph("<b>REPRESENTANTES EXCLUSIVOS<br/>PARA VENEZUELA</b>", st['rif'])])
     tabla_der = Table(col_der_data, colWidths=[1.5 * inch])
     tabla_der.setStyle(TableStyle([
@@ -632,99 +682,129 @@ def _build_totales_block(st, datos_cotizacion, modo_divisas=False):
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# FUNCIÓN PRINCIPAL
+# DOCUMENTO DE UNA SOLA PASADA
 # ─────────────────────────────────────────────────────────────────────────────
-def _generar_pagina_pdf(datos_cotizacion, items_slice, num_pagina, total_paginas,
-                        logos, st, output_path, modo_divisas=False):
+def _build_cabecera(st, datos_cotizacion, logos, modo_divisas=False):
     """
-    Genera un PDF de UNA SOLA PÁGINA con el contenido especificado.
-    Cada página se genera de forma independiente para garantizar que
-    el header siempre aparezca al inicio de cada hoja.
+    Bloques que se repiten idénticos en todas las páginas: header, barra de
+    información y datos del cliente (con sus separadores originales).
     """
-    es_ultima = (num_pagina == total_paginas)
-
-    doc = SimpleDocTemplate(
-        output_path,
-        pagesize=landscape(letter),
-        rightMargin=MARGEN_H,
-        leftMargin=MARGEN_H,
-        topMargin=MARGEN_V,
-        bottomMargin=MARGEN_V,
-    )
-
-    story = []
-
-    # ── HEADER ──────────────────────────────────────────────────────────────
-    story.append(_build_header_block(st, logos))
-    story.append(Spacer(1, 0.01 * inch))
-
-    # ── INFO DOCUMENTO ───────────────────────────────────────────────────────
-    story.append(_build_info_doc(st, datos_cotizacion, modo_divisas=modo_divisas))
-    story.append(Spacer(1, 0.08 * inch))
-
-    # ── DATOS DEL CLIENTE ───────────────────────────────────────────────────────────────────
-    story.append(Paragraph("▼ DATOS DEL CLIENTE", st['seccion']))
-    story.append(_build_cliente_block(st, datos_cotizacion))
-    story.append(Spacer(1, 0.05 * inch))
-
-    # ── TABLA DE ÍTEMS ──────────────────────────────────────────────────────────────────────
-    item_offset = (num_pagina - 1) * ITEMS_POR_PAGINA
-    story.append(_build_items_table(st, items_slice, item_offset, modo_divisas=modo_divisas))
-    story.append(Spacer(1, 0.08 * inch))
+    return [
+        _build_header_block(st, logos),
+        Spacer(1, 0.01 * inch),
+        _build_info_doc(st, datos_cotizacion, modo_divisas=modo_divisas),
+        Spacer(1, 0.08 * inch),
+        Paragraph("▼ DATOS DEL CLIENTE", st['seccion']),
+        _build_cliente_block(st, datos_cotizacion),
+        Spacer(1, 0.05 * inch),
+    ]
 
-    # ── TOTALES o NOTA DE CONTINUACIÓN ────────────────────────────────────────────────────────────
-    if es_ultima:
-        story.append(_build_totales_block(st, datos_cotizacion, modo_divisas=modo_divisas))
-    else:
-        story.append(_build_continua_block(st, num_pagina + 1))
 
-    story.append(Spacer(1, 0.08 * inch))
+def _altura_en_frame(flowables, frame):
+    """
+    Altura que ocupan los flowables al apilarse desde el tope de 'frame',
+    con las mismas reglas de espaciado que Frame.add (espacio antes/después
+    solapado). Solo mide: no dibuja ni carga imágenes en ningún canvas.
+    """
+    disponible = frame._getAvailableWidth()
+    y = frame._y
+    en_tope = True
+    espacio_previo = 0
+    for flowable in flowables:
+        s = 0
+        if not en_tope:
+            s = max(flowable.getSpaceBefore() - espacio_previo, 0)
+        _, h = flowable.wrap(disponible, y - frame._y1p - s)
+        espacio_previo = flowable.getSpaceAfter()
+        y -= h + s + espacio_previo
+        en_tope = False
+    return frame._y - y
+
+
+class _DocumentoCotizacion(BaseDocTemplate):
+    """
+    Documento multi-página construido en UNA sola pasada.
+
+    - La cabecera (header, barra de info y datos del cliente) se dibuja una
+      única vez como form XObject y cada página solo la referencia: los logos
+      quedan incrustados una sola vez en todo el PDF.
+    - La marca de agua también es un form XObject: sus trazos vectoriales se
+      escriben una vez y cada página los referencia.
+    - La marca de agua y la cabecera se dibujan en el callback onPage de la
+      plantilla; el frame de contenido empieza justo debajo de la cabecera,
+      en la misma posición que tenía en el diseño de una página.
+    - 'destino' puede ser una ruta o un objeto tipo archivo (BytesIO).
+    """
 
-    # ── PIE DE PÁGINA ────────────────────────────────────────────────────────
-    story.append(_build_footer_block(st))
+    _FORM_CABECERA = 'CabeceraCotizacion'
+    _FORM_MARCA_AGUA = 'MarcaAguaCotizacion'
+
+    def __init__(self, destino, cabecera):
+        super().__init__(
+            destino,
+            pagesize=landscape(letter),
+            rightMargin=MARGEN_H,
+            leftMargin=MARGEN_H,
+            topMargin=MARGEN_V,
+            bottomMargin=MARGEN_V,
+        )
+        self._cabecera = cabecera
+        self._cabecera_lista = False
+        self._background = InternationalFreightBackground()
+
+        # Mismo frame que usaba SimpleDocTemplate (padding por defecto de 6pt)
+        alto_cabecera = _altura_en_frame(cabecera, self._frame_completo())
+        alto_cuerpo = self.height - Frame(0, 0, 1, 1)._topPadding - alto_cabecera
+        cuerpo = Frame(
+            self.leftMargin, self.bottomMargin, self.width, alto_cuerpo,
+            topPadding=0, id='cuerpo'
+        )
+        self.addPageTemplates([
+            PageTemplate(id='cotizacion', frames=[cuerpo], onPage=self._dibujar_fondo)
+        ])
 
-    # Generar con marca de agua
-    background = InternationalFreightBackground()
-    doc.build(
-        story,
-        onFirstPage=background.draw_watermark,
-        onLaterPages=background.draw_watermark,
-    )
+    def _frame_completo(self):
+        return Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
 
-    return output_path
+    def _dibujar_fondo(self, canv, doc):
+        if not self._cabecera_lista:
+            # Primera página: se definen los dos forms una sola vez
+            canv.beginForm(self._FORM_MARCA_AGUA)
+            self._background.draw_watermark(canv, doc)
+            canv.endForm()
+            canv.beginForm(self._FORM_CABECERA)
+            self._frame_completo().addFromList(list(self._cabecera), canv)
+            canv.endForm()
+            self._cabecera_lista = True
+        canv.doForm(self._FORM_MARCA_AGUA)
+        canv.doForm(self._FORM_CABECERA)
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# FUNCIÓN PRINCIPAL
+# ─────────────────────────────────────────────────────────────────────────────
 def generar_pdf_cotizacion(datos_cotizacion, output_path, modo_divisas=False):
     """
     Genera un PDF multi-página con el diseño International Freight.
 
-    Estrategia: cada página se genera como un PDF independiente de una sola
-    hoja y luego se fusionan en un único archivo. Esto garantiza que el
-    header completo aparezca al inicio de cada página sin interferencia
-    del motor de flujo de ReportLab.
+    Estrategia: un solo documento (_DocumentoCotizacion). La cabecera se
+    repite mediante la plantilla de página y los ítems se paginan con la
+    regla fija de ITEMS_POR_PAGINA por hoja: cada página lleva su tabla de
+    ítems, la nota de continuación (o los totales en la última) y el pie,
+    seguidos de un salto de página.
 
     Args:
         datos_cotizacion: Diccionario con los datos de la cotización.
-        output_path: Ruta donde se guardará el PDF.
+        output_path: Ruta donde se guardará el PDF, o un objeto tipo archivo
+                     (p. ej. io.BytesIO) para generarlo en memoria.
+        modo_divisas: Si True, precios y totales en USD sin diferencial.
 
     Returns:
-        str: Ruta del archivo PDF generado.
+        str: Ruta del archivo PDF generado (o el mismo objeto tipo archivo).
     """
-    import tempfile
-    from pypdf import PdfWriter, PdfReader
-
-    # Cargar logos una sola vez
-    logos = {
-        'jdae': find_logo_path("LOGOJDAEAUTOPARTES.png"),
-        'aop':  find_logo_path("LogoAutoOnlinePro.png"),
-        'fb':   find_logo_path("LOGOFACEBOOK.png"),
-        'ig':   find_logo_path("LOGOINSTAGRAM.png"),
-        'tel':  find_logo_path("LOGOTELEFONO.png"),
-        'wa':   find_logo_path("LOGOWHATSAPP.png"),
-    }
-
-    # Construir estilos una sola vez
-    st = _build_styles()
+    # Logos y estilos: ya cargados en el proceso (DocumentAssets)
+    logos = _logos()
+    st = _estilos()
 
     # Obtener todos los ítems y dividir en páginas
     todos_items = datos_cotizacion.get('items', [])
@@ -734,50 +814,38 @@ def generar_pdf_cotizacion(datos_cotizacion, output_path, modo_divisas=False):
 
     total_paginas = len(paginas)
 
-    if total_paginas == 1:
-        # ── Caso simple: una sola página (comportamiento original) ────────────
-        return _generar_pagina_pdf(
-            datos_cotizacion, paginas[0], 1, 1,
-            logos, st, output_path, modo_divisas=modo_divisas
-        )
+    story = []
+    for num_pagina, items_slice in enumerate(paginas, 1):
+        # ── TABLA DE ÍTEMS ──────────────────────────────────────────────────
+        item_offset = (num_pagina - 1) * ITEMS_POR_PAGINA
+        story.append(_build_items_table(st, items_slice, item_offset, modo_divisas=modo_divisas))
+        story.append(Spacer(1, 0.08 * inch))
+
+        # ── TOTALES o NOTA DE CONTINUACIÓN ──────────────────────────────────
+        if num_pagina == total_paginas:
+            story.append(_build_totales_block(st, datos_cotizacion, modo_divisas=modo_divisas))
+        else:
+            story.append(_build_continua_block(st, num_pagina + 1))
+        story.append(Spacer(1, 0.08 * inch))
 
-    # ── Caso multi-página: generar cada hoja por separado y fusionar ──────────
-    writer = PdfWriter()
-    tmp_files = []
+        # ── PIE DE PÁGINA ───────────────────────────────────────────────────
+        story.append(_build_footer_block(st))
+        if num_pagina < total_paginas:
+            story.append(PageBreak())
 
-    try:
-        for num_pagina, items_slice in enumerate(paginas, 1):
-            # Archivo temporal para esta página
-            tmp_fd, tmp_path = tempfile.mkstemp(suffix=f'_p{num_pagina}.pdf')
-            os.close(tmp_fd)
-            tmp_files.append(tmp_path)
-
-            # Generar la página individual
-            _generar_pagina_pdf(
-                datos_cotizacion, items_slice, num_pagina, total_paginas,
-                logos, st, tmp_path, modo_divisas=modo_divisas
-            )
-
-            # Agregar la página al writer
-            reader = PdfReader(tmp_path)
-            for page in reader.pages:
-                writer.add_page(page)
-
-        # Escribir el PDF fusionado final
-        with open(output_path, 'wb') as f:
-            writer.write(f)
-
-    finally:
-        # Limpiar archivos temporales
-        for tmp_path in tmp_files:
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+    cabecera = _build_cabecera(st, datos_cotizacion, logos, modo_divisas=modo_divisas)
+    _DocumentoCotizacion(output_path, cabecera).build(story)
 
     return output_path
 
 
+def generar_pdf_bytes(datos_cotizacion, modo_divisas=False) -> bytes:
+    """Genera el PDF completamente en memoria y devuelve sus bytes."""
+    buffer = io.BytesIO()
+    generar_pdf_cotizacion(datos_cotizacion, buffer, modo_divisas=modo_divisas)
+    return buffer.getvalue()
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # CLASE WRAPPER PARA COMPATIBILIDAD
 # ─────────────────────────────────────────────────────────────────────────────
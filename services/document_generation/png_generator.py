@@ -1,19 +1,232 @@
 # services/document_generation/png_generator.py
 """
 Generador de PNG para cotizaciones de LogiPartVE Pro.
-Convierte cada página del PDF a un PNG de alta calidad.
+Rasteriza cada página de la cotización a un PNG de alta calidad.
 Soporte multi-página: devuelve una lista de rutas (una por página).
+
+Ruta directa en memoria: el PDF se construye en un BytesIO
+(generar_pdf_bytes) y se rasteriza en el mismo proceso con PDFium
+(pypdfium2), sin archivo temporal, sin subproceso de poppler y sin la
+pasada optimize=True de Pillow. Si pypdfium2 no está instalado se usa
+pdf2image/poppler como respaldo.
+
+Rendiciones: de una sola rasterización salen la miniatura del visor de la
+app, la imagen para WhatsApp/correo (JPEG o WebP con tamaño objetivo) y,
+solo bajo demanda, el PNG completo a self.dpi (ver RENDICIONES).
 """
 
-from pdf2image import convert_from_path
+import io
 import os
 
+from PIL import Image
+
+try:
+    import pypdfium2 as _pdfium
+except ImportError:  # respaldo: poppler vía pdf2image
+    _pdfium = None
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# RENDICIONES
+# ─────────────────────────────────────────────────────────────────────────────
+# Cambiar estos valores exige subir VERSION_PLANTILLA (document_cache) para
+# que las rendiciones ya cacheadas se regeneren.
+FORMATO_MENSAJE = os.environ.get('LOGIPARTVE_IMG_FORMATO', 'jpeg').lower()   # jpeg | webp
+
+RENDICIONES = {
+    # Vista previa en el visor de solo lectura de la app
+    'miniatura': {'formato': 'jpeg', 'lado_max': 1024, 'calidad': 72},
+    # WhatsApp / correo: WhatsApp recomprime igual, así que se apunta a un
+    # tamaño por página en lugar de a una calidad fija
+    'mensaje':   {'formato': FORMATO_MENSAJE, 'lado_max': 2048, 'kb_objetivo': 450},
+    # Original a la resolución de rasterización (solo bajo demanda)
+    'png':       {'formato': 'png'},
+}
+
+# Resolución (lado mayor, px) de la rasterización de la que se derivan las
+# rendiciones reducidas
+LADO_RASTER = max(spec.get('lado_max', 0) for spec in RENDICIONES.values())
+
+_EXTENSIONES = {'jpeg': 'jpg', 'webp': 'webp', 'png': 'png'}
+_MIMES = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'png': 'image/png'}
+
+# Rango de calidades que prueba la búsqueda del tamaño objetivo
+CALIDAD_MIN, CALIDAD_MAX = 40, 90
+
+
+def extension_rendicion(nombre: str) -> str:
+    """Extensión de archivo (sin punto) de una rendición."""
+    return _EXTENSIONES[RENDICIONES[nombre]['formato']]
+
+
+def mime_rendicion(nombre: str) -> str:
+    """Tipo MIME de una rendición (para st.download_button y adjuntos)."""
+    return _MIMES[RENDICIONES[nombre]['formato']]
+
+
+def sufijo_rendicion(nombre: str) -> str:
+    """Sufijo de la clave de caché de una rendición, p. ej. 'mensaje-jpg'."""
+    return f"{nombre}-{extension_rendicion(nombre)}"
+
 
 class PNGQuoteGenerator:
     """Generador de cotizaciones en formato PNG (multi-página)."""
 
-    def __init__(self):
-        self.dpi = 300  # Alta calidad para WhatsApp/Instagram
+    def __init__(self, dpi: int = 300, compress_level: int = 1):
+        """
+        Args:
+            dpi:            Resolución de salida (300 = alta calidad para WhatsApp/Instagram).
+            compress_level: Nivel zlib del PNG (0-9). 1 es ~10x más rápido que
+                            optimize=True con archivos apenas más grandes.
+        """
+        self.dpi = dpi
+        self.compress_level = compress_level
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # RASTERIZACIÓN EN MEMORIA
+    # ─────────────────────────────────────────────────────────────────────────
+    def _rasterizar(self, pdf, lado_max: int = None):
+        """
+        Convierte un PDF (bytes o ruta) en una lista de imágenes Pillow RGB,
+        una por página, a self.dpi. Con lado_max, cada página se rasteriza
+        directamente a ese lado mayor (sin pasar por self.dpi y reescalar).
+        """
+        if _pdfium is not None:
+            documento = _pdfium.PdfDocument(pdf)
+            try:
+                imagenes = []
+                for i in range(len(documento)):
+                    pagina = documento[i]
+                    escala = self.dpi / 72.0
+                    if lado_max:
+                        escala = min(escala, lado_max / max(pagina.get_size()))
+                    # PDFium redondea el bitmap hacia arriba (ceil(pt * escala)):
+                    # 792 pt a 150 dpi daban 1651 px por el error de coma
+                    # flotante. Se descuenta ese error para obtener los mismos
+                    # px que poppler (pt * dpi / 72).
+                    escala *= 1 - 1e-9
+                    imagenes.append(pagina.render(scale=escala).to_pil().convert('RGB'))
+                return imagenes
+            finally:
+                documento.close()
+
+        from pdf2image import convert_from_bytes, convert_from_path
+        if isinstance(pdf, (bytes, bytearray)):
+            return convert_from_bytes(bytes(pdf), dpi=self.dpi, fmt='png')
+        return convert_from_path(pdf, dpi=self.dpi, fmt='png')
+
+    def _a_png(self, imagen) -> bytes:
+        buffer = io.BytesIO()
+        imagen.save(buffer, 'PNG', compress_level=self.compress_level)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _guardar_como(imagen, formato: str, calidad: int) -> bytes:
+        buffer = io.BytesIO()
+        if formato == 'webp':
+            imagen.save(buffer, 'WEBP', quality=calidad, method=4)
+        else:
+            imagen.save(buffer, 'JPEG', quality=calidad)
+        return buffer.getvalue()
+
+    def _codificar(self, imagen, nombre: str) -> bytes:
+        """Codifica una página rasterizada según la rendición `nombre`."""
+        spec = RENDICIONES[nombre]
+        if spec['formato'] == 'png':
+            return self._a_png(imagen)
+
+        lado_max = spec.get('lado_max')
+        if lado_max and max(imagen.size) > lado_max:
+            imagen = imagen.copy()
+            imagen.thumbnail((lado_max, lado_max), Image.LANCZOS)
+
+        if 'kb_objetivo' not in spec:
+            return self._guardar_como(imagen, spec['formato'], spec['calidad'])
+
+        # Búsqueda binaria de la mayor calidad que cabe en el tamaño objetivo
+        objetivo = spec['kb_objetivo'] * 1024
+        bajo, alto = CALIDAD_MIN, CALIDAD_MAX
+        mejor = self._guardar_como(imagen, spec['formato'], bajo)
+        while bajo <= alto:
+            calidad = (bajo + alto) // 2
+            contenido = self._guardar_como(imagen, spec['formato'], calidad)
+            if len(contenido) <= objetivo:
+                mejor = contenido
+                bajo = calidad + 1
+            else:
+                alto = calidad - 1
+        return mejor
+
+    def render_renditions(self, quote_data, modo_divisas=False, nombres=('miniatura', 'mensaje')):
+        """
+        Genera el PDF y lo rasteriza una vez para todas las rendiciones
+        reducidas (más una a self.dpi si se pide el PNG completo).
+
+        Args:
+            quote_data:   Diccionario con datos de la cotización.
+            modo_divisas: Si True, usa el diseño PRECIO OPTIMIZADO (USD).
+            nombres:      Claves de RENDICIONES a producir.
+
+        Returns:
+            dict[str, list[bytes]]: por rendición, el contenido de cada página.
+        """
+        from .pdf_generator import generar_pdf_bytes
+        pdf = generar_pdf_bytes(quote_data, modo_divisas=modo_divisas)
+
+        # Las rendiciones con lado_max salen siempre de la misma rasterización
+        # a LADO_RASTER (resultado idéntico se pidan juntas o por separado);
+        # el PNG completo necesita la de self.dpi.
+        rasters = {}
+        resultado = {}
+        for nombre in nombres:
+            lado = LADO_RASTER if RENDICIONES[nombre].get('lado_max') else None
+            if lado not in rasters:
+                rasters[lado] = self._rasterizar(pdf, lado_max=lado)
+            resultado[nombre] = [self._codificar(img, nombre) for img in rasters[lado]]
+        return resultado
+
+    def render_pages(self, quote_data, modo_divisas=False):
+        """
+        Genera las páginas de la cotización como PNG en memoria.
+
+        Args:
+            quote_data:   Diccionario con datos de la cotización.
+            modo_divisas: Si True, usa el diseño PRECIO OPTIMIZADO (USD).
+
+        Returns:
+            list[bytes]: contenido PNG de cada página, en orden.
+        """
+        return self.render_renditions(quote_data, modo_divisas, ('png',))['png']
+
+    @staticmethod
+    def _guardar_paginas(paginas, output_path):
+        """
+        Escribe las páginas PNG en disco con la convención de nombres de
+        siempre: una sola página → output_path; varias → sufijos _p1, _p2, …
+        """
+        if not paginas:
+            print("No se pudieron generar imágenes del PDF")
+            return None
+
+        if len(paginas) == 1:
+            # ── Caso original: una sola página ───────────────────────────────
+            with open(output_path, 'wb') as f:
+                f.write(paginas[0])
+            return output_path
+
+        # ── Caso multi-página ────────────────────────────────────────────────
+        base, ext = os.path.splitext(output_path)
+        if not ext:
+            ext = '.png'
+
+        rutas = []
+        for i, contenido in enumerate(paginas, 1):
+            ruta_pagina = f"{base}_p{i}{ext}"
+            with open(ruta_pagina, 'wb') as f:
+                f.write(contenido)
+            rutas.append(ruta_pagina)
+
+        return rutas
 
     # ─────────────────────────────────────────────────────────────────────────
     # MÉTODO PRINCIPAL: PDF → lista de PNGs
@@ -39,41 +252,19 @@ class PNGQuoteGenerator:
                 - None      → error
         """
         try:
-            images = convert_from_path(pdf_path, dpi=self.dpi, fmt='png')
-
-            if not images:
-                print("No se pudieron generar imágenes del PDF")
-                return None
-
-            if len(images) == 1:
-                # ── Caso original: una sola página ───────────────────────────
-                images[0].save(output_path, 'PNG', quality=95, optimize=True)
-                return output_path
-
-            # ── Caso multi-página ────────────────────────────────────────────
-            base, ext = os.path.splitext(output_path)
-            if not ext:
-                ext = '.png'
-
-            rutas = []
-            for i, img in enumerate(images, 1):
-                ruta_pagina = f"{base}_p{i}{ext}"
-                img.save(ruta_pagina, 'PNG', quality=95, optimize=True)
-                rutas.append(ruta_pagina)
-
-            return rutas
+            paginas = [self._a_png(img) for img in self._rasterizar(pdf_path)]
+            return self._guardar_paginas(paginas, output_path)
 
         except Exception as e:
             print(f"Error generando PNG: {e}")
             return None
 
     # ─────────────────────────────────────────────────────────────────────────
-    # MÉTODO DESDE DATOS: genera PDF temporal y luego convierte a PNG(s)
+    # MÉTODO DESDE DATOS: PDF en memoria → PNG(s), sin archivos temporales
     # ─────────────────────────────────────────────────────────────────────────
     def generate_quote_png_from_data(self, quote_data, output_path):
         """
         Genera PNG(s) directamente desde los datos de cotización.
-        (Genera un PDF temporal y luego lo convierte.)
 
         Args:
             quote_data:  Diccionario con datos de la cotización.
@@ -83,25 +274,7 @@ class PNGQuoteGenerator:
             str | list[str] | None: igual que generate_quote_png().
         """
         try:
-            from .pdf_generator import PDFQuoteGenerator
-            import tempfile
-
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_pdf:
-                tmp_pdf_path = tmp_pdf.name
-
-            pdf_path = PDFQuoteGenerator.generate(quote_data, tmp_pdf_path)
-
-            if not pdf_path:
-                return None
-
-            result = self.generate_quote_png(pdf_path, output_path)
-
-            try:
-                os.unlink(tmp_pdf_path)
-            except Exception:
-                pass
-
-            return result
+            return self._guardar_paginas(self.render_pages(quote_data), output_path)
 
         except Exception as e:
             print(f"Error generando PNG desde datos: {e}")
@@ -123,25 +296,8 @@ class PNGQuoteGenerator:
             str | list[str] | None: igual que generate_quote_png().
         """
         try:
-            from .pdf_generator import PDFQuoteGenerator
-            import tempfile
-
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_pdf:
-                tmp_pdf_path = tmp_pdf.name
-
-            pdf_path = PDFQuoteGenerator.generate_divisas(quote_data, tmp_pdf_path)
-
-            if not pdf_path:
-                return None
-
-            result = self.generate_quote_png(pdf_path, output_path)
-
-            try:
-                os.unlink(tmp_pdf_path)
-            except Exception:
-                pass
-
-            return result
+            paginas = self.render_pages(quote_data, modo_divisas=True)
+            return self._guardar_paginas(paginas, output_path)
 
         except Exception as e:
             print(f"Error generando PNG divisas: {e}")
@@ -0,0 +1,115 @@
+# services/document_generation/quote_adapter.py
+"""
+Adaptadores BD → generadores de documentos.
+
+Convierten las filas de quotes / quote_items al formato que esperan el
+generador PDF/PNG y el Cuadro de Costos. Viven en services (y no en las
+vistas) porque también los usa la cola de render en segundo plano.
+"""
+
+from datetime import datetime
+
+from services.pricing import desglose
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ADAPTADOR: BD → PDF/PNG generator
+# ─────────────────────────────────────────────────────────────────────────────
+def adaptar_quote_para_generadores(qd: dict) -> dict:
+    """
+    Convierte el diccionario devuelto por get_quote_full_details()
+    (campos en inglés: description, part_number, quantity…)
+    al formato que espera PDFQuoteGenerator y PNGQuoteGenerator
+    (campos en español: descripcion, parte, cantidad…).
+
+    Los montos salen del desglose guardado de cada ítem y de la cotización
+    (services.pricing.desglose): no se recalcula nada.
+    """
+    items_adaptados = []
+    desgloses = []
+    for item in qd.get('items', []):
+        d = desglose.del_item(item)
+        desgloses.append(d)
+        items_adaptados.append({
+            'descripcion':         item.get('description', 'N/A'),
+            'parte':               item.get('part_number', ''),
+            'marca':               item.get('marca', ''),
+            'garantia':            item.get('garantia', ''),
+            'envio_tipo':          item.get('envio_tipo', ''),
+            'origen':              item.get('origen', ''),
+            'fabricacion':         item.get('fabricacion', ''),
+            'tiempo_entrega':      item.get('tiempo_entrega', ''),
+            **{campo: d[campo] for campo in desglose.CAMPOS_ITEM},
+            'costo_unitario':      d['precio_usd'],
+            'costo_total':         d['precio_usd'],
+            'costo_total_bs':      d['precio_bs'],
+        })
+    totales = desglose.de_cotizacion(qd, desgloses)
+
+    # Fecha en formato que espera el PDF
+    try:
+        fecha_str = datetime.fromisoformat(
+            str(qd.get('created_at', ''))
+        ).strftime('%Y-%m-%d')
+    except Exception:
+        fecha_str = datetime.now().strftime('%Y-%m-%d')
+
+    # Términos y condiciones
+    terminos = (
+        qd.get('terms_conditions') or
+        qd.get('terminos_condiciones') or
+        'Términos y condiciones estándar.'
+    )
+
+    return {
+        'quote_number':        qd.get('quote_number', 'N/A'),
+        'numero_cotizacion':   qd.get('quote_number', 'N/A'),
+        'analyst_name':        qd.get('analyst_name', ''),
+        'asesor_ventas':       qd.get('analyst_name', ''),
+        'fecha':               fecha_str,
+        'client': {
+            'nombre':    qd.get('client_name', ''),
+            'telefono':  qd.get('client_phone', ''),
+            'email':     qd.get('client_email', ''),
+            'ci_rif':    qd.get('client_cedula', ''),
+            'direccion': qd.get('client_address', ''),
+            'vehiculo':  qd.get('client_vehicle', ''),
+            'año':       qd.get('client_year', ''),
+            'vin':       qd.get('client_vin', ''),
+            'motor':     '',
+        },
+        'cliente': {
+            'nombre':    qd.get('client_name', ''),
+            'telefono':  qd.get('client_phone', ''),
+            'email':     qd.get('client_email', ''),
+            'ci_rif':    qd.get('client_cedula', ''),
+            'direccion': qd.get('client_address', ''),
+            'vehiculo':  qd.get('client_vehicle', ''),
+            'año':       qd.get('client_year', ''),
+            'vin':       qd.get('client_vin', ''),
+            'motor':     '',
+        },
+        'items':               items_adaptados,
+        **{campo: totales[campo] for campo in desglose.CAMPOS_TOTALES},
+        'terminos_condiciones': terminos,
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ADAPTADOR: BD → CUADRO DE COSTOS
+# ─────────────────────────────────────────────────────────────────────────────
+def items_para_cuadro_costos(items_raw: list) -> list:
+    """
+    Convierte los ítems de get_quote_items() al formato del Cuadro de Costos
+    (generar_cuadro_costos_png), con los valores del desglose guardado de
+    cada ítem: los mismos que el analista calculó y el cliente aprobó.
+    """
+    items_para_cuadro = []
+    for item in items_raw:
+        d = desglose.del_item(item)
+        items_para_cuadro.append({
+            'descripcion': item.get('description', 'Ítem'),
+            'parte':       item.get('part_number', ''),
+            **{campo: d[campo] for campo in desglose.CAMPOS_ITEM},
+        })
+    return items_para_cuadro
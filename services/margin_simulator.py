@@ -0,0 +1,289 @@
+# services/margin_simulator.py
+# Simulador "¿qué pasaría si?" de márgenes sobre los ítems históricos
+"""
+El administrador ajusta los factores de utilidad, el diferencial y las
+opciones de manejo sin ver su efecto. Este simulador aplica un conjunto de
+parámetros propuesto a todos los ítems históricos con la misma cadena de
+precios del analista (services.pricing.calcular_items):
+
+  - HistorialItems carga una vez por proceso los ítems (FOB, cantidad,
+    handling, manejo, impuesto %, envío, factor, IVA) y el estado y la
+    fecha de su cotización en arrays columnares; se relee cada
+    _REFRESCO_SEGUNDOS o al invalidar().
+  - simular() evalúa S escenarios a la vez: repite las columnas S veces
+    y hace una sola llamada vectorizada a calcular_items.
+  - Cada ítem pesa por su probabilidad de aprobación: 1 si la cotización
+    fue aprobada, 0 si fue rechazada o anulada y la tasa histórica de
+    aprobación si sigue abierta. Con elasticidad > 0 la probabilidad
+    cae cuando el precio del escenario sube respecto al actual:
+    p × (precio / precio_actual) ^ −elasticidad.
+
+Parámetros de un escenario (todos opcionales; lo omitido queda como hoy):
+  factores      {factor actual: factor propuesto}
+  escala_margen multiplica el margen del factor: 1 + (factor − 1) × escala
+  manejos       {manejo actual: manejo propuesto}
+  diferencial_porcentaje, tax_porcentaje, iva_porcentaje
+  elasticidad   sensibilidad de la aprobación al precio (0 = ninguna)
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from database.db_manager import DBManager, valor_fila
+from services.pricing import calcular_items
+
+# Antigüedad máxima de los arrays antes de releer la BD
+_REFRESCO_SEGUNDOS = 600
+
+# Filas por fetchmany al cargar
+_BLOQUE = 5000
+
+_COLUMNAS = ('quantity', 'unit_cost', 'international_handling', 'national_handling',
+             'shipping_cost', 'tax_percentage', 'profit_factor', 'aplicar_iva',
+             'status', 'created_at', 'quote_id')
+
+# Probabilidad de aprobación por estado (None = tasa histórica)
+_PROBABILIDAD_ESTADO = {'approved': 1.0, 'rejected': 0.0, 'cancelled': 0.0}
+
+# Períodos del filtro (días hacia atrás), los mismos de Estadísticas Globales
+PERIODOS = {'all': None, 'year': 365, 'quarter': 90, 'month': 30}
+
+
+def _fecha(valor) -> float:
+    """created_at (datetime o texto ISO) → timestamp; NaN si no se puede leer."""
+    if valor is None:
+        return np.nan
+    if isinstance(valor, str):
+        try:
+            valor = datetime.fromisoformat(valor.strip().replace('Z', ''))
+        except ValueError:
+            return np.nan
+    try:
+        return valor.replace(tzinfo=None).timestamp()
+    except (AttributeError, ValueError, OverflowError):
+        return np.nan
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# HISTORIAL EN MEMORIA
+# ─────────────────────────────────────────────────────────────────────────────
+class HistorialItems:
+    """Ítems históricos en arrays columnares, compartidos por todo el proceso."""
+
+    _lock = threading.RLock()
+    _cargado_en: Optional[float] = None
+    _datos: Optional[Dict[str, np.ndarray]] = None
+
+    @classmethod
+    def invalidar(cls):
+        """Fuerza la recarga en la próxima consulta."""
+        with cls._lock:
+            cls._cargado_en = None
+
+    @classmethod
+    def refrescar(cls) -> bool:
+        """Lee todos los ítems con FOB y cantidad y reemplaza los arrays."""
+        conn = None
+        filas = []
+        try:
+            conn = DBManager.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT qi.quantity, qi.unit_cost, qi.international_handling, qi.national_handling,
+                       qi.shipping_cost, qi.tax_percentage, qi.profit_factor, qi.aplicar_iva,
+                       q.status, q.created_at, qi.quote_id
+                FROM quote_items qi JOIN quotes q ON q.id = qi.quote_id
+                WHERE qi.unit_cost > 0 AND qi.quantity > 0
+            """)
+            while True:
+                bloque = cursor.fetchmany(_BLOQUE)
+                if not bloque:
+                    break
+                filas.extend(tuple(valor_fila(r, c, i) for i, c in enumerate(_COLUMNAS)) for r in bloque)
+            cursor.close()
+            conn.close()
+            conn = None
+        except Exception as e:
+            print(f"❌ Error cargando historial de ítems para el simulador: {e}")
+            if conn:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            return False
+
+        columnas = list(zip(*filas)) if filas else [()] * len(_COLUMNAS)
+        numerica = lambda j: np.asarray([float(v or 0) for v in columnas[j]], dtype=np.float64)
+        estados = np.asarray([str(v or 'draft') for v in columnas[8]], dtype=object)
+        datos = {
+            'cantidad':            numerica(0),
+            'costo_fob':           numerica(1),
+            'costo_handling':      numerica(2),
+            'costo_manejo':        numerica(3),
+            'costo_envio':         numerica(4),
+            'impuesto_porcentaje': numerica(5),
+            'factor_utilidad':     numerica(6),
+            'aplicar_iva':         np.asarray([bool(v) for v in columnas[7]], dtype=bool),
+            'estado':              estados,
+            'creado':              np.asarray([_fecha(v) for v in columnas[9]], dtype=np.float64),
+            'quote_id':            np.asarray([int(v or 0) for v in columnas[10]], dtype=np.int64),
+        }
+        with cls._lock:
+            cls._datos = datos
+            cls._cargado_en = time.monotonic()
+        return True
+
+    @classmethod
+    def datos(cls) -> Optional[Dict[str, np.ndarray]]:
+        """Arrays del historial (carga o relee cuando toca); None si la BD falla."""
+        cargado_en = cls._cargado_en
+        if cls._datos is None or cargado_en is None or time.monotonic() - cargado_en >= _REFRESCO_SEGUNDOS:
+            cls.refrescar()
+        return cls._datos
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SIMULACIÓN
+# ─────────────────────────────────────────────────────────────────────────────
+def _remapear(valores: np.ndarray, mapa: Optional[dict]) -> np.ndarray:
+    """Reemplaza cada valor actual por el propuesto en mapa (comparación a 4 decimales)."""
+    if not mapa:
+        return valores
+    resultado = valores.copy()
+    redondeados = np.round(valores, 4)
+    for actual, propuesto in mapa.items():
+        if propuesto is None:
+            continue
+        resultado[redondeados == round(float(actual), 4)] = float(propuesto)
+    return resultado
+
+
+def _filtro(datos: dict, periodo: str = 'all', estados: Optional[List[str]] = None) -> np.ndarray:
+    mascara = np.ones(len(datos['cantidad']), dtype=bool)
+    dias = PERIODOS.get(periodo)
+    if dias:
+        desde = (datetime.now() - timedelta(days=dias)).timestamp()
+        mascara &= datos['creado'] >= desde
+    if estados:
+        mascara &= np.isin(datos['estado'], list(estados))
+    return mascara
+
+
+def probabilidad_base(estado: np.ndarray) -> np.ndarray:
+    """Probabilidad de aprobación por ítem según el estado de su cotización."""
+    decididos = np.isin(estado, list(_PROBABILIDAD_ESTADO))
+    aprobados = estado == 'approved'
+    tasa = aprobados.sum() / decididos.sum() if decididos.any() else 0.0
+    probabilidad = np.full(len(estado), tasa, dtype=np.float64)
+    for valor, p in _PROBABILIDAD_ESTADO.items():
+        probabilidad[estado == valor] = p
+    return probabilidad
+
+
+def simular(escenarios: List[dict], periodo: str = 'all', estados: Optional[List[str]] = None,
+            base: Optional[dict] = None) -> Optional[dict]:
+    """
+    Evalúa escenarios sobre el historial.
+
+    Args:
+        escenarios: lista de dicts de parámetros (ver docstring del módulo)
+        periodo:    'all', 'year', 'quarter' o 'month' (fecha de la cotización)
+        estados:    estados de cotización a incluir (None = todos)
+        base:       diferencial/TAX/IVA de referencia (None = configuración vigente)
+
+    Returns:
+        dict: 'actual' (métricas con los parámetros de referencia) y
+        'escenarios' (una entrada de métricas por escenario): items,
+        cotizaciones, ingresos, utilidad, margen, diferencial,
+        ingresos_esperados, utilidad_esperada, margen_ponderado y
+        aprobacion_esperada. None si no se pudo leer el historial.
+    """
+    datos = HistorialItems.datos()
+    if datos is None:
+        return None
+    if base is None:
+        from services.repricing import parametros_vigentes
+        base = parametros_vigentes()
+
+    mascara = _filtro(datos, periodo, estados)
+    col = {k: v[mascara] for k, v in datos.items()}
+    n = len(col['cantidad'])
+    todos = [{}] + list(escenarios)       # el primero es la referencia
+    s = len(todos)
+
+    def repetir(clave):
+        return np.tile(col[clave], s)
+
+    def por_escenario(clave, defecto):
+        return np.repeat([float(e.get(clave, defecto)) for e in todos], n)
+
+    factores, manejos = [], []
+    for e in todos:
+        f = _remapear(col['factor_utilidad'], e.get('factores'))
+        escala = float(e.get('escala_margen', 1.0))
+        if escala != 1.0:
+            f = np.where(f > 0, 1 + (f - 1) * escala, f)
+        factores.append(f)
+        manejos.append(_remapear(col['costo_manejo'], e.get('manejos')))
+
+    r = calcular_items({
+        'cantidad':               repetir('cantidad'),
+        'costo_fob':              repetir('costo_fob'),
+        'costo_handling':         repetir('costo_handling'),
+        'costo_manejo':           np.concatenate(manejos) if n else np.zeros(0),
+        'costo_envio':            repetir('costo_envio'),
+        'impuesto_porcentaje':    repetir('impuesto_porcentaje'),
+        'factor_utilidad':        np.concatenate(factores) if n else np.zeros(0),
+        'tax_porcentaje':         por_escenario('tax_porcentaje', base['tax_porcentaje']),
+        'diferencial_porcentaje': por_escenario('diferencial_porcentaje', base['diferencial_porcentaje']),
+        'aplicar_iva':            repetir('aplicar_iva'),
+        'iva_porcentaje':         por_escenario('iva_porcentaje', base['iva_porcentaje']),
+    })
+    precio = r['precio_usd'].reshape(s, n)
+    utilidad = r['utilidad_valor'].reshape(s, n)
+    diferencial = r['diferencial_valor'].reshape(s, n)
+
+    p0 = probabilidad_base(col['estado'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relacion = np.where(precio[0] > 0, precio / np.where(precio[0] > 0, precio[0], 1), 1.0)
+    elasticidad = np.array([float(e.get('elasticidad', 0.0)) for e in todos])[:, None]
+    probabilidad = np.clip(p0 * relacion ** -elasticidad, 0.0, 1.0)
+
+    ingresos = precio.sum(axis=1)
+    ganancia = utilidad.sum(axis=1)
+    esperados = (probabilidad * precio).sum(axis=1)
+    ganancia_esperada = (probabilidad * utilidad).sum(axis=1)
+    cotizaciones = int(len(np.unique(col['quote_id'])))
+
+    def metricas(i):
+        return {
+            'items':               n,
+            'cotizaciones':        cotizaciones,
+            'ingresos':            round(float(ingresos[i]), 2),
+            'utilidad':            round(float(ganancia[i]), 2),
+            'margen':              round(float(ganancia[i] / ingresos[i]), 4) if ingresos[i] else 0.0,
+            'diferencial':         round(float(diferencial[i].sum()), 2),
+            'ingresos_esperados':  round(float(esperados[i]), 2),
+            'utilidad_esperada':   round(float(ganancia_esperada[i]), 2),
+            'margen_ponderado':    round(float(ganancia_esperada[i] / esperados[i]), 4) if esperados[i] else 0.0,
+            'aprobacion_esperada': round(float(probabilidad[i].mean()), 4) if n else 0.0,
+        }
+
+    return {'actual': metricas(0), 'escenarios': [metricas(i) for i in range(1, s)]}
+
+
+def barrer(escenario: dict, escalas, **filtros) -> Optional[List[dict]]:
+    """
+    Curva del escenario al escalar su margen: una simulación por valor de
+    escalas (escala_margen), todas en la misma llamada vectorizada.
+    """
+    escalas = [float(x) for x in escalas]
+    base = float(escenario.get('escala_margen', 1.0))
+    resultado = simular([{**escenario, 'escala_margen': base * x} for x in escalas], **filtros)
+    if resultado is None:
+        return None
+    return [{'escala': x, **m} for x, m in zip(escalas, resultado['escenarios'])]
@@ -0,0 +1,19 @@
+# services/pricing/__init__.py
+"""
+Motor de precios de LogiPartVE Pro (cadena de 9 pasos de la cotización y flete)
+"""
+
+from .engine import (
+    COLUMNAS_ENTRADA,
+    MULTIPLO_USD,
+    calcular_item,
+    calcular_items,
+    totales_cotizacion,
+)
+from .freight import MINIMO_USD, TarifasFlete, costos_flete
+from .incremental import TotalesIncrementales
+from .packing import CAJAS_ESTANDAR, consolidar, empacar
+
+__all__ = ['COLUMNAS_ENTRADA', 'MULTIPLO_USD', 'calcular_item', 'calcular_items', 'totales_cotizacion',
+           'TotalesIncrementales', 'MINIMO_USD', 'TarifasFlete', 'costos_flete',
+           'CAJAS_ESTANDAR', 'consolidar', 'empacar']
@@ -0,0 +1,206 @@
+# services/pricing/desglose.py
+# Desglose de costos congelado al guardar: lo que los documentos leen sin recalcular
+"""
+Al guardar una cotización, el resultado del motor de precios se guarda
+junto a cada ítem (quote_items.desglose) y a la cotización
+(quotes.desglose): JSONB en PostgreSQL, texto JSON en SQLite. El PDF/PNG,
+el Cuadro de Costos y las vistas de Mis Cotizaciones leen estos valores
+tal cual: ver o generar una cotización ya no recalcula nada y una
+cotización vieja se ve exactamente como se cotizó, aunque después cambie
+el diferencial, el TAX o el IVA de la configuración.
+
+Formato (versión VERSION): un dict plano con 'v' y las claves de
+CAMPOS_ITEM / CAMPOS_TOTALES (mismos nombres que usan los generadores).
+Un desglose de otra versión o incompleto se ignora y se reconstruye con
+item_legado() / totales_legado(), la lógica de respaldo que antes vivía en
+quote_adapter; database/migrations/backfill_quote_desglose.py congela así
+el histórico una sola vez.
+"""
+
+import json
+from typing import Optional
+
+from .engine import _monto, totales_cotizacion
+
+# Versión del formato guardado
+VERSION = 1
+
+# Campos del desglose de un ítem
+CAMPOS_ITEM = (
+    'cantidad', 'costo_fob', 'fob_total', 'costo_handling', 'costo_manejo',
+    'costo_impuesto', 'impuesto_porcentaje', 'factor_utilidad', 'utilidad_valor',
+    'costo_envio', 'costo_tax', 'tax_porcentaje', 'diferencial_valor',
+    'diferencial_porcentaje', 'precio_usd', 'precio_bs', 'aplicar_iva',
+    'iva_porcentaje', 'iva_valor',
+)
+
+# Campos del desglose de la cotización (claves de totales_desde_sumas)
+CAMPOS_TOTALES = (
+    'sub_total', 'iva_total', 'total_a_pagar', 'abona_ya', 'y_en_entrega',
+    'total_usd', 'total_bs', 'total_usd_divisas', 'usd_abono', 'usd_entrega',
+)
+
+# Porcentajes y factores se guardan con 4 decimales; los montos, al centavo
+_CAMPOS_TASA = ('impuesto_porcentaje', 'factor_utilidad', 'tax_porcentaje',
+                'diferencial_porcentaje', 'iva_porcentaje')
+
+# TAX de las cotizaciones guardadas antes de que el TAX fuera configurable
+_TAX_LEGADO = 7.0
+
+
+def _normalizar(campo: str, valor):
+    if campo == 'aplicar_iva':
+        return bool(valor)
+    if campo == 'cantidad':
+        return int(_monto(valor) or 1)
+    return round(_monto(valor), 4 if campo in _CAMPOS_TASA else 2)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CONSTRUCCIÓN (al guardar)
+# ─────────────────────────────────────────────────────────────────────────────
+def desglose_item(item: dict) -> dict:
+    """
+    Desglose de un ítem ya calculado por el motor (claves del formulario del
+    analista: fob_total, costo_impuesto, utilidad_valor, costo_tax, …).
+    """
+    desglose = {'v': VERSION}
+    for campo in CAMPOS_ITEM:
+        valor = item.get(campo)
+        if campo == 'factor_utilidad' and not valor:
+            valor = 1.0
+        desglose[campo] = _normalizar(campo, valor)
+    return desglose
+
+
+def desglose_totales(totales: dict) -> dict:
+    """Desglose de la cotización a partir de los totales del motor."""
+    desglose = {'v': VERSION}
+    for campo in CAMPOS_TOTALES:
+        desglose[campo] = _normalizar(campo, totales.get(campo))
+    return desglose
+
+
+def serializar(desglose: Optional[dict]) -> Optional[str]:
+    """Texto JSON compacto para guardar en la columna desglose."""
+    if not desglose:
+        return None
+    return json.dumps(desglose, separators=(',', ':'), ensure_ascii=False)
+
+
+def leer(valor, campos: tuple = CAMPOS_ITEM) -> Optional[dict]:
+    """
+    Desglose guardado (dict de JSONB o texto JSON) o None si falta, es de
+    otra versión o no trae todos los campos.
+    """
+    if not valor:
+        return None
+    if isinstance(valor, (str, bytes)):
+        try:
+            valor = json.loads(valor)
+        except (ValueError, TypeError):
+            return None
+    if not isinstance(valor, dict) or valor.get('v') != VERSION:
+        return None
+    if any(campo not in valor for campo in campos):
+        return None
+    return valor
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# RESPALDO: cotizaciones guardadas sin desglose
+# ─────────────────────────────────────────────────────────────────────────────
+def item_legado(row: dict) -> dict:
+    """
+    Reconstruye el desglose de una fila de quote_items sin desglose
+    guardado, con los campos calculados que sí se guardaron (fob_total,
+    utilidad_valor, precio_usd, precio_bs, diferencial_*, iva_*) y los
+    demás recalculados como lo hacía el Cuadro de Costos.
+    """
+    cantidad = int(_monto(row.get('quantity')) or 1)
+    costo_fob = _monto(row.get('unit_cost'))
+    imp_pct = _monto(row.get('tax_percentage'))
+    factor_ut = _monto(row.get('profit_factor')) or 1.0
+    handling = _monto(row.get('international_handling'))
+    manejo = _monto(row.get('national_handling'))
+    envio = _monto(row.get('shipping_cost'))
+
+    fob_total = _monto(row.get('fob_total')) or costo_fob * cantidad
+    utilidad = _monto(row.get('utilidad_valor')) or (fob_total * factor_ut) - fob_total
+    imp_int = fob_total * (imp_pct / 100)
+    base_tax = fob_total + handling + manejo + imp_int + utilidad + envio
+    costo_tax = base_tax * (_TAX_LEGADO / 100)
+
+    # precio_usd y total_cost deben coincidir; si no, vale el mayor (el aprobado)
+    precio_usd = max(_monto(row.get('precio_usd')), _monto(row.get('total_cost')))
+    if precio_usd <= 0:
+        precio_usd = -(-(base_tax + costo_tax) // 5) * 5
+
+    precio_bs = _monto(row.get('precio_bs'))
+    dif_pct = _monto(row.get('diferencial_porcentaje'))
+    dif_val = _monto(row.get('diferencial_valor'))
+    if precio_bs > 0:
+        dif_val = dif_val or precio_bs - precio_usd
+        if not dif_pct:
+            dif_pct = round(dif_val / precio_usd * 100, 2) if precio_usd > 0 else 45.0
+    else:
+        try:
+            from database.config_helpers import ConfigHelpers
+            dif_pct = ConfigHelpers.get_diferencial()
+        except Exception:
+            dif_pct = 45.0
+        dif_val = precio_usd * (dif_pct / 100)
+        precio_bs = precio_usd + dif_val
+
+    aplicar_iva = bool(row.get('aplicar_iva', False))
+    iva_pct = _monto(row.get('iva_porcentaje')) or 16.0
+    iva_val = _monto(row.get('iva_valor'))
+    if aplicar_iva and iva_val == 0:
+        iva_val = precio_bs * (iva_pct / 100)
+
+    return desglose_item({
+        'cantidad': cantidad, 'costo_fob': costo_fob, 'fob_total': fob_total,
+        'costo_handling': handling, 'costo_manejo': manejo, 'costo_impuesto': imp_int,
+        'impuesto_porcentaje': imp_pct, 'factor_utilidad': factor_ut, 'utilidad_valor': utilidad,
+        'costo_envio': envio, 'costo_tax': costo_tax, 'tax_porcentaje': _TAX_LEGADO,
+        'diferencial_valor': dif_val, 'diferencial_porcentaje': dif_pct,
+        'precio_usd': precio_usd, 'precio_bs': precio_bs, 'aplicar_iva': aplicar_iva,
+        'iva_porcentaje': iva_pct, 'iva_valor': iva_val,
+    })
+
+
+def totales_legado(quote: dict, items: list) -> dict:
+    """
+    Reconstruye el desglose de una cotización sin desglose guardado. Los
+    totales de cabecera guardados (sub_total, iva_total, abona_ya,
+    en_entrega, total_amount) son los que se cotizaron y tienen prioridad;
+    los demás salen de los desgloses de sus ítems.
+    """
+    totales = totales_cotizacion([
+        {**item, 'costo_total': item['precio_usd'], 'costo_total_bs': item['precio_bs']}
+        for item in items
+    ])
+    if _monto(quote.get('total_amount')) or _monto(quote.get('sub_total')):
+        totales['sub_total'] = _monto(quote.get('sub_total'))
+        totales['iva_total'] = _monto(quote.get('iva_total'))
+        totales['total_a_pagar'] = totales['sub_total'] + totales['iva_total']
+        totales['abona_ya'] = _monto(quote.get('abona_ya'))
+        totales['y_en_entrega'] = _monto(quote.get('en_entrega'))
+        totales['total_usd'] = _monto(quote.get('total_amount'))
+    return desglose_totales(totales)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LECTURA
+# ─────────────────────────────────────────────────────────────────────────────
+def del_item(row: dict) -> dict:
+    """Desglose de una fila de quote_items: el guardado o, si no hay, el reconstruido."""
+    return leer(row.get('desglose'), CAMPOS_ITEM) or item_legado(row)
+
+
+def de_cotizacion(quote: dict, items: list) -> dict:
+    """
+    Desglose de una fila de quotes: el guardado o, si no hay, el
+    reconstruido (items: desgloses de sus ítems, ver del_item).
+    """
+    return leer(quote.get('desglose'), CAMPOS_TOTALES) or totales_legado(quote, items)
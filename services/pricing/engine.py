@@ -0,0 +1,349 @@
+# services/pricing/engine.py
+# Motor de precios: cadena de 9 pasos de la cotización, vectorizada con NumPy
+"""
+Una sola implementación de la cadena de precios del Excel del usuario
+(antes copiada en SECCIÓN 6 / SECCIÓN 8 de analyst_panel y en
+DBManager.update_quote_complete):
+
+  1. FOB total         = FOB × Cantidad
+  2. Impuesto int.     = FOB total × impuesto%
+  3. Utilidad          = FOB total × Factor − FOB total
+  4. Base TAX          = FOB + Handling + Manejo + Impuesto + Utilidad + Envío
+     TAX               = Base TAX × tax%
+  5. Precio USD        = Base TAX + TAX
+  6. Diferencial       = Precio USD × diferencial%
+  7. Precio Bs sin IVA = Precio USD + Diferencial
+  8. IVA               = Precio Bs sin IVA × iva%   (solo si aplica)
+  9. Precio USD final  = múltiplo de 5 hacia arriba; la diferencia
+                         (redondeo) se suma a la utilidad
+
+Reglas de centavos: todo se calcula en centavos enteros (int64). Cada
+monto derivado de un porcentaje o factor se redondea al centavo (mitad
+hacia arriba) en el paso donde nace, y los montos compuestos son sumas
+exactas de centavos. Así Precio USD = suma de sus componentes, Precio Bs
+= Precio USD + Diferencial y los totales de la cotización cuadran con la
+suma de los ítems sin residuos de coma flotante. El múltiplo de 5 se
+aplica sobre el precio ya redondeado al centavo (un 200.000000001 de
+coma flotante ya no salta a 205).
+"""
+
+import numpy as np
+
+# Columnas de entrada de calcular_items (una posición por ítem)
+COLUMNAS_ENTRADA = (
+    'cantidad', 'costo_fob', 'costo_handling', 'costo_manejo', 'costo_envio',
+    'impuesto_porcentaje', 'factor_utilidad', 'tax_porcentaje',
+    'diferencial_porcentaje', 'aplicar_iva', 'iva_porcentaje',
+)
+
+# Múltiplo (USD) al que se redondea hacia arriba el precio USD
+MULTIPLO_USD = 5
+_MULTIPLO_CENTAVOS = MULTIPLO_USD * 100
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CENTAVOS
+# ─────────────────────────────────────────────────────────────────────────────
+def _redondear(centavos):
+    """
+    Monto en centavos (float) → centavos enteros, mitad hacia arriba (lejos
+    de cero). El redondeo previo a 6 decimales absorbe el error binario
+    (1.005 × 100 = 100.49999…).
+    """
+    c = np.round(np.asarray(centavos, dtype=np.float64), 6)
+    return (np.sign(c) * np.floor(np.abs(c) + 0.5)).astype(np.int64)
+
+
+def _centavos(dolares):
+    """Dólares (escalar o array) → centavos enteros."""
+    return _redondear(np.asarray(dolares, dtype=np.float64) * 100)
+
+
+def _porcentaje(centavos, porcentaje):
+    """centavos × porcentaje / 100, redondeado al centavo."""
+    return _redondear(centavos * np.asarray(porcentaje, dtype=np.float64) / 100)
+
+
+def _techo_multiplo(centavos):
+    """Redondea hacia arriba al múltiplo de MULTIPLO_USD (en centavos)."""
+    return -(-centavos // _MULTIPLO_CENTAVOS) * _MULTIPLO_CENTAVOS
+
+
+def _dolares(centavos):
+    return np.asarray(centavos, dtype=np.float64) / 100
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ÍTEMS
+# ─────────────────────────────────────────────────────────────────────────────
+def calcular_items(columnas: dict) -> dict:
+    """
+    Aplica la cadena de precios a todos los ítems de una cotización a la vez.
+
+    Args:
+        columnas: dict con las claves de COLUMNAS_ENTRADA; cada valor es un
+                  array (o lista) con una posición por ítem. Los montos son
+                  en USD; los porcentajes, en puntos (16 = 16%).
+
+    Returns:
+        dict[str, np.ndarray]: totales por ítem en USD (fob_total,
+        costo_impuesto, utilidad, utilidad_valor, base_tax, costo_tax,
+        precio_usd_sin_redondeo, diferencial_valor, precio_bs_sin_iva,
+        iva_valor, precio_bs, precio_usd, redondeo_valor, factor_real) y
+        los unitarios correspondientes con sufijo _unitario.
+    """
+    cantidad = np.asarray(columnas['cantidad'], dtype=np.float64)
+    factor = np.asarray(columnas['factor_utilidad'], dtype=np.float64)
+    aplicar_iva = np.asarray(columnas['aplicar_iva'], dtype=bool)
+
+    fob = _centavos(np.asarray(columnas['costo_fob'], dtype=np.float64) * cantidad)
+    handling = _centavos(columnas['costo_handling'])
+    manejo = _centavos(columnas['costo_manejo'])
+    envio = _centavos(columnas['costo_envio'])
+
+    impuesto = _porcentaje(fob, columnas['impuesto_porcentaje'])
+    utilidad = np.where(factor > 0, _redondear(fob * factor) - fob, 0)
+    base_tax = fob + handling + manejo + impuesto + utilidad + envio
+    tax = _porcentaje(base_tax, columnas['tax_porcentaje'])
+    precio_usd = base_tax + tax
+    diferencial = _porcentaje(precio_usd, columnas['diferencial_porcentaje'])
+    precio_bs_sin_iva = precio_usd + diferencial
+    iva = np.where(aplicar_iva, _porcentaje(precio_bs_sin_iva, columnas['iva_porcentaje']), 0)
+    precio_bs = precio_bs_sin_iva + iva
+
+    precio_usd_redondeado = _techo_multiplo(precio_usd)
+    redondeo = precio_usd_redondeado - precio_usd
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor_real = np.where(
+            fob > 0, np.round(precio_usd_redondeado / np.where(fob > 0, fob, 1), 4), factor)
+
+    totales = {
+        'fob_total': fob,
+        'costo_impuesto': impuesto,
+        'utilidad': utilidad,
+        'utilidad_valor': utilidad + redondeo,
+        'base_tax': base_tax,
+        'costo_tax': tax,
+        'precio_usd_sin_redondeo': precio_usd,
+        'diferencial_valor': diferencial,
+        'precio_bs_sin_iva': precio_bs_sin_iva,
+        'iva_valor': iva,
+        'precio_bs': precio_bs,
+        'precio_usd': precio_usd_redondeado,
+        'redondeo_valor': redondeo,
+    }
+
+    resultado = {clave: _dolares(valor) for clave, valor in totales.items()}
+    divisor = np.where(cantidad > 0, cantidad, 1)
+    for clave, valor in totales.items():
+        resultado[f'{clave}_unitario'] = np.where(
+            cantidad > 0, _dolares(_redondear(valor / divisor)), 0.0)
+    resultado['factor_real'] = factor_real
+    return resultado
+
+
+def calcular_item(**entrada) -> dict:
+    """
+    Cadena de precios de un solo ítem (formulario del analista).
+
+    Args:
+        **entrada: las claves de COLUMNAS_ENTRADA como escalares.
+
+    Returns:
+        dict[str, float]: mismas claves que calcular_items().
+    """
+    columnas = {clave: [entrada[clave]] for clave in COLUMNAS_ENTRADA}
+    return {clave: float(valor[0]) for clave, valor in calcular_items(columnas).items()}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# TOTALES DE LA COTIZACIÓN
+# ─────────────────────────────────────────────────────────────────────────────
+# Aportes en centavos de cada ítem a las sumas de la cotización. Los totales
+# salen de estas sumas (totales_desde_sumas); TotalesIncrementales las
+# mantiene ítem a ítem.
+APORTES = ('bs_sin_iva', 'iva', 'abona', 'usd_divisas', 'usd_abono', 'total_usd', 'total_bs')
+
+# Campos de un ítem guardado que intervienen en sus aportes
+CAMPOS_APORTE = (
+    'fob_total', 'costo_handling', 'costo_manejo', 'costo_impuesto', 'utilidad_valor',
+    'costo_envio', 'costo_tax', 'costo_total', 'costo_total_bs', 'precio_usd', 'precio_bs',
+    'total', 'total_cost', 'aplicar_iva', 'iva_valor', 'iva_porcentaje',
+    'diferencial_porcentaje',
+)
+
+
+def _monto(valor) -> float:
+    try:
+        return float(valor or 0)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _columna(items: list, *claves) -> np.ndarray:
+    """
+    Columna de montos de los ítems guardados. Con varias claves se usa la
+    primera que tenga valor (respaldo para cotizaciones antiguas).
+    """
+    valores = []
+    for item in items:
+        valor = 0.0
+        for clave in claves:
+            valor = _monto(item.get(clave, 0))
+            if valor:
+                break
+        valores.append(valor)
+    return np.asarray(valores, dtype=np.float64)
+
+
+def aportes_columnas(columnas: dict) -> dict:
+    """
+    Aportes a las sumas de la cotización a partir de columnas de montos por
+    ítem (USD): fob_total, costo_handling, costo_manejo, costo_impuesto,
+    utilidad_valor, costo_envio, costo_tax, precio_bs (con IVA), iva_valor,
+    aplicar_iva, diferencial_porcentaje, costo_total y costo_total_bs.
+
+    Returns:
+        dict[str, np.ndarray]: por clave de APORTES, centavos por ítem.
+    """
+    fob = _centavos(columnas['fob_total'])
+    handling = _centavos(columnas['costo_handling'])
+    manejo = _centavos(columnas['costo_manejo'])
+    impuesto = _centavos(columnas['costo_impuesto'])
+    utilidad = _centavos(columnas['utilidad_valor'])
+    envio = _centavos(columnas['costo_envio'])
+    tax = _centavos(columnas['costo_tax'])
+    aplicar_iva = np.asarray(columnas['aplicar_iva'], dtype=bool)
+    iva = np.where(aplicar_iva, _centavos(columnas['iva_valor']), 0)
+
+    abono_usd = fob + handling + manejo + impuesto + utilidad
+    return {
+        # precio_bs del ítem incluye su IVA: el sub-total va sin IVA
+        'bs_sin_iva': _centavos(columnas['precio_bs']) - iva,
+        'iva': iva,
+        'abona': _porcentaje(abono_usd + tax,
+                             100 + np.asarray(columnas['diferencial_porcentaje'], dtype=np.float64)),
+        'usd_divisas': abono_usd + envio + tax,
+        'usd_abono': abono_usd,
+        'total_usd': _centavos(columnas['costo_total']),
+        'total_bs': _centavos(columnas['costo_total_bs']),
+    }
+
+
+def aportes_items(items: list) -> dict:
+    """
+    Aportes de cada ítem ya calculado (dicts con las claves que guarda
+    analyst_panel: fob_total, costo_impuesto, utilidad_valor, costo_tax,
+    precio_bs, iva_valor, …) a las sumas de la cotización.
+
+    Returns:
+        dict[str, np.ndarray]: por clave de APORTES, centavos por ítem.
+    """
+    columnas = {clave: _columna(items, clave) for clave in (
+        'fob_total', 'costo_handling', 'costo_manejo', 'costo_impuesto', 'utilidad_valor',
+        'costo_envio', 'costo_tax', 'diferencial_porcentaje')}
+    columnas['aplicar_iva'] = [bool(item.get('aplicar_iva', False)) for item in items]
+    columnas['precio_bs'] = _columna(items, 'precio_bs', 'costo_total_bs', 'costo_total')
+    columnas['costo_total'] = _columna(items, 'costo_total', 'precio_usd')
+    columnas['costo_total_bs'] = _columna(items, 'costo_total_bs', 'costo_total')
+    aportes = aportes_columnas({**columnas, 'iva_valor': _columna(items, 'iva_valor')})
+
+    # IVA faltante en ítems antiguos: se calcula sobre precio_usd (el
+    # precio_bs de esos ítems no lo incluye, el sub-total no cambia)
+    faltante = np.asarray(columnas['aplicar_iva'], dtype=bool) & (aportes['iva'] == 0)
+    if faltante.any():
+        respaldo = _porcentaje(_centavos(_columna(items, 'precio_usd', 'total', 'total_cost')),
+                               [_monto(item.get('iva_porcentaje', 16.0)) or 16.0 for item in items])
+        aportes['iva'] = np.where(faltante, respaldo, aportes['iva'])
+    return aportes
+
+
+def aportes_guardados(columnas: dict) -> dict:
+    """
+    Aportes a los totales de cabecera (sub_total, iva_total, abona_ya,
+    total_amount) a partir de columnas tal como quedan en quote_items:
+    precio_usd (total_cost), precio_bs, iva_valor, iva_porcentaje,
+    aplicar_iva, costo_envio y diferencial_porcentaje.
+
+    quote_items no guarda el impuesto ni el TAX desglosados; el abono sale
+    de la identidad de la cadena: FOB + Handling + Manejo + Impuesto +
+    Utilidad (con redondeo) + TAX = Precio USD − Envío.
+
+    Returns:
+        dict[str, np.ndarray]: bs_sin_iva, iva, abona y total_usd en
+        centavos por ítem (mismo significado que en APORTES).
+    """
+    precio_usd = _centavos(columnas['precio_usd'])
+    aplicar_iva = np.asarray(columnas['aplicar_iva'], dtype=bool)
+    iva = np.where(aplicar_iva, _centavos(columnas['iva_valor']), 0)
+    bs_sin_iva = _centavos(columnas['precio_bs']) - iva
+
+    # IVA faltante en ítems antiguos: mismo respaldo que aportes_items
+    faltante = aplicar_iva & (iva == 0)
+    if faltante.any():
+        porcentaje = np.asarray(columnas['iva_porcentaje'], dtype=np.float64)
+        iva = np.where(faltante, _porcentaje(precio_usd, np.where(porcentaje > 0, porcentaje, 16.0)), iva)
+
+    return {
+        'bs_sin_iva': bs_sin_iva,
+        'iva': iva,
+        'abona': _porcentaje(precio_usd - _centavos(columnas['costo_envio']),
+                             100 + np.asarray(columnas['diferencial_porcentaje'], dtype=np.float64)),
+        'total_usd': precio_usd,
+    }
+
+
+def totales_desde_sumas(sumas: dict) -> dict:
+    """
+    Totales de la cotización a partir de las sumas en centavos de los
+    aportes de sus ítems (una clave por APORTES).
+
+    Returns:
+        dict[str, float]:
+            sub_total          Σ precio Bs sin IVA (con diferencial)
+            iva_total          Σ IVA de los ítems con IVA
+            total_a_pagar      sub_total + iva_total
+            abona_ya           Σ (FOB+Handling+Manejo+Impuesto+Utilidad+TAX) × (1 + dif%)
+            y_en_entrega       total_a_pagar − abona_ya
+            total_usd          Σ precio USD de los ítems (total_amount)
+            total_bs           Σ costo_total_bs de los ítems
+            total_usd_divisas  Σ (… + Envío + TAX) redondeado al múltiplo de 5
+            usd_abono          Σ (FOB+Handling+Manejo+Impuesto+Utilidad) al múltiplo de 5
+            usd_entrega        total_usd_divisas − usd_abono (≥ 0)
+    """
+    sub_total = int(sumas['bs_sin_iva'])
+    iva_total = int(sumas['iva'])
+    total_a_pagar = sub_total + iva_total
+    abona_ya = int(sumas['abona'])
+
+    total_usd_divisas = int(sumas['usd_divisas'])
+    total_usd_divisas = int(_techo_multiplo(total_usd_divisas)) if total_usd_divisas > 0 else 0
+    usd_abono = int(_techo_multiplo(int(sumas['usd_abono'])))
+    usd_entrega = total_usd_divisas - usd_abono
+    if usd_entrega < 0:
+        usd_abono, usd_entrega = total_usd_divisas, 0
+
+    return {
+        'sub_total': sub_total / 100,
+        'iva_total': iva_total / 100,
+        'total_a_pagar': total_a_pagar / 100,
+        'abona_ya': abona_ya / 100,
+        'y_en_entrega': (total_a_pagar - abona_ya) / 100,
+        'total_usd': int(sumas['total_usd']) / 100,
+        'total_bs': int(sumas['total_bs']) / 100,
+        'total_usd_divisas': total_usd_divisas / 100,
+        'usd_abono': usd_abono / 100,
+        'usd_entrega': usd_entrega / 100,
+    }
+
+
+def totales_cotizacion(items: list) -> dict:
+    """
+    Totales de la cotización a partir de los ítems ya calculados.
+    Mismas claves que totales_desde_sumas().
+    """
+    if not items:
+        return totales_desde_sumas(dict.fromkeys(APORTES, 0))
+    aportes = aportes_items(items)
+    return totales_desde_sumas({clave: int(aportes[clave].sum()) for clave in APORTES})
@@ -0,0 +1,347 @@
+# services/pricing/freight.py
+# Motor de flete: tabla de tarifas con vigencias en memoria y evaluación por lotes
+"""
+Una sola implementación del costo de envío (antes calcular_envio en
+analyst_panel, con sus propias reglas, y CalculationService.calculate_
+freight_cost, con otras):
+
+  Peso volumétrico = L × A × H / 5000                       (kg)
+  $/lb             = máx(peso real, volumétrico) × 2.20462  (lb)
+  $/kg             = máx(peso real, volumétrico)            (kg)
+  $/ft³            = L × A × H / 28316.8                    (ft³)
+  Costo            = facturable × tarifa, mínimo $25, al centavo
+
+La regla la fija la unidad de la tarifa (columna unit de freight_rates),
+no el nombre del origen, así una combinación nueva no requiere código.
+
+TarifasFlete mantiene, por proceso, las vigencias de cada combinación
+origen/tipo (freight_rate_history + freight_rates): se carga una vez, se
+invalida desde DBManager.set_freight_rate y se relee cada
+_REFRESCO_SEGUNDOS para recoger cambios de otros procesos. Una tarifa
+rige desde su effective_from hasta la siguiente; antes de la primera
+vigencia conocida se usa la primera.
+
+evaluar() calcula N paquetes × todas las combinaciones en una sola
+pasada de NumPy y devuelve la opción más barata de cada paquete.
+"""
+
+import calendar
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from database.db_manager import DBManager, valor_fila
+from .engine import _dolares, _redondear
+
+# Divisor del peso volumétrico (cm³ → kg)
+DIVISOR_VOLUMETRICO = 5000
+LB_POR_KG = 2.20462
+CM3_POR_FT3 = 28316.8
+
+# Cargo mínimo por envío (USD)
+MINIMO_USD = 25.0
+
+# Tarifas usadas cuando la combinación no está en la BD (origen, tipo) → (tarifa, unidad)
+TARIFAS_POR_DEFECTO = {
+    ('Miami', 'Aéreo'):    (9.0, '$/lb'),
+    ('Miami', 'Marítimo'): (40.0, '$/ft³'),
+    ('Madrid', 'Aéreo'):   (25.0, '$/kg'),
+}
+
+# Antigüedad máxima de la tabla antes de releerla desde la BD
+_REFRESCO_SEGUNDOS = 300
+
+# Base facturable por unidad de tarifa
+_BASE_LB, _BASE_KG, _BASE_FT3 = 0, 1, 2
+_UNIDAD_FACTURABLE = {_BASE_LB: 'lb', _BASE_KG: 'kg', _BASE_FT3: 'ft³'}
+
+
+def _base(unidad: str, tipo_envio: str) -> int:
+    """Base facturable de una tarifa según su unidad ('$/lb', '$/kg', '$/ft³')."""
+    u = (unidad or '').lower()
+    if 'lb' in u:
+        return _BASE_LB
+    if 'ft' in u:
+        return _BASE_FT3
+    if 'kg' in u:
+        return _BASE_KG
+    return _BASE_FT3 if tipo_envio == 'Marítimo' else _BASE_KG
+
+
+def _epoch(valor) -> float:
+    """
+    Fecha de la BD (datetime, date, texto ISO o segundos) → segundos.
+    Las fechas sin zona se leen como UTC; lo importante es que las
+    vigencias y la hora actual de la BD se conviertan igual.
+    """
+    if valor is None:
+        return float('-inf')
+    if isinstance(valor, (int, float, np.integer, np.floating)):
+        return float(valor)
+    if isinstance(valor, str):
+        texto = valor.strip().replace('T', ' ')
+        for formato in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+            try:
+                valor = datetime.strptime(texto[:26], formato)
+                break
+            except ValueError:
+                continue
+        else:
+            return float('-inf')
+    if isinstance(valor, datetime):
+        if valor.tzinfo is not None:
+            return valor.timestamp()
+        return calendar.timegm(valor.timetuple()) + valor.microsecond / 1e6
+    if isinstance(valor, date):
+        return float(calendar.timegm(valor.timetuple()))
+    return float('-inf')
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CÁLCULO VECTORIZADO
+# ─────────────────────────────────────────────────────────────────────────────
+def costos_flete(largo_cm, ancho_cm, alto_cm, peso_kg, tarifas, bases) -> dict:
+    """
+    Costo de envío de N paquetes en K combinaciones.
+
+    Args:
+        largo_cm, ancho_cm, alto_cm, peso_kg: arrays (N,)
+        tarifas: array (N, K) o (K,) con la tarifa de cada combinación;
+                 NaN = combinación sin tarifa
+        bases:   array (K,) con la base facturable de cada tarifa (_base)
+
+    Returns:
+        dict: peso_volumetrico (N,), facturable (N, K), costo (N, K, USD;
+        NaN sin tarifa), es_minimo (N, K)
+    """
+    largo = np.asarray(largo_cm, dtype=np.float64)
+    ancho = np.asarray(ancho_cm, dtype=np.float64)
+    alto = np.asarray(alto_cm, dtype=np.float64)
+    peso = np.asarray(peso_kg, dtype=np.float64)
+    tarifas = np.atleast_2d(np.asarray(tarifas, dtype=np.float64))
+    bases = np.asarray(bases, dtype=np.int64)
+
+    vol_cm3 = largo * ancho * alto
+    peso_vol = vol_cm3 / DIVISOR_VOLUMETRICO
+    mayor_kg = np.maximum(peso, peso_vol)
+
+    # (N, 3) con las tres bases posibles; cada combinación elige su columna
+    por_base = np.stack([mayor_kg * LB_POR_KG, mayor_kg, vol_cm3 / CM3_POR_FT3], axis=1)
+    facturable = por_base[:, bases]
+
+    sin_tarifa = np.isnan(tarifas)
+    calculado = _redondear(facturable * np.where(sin_tarifa, 0.0, tarifas) * 100)
+    minimo = int(round(MINIMO_USD * 100))
+    es_minimo = (calculado < minimo) & ~sin_tarifa
+    costo = _dolares(np.maximum(calculado, minimo))
+    costo[np.broadcast_to(sin_tarifa, costo.shape)] = np.nan
+
+    return {
+        'peso_volumetrico': peso_vol,
+        'facturable': facturable,
+        'costo': costo,
+        'es_minimo': es_minimo,
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# TABLA DE TARIFAS
+# ─────────────────────────────────────────────────────────────────────────────
+class TarifasFlete:
+    """
+    Tabla de tarifas con vigencias, compartida por todo el proceso.
+    La tabla se publica como un único dict inmutable: los lectores toman la
+    referencia y nunca ven una carga a medias.
+    """
+
+    _lock = threading.RLock()
+    _cargado_en: Optional[float] = None
+    _tabla: Optional[dict] = None
+
+    # ── Carga desde BD ─────────────────────────────────────────────────────
+
+    @classmethod
+    def invalidar(cls):
+        """Fuerza la recarga en la próxima consulta (lo llama set_freight_rate)."""
+        with cls._lock:
+            cls._cargado_en = None
+
+    @classmethod
+    def refrescar(cls) -> bool:
+        """Relee freight_rate_history y freight_rates y reemplaza la tabla."""
+        conn = None
+        historial, vigentes, ahora_bd = [], [], None
+        try:
+            conn = DBManager.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT LOCALTIMESTAMP AS ahora" if DBManager.USE_POSTGRES
+                           else "SELECT CURRENT_TIMESTAMP AS ahora")
+            ahora_bd = valor_fila(cursor.fetchone(), 'ahora', 0)
+            try:
+                cursor.execute("""
+                    SELECT origin, shipping_type, rate, unit, effective_from
+                    FROM freight_rate_history ORDER BY effective_from, id
+                """)
+                historial = cursor.fetchall()
+            except Exception as e:
+                print(f"⚠️ Historial de tarifas no disponible: {e}")
+                conn.rollback()
+            cursor.execute("SELECT origin, shipping_type, rate, unit, updated_at FROM freight_rates")
+            vigentes = cursor.fetchall()
+            cursor.close()
+            conn.close()
+            conn = None
+        except Exception as e:
+            print(f"❌ Error cargando tarifas de flete: {e}")
+            if conn:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            if cls._tabla is not None:
+                return False
+            # Sin tabla previa: se trabaja con las tarifas por defecto
+
+        vigencias: Dict[Tuple[str, str], Dict[float, Tuple[float, str]]] = {}
+        for filas, columna_desde in ((historial, 'effective_from'), (vigentes, 'updated_at')):
+            for fila in filas:
+                combinacion = (valor_fila(fila, 'origin', 0), valor_fila(fila, 'shipping_type', 1))
+                desde = _epoch(valor_fila(fila, columna_desde, 4))
+                vigencias.setdefault(combinacion, {})[desde] = (float(valor_fila(fila, 'rate', 2)),
+                                                               valor_fila(fila, 'unit', 3) or '')
+
+        for combinacion, (tarifa, unidad) in TARIFAS_POR_DEFECTO.items():
+            vigencias.setdefault(combinacion, {float('-inf'): (tarifa, unidad)})
+
+        orden = list(TARIFAS_POR_DEFECTO) + sorted(set(vigencias) - set(TARIFAS_POR_DEFECTO))
+        combinaciones, desde, tarifas, unidades = [], [], [], []
+        for origen, tipo in orden:
+            puntos = sorted(vigencias[(origen, tipo)].items())
+            unidad = puntos[-1][1][1] or TARIFAS_POR_DEFECTO.get((origen, tipo), (0, ''))[1]
+            combinaciones.append((origen, tipo, unidad))
+            desde.append(np.array([p[0] for p in puntos], dtype=np.float64))
+            tarifas.append(np.array([p[1][0] for p in puntos], dtype=np.float64))
+            unidades.append(unidad)
+
+        tabla = {
+            'combinaciones': combinaciones,
+            'indice': {(o, t): j for j, (o, t, _) in enumerate(combinaciones)},
+            'bases': np.array([_base(u, t) for (_, t, u) in combinaciones], dtype=np.int64),
+            'desde': desde,
+            'tarifas': tarifas,
+            # Reloj de la BD: las vigencias se escriben con CURRENT_TIMESTAMP
+            'desfase': (_epoch(ahora_bd) - time.time()) if ahora_bd is not None else 0.0,
+        }
+        with cls._lock:
+            cls._tabla = tabla
+            cls._cargado_en = time.monotonic()
+        return True
+
+    @classmethod
+    def _asegurar(cls) -> dict:
+        cargado_en = cls._cargado_en
+        if cls._tabla is None or cargado_en is None or time.monotonic() - cargado_en >= _REFRESCO_SEGUNDOS:
+            cls.refrescar()
+            with cls._lock:
+                # Si la BD falló con tabla previa, se reintenta en el próximo ciclo
+                if cls._cargado_en is None:
+                    cls._cargado_en = time.monotonic()
+        return cls._tabla
+
+    # ── Consultas ──────────────────────────────────────────────────────────
+
+    @classmethod
+    def combinaciones(cls) -> List[Tuple[str, str, str]]:
+        """[(origen, tipo, unidad), ...] en el orden de las columnas de evaluar()."""
+        return list(cls._asegurar()['combinaciones'])
+
+    @classmethod
+    def _fechas(cls, tabla: dict, fechas, n: int) -> np.ndarray:
+        if fechas is None:
+            return np.full(n, time.time() + tabla['desfase'])
+        if isinstance(fechas, (list, tuple, np.ndarray)):
+            return np.array([_epoch(f) for f in fechas], dtype=np.float64)
+        return np.full(n, _epoch(fechas))
+
+    @staticmethod
+    def _matriz(tabla: dict, momentos: np.ndarray) -> np.ndarray:
+        """Tarifa vigente de cada combinación en cada momento → (N, K)."""
+        matriz = np.empty((len(momentos), len(tabla['combinaciones'])), dtype=np.float64)
+        for j, (desde, tarifas) in enumerate(zip(tabla['desde'], tabla['tarifas'])):
+            idx = np.searchsorted(desde, momentos, side='right') - 1
+            matriz[:, j] = tarifas[np.clip(idx, 0, len(tarifas) - 1)]
+        return matriz
+
+    @classmethod
+    def tarifa(cls, origen: str, tipo_envio: str, fecha=None) -> Optional[float]:
+        """Tarifa vigente de una combinación (hoy o en la fecha dada); None si no existe."""
+        tabla = cls._asegurar()
+        j = tabla['indice'].get((origen, tipo_envio))
+        if j is None:
+            return None
+        return float(cls._matriz(tabla, cls._fechas(tabla, fecha, 1))[0, j])
+
+    @classmethod
+    def evaluar(cls, largo_cm, ancho_cm, alto_cm, peso_kg, fechas=None) -> dict:
+        """
+        Evalúa N paquetes en todas las combinaciones origen/tipo a la vez.
+
+        Args:
+            largo_cm, ancho_cm, alto_cm, peso_kg: escalares o arrays (N,)
+            fechas: None (hoy), una fecha para todos o una por paquete
+
+        Returns:
+            dict: combinaciones [(origen, tipo, unidad)], tarifa (N, K),
+            las claves de costos_flete, unidad_facturable [K],
+            mas_barata (N,) con el índice de la combinación más barata y
+            costo_mas_barato (N,)
+        """
+        tabla = cls._asegurar()
+        largo, ancho, alto, peso = np.broadcast_arrays(
+            *(np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (largo_cm, ancho_cm, alto_cm, peso_kg)))
+        tarifas = cls._matriz(tabla, cls._fechas(tabla, fechas, len(largo)))
+        resultado = costos_flete(largo, ancho, alto, peso, tarifas, tabla['bases'])
+
+        costo = resultado['costo']
+        comparables = np.where(np.isnan(costo), np.inf, costo)
+        mas_barata = np.argmin(comparables, axis=1) if costo.shape[1] else np.zeros(len(largo), dtype=np.int64)
+        resultado.update({
+            'combinaciones': list(tabla['combinaciones']),
+            'unidad_facturable': [_UNIDAD_FACTURABLE[b] for b in tabla['bases']],
+            'tarifa': tarifas,
+            'mas_barata': mas_barata,
+            'costo_mas_barato': np.take_along_axis(costo, mas_barata[:, None], axis=1)[:, 0]
+                                if costo.shape[1] else np.full(len(largo), np.nan),
+        })
+        return resultado
+
+    @classmethod
+    def cotizar(cls, largo_cm: float, ancho_cm: float, alto_cm: float, peso_kg: float,
+                origen: str, tipo_envio: str, fecha=None) -> dict:
+        """
+        Costo de un paquete en una combinación.
+
+        Returns:
+            dict: costo, facturable, unidad ('lb'/'kg'/'ft³'), tarifa,
+            unidad_tarifa ('$/lb'...), peso_volumetrico, es_minimo;
+            costo None si la combinación no tiene tarifa
+        """
+        resultado = cls.evaluar(largo_cm, ancho_cm, alto_cm, peso_kg, fechas=fecha)
+        j = next((i for i, (o, t, _) in enumerate(resultado['combinaciones'])
+                  if o == origen and t == tipo_envio), None)
+        if j is None:
+            return {'costo': None, 'facturable': 0.0, 'unidad': '', 'tarifa': None,
+                    'unidad_tarifa': '', 'peso_volumetrico': float(resultado['peso_volumetrico'][0]),
+                    'es_minimo': False}
+        return {
+            'costo': float(resultado['costo'][0, j]),
+            'facturable': float(resultado['facturable'][0, j]),
+            'unidad': resultado['unidad_facturable'][j],
+            'tarifa': float(resultado['tarifa'][0, j]),
+            'unidad_tarifa': resultado['combinaciones'][j][2],
+            'peso_volumetrico': float(resultado['peso_volumetrico'][0]),
+            'es_minimo': bool(resultado['es_minimo'][0, j]),
+        }
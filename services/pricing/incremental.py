@@ -0,0 +1,117 @@
+# services/pricing/incremental.py
+# Totales de la cotización en curso mantenidos ítem a ítem (sesión del analista)
+"""
+El panel del analista muestra los totales en cada rerun de Streamlit (cada
+tecla). TotalesIncrementales guarda, por ítem, sus aportes en centavos a
+las sumas de la cotización y las sumas mismas, de modo que:
+
+  - un rerun sin cambios en la lista devuelve los totales en O(1);
+  - agregar, reemplazar o quitar un ítem ajusta las sumas en O(1) y solo
+    calcula los aportes del ítem que cambió;
+  - los aportes se memorizan por el contenido del ítem (un ítem
+    idéntico a uno ya visto, o reemplazado por sí mismo, no se recalcula).
+
+La instancia se asocia a un objeto lista concreto (st.session_state.
+cotizacion_items). Si la lista se sustituye (nueva cotización, borrador,
+edición, copia) o cambia de largo por fuera de estos métodos, el siguiente
+totales() la reconstruye completa en una sola llamada vectorizada.
+"""
+
+from .engine import APORTES, CAMPOS_APORTE, aportes_items, totales_desde_sumas
+
+# Entradas máximas de la memoria de aportes por contenido
+MEMO_MAX = 512
+
+
+def huella_item(item: dict) -> tuple:
+    """
+    Clave de memoria del contenido de un ítem: la tupla de los campos que
+    aportan (se compara completa, no solo su hash).
+    """
+    huella = tuple(item.get(campo) for campo in CAMPOS_APORTE)
+    try:
+        hash(huella)
+    except TypeError:   # valor no hashable (lista, dict): se usa su repr
+        huella = tuple(repr(valor) for valor in huella)
+    return huella
+
+
+class TotalesIncrementales:
+    """Sumas de los aportes de los ítems de una lista, actualizadas por deltas."""
+
+    def __init__(self):
+        self._lista = None
+        self._aportes = []          # por posición: tupla de centavos en orden APORTES
+        self._sumas = [0] * len(APORTES)
+        self._memo = {}             # huella → tupla de aportes
+        self._totales = None
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # APORTES
+    # ─────────────────────────────────────────────────────────────────────────
+    def _aporte(self, item: dict) -> tuple:
+        huella = huella_item(item)
+        aporte = self._memo.get(huella)
+        if aporte is None:
+            columnas = aportes_items([item])
+            aporte = tuple(int(columnas[clave][0]) for clave in APORTES)
+            if len(self._memo) >= MEMO_MAX:
+                self._memo.clear()
+            self._memo[huella] = aporte
+        return aporte
+
+    def _sumar(self, aporte: tuple, signo: int):
+        self._sumas = [s + signo * a for s, a in zip(self._sumas, aporte)]
+        self._totales = None
+
+    def _reconstruir(self, items: list):
+        self._lista = items
+        self._totales = None
+        if not items:
+            self._aportes = []
+            self._sumas = [0] * len(APORTES)
+            return
+        columnas = aportes_items(items)
+        self._aportes = list(zip(*(columnas[clave].tolist() for clave in APORTES)))
+        self._sumas = [int(columnas[clave].sum()) for clave in APORTES]
+        if len(self._memo) + len(items) > MEMO_MAX:
+            self._memo.clear()
+        for item, aporte in zip(items, self._aportes):
+            self._memo[huella_item(item)] = aporte
+
+    def _sincronizar(self, items: list):
+        if items is not self._lista or len(items) != len(self._aportes):
+            self._reconstruir(items)
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # API
+    # ─────────────────────────────────────────────────────────────────────────
+    def totales(self, items: list) -> dict:
+        """Totales de la lista (claves de totales_desde_sumas)."""
+        self._sincronizar(items)
+        if self._totales is None:
+            self._totales = totales_desde_sumas(dict(zip(APORTES, self._sumas)))
+        return self._totales
+
+    def agregar(self, items: list, item: dict):
+        """items.append(item) ajustando las sumas."""
+        self._sincronizar(items)
+        aporte = self._aporte(item)
+        items.append(item)
+        self._aportes.append(aporte)
+        self._sumar(aporte, 1)
+
+    def reemplazar(self, items: list, indice: int, item: dict):
+        """items[indice] = item ajustando las sumas."""
+        self._sincronizar(items)
+        aporte = self._aporte(item)
+        items[indice] = item
+        self._sumar(self._aportes[indice], -1)
+        self._aportes[indice] = aporte
+        self._sumar(aporte, 1)
+
+    def quitar(self, items: list, indice: int):
+        """items.pop(indice) ajustando las sumas."""
+        self._sincronizar(items)
+        items.pop(indice)
+        self._sumar(self._aportes.pop(indice), -1)
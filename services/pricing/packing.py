@@ -0,0 +1,250 @@
+# services/pricing/packing.py
+# Envío consolidado: empaque 3D de los ítems de una cotización en cajas estándar
+"""
+calcular_envio cotiza cada ítem por separado, con su propio peso
+volumétrico y el mínimo de $25 por ítem. Cuando un pedido trae varias
+piezas del mismo origen, lo que realmente se despacha son cajas
+consolidadas. consolidar():
+
+  1. Agrupa las unidades por origen (Miami, Madrid).
+  2. Las empaca con primero-que-cabe decreciente (FFD) por volumen, con
+     las 6 rotaciones de cada pieza, sobre espacios libres de guillotina
+     (cada pieza colocada parte su espacio en 3 espacios disjuntos).
+     Las cajas se abren del tamaño estándar más grande y al final cada
+     una se reduce al tamaño estándar más chico que aún contiene sus piezas.
+     Se prueba con cada preferencia de rotación de ORDENES_ROTACION y se
+     queda el empaque con menos cajas y menos volumen total.
+  3. Las piezas que no caben en ninguna caja estándar viajan sueltas.
+  4. Cotiza en una sola llamada a TarifasFlete.evaluar las unidades
+     sueltas (envío por ítem) y las cajas (envío consolidado), en todos
+     los tipos de envío del origen, y reporta el ahorro.
+
+Para 50 ítems el empaque completo toma pocos milisegundos.
+"""
+
+from itertools import permutations
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .freight import TarifasFlete
+
+# Cajas estándar: (nombre, largo cm, ancho cm, alto cm, peso máximo kg), de menor a mayor
+CAJAS_ESTANDAR = (
+    ('S',  30, 20, 20, 20.0),
+    ('M',  40, 30, 30, 30.0),
+    ('L',  60, 40, 40, 40.0),
+    ('XL', 80, 60, 50, 60.0),
+)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# EMPAQUE
+# ─────────────────────────────────────────────────────────────────────────────
+# Preferencias de rotación (l, a, h) probadas por el empaque: la más baja
+# primero (apoyada en su cara mayor), la más larga a lo largo, la más ancha
+# al fondo y la más alta primero (de pie)
+ORDENES_ROTACION = (
+    lambda r: (r[2], -r[0] * r[1]),
+    lambda r: (-r[0], -r[1]),
+    lambda r: (-r[1], -r[0]),
+    lambda r: (-r[2], -r[0]),
+)
+
+
+def _rotaciones(dims: Tuple[float, float, float], orden: int) -> List[Tuple[float, float, float]]:
+    """Orientaciones distintas de una pieza, en la preferencia ORDENES_ROTACION[orden]."""
+    return sorted(set(permutations(dims)), key=ORDENES_ROTACION[orden])
+
+
+class _Caja:
+    """Caja abierta durante el empaque: espacios libres (x, y, z, l, a, h) y piezas."""
+
+    __slots__ = ('dims', 'peso_max', 'orden', 'libres', 'piezas', 'peso')
+
+    def __init__(self, dims: Tuple[float, float, float], peso_max: float, orden: int = 0):
+        self.dims = dims
+        self.peso_max = peso_max
+        self.orden = orden
+        self.libres = [(0.0, 0.0, 0.0) + tuple(dims)]
+        self.piezas = []        # (indice, x, y, z, l, a, h)
+        self.peso = 0.0
+
+    def colocar(self, indice: int, dims: Tuple[float, float, float], peso: float) -> bool:
+        """Coloca la pieza en el primer espacio libre donde cabe en alguna rotación."""
+        if self.peso + peso > self.peso_max + 1e-9:
+            return False
+        rotaciones = _rotaciones(dims, self.orden)
+        for k, (x, y, z, L, A, H) in enumerate(self.libres):
+            for l, a, h in rotaciones:
+                if l <= L + 1e-9 and a <= A + 1e-9 and h <= H + 1e-9:
+                    # Guillotina: a la derecha, al frente y encima de la pieza
+                    nuevos = [
+                        (x + l, y, z, L - l, A, H),
+                        (x, y + a, z, l, A - a, H),
+                        (x, y, z + h, l, a, H - h),
+                    ]
+                    self.libres[k:k + 1] = [e for e in nuevos if min(e[3:]) > 1e-9]
+                    # Primero los espacios más bajos y al fondo (pila estable)
+                    self.libres.sort(key=lambda e: (e[2], e[1], e[0]))
+                    self.piezas.append((indice, x, y, z, l, a, h))
+                    self.peso += peso
+                    return True
+        return False
+
+
+def _cabe(dims: Tuple[float, float, float], caja: tuple) -> bool:
+    pieza, interior = sorted(dims), sorted(caja[1:4])
+    return all(p <= c + 1e-9 for p, c in zip(pieza, interior))
+
+
+def _empacar(unidades: List[tuple], caja: tuple, orden: int = 0) -> List[_Caja]:
+    """FFD: unidades (indice, dims, peso) ya ordenadas por volumen decreciente."""
+    cajas: List[_Caja] = []
+    for indice, dims, peso in unidades:
+        if not any(c.colocar(indice, dims, peso) for c in cajas):
+            nueva = _Caja(tuple(float(v) for v in caja[1:4]), caja[4], orden)
+            nueva.colocar(indice, dims, peso)
+            cajas.append(nueva)
+    return cajas
+
+
+def _reducir(caja: _Caja, unidades: Dict[int, tuple]) -> Tuple[tuple, _Caja]:
+    """Tamaño estándar más chico en el que las piezas de la caja caben en una sola caja."""
+    piezas = sorted((unidades[p[0]] for p in caja.piezas),
+                    key=lambda u: -u[1][0] * u[1][1] * u[1][2])
+    peso = sum(u[2] for u in piezas)
+    volumen = sum(u[1][0] * u[1][1] * u[1][2] for u in piezas)
+    for estandar in CAJAS_ESTANDAR:
+        if estandar[4] + 1e-9 < peso or estandar[1] * estandar[2] * estandar[3] < volumen:
+            continue
+        if not all(_cabe(u[1], estandar) for u in piezas):
+            continue
+        for orden in range(len(ORDENES_ROTACION)):
+            intento = _empacar(piezas, estandar, orden)
+            if len(intento) == 1:
+                return estandar, intento[0]
+    return CAJAS_ESTANDAR[-1], caja
+
+
+def empacar(items: List[dict]) -> dict:
+    """
+    Empaca unidades de un mismo origen en cajas estándar.
+
+    Args:
+        items: dicts con largo, ancho, alto (cm), peso (kg) y cantidad
+
+    Returns:
+        dict: cajas [{caja, largo, ancho, alto, peso, unidades, items,
+        ocupacion}] y sueltos [índices de ítems que no caben en ninguna caja]
+    """
+    mayor = CAJAS_ESTANDAR[-1]
+    unidades, sueltos = [], []
+    for i, item in enumerate(items):
+        dims = (float(item['largo']), float(item['ancho']), float(item['alto']))
+        peso = float(item['peso'])
+        cantidad = int(item.get('cantidad') or 1)
+        if not _cabe(dims, mayor) or peso > mayor[4]:
+            sueltos.extend([i] * cantidad)
+            continue
+        unidades.extend((i, dims, peso) for _ in range(cantidad))
+
+    # Cada unidad recibe un índice propio; el ítem de origen se recupera al final
+    numeradas = [(u, dims, peso) for u, (_, dims, peso) in enumerate(unidades)]
+    numeradas.sort(key=lambda u: (-u[1][0] * u[1][1] * u[1][2], -u[2]))
+    por_unidad = {u[0]: u for u in numeradas}
+
+    mejor = None
+    for orden in range(len(ORDENES_ROTACION)):
+        reducidas = [_reducir(caja, por_unidad) for caja in _empacar(numeradas, mayor, orden)]
+        costo = (len(reducidas), sum(e[1] * e[2] * e[3] for e, _ in reducidas))
+        if mejor is None or costo < mejor[0]:
+            mejor = (costo, reducidas)
+
+    cajas = []
+    for estandar, caja in (mejor[1] if mejor else []):
+        volumen = sum(p[4] * p[5] * p[6] for p in caja.piezas)
+        cajas.append({
+            'caja': estandar[0],
+            'largo': estandar[1], 'ancho': estandar[2], 'alto': estandar[3],
+            'peso': round(caja.peso, 3),
+            'unidades': len(caja.piezas),
+            'items': sorted({unidades[p[0]][0] for p in caja.piezas}),
+            'ocupacion': round(volumen / (estandar[1] * estandar[2] * estandar[3]), 4),
+        })
+    return {'cajas': cajas, 'sueltos': sueltos}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# COMPARATIVA DE COSTOS
+# ─────────────────────────────────────────────────────────────────────────────
+def consolidar(items: List[dict], fecha=None) -> dict:
+    """
+    Envío consolidado vs envío por ítem de los ítems de una cotización.
+
+    Args:
+        items: dicts con origen ('Miami'/'Madrid'), largo, ancho, alto (cm),
+               peso (kg) y cantidad; los ítems sin medidas se ignoran
+        fecha: fecha de las tarifas (None = hoy)
+
+    Returns:
+        dict: origenes {origen: {cajas, sueltos, peso_real,
+        peso_volumetrico, opciones [{tipo, individual, consolidado,
+        ahorro}], mejor}} e individual, consolidado y ahorro totales
+        (opción más barata de cada origen)
+    """
+    grupos: Dict[str, List[dict]] = {}
+    for item in items:
+        try:
+            dims = [float(item.get(k) or 0) for k in ('largo', 'ancho', 'alto', 'peso')]
+            cantidad = int(item.get('cantidad') or 1)
+        except (TypeError, ValueError):
+            continue
+        if min(dims[:3]) <= 0 or cantidad <= 0:
+            continue
+        grupos.setdefault(item.get('origen') or 'Miami', []).append(
+            dict(zip(('largo', 'ancho', 'alto', 'peso'), dims), cantidad=cantidad))
+
+    resultado = {'origenes': {}, 'individual': 0.0, 'consolidado': 0.0, 'ahorro': 0.0}
+    for origen, grupo in grupos.items():
+        empaque = empacar(grupo)
+        cajas, sueltos = empaque['cajas'], empaque['sueltos']
+
+        # Una sola evaluación: ítems (por unidad) + cajas + piezas sueltas
+        paquetes = ([(g['largo'], g['ancho'], g['alto'], g['peso']) for g in grupo] +
+                    [(c['largo'], c['ancho'], c['alto'], c['peso']) for c in cajas] +
+                    [(grupo[i]['largo'], grupo[i]['ancho'], grupo[i]['alto'], grupo[i]['peso'])
+                     for i in sueltos])
+        ev = TarifasFlete.evaluar(*np.array(paquetes, dtype=np.float64).T, fechas=fecha)
+        n = len(grupo)
+        cantidades = np.array([g['cantidad'] for g in grupo], dtype=np.float64)
+
+        opciones = []
+        for j, (o, tipo, _) in enumerate(ev['combinaciones']):
+            if o != origen:
+                continue
+            individual = float(np.round(ev['costo'][:n, j] @ cantidades, 2))
+            consolidado = float(np.round(ev['costo'][n:, j].sum(), 2))
+            opciones.append({'tipo': tipo, 'individual': individual, 'consolidado': consolidado,
+                             'ahorro': round(individual - consolidado, 2)})
+
+        total_cajas = cajas + [{'largo': grupo[i]['largo'], 'ancho': grupo[i]['ancho'],
+                                'alto': grupo[i]['alto'], 'peso': grupo[i]['peso']} for i in sueltos]
+        mejor: Optional[dict] = min(opciones, key=lambda o: o['consolidado']) if opciones else None
+        resultado['origenes'][origen] = {
+            'cajas': cajas,
+            'sueltos': sueltos,
+            'peso_real': round(sum(g['peso'] * g['cantidad'] for g in grupo), 2),
+            'peso_volumetrico': round(float(ev['peso_volumetrico'][n:].sum()), 2),
+            'volumen_cm3': round(sum(c['largo'] * c['ancho'] * c['alto'] for c in total_cajas), 1),
+            'opciones': opciones,
+            'mejor': mejor,
+        }
+        if mejor:
+            resultado['individual'] += min(o['individual'] for o in opciones)
+            resultado['consolidado'] += mejor['consolidado']
+
+    resultado['individual'] = round(resultado['individual'], 2)
+    resultado['consolidado'] = round(resultado['consolidado'], 2)
+    resultado['ahorro'] = round(resultado['individual'] - resultado['consolidado'], 2)
+    return resultado
@@ -0,0 +1,457 @@
+# services/reconciliation.py
+# Conciliación masiva: totales de cabecera de quotes vs la suma de sus ítems
+"""
+Los totales de cabecera de una cotización (sub_total, iva_total, abona_ya,
+en_entrega, total_amount) se guardan aparte de los ítems y los han escrito
+varias generaciones de código. Este escáner los contrasta con lo que dicen
+los ítems guardados:
+
+  - Recorre quotes ⟕ quote_items ordenado por cotización con un cursor del
+    lado del servidor (cursor con nombre en PostgreSQL; en SQLite el cursor
+    ya itera sin materializar) y procesa BLOQUE filas a la vez.
+  - Cada bloque se calcula vectorizado: aportes_guardados() por ítem y
+    np.add.at por cotización, en centavos, igual que el motor de precios.
+  - Las diferencias mayores a la tolerancia se guardan en
+    quote_reconciliation (una fila por campo) con el id de la corrida.
+  - En modo corrección (o después, con corregir_corrida() sobre una
+    corrida ya revisada), las cotizaciones con diferencias (y con ítems) se
+    actualizan con UPDATE masivos; se anulan pdf_path/jpeg_path para que
+    los documentos se regeneren, y quotes.desglose para que se reconstruya
+    desde la cabecera corregida (services.pricing.desglose). updated_at no
+    se toca (es la fecha del último cambio de estado).
+
+Las escrituras se hacen al terminar el recorrido, por lotes: la lectura
+nunca compite con las escrituras (SQLite bloquea escrituras mientras hay
+un lector abierto).
+"""
+
+import time
+import uuid
+
+import numpy as np
+
+from database.db_manager import DBManager, valor_fila
+from services.pricing.engine import _centavos, aportes_guardados
+
+# Filas (cotización × ítem) por bloque del cursor
+BLOQUE = 20000
+
+# Filas por INSERT/UPDATE masivo
+LOTE_ESCRITURA = 1000
+
+# Diferencia máxima aceptada por campo (USD): 1 centavo por redondeos viejos
+TOLERANCIA = 0.01
+
+# Campos de cabecera que se concilian, en orden
+CAMPOS = ('sub_total', 'iva_total', 'abona_ya', 'en_entrega', 'total_amount')
+
+_COLUMNAS = ('id', 'quote_number', 'total_amount', 'sub_total', 'iva_total', 'abona_ya',
+             'en_entrega', 'item_id', 'total_cost', 'precio_usd', 'precio_bs', 'iva_valor',
+             'iva_porcentaje', 'aplicar_iva', 'shipping_cost', 'diferencial_porcentaje')
+
+
+def init_reconciliation_table():
+    """Crea la tabla 'quote_reconciliation' si no existe."""
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        id_type = "SERIAL PRIMARY KEY" if DBManager.USE_POSTGRES else "INTEGER PRIMARY KEY AUTOINCREMENT"
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS quote_reconciliation (
+                id           {id_type},
+                corrida      TEXT NOT NULL,
+                quote_id     INTEGER NOT NULL,
+                quote_number TEXT,
+                campo        TEXT NOT NULL,
+                guardado     REAL,
+                esperado     REAL,
+                diferencia   REAL,
+                nota         TEXT,
+                detectado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                corregido_en TIMESTAMP
+            )
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_quote_reconciliation_corrida "
+            "ON quote_reconciliation (corrida, quote_id)"
+        )
+        conn.commit()
+        cursor.close()
+        return True
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"❌ Error creando tabla quote_reconciliation: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LECTURA EN STREAMING
+# ─────────────────────────────────────────────────────────────────────────────
+def _bloques(bloque: int = BLOQUE):
+    """
+    Genera listas de filas (tuplas en orden _COLUMNAS), cortadas siempre en
+    un límite de cotización: las filas de una cotización nunca quedan
+    repartidas entre dos bloques.
+    """
+    conn = DBManager.get_connection()
+    try:
+        if DBManager.USE_POSTGRES:
+            cursor = conn.cursor(name=f"conciliacion_{uuid.uuid4().hex[:8]}")
+            cursor.itersize = bloque
+        else:
+            cursor = conn.cursor()
+        cursor.execute("""
+            SELECT q.id, q.quote_number, q.total_amount, q.sub_total, q.iva_total, q.abona_ya,
+                   q.en_entrega, qi.id AS item_id, qi.total_cost, qi.precio_usd, qi.precio_bs,
+                   qi.iva_valor, qi.iva_porcentaje, qi.aplicar_iva, qi.shipping_cost,
+                   qi.diferencial_porcentaje
+            FROM quotes q LEFT JOIN quote_items qi ON qi.quote_id = q.id
+            ORDER BY q.id, qi.id
+        """)
+        pendiente = []
+        while True:
+            filas = cursor.fetchmany(bloque)
+            if not filas:
+                break
+            filas = pendiente + [tuple(valor_fila(r, c, i) for i, c in enumerate(_COLUMNAS)) for r in filas]
+            # La última cotización puede seguir en el próximo bloque
+            ultima = filas[-1][0]
+            corte = len(filas)
+            while corte > 0 and filas[corte - 1][0] == ultima:
+                corte -= 1
+            if corte == 0:
+                pendiente = filas
+                continue
+            pendiente = filas[corte:]
+            yield filas[:corte]
+        if pendiente:
+            yield pendiente
+        cursor.close()
+    finally:
+        conn.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CÁLCULO VECTORIZADO
+# ─────────────────────────────────────────────────────────────────────────────
+def _columna(filas: list, j: int) -> np.ndarray:
+    return np.asarray([float(f[j] or 0) for f in filas], dtype=np.float64)
+
+
+def conciliar_bloque(filas: list, tolerancia: float = TOLERANCIA) -> list:
+    """
+    Compara la cabecera de cada cotización del bloque con sus ítems.
+
+    Returns:
+        list[dict]: una entrada por cotización con diferencias: id,
+        quote_number, sin_items, esperado {campo: USD} y diferencias
+        [(campo, guardado, esperado, diferencia)]
+    """
+    if not filas:
+        return []
+    quote_ids = np.asarray([f[0] for f in filas], dtype=np.int64)
+    inicio = np.flatnonzero(np.r_[True, quote_ids[1:] != quote_ids[:-1]])
+    posicion = np.cumsum(np.r_[True, quote_ids[1:] != quote_ids[:-1]]) - 1
+    cabeceras = [filas[i] for i in inicio]
+
+    con_item = np.asarray([f[7] is not None for f in filas], dtype=bool)
+    items = [f for f, hay in zip(filas, con_item) if hay]
+    sumas = {clave: np.zeros(len(inicio), dtype=np.int64)
+             for clave in ('bs_sin_iva', 'iva', 'abona', 'total_usd')}
+    if items:
+        precio_usd = _columna(items, 8)
+        precio_usd = np.where(precio_usd != 0, precio_usd, _columna(items, 9))
+        precio_bs = _columna(items, 10)
+        aportes = aportes_guardados({
+            'precio_usd':             precio_usd,
+            'precio_bs':              np.where(precio_bs != 0, precio_bs, precio_usd),
+            'iva_valor':              _columna(items, 11),
+            'iva_porcentaje':         _columna(items, 12),
+            'aplicar_iva':            [bool(f[13]) for f in items],
+            'costo_envio':            _columna(items, 14),
+            'diferencial_porcentaje': _columna(items, 15),
+        })
+        for clave in sumas:
+            np.add.at(sumas[clave], posicion[con_item], aportes[clave])
+    cantidad_items = np.bincount(posicion[con_item], minlength=len(inicio))
+
+    total_a_pagar = sumas['bs_sin_iva'] + sumas['iva']
+    esperado = {
+        'sub_total':    sumas['bs_sin_iva'],
+        'iva_total':    sumas['iva'],
+        'abona_ya':     sumas['abona'],
+        'en_entrega':   total_a_pagar - sumas['abona'],
+        'total_amount': sumas['total_usd'],
+    }
+    guardado = {campo: _centavos(_columna(cabeceras, 2 + j_campo))
+                for campo, j_campo in zip(CAMPOS, (1, 2, 3, 4, 0))}
+    limite = int(round(tolerancia * 100))
+    fuera = np.zeros(len(inicio), dtype=bool)
+    for campo in CAMPOS:
+        fuera |= np.abs(guardado[campo] - esperado[campo]) > limite
+
+    resultado = []
+    for i in np.flatnonzero(fuera):
+        diferencias = [
+            (campo, guardado[campo][i] / 100, esperado[campo][i] / 100,
+             (guardado[campo][i] - esperado[campo][i]) / 100)
+            for campo in CAMPOS if abs(int(guardado[campo][i] - esperado[campo][i])) > limite
+        ]
+        resultado.append({
+            'id':           int(cabeceras[i][0]),
+            'quote_number': cabeceras[i][1],
+            'sin_items':    bool(cantidad_items[i] == 0),
+            'esperado':     {campo: esperado[campo][i] / 100 for campo in CAMPOS},
+            'diferencias':  diferencias,
+        })
+    return resultado
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ESCRITURA
+# ─────────────────────────────────────────────────────────────────────────────
+def _guardar_reporte(cursor, corrida: str, hallazgos: list):
+    filas = [
+        (corrida, h['id'], h['quote_number'], campo, guardado, esperado, diferencia,
+         'sin ítems' if h['sin_items'] else None)
+        for h in hallazgos for campo, guardado, esperado, diferencia in h['diferencias']
+    ]
+    if not filas:
+        return
+    if DBManager.USE_POSTGRES:
+        from psycopg2.extras import execute_values
+        execute_values(cursor, """
+            INSERT INTO quote_reconciliation
+                (corrida, quote_id, quote_number, campo, guardado, esperado, diferencia, nota)
+            VALUES %s
+        """, filas, page_size=LOTE_ESCRITURA)
+        return
+    cursor.executemany("""
+        INSERT INTO quote_reconciliation
+            (corrida, quote_id, quote_number, campo, guardado, esperado, diferencia, nota)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, filas)
+
+
+def _corregir(cursor, corrida: str, hallazgos: list):
+    filas = [(h['id'],) + tuple(h['esperado'][campo] for campo in CAMPOS) for h in hallazgos]
+    if DBManager.USE_POSTGRES:
+        from psycopg2.extras import execute_values
+        execute_values(cursor, """
+            UPDATE quotes AS q SET
+                sub_total = v.sub_total, iva_total = v.iva_total, abona_ya = v.abona_ya,
+                en_entrega = v.en_entrega, total_amount = v.total_amount,
+                desglose = NULL, pdf_path = NULL, jpeg_path = NULL
+            FROM (VALUES %s) AS v(id, sub_total, iva_total, abona_ya, en_entrega, total_amount)
+            WHERE q.id = v.id
+        """, filas, page_size=LOTE_ESCRITURA)
+        execute_values(cursor, """
+            UPDATE quote_reconciliation AS r SET corregido_en = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(corrida, quote_id)
+            WHERE r.corrida = v.corrida AND r.quote_id = v.quote_id
+        """, [(corrida, h['id']) for h in hallazgos], page_size=LOTE_ESCRITURA)
+        return
+    cursor.executemany("""
+        UPDATE quotes SET
+            sub_total = ?, iva_total = ?, abona_ya = ?, en_entrega = ?, total_amount = ?,
+            desglose = NULL, pdf_path = NULL, jpeg_path = NULL
+        WHERE id = ?
+    """, [fila[1:] + fila[:1] for fila in filas])
+    cursor.executemany(
+        "UPDATE quote_reconciliation SET corregido_en = CURRENT_TIMESTAMP WHERE corrida = ? AND quote_id = ?",
+        [(corrida, h['id']) for h in hallazgos])
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# API
+# ─────────────────────────────────────────────────────────────────────────────
+def escanear(corregir: bool = False, tolerancia: float = TOLERANCIA, usuario_id: int = None,
+             progreso=None) -> dict:
+    """
+    Recorre todas las cotizaciones, guarda las diferencias en
+    quote_reconciliation y, si corregir=True, corrige las cabeceras.
+    Las cotizaciones sin ítems se reportan pero no se corrigen (la
+    cabecera es lo único que queda de ellas).
+
+    Args:
+        progreso: callback(cotizaciones_revisadas) por bloque
+
+    Returns:
+        dict: corrida, revisadas, con_diferencias, sin_items, corregidas,
+        por_campo {campo: cotizaciones}, segundos y error
+    """
+    inicio = time.monotonic()
+    corrida = time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:6]
+    stats = {'corrida': corrida, 'revisadas': 0, 'con_diferencias': 0, 'sin_items': 0,
+             'corregidas': 0, 'por_campo': dict.fromkeys(CAMPOS, 0), 'segundos': 0.0,
+             'error': None}
+    hallazgos = []
+    try:
+        for filas in _bloques():
+            encontrados = conciliar_bloque(filas, tolerancia)
+            hallazgos.extend(encontrados)
+            stats['revisadas'] += len({f[0] for f in filas})
+            if progreso:
+                progreso(stats['revisadas'])
+    except Exception as e:
+        print(f"❌ Error recorriendo cotizaciones para conciliar: {e}")
+        stats['error'] = str(e)
+        stats['segundos'] = round(time.monotonic() - inicio, 2)
+        return stats
+
+    stats['con_diferencias'] = len(hallazgos)
+    stats['sin_items'] = sum(1 for h in hallazgos if h['sin_items'])
+    for h in hallazgos:
+        for campo, *_ in h['diferencias']:
+            stats['por_campo'][campo] += 1
+
+    if hallazgos:
+        init_reconciliation_table()
+        corregibles = [h for h in hallazgos if not h['sin_items']] if corregir else []
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            for i in range(0, len(hallazgos), LOTE_ESCRITURA):
+                _guardar_reporte(cursor, corrida, hallazgos[i:i + LOTE_ESCRITURA])
+            conn.commit()
+            # Correcciones: una transacción por lote
+            for i in range(0, len(corregibles), LOTE_ESCRITURA):
+                lote = corregibles[i:i + LOTE_ESCRITURA]
+                _corregir(cursor, corrida, lote)
+                conn.commit()
+                stats['corregidas'] += len(lote)
+            cursor.close()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error guardando la conciliación: {e}")
+            stats['error'] = str(e)
+        finally:
+            conn.close()
+
+    if usuario_id and stats['corregidas']:
+        DBManager.log_activity(
+            usuario_id, 'reconcile_quotes',
+            f"Corrigió totales de {stats['corregidas']} cotizaciones (corrida {corrida})"
+        )
+    stats['segundos'] = round(time.monotonic() - inicio, 2)
+    return stats
+
+
+def corregir_corrida(corrida: str, usuario_id: int = None) -> dict:
+    """
+    Aplica las correcciones registradas en quote_reconciliation para una
+    corrida ya escaneada (la que revisó el administrador), sin volver a
+    recorrer el historial: cada campo reportado pasa a su valor esperado.
+
+    Solo se tocan las cotizaciones de esa corrida, con ítems y aún sin
+    corregir. Si una cotización cambió después del escaneo (algún campo ya
+    no tiene el valor guardado que se reportó) se omite: su diferencia
+    reportada ya no es válida.
+
+    Returns:
+        dict: corregidas, omitidas, segundos y error
+    """
+    inicio = time.monotonic()
+    stats = {'corregidas': 0, 'omitidas': 0, 'segundos': 0.0, 'error': None}
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT r.quote_id, r.campo, r.guardado, r.esperado,
+                   q.sub_total, q.iva_total, q.abona_ya, q.en_entrega, q.total_amount
+            FROM quote_reconciliation r JOIN quotes q ON q.id = r.quote_id
+            WHERE r.corrida = {ph} AND r.nota IS NULL AND r.corregido_en IS NULL
+            ORDER BY r.quote_id
+        """, (corrida,))
+        columnas = ('quote_id', 'campo', 'guardado', 'esperado') + CAMPOS
+        filas = [{c: valor_fila(r, c, i) for i, c in enumerate(columnas)} for r in cursor.fetchall()]
+
+        # Por cotización: valores actuales de la cabecera con los campos
+        # reportados reemplazados por su valor esperado
+        hallazgos, vigentes = {}, {}
+        for fila in filas:
+            quote_id = fila['quote_id']
+            h = hallazgos.setdefault(quote_id, {
+                'id': quote_id,
+                'esperado': {campo: float(fila[campo] or 0) for campo in CAMPOS},
+            })
+            actual = int(_centavos(float(fila[fila['campo']] or 0)))
+            vigentes[quote_id] = (vigentes.get(quote_id, True)
+                                  and actual == int(_centavos(float(fila['guardado'] or 0))))
+            h['esperado'][fila['campo']] = float(fila['esperado'] or 0)
+        corregibles = [h for quote_id, h in hallazgos.items() if vigentes[quote_id]]
+        stats['omitidas'] = len(hallazgos) - len(corregibles)
+
+        # Una transacción por lote, como escanear(corregir=True)
+        for i in range(0, len(corregibles), LOTE_ESCRITURA):
+            lote = corregibles[i:i + LOTE_ESCRITURA]
+            _corregir(cursor, corrida, lote)
+            conn.commit()
+            stats['corregidas'] += len(lote)
+        cursor.close()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"❌ Error aplicando la conciliación {corrida}: {e}")
+        stats['error'] = str(e)
+    finally:
+        if conn:
+            conn.close()
+
+    if usuario_id and stats['corregidas']:
+        DBManager.log_activity(
+            usuario_id, 'reconcile_quotes',
+            f"Corrigió totales de {stats['corregidas']} cotizaciones (corrida {corrida})"
+        )
+    stats['segundos'] = round(time.monotonic() - inicio, 2)
+    return stats
+
+
+def contar() -> int:
+    """Cotizaciones que recorrerá escanear() (para la barra de progreso)."""
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) AS n FROM quotes")
+        n = valor_fila(cursor.fetchone(), 'n', 0)
+        cursor.close()
+        return int(n or 0)
+    except Exception as e:
+        print(f"❌ Error contando cotizaciones: {e}")
+        return 0
+    finally:
+        if conn:
+            conn.close()
+
+
+def reporte(corrida: str, limite: int = 500) -> list:
+    """Diferencias guardadas de una corrida (mayores primero)."""
+    conn = None
+    try:
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT quote_id, quote_number, campo, guardado, esperado, diferencia, nota, corregido_en
+            FROM quote_reconciliation WHERE corrida = {ph}
+            ORDER BY ABS(diferencia) DESC LIMIT {ph}
+        """, (corrida, limite))
+        columnas = ('quote_id', 'quote_number', 'campo', 'guardado', 'esperado', 'diferencia',
+                    'nota', 'corregido_en')
+        filas = [{c: valor_fila(r, c, i) for i, c in enumerate(columnas)} for r in cursor.fetchall()]
+        cursor.close()
+        return filas
+    except Exception as e:
+        print(f"❌ Error leyendo reporte de conciliación: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
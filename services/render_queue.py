@@ -0,0 +1,454 @@
+# services/render_queue.py
+# Cola de render de documentos en segundo plano (pool de procesos + tabla render_jobs)
+"""
+Todo el render de documentos (PDF BCV, PDF divisas, páginas PNG y Cuadro de
+Costos) es CPU puro: dentro del hilo del script de Streamlit retiene el GIL y
+frena las sesiones de todos los demás analistas. Este servicio lo saca a un
+pool acotado de procesos:
+
+  - Tabla render_jobs: un registro por documento con estado
+    queued → running → done | failed, la referencia doc:// resultante y el
+    error si lo hubo. La UI la consulta para saber si un documento está listo.
+  - Cola en memoria acotada (RENDER_QUEUE_MAX). Si no hay espacio para el
+    juego de documentos, encolar() devuelve None y la UI decide (avisar,
+    generar luego): esa es la contrapresión.
+  - Hilos despachadores (uno por worker) que sacan trabajos de la cola,
+    los marcan running y esperan el resultado del proceso. La BD solo se toca
+    desde este proceso; los workers solo renderizan y publican en
+    DocumentStore.
+  - El pool usa 'spawn': los workers no heredan conexiones a la BD ni los
+    hilos de Streamlit.
+
+Al guardar o aprobar una cotización se encola el juego completo
+(encolar_cotizacion); los botones GENERAR encolan solo el tipo pedido.
+Un trabajo cuyo documento ya está en DocumentCache termina casi de inmediato.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from database.db_manager import DBManager, valor_fila
+
+# Juego completo de documentos de una cotización. 'png' son la miniatura y
+# la imagen para mensajería; el PNG completo ('png_full') solo se genera
+# bajo demanda.
+TIPOS_DOCUMENTO = ('pdf_bcv', 'pdf_divisas', 'png', 'cuadro_costos')
+
+# Columna de quotes que guarda la referencia de cada tipo
+COLUMNA_QUOTES = {'pdf_bcv': 'pdf_path', 'png': 'jpeg_path'}
+
+ESTADOS_PENDIENTES = ('queued', 'running')
+
+# Minutos tras los cuales un trabajo pendiente se da por perdido
+# (proceso reiniciado, réplica caída)
+MINUTOS_VENCIMIENTO = 15
+
+
+def init_render_jobs_table():
+    """
+    Crea la tabla 'render_jobs' si no existe.
+    Compatible con PostgreSQL y SQLite. Idempotente.
+    """
+    is_postgres = DBManager.USE_POSTGRES
+    conn = None
+    try:
+        conn = DBManager.get_connection()
+        cursor = conn.cursor()
+        if is_postgres:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS render_jobs (
+                    id             SERIAL PRIMARY KEY,
+                    quote_id       INTEGER NOT NULL,
+                    tipo           TEXT NOT NULL,
+                    estado         TEXT NOT NULL DEFAULT 'queued',
+                    clave          TEXT,
+                    referencia     TEXT,
+                    error          TEXT,
+                    creado_en      TIMESTAMP DEFAULT NOW(),
+                    actualizado_en TIMESTAMP DEFAULT NOW()
+                )
+            """)
+        else:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS render_jobs (
+                    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+                    quote_id       INTEGER NOT NULL,
+                    tipo           TEXT NOT NULL,
+                    estado         TEXT NOT NULL DEFAULT 'queued',
+                    clave          TEXT,
+                    referencia     TEXT,
+                    error          TEXT,
+                    creado_en      TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_render_jobs_quote ON render_jobs (quote_id, tipo)"
+        )
+        conn.commit()
+        cursor.close()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"❌ Error creando tabla render_jobs: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# TRABAJO EN EL PROCESO WORKER
+# ─────────────────────────────────────────────────────────────────────────────
+def precargar_worker():
+    """Initializer de cada proceso del pool: fuentes, logos y estilos en memoria."""
+    from services.document_generation.assets import DocumentAssets
+    DocumentAssets.precargar()
+
+
+def render_documento(tipo: str, datos: dict) -> str:
+    """
+    Se ejecuta en un proceso del pool: renderiza (o toma del caché) y publica
+    en DocumentStore. Retorna la referencia doc://. No toca la BD.
+    """
+    from services.document_generation.document_storage import DocumentStore
+
+    if tipo == 'pdf_bcv':
+        referencia, _ = DocumentStore.guardar_pdf(datos)
+    elif tipo == 'pdf_divisas':
+        referencia, _ = DocumentStore.guardar_pdf(datos, modo_divisas=True)
+    elif tipo == 'png':
+        # Miniatura + imagen para mensajería de una sola rasterización;
+        # la referencia que se guarda en quotes.jpeg_path es la de mensajería
+        referencia, _ = DocumentStore.guardar_imagenes(datos)['mensaje']
+    elif tipo == 'png_full':
+        referencia, _ = DocumentStore.guardar_imagenes(datos, rendiciones=('png',))['png']
+    elif tipo == 'cuadro_costos':
+        referencia, _ = DocumentStore.guardar_cuadro_costos(datos['quote'], datos['items'])
+    else:
+        raise ValueError(f"Tipo de documento desconocido: {tipo}")
+    return referencia
+
+
+def datos_para(quote_id: int, tipos) -> dict:
+    """Entrada de cada generador, leída de la BD en este proceso. {} si no existe."""
+    from services.document_generation.quote_adapter import (
+        adaptar_quote_para_generadores, items_para_cuadro_costos
+    )
+
+    datos = {}
+    if any(t != 'cuadro_costos' for t in tipos):
+        qd = DBManager.get_quote_full_details(quote_id)
+        if not qd:
+            return {}
+        adaptados = adaptar_quote_para_generadores(qd)
+        for tipo in tipos:
+            if tipo != 'cuadro_costos':
+                datos[tipo] = adaptados
+    if 'cuadro_costos' in tipos:
+        quote = DBManager.get_quote_by_id(quote_id)
+        items_raw = DBManager.get_quote_items(quote_id)
+        if quote and items_raw:
+            datos['cuadro_costos'] = {
+                'quote': quote, 'items': items_para_cuadro_costos(items_raw)
+            }
+    return datos
+
+
+def clave_documento(tipo: str, datos: dict) -> str:
+    """Clave de contenido del documento (la misma que calcula DocumentCache)."""
+    from services.document_generation.document_cache import DocumentCache
+
+    if tipo == 'cuadro_costos':
+        return DocumentCache.clave_cuadro_costos(datos['quote'], datos['items'])
+    preparados = DocumentCache.preparar_datos(datos)
+    if tipo == 'png':
+        return DocumentCache.clave_rendicion(preparados, 'mensaje')
+    if tipo == 'png_full':
+        return DocumentCache.clave_rendicion(preparados, 'png')
+    return DocumentCache.clave(preparados, 'pdf', tipo == 'pdf_divisas')
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# COLA
+# ─────────────────────────────────────────────────────────────────────────────
+class RenderQueue:
+    """Pool de procesos + cola acotada compartidos por todas las sesiones del proceso."""
+
+    WORKERS = int(os.environ.get('RENDER_WORKERS', '2'))
+    MAX_EN_COLA = int(os.environ.get('RENDER_QUEUE_MAX', '40'))
+    TIMEOUT_SEGUNDOS = 300
+    # Cada cuántos segundos se buscan trabajos vencidos (desde los despachadores)
+    VENCER_CADA_SEGUNDOS = 60
+
+    _lock = threading.RLock()
+    _cola = None
+    _pool = None
+    _ultimo_vencimiento = 0.0
+
+    @classmethod
+    def _iniciar(cls):
+        with cls._lock:
+            if cls._cola is not None:
+                return
+            init_render_jobs_table()
+            cls._vencer_si_toca()
+            cls._cola = queue.Queue(maxsize=cls.MAX_EN_COLA)
+            cls._pool = cls._nuevo_pool()
+            for i in range(cls.WORKERS):
+                threading.Thread(target=cls._despachar, name=f'render-{i}',
+                                 daemon=True).start()
+
+    @classmethod
+    def _nuevo_pool(cls):
+        return ProcessPoolExecutor(
+            max_workers=cls.WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=precargar_worker,
+        )
+
+    # ── Despacho ─────────────────────────────────────────────────────────────
+    @classmethod
+    def _despachar(cls):
+        """Bucle de cada hilo despachador: un trabajo a la vez por worker."""
+        while True:
+            cls._vencer_si_toca()
+            try:
+                job_id, quote_id, tipo, datos = cls._cola.get(timeout=cls.VENCER_CADA_SEGUNDOS)
+            except queue.Empty:
+                continue
+            try:
+                cls._actualizar(job_id, 'running')
+                try:
+                    futuro = cls._pool.submit(render_documento, tipo, datos)
+                except BrokenProcessPool:
+                    with cls._lock:
+                        cls._pool = cls._nuevo_pool()
+                    futuro = cls._pool.submit(render_documento, tipo, datos)
+                referencia = futuro.result(timeout=cls.TIMEOUT_SEGUNDOS)
+                cls._completar(job_id, quote_id, tipo, referencia)
+            except Exception as e:
+                print(f"❌ Error renderizando {tipo} de cotización {quote_id}: {e}")
+                cls._actualizar(job_id, 'failed', error=str(e)[:500])
+            finally:
+                cls._cola.task_done()
+
+    @classmethod
+    def _actualizar(cls, job_id: int, estado: str, referencia: str = None, error: str = None):
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE render_jobs
+                SET estado = {ph}, referencia = COALESCE({ph}, referencia),
+                    error = {ph}, actualizado_en = CURRENT_TIMESTAMP
+                WHERE id = {ph}
+            """, (estado, referencia, error, job_id))
+            conn.commit()
+            cursor.close()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error actualizando render_jobs {job_id}: {e}")
+        finally:
+            conn.close()
+
+    @classmethod
+    def _completar(cls, job_id: int, quote_id: int, tipo: str, referencia: str):
+        """
+        Marca el trabajo como done y, para PDF BCV y PNG, guarda la referencia
+        en quotes. Solo el trabajo más reciente de ese tipo escribe en quotes:
+        un render viejo que termina tarde no pisa al de la última edición.
+        """
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE render_jobs
+                SET estado = 'done', referencia = {ph}, error = NULL,
+                    actualizado_en = CURRENT_TIMESTAMP
+                WHERE id = {ph}
+            """, (referencia, job_id))
+            columna = COLUMNA_QUOTES.get(tipo)
+            if columna:
+                cursor.execute(f"""
+                    UPDATE quotes SET {columna} = {ph}
+                    WHERE id = {ph}
+                      AND NOT EXISTS (
+                          SELECT 1 FROM render_jobs
+                          WHERE quote_id = {ph} AND tipo = {ph} AND id > {ph}
+                      )
+                """, (referencia, quote_id, quote_id, tipo, job_id))
+            conn.commit()
+            cursor.close()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error completando render_jobs {job_id}: {e}")
+        finally:
+            conn.close()
+
+    @classmethod
+    def _vencer_si_toca(cls):
+        """
+        Barrido de vencidos a lo sumo cada VENCER_CADA_SEGUNDOS por proceso.
+        Lo llaman los despachadores (también con la cola vacía) y encolar();
+        estado() solo lee.
+        """
+        with cls._lock:
+            ahora = time.monotonic()
+            if ahora - cls._ultimo_vencimiento < cls.VENCER_CADA_SEGUNDOS:
+                return
+            cls._ultimo_vencimiento = ahora
+        cls._vencer_pendientes()
+
+    @classmethod
+    def _vencer_pendientes(cls):
+        """Marca como failed los trabajos pendientes que llevan demasiado tiempo."""
+        is_postgres = DBManager.USE_POSTGRES
+        limite = (f"NOW() - INTERVAL '{MINUTOS_VENCIMIENTO} minutes'" if is_postgres
+                  else f"datetime('now', '-{MINUTOS_VENCIMIENTO} minutes')")
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE render_jobs
+                SET estado = 'failed', error = 'Trabajo interrumpido (proceso reiniciado)',
+                    actualizado_en = CURRENT_TIMESTAMP
+                WHERE estado IN ('queued', 'running') AND actualizado_en < {limite}
+            """)
+            conn.commit()
+            cursor.close()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error venciendo render_jobs: {e}")
+        finally:
+            conn.close()
+
+    # ── API ──────────────────────────────────────────────────────────────────
+    @classmethod
+    def encolar(cls, quote_id: int, tipos=TIPOS_DOCUMENTO):
+        """
+        Encola los documentos indicados de una cotización.
+
+        Retorna la lista de IDs de render_jobs creados ([] si todo ya estaba
+        pendiente con los mismos datos), o None si la cola no tiene espacio
+        para todos (contrapresión: no se encola nada).
+        """
+        cls._iniciar()
+        cls._vencer_si_toca()
+        datos = datos_para(quote_id, tipos)
+        if not datos:
+            return []
+
+        # No duplicar un documento que ya está pendiente con el mismo contenido
+        pendientes = {
+            job['clave'] for job in cls.estado(quote_id).values()
+            if job['estado'] in ESTADOS_PENDIENTES
+        }
+        nuevos = []
+        for tipo in tipos:
+            if tipo in datos:
+                clave = clave_documento(tipo, datos[tipo])
+                if clave not in pendientes:
+                    nuevos.append((tipo, clave))
+        if not nuevos:
+            return []
+
+        is_postgres = DBManager.USE_POSTGRES
+        ph = '%s' if is_postgres else '?'
+        with cls._lock:
+            if cls._cola.qsize() + len(nuevos) > cls.MAX_EN_COLA:
+                return None
+
+            ids = []
+            conn = DBManager.get_connection()
+            try:
+                cursor = conn.cursor()
+                for tipo, clave in nuevos:
+                    sql = f"""
+                        INSERT INTO render_jobs (quote_id, tipo, estado, clave)
+                        VALUES ({ph}, {ph}, 'queued', {ph})
+                    """
+                    if is_postgres:
+                        cursor.execute(sql + " RETURNING id", (quote_id, tipo, clave))
+                        ids.append(cursor.fetchone()['id'])
+                    else:
+                        cursor.execute(sql, (quote_id, tipo, clave))
+                        ids.append(cursor.lastrowid)
+                conn.commit()
+                cursor.close()
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Error encolando documentos de cotización {quote_id}: {e}")
+                return None
+            finally:
+                conn.close()
+
+            for job_id, (tipo, _) in zip(ids, nuevos):
+                cls._cola.put_nowait((job_id, quote_id, tipo, datos[tipo]))
+            return ids
+
+    @classmethod
+    def encolar_cotizacion(cls, quote_id: int):
+        """Juego completo de documentos (al guardar o aprobar). Nunca lanza excepción."""
+        try:
+            return cls.encolar(quote_id, TIPOS_DOCUMENTO)
+        except Exception as e:
+            print(f"❌ Error encolando documentos de cotización {quote_id}: {e}")
+            return None
+
+    @classmethod
+    def estado(cls, quote_id: int) -> dict:
+        """
+        Último trabajo de cada tipo de documento de la cotización:
+        {tipo: {'id', 'estado', 'clave', 'referencia', 'error'}}.
+        Solo lectura: la UI lo consulta cada pocos segundos; los trabajos
+        vencidos los marca el barrido de _vencer_si_toca().
+        """
+        cls._iniciar()
+        ph = '%s' if DBManager.USE_POSTGRES else '?'
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, tipo, estado, clave, referencia, error
+                FROM render_jobs
+                WHERE quote_id = {ph}
+                ORDER BY id DESC
+            """, (quote_id,))
+            rows = cursor.fetchall()
+            cursor.close()
+        except Exception as e:
+            print(f"❌ Error consultando render_jobs: {e}")
+            rows = []
+        finally:
+            conn.close()
+
+        trabajos = {}
+        for row in rows:
+            tipo = valor_fila(row, 'tipo', 1)
+            if tipo not in trabajos:
+                trabajos[tipo] = {
+                    'id':         valor_fila(row, 'id', 0),
+                    'estado':     valor_fila(row, 'estado', 2),
+                    'clave':      valor_fila(row, 'clave', 3),
+                    'referencia': valor_fila(row, 'referencia', 4),
+                    'error':      valor_fila(row, 'error', 5),
+                }
+        return trabajos
+
+    @classmethod
+    def pendiente(cls, quote_id: int, tipo: str) -> bool:
+        job = cls.estado(quote_id).get(tipo)
+        return bool(job) and job['estado'] in ESTADOS_PENDIENTES
+
+    @classmethod
+    def carga(cls) -> tuple:
+        """(trabajos en cola, capacidad) para mostrar en la UI."""
+        cls._iniciar()
+        return cls._cola.qsize(), cls.MAX_EN_COLA
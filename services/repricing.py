@@ -0,0 +1,380 @@
+# services/repricing.py
+# Recalculo masivo de cotizaciones abiertas tras cambiar diferencial, TAX o IVA
+"""
+Cuando el administrador cambia el diferencial, el TAX o el IVA, las
+cotizaciones abiertas (borrador y enviadas) conservan los precios viejos
+hasta que un analista las abre y las vuelve a guardar. Este servicio las
+recalcula todas con el motor de precios:
+
+  - Recorre las cotizaciones abiertas por lotes de LOTE (clave id > último)
+    y trae los ítems de cada lote en una sola consulta.
+  - Recalcula cada lote vectorizado (services.pricing): una llamada a
+    calcular_items para todos los ítems y sumas por cotización con
+    np.add.at.
+  - previsualizar() solo lee: cuántas cotizaciones cambian y el delta en
+    USD y en Bs por analista. aplicar() escribe con UPDATE masivos (una
+    transacción por lote), reemplaza el desglose guardado de ítems y
+    cotizaciones (services.pricing.desglose) y anula pdf_path/jpeg_path de
+    las cotizaciones que cambiaron, igual que update_quote_complete.
+
+Entradas por ítem que se respetan tal cual: FOB, cantidad, handling, manejo,
+envío, impuesto internacional % y factor de utilidad (cada ítem guarda el
+suyo). Lo que se reemplaza por la configuración vigente: TAX %, diferencial %
+e IVA %. El envío no se recalcula con las tarifas de flete: quote_items no
+guarda peso ni medidas, solo el costo de envío resultante.
+"""
+
+import numpy as np
+
+from database.db_manager import DBManager, valor_fila
+from services.pricing import calcular_items, desglose
+from services.pricing.engine import APORTES, aportes_columnas, totales_desde_sumas
+
+# Estados de cotización que se recalculan
+ESTADOS_ABIERTOS = ('draft', 'sent')
+
+# Cotizaciones por lote (y por transacción al aplicar)
+LOTE = 200
+
+_COLUMNAS_QUOTE = ('id', 'quote_number', 'analyst_id', 'full_name', 'total_amount',
+                   'sub_total', 'iva_total')
+_COLUMNAS_ITEM = ('id', 'quote_id', 'quantity', 'unit_cost', 'international_handling',
+                  'national_handling', 'shipping_cost', 'tax_percentage', 'profit_factor',
+                  'aplicar_iva', 'total_cost', 'precio_bs', 'iva_valor', 'diferencial_valor')
+
+# Columnas de quote_items que escribe aplicar(), en este orden
+COLUMNAS_ITEM_ACTUALIZADAS = (
+    'total_cost', 'precio_usd', 'precio_bs', 'fob_total', 'utilidad_valor',
+    'diferencial_porcentaje', 'diferencial_valor', 'iva_porcentaje', 'iva_valor', 'desglose',
+)
+
+
+def parametros_vigentes() -> dict:
+    """Diferencial, TAX e IVA de la configuración (los mismos del formulario)."""
+    from database.config_helpers import ConfigHelpers
+    return {
+        'diferencial_porcentaje': ConfigHelpers.get_diferencial(),
+        'tax_porcentaje':         ConfigHelpers.get_tax_percentage(),
+        'iva_porcentaje':         ConfigHelpers.get_iva_venezuela(),
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LECTURA POR LOTES
+# ─────────────────────────────────────────────────────────────────────────────
+def iterar_lotes(lote: int = LOTE):
+    """
+    Genera (cotizaciones, items) por lote de cotizaciones abiertas, en orden
+    de id. Cada elemento es un dict con las columnas de _COLUMNAS_QUOTE /
+    _COLUMNAS_ITEM; los ítems vienen ordenados por (quote_id, id).
+    """
+    ph = '%s' if DBManager.USE_POSTGRES else '?'
+    estados = ', '.join([ph] * len(ESTADOS_ABIERTOS))
+    ultimo = 0
+    while True:
+        conn = DBManager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT q.id, q.quote_number, q.analyst_id, u.full_name, q.total_amount,
+                       q.sub_total, q.iva_total
+                FROM quotes q LEFT JOIN users u ON u.id = q.analyst_id
+                WHERE q.status IN ({estados}) AND q.id > {ph}
+                ORDER BY q.id LIMIT {ph}
+            """, list(ESTADOS_ABIERTOS) + [ultimo, lote])
+            cotizaciones = [{c: valor_fila(r, c, i) for i, c in enumerate(_COLUMNAS_QUOTE)}
+                            for r in cursor.fetchall()]
+            if not cotizaciones:
+                cursor.close()
+                return
+            ids = [c['id'] for c in cotizaciones]
+            cursor.execute(f"""
+                SELECT {', '.join(_COLUMNAS_ITEM)}
+                FROM quote_items
+                WHERE quote_id IN ({', '.join([ph] * len(ids))})
+                ORDER BY quote_id, id
+            """, ids)
+            items = [{c: valor_fila(r, c, i) for i, c in enumerate(_COLUMNAS_ITEM)}
+                     for r in cursor.fetchall()]
+            cursor.close()
+        finally:
+            conn.close()
+        yield cotizaciones, items
+        ultimo = ids[-1]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# RECALCULO VECTORIZADO
+# ─────────────────────────────────────────────────────────────────────────────
+def _columna(filas: list, clave: str) -> np.ndarray:
+    return np.asarray([float(f[clave] or 0) for f in filas], dtype=np.float64)
+
+
+def recalcular_lote(cotizaciones: list, items: list, parametros: dict) -> list:
+    """
+    Recalcula un lote con los parámetros dados.
+
+    Returns:
+        list[dict]: una entrada por cotización recalculable con 'id',
+        'quote_number', 'analyst_id', 'analista', 'cambia', 'delta_usd',
+        'delta_bs', 'totales' (claves de totales_desde_sumas) e 'items'
+        (tuplas (item_id, *COLUMNAS_ITEM_ACTUALIZADAS)). Las cotizaciones
+        sin ítems o con algún ítem sin FOB o sin cantidad quedan fuera
+        (no hay con qué recalcularlas) con 'omitida': True.
+    """
+    if not items:
+        return [{**_resumen(c), 'omitida': True} for c in cotizaciones]
+
+    n = len(items)
+    cantidad = _columna(items, 'quantity')
+    fob = _columna(items, 'unit_cost')
+    handling = _columna(items, 'international_handling')
+    manejo = _columna(items, 'national_handling')
+    envio = _columna(items, 'shipping_cost')
+    aplicar_iva = np.asarray([bool(f['aplicar_iva']) for f in items], dtype=bool)
+    entrada = {
+        'cantidad':               cantidad,
+        'costo_fob':              fob,
+        'costo_handling':         handling,
+        'costo_manejo':           manejo,
+        'costo_envio':            envio,
+        'impuesto_porcentaje':    _columna(items, 'tax_percentage'),
+        'factor_utilidad':        _columna(items, 'profit_factor'),
+        'tax_porcentaje':         np.full(n, parametros['tax_porcentaje']),
+        'diferencial_porcentaje': np.full(n, parametros['diferencial_porcentaje']),
+        'aplicar_iva':            aplicar_iva,
+        'iva_porcentaje':         np.full(n, parametros['iva_porcentaje']),
+    }
+    r = calcular_items(entrada)
+    aportes = aportes_columnas({
+        'fob_total':              r['fob_total'],
+        'costo_handling':         handling,
+        'costo_manejo':           manejo,
+        'costo_impuesto':         r['costo_impuesto'],
+        'utilidad_valor':         r['utilidad_valor'],
+        'costo_envio':            envio,
+        'costo_tax':              r['costo_tax'],
+        'precio_bs':              r['precio_bs'],
+        'iva_valor':              r['iva_valor'],
+        'aplicar_iva':            aplicar_iva,
+        'diferencial_porcentaje': np.full(n, parametros['diferencial_porcentaje']),
+        'costo_total':            r['precio_usd'],
+        'costo_total_bs':         r['precio_bs'],
+    })
+
+    # Posición de la cotización de cada ítem y sumas por cotización
+    ids = np.asarray([c['id'] for c in cotizaciones])
+    posicion = np.searchsorted(ids, np.asarray([f['quote_id'] for f in items]))
+    sumas = {}
+    for clave in APORTES:
+        sumas[clave] = np.zeros(len(ids), dtype=np.int64)
+        np.add.at(sumas[clave], posicion, aportes[clave])
+    invalidos = np.zeros(len(ids), dtype=np.int64)
+    np.add.at(invalidos, posicion, ((fob <= 0) | (cantidad <= 0)).astype(np.int64))
+    cantidad_items = np.bincount(posicion, minlength=len(ids))
+
+    # Cambio por ítem, comparado al centavo con lo guardado
+    cambia_item = np.zeros(n, dtype=bool)
+    for nuevo, guardado in (('precio_usd', 'total_cost'), ('precio_bs', 'precio_bs'),
+                            ('iva_valor', 'iva_valor'), ('diferencial_valor', 'diferencial_valor')):
+        cambia_item |= np.round(r[nuevo] * 100) != np.round(_columna(items, guardado) * 100)
+    cambios_por_quote = np.bincount(posicion, weights=cambia_item, minlength=len(ids))
+
+    filas_item = list(zip(
+        (f['id'] for f in items),
+        r['precio_usd'].tolist(), r['precio_usd'].tolist(), r['precio_bs'].tolist(),
+        r['fob_total'].tolist(), r['utilidad_valor'].tolist(),
+        [float(parametros['diferencial_porcentaje'])] * n, r['diferencial_valor'].tolist(),
+        [float(parametros['iva_porcentaje'])] * n, r['iva_valor'].tolist(),
+        _desgloses(entrada, r),
+    ))
+    inicio = np.concatenate(([0], np.cumsum(cantidad_items)))
+
+    resultado = []
+    for i, cot in enumerate(cotizaciones):
+        if cantidad_items[i] == 0 or invalidos[i]:
+            resultado.append({**_resumen(cot), 'omitida': True})
+            continue
+        totales = totales_desde_sumas({clave: int(sumas[clave][i]) for clave in APORTES})
+        totales['desglose'] = desglose.serializar(desglose.desglose_totales(totales))
+        antes_bs = float(cot['sub_total'] or 0) + float(cot['iva_total'] or 0)
+        delta_usd = round(totales['total_usd'] - float(cot['total_amount'] or 0), 2)
+        delta_bs = round(totales['total_a_pagar'] - antes_bs, 2)
+        resultado.append({
+            **_resumen(cot),
+            'omitida':   False,
+            'cambia':    bool(cambios_por_quote[i]) or delta_usd != 0 or delta_bs != 0,
+            'delta_usd': delta_usd,
+            'delta_bs':  delta_bs,
+            'totales':   totales,
+            'items':     filas_item[inicio[i]:inicio[i + 1]],
+        })
+    return resultado
+
+
+def _desgloses(entrada: dict, r: dict) -> list:
+    """Desglose guardado (JSON) de cada ítem recalculado."""
+    columnas = {**{c: v.tolist() if isinstance(v, np.ndarray) else v for c, v in entrada.items()},
+                **{c: r[c].tolist() for c in desglose.CAMPOS_ITEM if c in r}}
+    return [
+        desglose.serializar(desglose.desglose_item({c: columnas[c][i] for c in desglose.CAMPOS_ITEM}))
+        for i in range(len(r['precio_usd']))
+    ]
+
+
+def _resumen(cot: dict) -> dict:
+    return {
+        'id':           cot['id'],
+        'quote_number': cot['quote_number'],
+        'analyst_id':   cot['analyst_id'],
+        'analista':     cot['full_name'] or f"#{cot['analyst_id']}",
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# API
+# ─────────────────────────────────────────────────────────────────────────────
+def _acumular(stats: dict, recalculadas: list):
+    for cot in recalculadas:
+        stats['revisadas'] += 1
+        if cot['omitida']:
+            stats['omitidas'] += 1
+            continue
+        if not cot['cambia']:
+            continue
+        stats['afectadas'] += 1
+        stats['items'] += len(cot['items'])
+        stats['delta_usd'] += cot['delta_usd']
+        stats['delta_bs'] += cot['delta_bs']
+        fila = stats['por_analista'].setdefault(cot['analista'], {
+            'analista': cot['analista'], 'cotizaciones': 0, 'delta_usd': 0.0, 'delta_bs': 0.0})
+        fila['cotizaciones'] += 1
+        fila['delta_usd'] += cot['delta_usd']
+        fila['delta_bs'] += cot['delta_bs']
+
+
+def _stats_vacias(parametros: dict) -> dict:
+    return {'parametros': parametros, 'revisadas': 0, 'afectadas': 0, 'omitidas': 0,
+            'items': 0, 'delta_usd': 0.0, 'delta_bs': 0.0, 'por_analista': {}, 'error': None}
+
+
+def _cerrar_stats(stats: dict) -> dict:
+    stats['delta_usd'] = round(stats['delta_usd'], 2)
+    stats['delta_bs'] = round(stats['delta_bs'], 2)
+    stats['por_analista'] = sorted(
+        ({**f, 'delta_usd': round(f['delta_usd'], 2), 'delta_bs': round(f['delta_bs'], 2)}
+         for f in stats['por_analista'].values()),
+        key=lambda f: -abs(f['delta_usd']))
+    return stats
+
+
+def previsualizar(parametros: dict = None, progreso=None) -> dict:
+    """
+    Impacto de recalcular las cotizaciones abiertas, sin escribir nada.
+
+    Args:
+        parametros: diferencial/TAX/IVA a aplicar (por defecto, los vigentes).
+        progreso:   callable opcional(revisadas) llamado tras cada lote.
+
+    Returns:
+        dict: 'parametros', 'revisadas', 'afectadas', 'omitidas', 'items',
+        'delta_usd', 'delta_bs', 'por_analista' (lista de dicts con
+        analista, cotizaciones, delta_usd, delta_bs) y 'error'.
+    """
+    parametros = parametros or parametros_vigentes()
+    stats = _stats_vacias(parametros)
+    try:
+        for cotizaciones, items in iterar_lotes():
+            _acumular(stats, recalcular_lote(cotizaciones, items, parametros))
+            if progreso:
+                progreso(stats['revisadas'])
+    except Exception as e:
+        print(f"❌ Error previsualizando recalculo de cotizaciones: {e}")
+        stats['error'] = str(e)
+    return _cerrar_stats(stats)
+
+
+def _escribir_lote(cursor, cambiadas: list):
+    """UPDATE masivo de ítems y totales de las cotizaciones de un lote."""
+    filas_items = [fila for cot in cambiadas for fila in cot['items']]
+    filas_quotes = [
+        (cot['id'], cot['totales']['total_usd'], cot['totales']['sub_total'],
+         cot['totales']['iva_total'], cot['totales']['abona_ya'], cot['totales']['y_en_entrega'],
+         cot['totales']['desglose'])
+        for cot in cambiadas
+    ]
+    if DBManager.USE_POSTGRES:
+        from psycopg2.extras import execute_values
+        # VALUES llega como texto: el desglose se convierte a JSONB al asignarlo
+        asignaciones = ', '.join(f"{c} = v.{c}" + ('::jsonb' if c == 'desglose' else '')
+                                 for c in COLUMNAS_ITEM_ACTUALIZADAS)
+        execute_values(cursor, f"""
+            UPDATE quote_items AS qi SET {asignaciones}
+            FROM (VALUES %s) AS v(id, {', '.join(COLUMNAS_ITEM_ACTUALIZADAS)})
+            WHERE qi.id = v.id
+        """, filas_items, page_size=1000)
+        execute_values(cursor, """
+            UPDATE quotes AS q SET
+                total_amount = v.total_amount, sub_total = v.sub_total,
+                iva_total = v.iva_total, abona_ya = v.abona_ya, en_entrega = v.en_entrega,
+                desglose = v.desglose::jsonb, pdf_path = NULL, jpeg_path = NULL
+            FROM (VALUES %s) AS v(id, total_amount, sub_total, iva_total, abona_ya, en_entrega, desglose)
+            WHERE q.id = v.id
+        """, filas_quotes, page_size=1000)
+        return
+
+    asignaciones = ', '.join(f"{c} = ?" for c in COLUMNAS_ITEM_ACTUALIZADAS)
+    cursor.executemany(f"UPDATE quote_items SET {asignaciones} WHERE id = ?",
+                       [fila[1:] + fila[:1] for fila in filas_items])
+    cursor.executemany("""
+        UPDATE quotes SET
+            total_amount = ?, sub_total = ?, iva_total = ?, abona_ya = ?, en_entrega = ?,
+            desglose = ?, pdf_path = NULL, jpeg_path = NULL
+        WHERE id = ?
+    """, [fila[1:] + fila[:1] for fila in filas_quotes])
+
+
+def aplicar(parametros: dict, usuario_id: int = None, progreso=None) -> dict:
+    """
+    Recalcula y guarda las cotizaciones abiertas con los parámetros dados
+    (los mismos que se mostraron en la previsualización). Cada lote se
+    escribe en su propia transacción; si un lote falla se revierte y el
+    recalculo se detiene ahí (los lotes anteriores quedan aplicados).
+
+    Returns:
+        dict: mismas claves que previsualizar(); 'afectadas' son las
+        cotizaciones efectivamente actualizadas.
+    """
+    stats = _stats_vacias(parametros)
+    try:
+        for cotizaciones, items in iterar_lotes():
+            recalculadas = recalcular_lote(cotizaciones, items, parametros)
+            cambiadas = [c for c in recalculadas if not c['omitida'] and c['cambia']]
+            if cambiadas:
+                conn = DBManager.get_connection()
+                try:
+                    cursor = conn.cursor()
+                    _escribir_lote(cursor, cambiadas)
+                    conn.commit()
+                    cursor.close()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    conn.close()
+            _acumular(stats, recalculadas)
+            if progreso:
+                progreso(stats['revisadas'])
+    except Exception as e:
+        print(f"❌ Error aplicando recalculo de cotizaciones: {e}")
+        stats['error'] = str(e)
+
+    if usuario_id and stats['afectadas']:
+        p = parametros
+        DBManager.log_activity(
+            usuario_id, 'bulk_reprice',
+            f"Recalculó {stats['afectadas']} cotizaciones abiertas "
+            f"(diferencial {p['diferencial_porcentaje']}%, TAX {p['tax_porcentaje']}%, "
+            f"IVA {p['iva_porcentaje']}%): Δ USD {stats['delta_usd']:+.2f}"
+        )
+    return _cerrar_stats(stats)
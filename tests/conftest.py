@@ -0,0 +1,29 @@
+# tests/conftest.py
+# Configuración común de pytest: raíz del proyecto en sys.path y BD SQLite temporal
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+
+if str(RAIZ) not in sys.path:
+    sys.path.insert(0, str(RAIZ))
+
+
+def cargar_fixture(nombre: str):
+    """Contenido de tests/fixtures/<nombre> (JSON)."""
+    with open(FIXTURES / nombre, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def bd_temporal(tmp_path, monkeypatch):
+    """DBManager apuntando a una BD SQLite vacía e inicializada en tmp_path."""
+    from database.db_manager import DBManager
+    monkeypatch.setattr(DBManager, 'USE_POSTGRES', False)
+    monkeypatch.setattr(DBManager, 'DB_PATH', tmp_path / 'logipartve_test.db')
+    DBManager.init_database()
+    return DBManager
@@ -0,0 +1,174 @@
+# tests/test_ai_providers.py
+"""
+Solicitud cubierta entre proveedores de IA, sin red: cobertura tras
+espera_cobertura, paso inmediato al siguiente ante un error, timeout que
+cuenta como fallo y abre el circuito, y la prueba del circuito semiabierto.
+"""
+
+import time
+
+import pytest
+
+from services.ai_providers import Circuito, Proveedor, ProveedoresIA, ProveedorSimulado
+
+
+class ProveedorSordo(Proveedor):
+    """Responde tarde e ignora la cancelación (como una SDK en plena llamada HTTP)."""
+
+    def __init__(self, nombre: str, latencia: float, timeout: float):
+        super().__init__(timeout)
+        self.nombre = nombre
+        self.latencia = latencia
+        self.terminadas = 0
+
+    def generar(self, prompt, cancelado):
+        time.sleep(self.latencia)
+        self.terminadas += 1
+        return f"DESCRIPCIÓN: respuesta tardía de {self.nombre}"
+
+
+@pytest.fixture(autouse=True)
+def circuitos_limpios():
+    ProveedoresIA.reiniciar()
+    yield
+    ProveedoresIA.reiniciar()
+
+
+def _latencias(nombre: str) -> dict:
+    """{resultado: cantidad} registrados para el proveedor."""
+    datos = ProveedoresIA.estadisticas().get(nombre, {'latencias': {}})
+    return {resultado: h['n'] for resultado, h in datos['latencias'].items()}
+
+
+def _esperar(condicion, segundos: float = 3.0):
+    limite = time.monotonic() + segundos
+    while not condicion():
+        assert time.monotonic() < limite, 'la condición no se cumplió a tiempo'
+        time.sleep(0.02)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# COBERTURA Y RESPALDO
+# ─────────────────────────────────────────────────────────────────────────────
+def test_cobertura_tras_la_espera():
+    lento = ProveedorSimulado('lento', latencia=2.0)
+    rapido = ProveedorSimulado('rapido', latencia=0.05)
+
+    resultado = ProveedoresIA.generar('prompt', [lento, rapido], espera_cobertura=0.2)
+
+    assert resultado['success'] and resultado['provider'] == 'rapido'
+    # Salió tras la espera de cobertura, sin esperar los 2 s del primero
+    assert 200 <= resultado['latencia_ms'] < 1500
+    assert (lento.llamadas, rapido.llamadas) == (1, 1)
+    # El primero se cancela: su resultado se descarta y no abre su circuito
+    _esperar(lambda: _latencias('lento') == {'descartado': 1})
+    assert _latencias('rapido') == {'ok': 1}
+    assert ProveedoresIA.circuito('lento').estado == 'cerrado'
+
+
+def test_sin_cobertura_si_el_primero_responde_antes():
+    rapido = ProveedorSimulado('rapido', latencia=0.02)
+    respaldo = ProveedorSimulado('respaldo', latencia=0.02)
+
+    resultado = ProveedoresIA.generar('prompt', [rapido, respaldo], espera_cobertura=1.0)
+
+    assert resultado['provider'] == 'rapido'
+    assert respaldo.llamadas == 0
+
+
+def test_error_lanza_el_siguiente_sin_esperar():
+    roto = ProveedorSimulado('roto', latencia=0.05, tasa_error=1.0)
+    respaldo = ProveedorSimulado('respaldo', latencia=0.05)
+
+    resultado = ProveedoresIA.generar('prompt', [roto, respaldo], espera_cobertura=5.0)
+
+    assert resultado['success'] and resultado['provider'] == 'respaldo'
+    assert resultado['latencia_ms'] < 1000
+    assert _latencias('roto') == {'error': 1}
+    assert ProveedoresIA.circuito('roto').fallos == 1
+
+
+def test_proveedor_sin_generar_falla_al_crearse():
+    class ProveedorIncompleto(Proveedor):
+        nombre = 'incompleto'
+
+    with pytest.raises(TypeError):
+        ProveedorIncompleto()
+
+
+def test_todos_fallan():
+    resultado = ProveedoresIA.generar(
+        'prompt', [ProveedorSimulado('a', latencia=0.01, tasa_error=1.0),
+                   ProveedorSimulado('b', latencia=0.01, tasa_error=1.0)])
+    assert not resultado['success'] and resultado['provider'] == 'none'
+    assert 'a: ' in resultado['error'] and 'b: ' in resultado['error']
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# TIMEOUTS Y CIRCUITO
+# ─────────────────────────────────────────────────────────────────────────────
+def test_timeout_cuenta_como_fallo_y_abre_el_circuito(monkeypatch):
+    monkeypatch.setattr(Circuito, 'FALLOS_APERTURA', 2)
+    colgado = ProveedorSordo('colgado', latencia=0.4, timeout=0.1)
+
+    for _ in range(2):
+        resultado = ProveedoresIA.generar('prompt', [colgado], espera_cobertura=5.0)
+        assert not resultado['success']
+        assert 'sin respuesta en 0.1s' in resultado['error']
+
+    # La respuesta tardía llega, pero el timeout ya se contó: no se registra
+    # otra vez ni deshace los fallos del circuito
+    _esperar(lambda: colgado.terminadas == 2)
+    time.sleep(0.05)
+    assert _latencias('colgado') == {'timeout': 2}
+    circuito = ProveedoresIA.circuito('colgado')
+    assert (circuito.estado, circuito.fallos) == ('abierto', 2)
+
+    # Circuito abierto: ni se intenta
+    resultado = ProveedoresIA.generar('prompt', [colgado], espera_cobertura=5.0)
+    assert 'circuito abierto' in resultado['error']
+    assert colgado.terminadas == 2
+
+
+def test_circuito_abierto_pasa_al_siguiente(monkeypatch):
+    monkeypatch.setattr(Circuito, 'FALLOS_APERTURA', 1)
+    roto = ProveedorSimulado('roto', latencia=0.01, tasa_error=1.0)
+    respaldo = ProveedorSimulado('respaldo', latencia=0.01)
+    ProveedoresIA.generar('prompt', [roto, respaldo])
+    assert ProveedoresIA.circuito('roto').estado == 'abierto'
+
+    resultado = ProveedoresIA.generar('prompt', [roto, respaldo], espera_cobertura=5.0)
+    assert resultado['provider'] == 'respaldo'
+    assert roto.llamadas == 1
+
+
+def test_semiabierto_una_sola_prueba(monkeypatch):
+    monkeypatch.setattr(Circuito, 'FALLOS_APERTURA', 1)
+    monkeypatch.setattr(Circuito, 'ENFRIAMIENTO_SEGUNDOS', 0.1)
+    circuito = Circuito()
+    circuito.fallo()
+    assert not circuito.permite()
+
+    time.sleep(0.15)
+    assert circuito.permite()
+    assert circuito.estado == 'semiabierto'
+    assert not circuito.permite()   # solo una solicitud de prueba a la vez
+
+    circuito.fallo()                # la prueba falla: vuelve a abrirse
+    assert circuito.estado == 'abierto' and not circuito.permite()
+
+
+def test_semiabierto_se_cierra_con_una_prueba_exitosa(monkeypatch):
+    monkeypatch.setattr(Circuito, 'FALLOS_APERTURA', 1)
+    monkeypatch.setattr(Circuito, 'ENFRIAMIENTO_SEGUNDOS', 0.1)
+    inestable = ProveedorSimulado('inestable', latencia=0.01, tasa_error=1.0)
+
+    assert not ProveedoresIA.generar('prompt', [inestable])['success']
+    assert ProveedoresIA.circuito('inestable').estado == 'abierto'
+
+    time.sleep(0.15)
+    inestable.tasa_error = 0.0
+    resultado = ProveedoresIA.generar('prompt', [inestable])
+    assert resultado['success'] and resultado['provider'] == 'inestable'
+    circuito = ProveedoresIA.circuito('inestable')
+    assert (circuito.estado, circuito.fallos) == ('cerrado', 0)
@@ -0,0 +1,79 @@
+# tests/test_cliente_manager.py
+"""
+Alta de clientes sin duplicados entre procesos: guardar_o_actualizar busca
+el nombre normalizado en la BD (no en el índice en memoria, que puede estar
+atrasado) y el índice único de nombre_norm frena el alta simultánea.
+"""
+
+import sqlite3
+
+import pytest
+
+from database import cliente_manager
+from database.cliente_index import ClienteIndex
+from database.cliente_manager import guardar_o_actualizar, normalizar
+from database.migrations.backfill_clientes_norm import migrate as backfill_norm
+
+
+def _insertar_desde_otro_proceso(bd, nombre: str) -> int:
+    """INSERT directo, como lo haría otro worker con su propio índice."""
+    conn = bd.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO clientes (nombre, nombre_norm) VALUES (?, ?)",
+                   (nombre, normalizar(nombre)))
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+
+def _filas(bd) -> list:
+    conn = bd.get_connection()
+    filas = conn.execute("SELECT id, nombre, telefono FROM clientes ORDER BY id").fetchall()
+    conn.close()
+    return [tuple(f) for f in filas]
+
+
+@pytest.fixture
+def bd(bd_temporal):
+    ClienteIndex.invalidar()
+    backfill_norm()
+    yield bd_temporal
+    ClienteIndex.invalidar()
+
+
+def test_cliente_de_otro_proceso_no_se_duplica(bd):
+    # Índice de este proceso cargado (vacío) antes del alta del otro worker
+    assert ClienteIndex.asegurar_cargado()
+    jose = _insertar_desde_otro_proceso(bd, 'José Pérez')
+
+    resultado = guardar_o_actualizar({'nombre': 'JOSE PEREZ', 'telefono': '0414-5551234'})
+
+    assert (resultado['accion'], resultado['cliente_id']) == ('actualizado', jose)
+    assert _filas(bd) == [(jose, 'José Pérez', '0414-5551234')]
+    # Y queda registrado en el índice en memoria
+    assert ClienteIndex.buscar_por_numero(telefono='04145551234') == [jose]
+
+
+def test_indice_unico_de_nombre_norm(bd):
+    _insertar_desde_otro_proceso(bd, 'Ana Ruiz')
+    with pytest.raises(sqlite3.IntegrityError):
+        _insertar_desde_otro_proceso(bd, 'ANA RUÍZ')
+
+
+def test_alta_simultanea_actualiza_el_existente(bd, monkeypatch):
+    # El otro worker inserta entre la búsqueda y el INSERT de este proceso
+    buscar = cliente_manager._buscar_por_nombre_norm
+    ganador = []
+
+    def buscar_con_carrera(cursor, nombre_norm):
+        if not ganador:
+            ganador.append(_insertar_desde_otro_proceso(bd, 'Luis Gómez'))
+            return None
+        return buscar(cursor, nombre_norm)
+
+    monkeypatch.setattr(cliente_manager, '_buscar_por_nombre_norm', buscar_con_carrera)
+
+    resultado = guardar_o_actualizar({'nombre': 'Luis Gomez', 'telefono': '0412-7654321'})
+
+    assert (resultado['accion'], resultado['cliente_id']) == ('actualizado', ganador[0])
+    assert _filas(bd) == [(ganador[0], 'Luis Gómez', '0412-7654321')]
@@ -0,0 +1,222 @@
+# tests/test_document_storage.py
+"""
+Almacenamiento durable de documentos: publicar una entrada de DocumentCache,
+su manifiesto, la lectura en streaming (DocumentStore.abrir) y la descarga
+al caché local de un contenedor nuevo (DocumentStore.paginas).
+
+Cada prueba corre contra el backend en disco, contra S3Storage con un
+cliente S3 en memoria y, si moto está instalado, contra boto3 real con S3
+simulado en el proceso (mock_aws).
+"""
+
+import io
+import json
+
+import pytest
+
+from services.document_generation.document_cache import DocumentCache
+from services.document_generation.document_storage import (
+    DocumentStore, FileSystemStorage, S3Storage,
+)
+
+BUCKET = 'logipartve-docs'
+
+PAGINAS = [b'\x89PNG pagina uno' * 100, b'\x89PNG pagina dos' * 250]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CLIENTE S3 EN MEMORIA
+# ─────────────────────────────────────────────────────────────────────────────
+class ClienteS3Falso:
+    """Subconjunto de la API de boto3 que usa S3Storage, sobre un dict."""
+
+    def __init__(self):
+        from botocore.exceptions import ClientError
+        self._error = ClientError
+        self.objetos = {}
+        self.subidas_por_partes = 0
+
+    def _no_existe(self, codigo, operacion):
+        return self._error({'Error': {'Code': codigo, 'Message': 'Not Found'}}, operacion)
+
+    def put_object(self, Bucket, Key, Body):
+        self.objetos[(Bucket, Key)] = bytes(Body)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key):
+        # Como boto3: lee el archivo por bloques, sin cargarlo de una vez
+        partes = []
+        while True:
+            bloque = Fileobj.read(8 * 1024)
+            if not bloque:
+                break
+            partes.append(bloque)
+        self.objetos[(Bucket, Key)] = b''.join(partes)
+        self.subidas_por_partes += 1
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objetos:
+            raise self._no_existe('NoSuchKey', 'GetObject')
+        return {'Body': io.BytesIO(self.objetos[(Bucket, Key)])}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objetos:
+            raise self._no_existe('404', 'HeadObject')
+        return {'ContentLength': len(self.objetos[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objetos.pop((Bucket, Key), None)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# FIXTURES
+# ─────────────────────────────────────────────────────────────────────────────
+@pytest.fixture
+def cache_local(tmp_path, monkeypatch):
+    """DocumentCache en un directorio vacío (un contenedor recién creado)."""
+    monkeypatch.setattr(DocumentCache, 'DIRECTORIO', str(tmp_path / 'cache'))
+    monkeypatch.setattr(DocumentCache, '_total_bytes', None)
+    return tmp_path
+
+
+@pytest.fixture(params=['filesystem', 's3-falso', 's3-moto'])
+def backend(request, tmp_path, monkeypatch):
+    """Backend durable configurado en DocumentStore durante la prueba."""
+    if request.param == 'filesystem':
+        almacen = FileSystemStorage(str(tmp_path / 'durable'))
+    elif request.param == 's3-falso':
+        pytest.importorskip('botocore')
+        almacen = S3Storage(BUCKET, prefijo='pruebas', cliente=ClienteS3Falso())
+    else:
+        moto = pytest.importorskip('moto')
+        boto3 = pytest.importorskip('boto3')
+        for variable in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+            monkeypatch.setenv(variable, 'pruebas')
+        simulacion = moto.mock_aws()
+        simulacion.start()
+        request.addfinalizer(simulacion.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        almacen = S3Storage(BUCKET, region='us-east-1', prefijo='pruebas')
+    monkeypatch.setattr(DocumentStore, '_backend', None)
+    DocumentStore.configurar(almacen)
+    return almacen
+
+
+@pytest.fixture
+def publicado(cache_local, backend):
+    """Documento de dos páginas generado en el caché local y publicado."""
+    manifiesto = DocumentCache.guardar('abc123-png-png', PAGINAS, 'png', tipo='imagen',
+                                       rendicion='png', modo='bcv', quote_number='2026-30417')
+    return DocumentStore.publicar(manifiesto), manifiesto
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# PUBLICAR
+# ─────────────────────────────────────────────────────────────────────────────
+def test_publicar_sube_paginas_y_manifiesto(publicado, backend):
+    referencia, manifiesto = publicado
+    assert referencia == DocumentStore.referencia('2026-30417', 'abc123-png-png')
+    assert DocumentStore.publicado(referencia)
+
+    prefijo = 'cotizaciones/2026-30417/abc123-png-png'
+    publico = json.loads(backend.leer(f'{prefijo}/manifest.json'))
+    assert publico['paginas'] == ['p1.png', 'p2.png']
+    assert publico['clave'] == manifiesto['clave']
+    assert publico['tipo'] == 'imagen'
+    assert 'rutas' not in publico and 'desde_cache' not in publico
+    assert [backend.leer(f'{prefijo}/{p}') for p in publico['paginas']] == PAGINAS
+
+
+def test_publicar_no_repite_la_subida(publicado, backend, monkeypatch):
+    referencia, manifiesto = publicado
+    escrituras = []
+    monkeypatch.setattr(backend, 'escribir', lambda clave, contenido: escrituras.append(clave))
+    assert DocumentStore.publicar(manifiesto) == referencia
+    assert escrituras == []
+
+
+def test_referencia_no_publicada(cache_local, backend):
+    referencia = DocumentStore.referencia('2026-99999', 'no-existe')
+    assert not DocumentStore.publicado(referencia)
+    assert DocumentStore.paginas(referencia) == []
+
+
+def test_s3_sube_archivos_por_partes(publicado, backend):
+    if not isinstance(getattr(backend, 'cliente', None), ClienteS3Falso):
+        pytest.skip('solo el cliente en memoria cuenta las subidas')
+    # Las páginas se suben desde archivo (upload_fileobj); el manifiesto, en bytes
+    assert backend.cliente.subidas_por_partes == len(PAGINAS)
+    assert all(clave.startswith('pruebas/') for _, clave in backend.cliente.objetos)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LECTURA
+# ─────────────────────────────────────────────────────────────────────────────
+def test_abrir_en_streaming(publicado):
+    referencia, _ = publicado
+    for numero, esperado in enumerate(PAGINAS, 1):
+        stream = DocumentStore.abrir(referencia, pagina=numero)
+        try:
+            leido = b''.join(iter(lambda: stream.read(1000), b''))
+        finally:
+            stream.close()
+        assert leido == esperado
+
+
+def test_abrir_clave_inexistente(backend):
+    with pytest.raises(FileNotFoundError):
+        backend.abrir('cotizaciones/2026-99999/no-existe/manifest.json')
+    assert not backend.existe('cotizaciones/2026-99999/no-existe/manifest.json')
+
+
+def test_paginas_descarga_al_cache_de_un_contenedor_nuevo(publicado, tmp_path, monkeypatch):
+    referencia, _ = publicado
+    # Contenedor nuevo: el caché local está vacío
+    monkeypatch.setattr(DocumentCache, 'DIRECTORIO', str(tmp_path / 'cache_nuevo'))
+    monkeypatch.setattr(DocumentCache, '_total_bytes', None)
+    assert DocumentCache.obtener('abc123-png-png') is None
+
+    rutas = DocumentStore.paginas(referencia)
+    assert len(rutas) == len(PAGINAS)
+    for ruta, esperado in zip(rutas, PAGINAS):
+        assert ruta.startswith(str(tmp_path / 'cache_nuevo'))
+        with open(ruta, 'rb') as f:
+            assert f.read() == esperado
+
+    local = DocumentCache.obtener('abc123-png-png')
+    assert local['rutas'] == rutas
+    assert (local['tipo'], local['rendicion'], local['quote_number']) == ('imagen', 'png', '2026-30417')
+
+
+def test_paginas_sirve_del_cache_sin_tocar_el_backend(publicado, backend, monkeypatch):
+    referencia, manifiesto = publicado
+
+    def sin_backend(*args, **kwargs):
+        raise AssertionError('no debía consultarse el backend')
+
+    monkeypatch.setattr(backend, 'abrir', sin_backend)
+    assert DocumentStore.paginas(referencia) == manifiesto['rutas']
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CONFIGURACIÓN
+# ─────────────────────────────────────────────────────────────────────────────
+def test_backend_s3_desde_el_entorno(monkeypatch):
+    pytest.importorskip('boto3')
+    monkeypatch.setenv('DOCUMENT_STORAGE', 's3')
+    monkeypatch.setenv('DOCUMENT_S3_BUCKET', BUCKET)
+    monkeypatch.setenv('DOCUMENT_S3_ENDPOINT_URL', 'http://127.0.0.1:9000')
+    monkeypatch.setenv('DOCUMENT_S3_REGION', 'us-east-1')
+    monkeypatch.setenv('DOCUMENT_S3_PREFIX', '/logipartve/')
+    monkeypatch.setattr(DocumentStore, '_backend', None)
+
+    almacen = DocumentStore.backend()
+    assert isinstance(almacen, S3Storage)
+    assert almacen.bucket == BUCKET and almacen.prefijo == 'logipartve'
+    assert almacen.cliente.meta.endpoint_url == 'http://127.0.0.1:9000'
+    assert DocumentStore.backend() is almacen
+
+
+def test_filesystem_rechaza_claves_fuera_de_la_raiz(tmp_path):
+    almacen = FileSystemStorage(str(tmp_path / 'durable'))
+    with pytest.raises(ValueError):
+        almacen.escribir('../fuera.txt', b'x')
@@ -0,0 +1,165 @@
+# tests/test_png_generator.py
+"""
+Paridad de las páginas PNG con el PDF de la cotización.
+
+render_pages() debe producir una imagen por cada página de
+generar_pdf_bytes() y, a self.dpi, exactamente los px que corresponden al
+tamaño de la página en puntos (pt * dpi / 72), tanto por PDFium como por
+el respaldo pdf2image/poppler. El contenido se compara con el PDF
+rasterizado por un motor independiente (PyMuPDF) al mismo dpi: una página
+en blanco o con el contenido desplazado no pasa.
+"""
+
+import io
+import shutil
+import sys
+import types
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from conftest import cargar_fixture
+from services.document_generation import png_generator
+from services.document_generation.pdf_generator import ITEMS_POR_PAGINA, generar_pdf_bytes
+from services.document_generation.png_generator import PNGQuoteGenerator
+
+pdfium = pytest.importorskip('pypdfium2')
+
+# Diferencia media por píxel (escala de grises 0-255) aceptada frente al PDF
+# rasterizado por PyMuPDF: cubre el antialiasing distinto de cada motor
+# (~1.5-2.2); una página en blanco o desplazada 3 pt ronda 15-20
+TOLERANCIA_DIFERENCIA = 4.0
+
+
+@pytest.fixture(scope='module')
+def cotizacion():
+    return cargar_fixture('cotizacion_documento.json')
+
+
+@pytest.fixture(scope='module')
+def paginas_pdf(cotizacion):
+    """Tamaño (ancho, alto) en puntos de cada página del PDF."""
+    documento = pdfium.PdfDocument(generar_pdf_bytes(cotizacion))
+    try:
+        return [documento[i].get_size() for i in range(len(documento))]
+    finally:
+        documento.close()
+
+
+def _px_esperados(paginas, dpi):
+    return [(round(ancho * dpi / 72), round(alto * dpi / 72)) for ancho, alto in paginas]
+
+
+def _tamanos(pngs):
+    tamanos = []
+    for contenido in pngs:
+        imagen = Image.open(io.BytesIO(contenido))
+        assert imagen.format == 'PNG'
+        tamanos.append(imagen.size)
+    return tamanos
+
+
+def _gris(contenido: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(contenido)).convert('L')
+
+
+def _diferencia_media(a: Image.Image, b: Image.Image) -> float:
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0]
+
+
+def _referencias_pymupdf(pdf: bytes, dpi: int) -> list:
+    """Cada página del PDF rasterizada por PyMuPDF, en escala de grises."""
+    pymupdf = pytest.importorskip('pymupdf')
+    documento = pymupdf.open(stream=pdf, filetype='pdf')
+    try:
+        return [_gris(pagina.get_pixmap(dpi=dpi).tobytes('png')) for pagina in documento]
+    finally:
+        documento.close()
+
+
+def test_fixture_ocupa_varias_paginas(cotizacion, paginas_pdf):
+    esperadas = -(-len(cotizacion['items']) // ITEMS_POR_PAGINA)
+    assert esperadas > 1
+    assert len(paginas_pdf) == esperadas
+
+
+@pytest.mark.parametrize('dpi', [72, 150, 300])
+def test_paginas_y_px_igual_que_el_pdf(cotizacion, paginas_pdf, dpi):
+    pngs = PNGQuoteGenerator(dpi=dpi).render_pages(cotizacion)
+    assert _tamanos(pngs) == _px_esperados(paginas_pdf, dpi)
+
+
+@pytest.mark.parametrize('dpi', [72, 150])
+def test_contenido_igual_que_el_pdf_rasterizado(cotizacion, dpi):
+    referencias = _referencias_pymupdf(generar_pdf_bytes(cotizacion), dpi)
+    pngs = PNGQuoteGenerator(dpi=dpi).render_pages(cotizacion)
+    assert len(pngs) == len(referencias)
+    for numero, (contenido, referencia) in enumerate(zip(pngs, referencias), 1):
+        pagina = _gris(contenido)
+        assert pagina.size == referencia.size
+        diferencia = _diferencia_media(pagina, referencia)
+        assert diferencia < TOLERANCIA_DIFERENCIA, f'página {numero}: {diferencia:.2f}'
+
+
+def test_comparacion_detecta_pagina_en_blanco_o_desplazada(cotizacion):
+    """La tolerancia no es tan amplia como para aceptar una página vacía o corrida."""
+    referencia = _referencias_pymupdf(generar_pdf_bytes(cotizacion), 150)[0]
+    pagina = _gris(PNGQuoteGenerator(dpi=150).render_pages(cotizacion)[0])
+
+    en_blanco = Image.new('L', pagina.size, 255)
+    desplazada = ImageChops.offset(pagina, 0, 6)       # 3 pt hacia abajo a 150 dpi
+    desplazada.paste(255, (0, 0, pagina.width, 6))
+    assert _diferencia_media(en_blanco, referencia) > TOLERANCIA_DIFERENCIA
+    assert _diferencia_media(desplazada, referencia) > TOLERANCIA_DIFERENCIA
+
+
+def test_modo_divisas_misma_paginacion(cotizacion):
+    pdf = generar_pdf_bytes(cotizacion, modo_divisas=True)
+    documento = pdfium.PdfDocument(pdf)
+    try:
+        paginas = [documento[i].get_size() for i in range(len(documento))]
+    finally:
+        documento.close()
+    pngs = PNGQuoteGenerator(dpi=150).render_pages(cotizacion, modo_divisas=True)
+    assert _tamanos(pngs) == _px_esperados(paginas, 150)
+
+
+def test_rendiciones_reducidas_respetan_lado_max(cotizacion, paginas_pdf):
+    rendiciones = PNGQuoteGenerator(dpi=300).render_renditions(cotizacion)
+    for nombre, contenidos in rendiciones.items():
+        assert len(contenidos) == len(paginas_pdf)
+        lado_max = png_generator.RENDICIONES[nombre]['lado_max']
+        for contenido in contenidos:
+            assert max(Image.open(io.BytesIO(contenido)).size) <= lado_max
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# RESPALDO pdf2image (sin pypdfium2)
+# ─────────────────────────────────────────────────────────────────────────────
+def test_respaldo_pdf2image_recibe_dpi(cotizacion, paginas_pdf, monkeypatch):
+    """Sin PDFium se llama a pdf2image con los bytes del PDF y self.dpi."""
+    llamadas = []
+
+    def convert_from_bytes(pdf, dpi, fmt):
+        # Imita a poppler: una imagen por página a pt * dpi / 72
+        llamadas.append({'es_pdf': pdf.startswith(b'%PDF'), 'dpi': dpi, 'fmt': fmt})
+        return [Image.new('RGB', tamano, 'white') for tamano in _px_esperados(paginas_pdf, dpi)]
+
+    falso = types.ModuleType('pdf2image')
+    falso.convert_from_bytes = convert_from_bytes
+    falso.convert_from_path = None
+    monkeypatch.setitem(sys.modules, 'pdf2image', falso)
+    monkeypatch.setattr(png_generator, '_pdfium', None)
+
+    pngs = PNGQuoteGenerator(dpi=150).render_pages(cotizacion)
+
+    assert llamadas == [{'es_pdf': True, 'dpi': 150, 'fmt': 'png'}]
+    assert _tamanos(pngs) == _px_esperados(paginas_pdf, 150)
+
+
+@pytest.mark.skipif(shutil.which('pdftoppm') is None, reason='poppler no instalado')
+def test_respaldo_poppler_real(cotizacion, paginas_pdf, monkeypatch):
+    pytest.importorskip('pdf2image')
+    monkeypatch.setattr(png_generator, '_pdfium', None)
+    pngs = PNGQuoteGenerator(dpi=150).render_pages(cotizacion)
+    assert _tamanos(pngs) == _px_esperados(paginas_pdf, 150)
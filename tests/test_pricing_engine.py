@@ -0,0 +1,295 @@
+# tests/test_pricing_engine.py
+# Golden files del motor de precios (services/pricing/engine.py), al centavo exacto
+"""
+tests/fixtures/cotizaciones.json guarda cotizaciones con la forma de las
+reales (vehículos, repuestos, cantidades, orígenes y opciones de
+configuración de uso habitual, sin datos de clientes), con sus entradas
+(lo que el analista carga en el formulario y la configuración vigente) y
+los resultados esperados en centavos enteros: por ítem (calcular_items),
+por cotización (totales_cotizacion) y por fila guardada (aportes_guardados).
+Para sumar una cotización real al golden basta agregar sus entradas y
+calcular los esperados con referencia_item / referencia_totales.
+
+Los esperados se verifican contra el motor y, además, contra una
+implementación de referencia en Decimal de la misma cadena de 9 pasos: si
+alguien regenera el golden con un motor equivocado, la referencia lo
+detecta.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pytest
+
+from conftest import cargar_fixture
+from services.pricing import engine
+from services.pricing.engine import (
+    aportes_guardados, calcular_item, calcular_items, totales_cotizacion
+)
+
+COTIZACIONES = cargar_fixture('cotizaciones.json')
+
+# Resultados por ítem fijados en el golden (centavos)
+CAMPOS_ITEM = (
+    'fob_total', 'costo_impuesto', 'utilidad_valor', 'base_tax', 'costo_tax',
+    'precio_usd_sin_redondeo', 'diferencial_valor', 'iva_valor', 'precio_bs',
+    'precio_usd', 'redondeo_valor',
+)
+
+
+def _ids(cotizaciones):
+    return [c['nombre'] for c in cotizaciones]
+
+
+def _c(dolares) -> int:
+    """Dólares (float del motor) → centavos enteros, sin ambigüedad."""
+    return int(round(float(dolares) * 100))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# REFERENCIA EN DECIMAL
+# ─────────────────────────────────────────────────────────────────────────────
+def _redondear(centavos: Decimal) -> int:
+    return int(centavos.quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def _d(valor) -> Decimal:
+    return Decimal(str(valor))
+
+
+def _techo5(centavos: int) -> int:
+    return -(-centavos // 500) * 500
+
+
+def referencia_item(item: dict, config: dict) -> dict:
+    """Cadena de 9 pasos en Decimal, en centavos."""
+    fob = _redondear(_d(item['costo_fob']) * item['cantidad'] * 100)
+    handling = _redondear(_d(item['costo_handling']) * 100)
+    manejo = _redondear(_d(item['costo_manejo']) * 100)
+    envio = _redondear(_d(item['costo_envio']) * 100)
+    impuesto = _redondear(fob * _d(item['impuesto_porcentaje']) / 100)
+    factor = _d(item['factor_utilidad'])
+    utilidad = _redondear(fob * factor) - fob if factor > 0 else 0
+    base_tax = fob + handling + manejo + impuesto + utilidad + envio
+    tax = _redondear(base_tax * _d(config['tax_porcentaje']) / 100)
+    precio_usd = base_tax + tax
+    diferencial = _redondear(precio_usd * _d(config['diferencial_porcentaje']) / 100)
+    bs_sin_iva = precio_usd + diferencial
+    iva = _redondear(bs_sin_iva * _d(config['iva_porcentaje']) / 100) if config['aplicar_iva'] else 0
+    redondeado = _techo5(precio_usd)
+    return {
+        'fob_total': fob, 'costo_impuesto': impuesto,
+        'utilidad_valor': utilidad + redondeado - precio_usd, 'base_tax': base_tax,
+        'costo_tax': tax, 'precio_usd_sin_redondeo': precio_usd,
+        'diferencial_valor': diferencial, 'iva_valor': iva, 'precio_bs': bs_sin_iva + iva,
+        'precio_usd': redondeado, 'redondeo_valor': redondeado - precio_usd,
+    }
+
+
+def referencia_totales(items: list, config: dict) -> dict:
+    """Totales de la cotización en Decimal, en centavos, desde los ítems de referencia."""
+    sumas = dict.fromkeys(('bs', 'iva', 'abona', 'divisas', 'abono', 'usd', 'bs_total'), 0)
+    for entrada, r in items:
+        handling = _redondear(_d(entrada['costo_handling']) * 100)
+        manejo = _redondear(_d(entrada['costo_manejo']) * 100)
+        envio = _redondear(_d(entrada['costo_envio']) * 100)
+        abono = r['fob_total'] + handling + manejo + r['costo_impuesto'] + r['utilidad_valor']
+        sumas['bs'] += r['precio_bs'] - r['iva_valor']
+        sumas['iva'] += r['iva_valor']
+        sumas['abona'] += _redondear(
+            (abono + r['costo_tax']) * (100 + _d(config['diferencial_porcentaje'])) / 100)
+        sumas['divisas'] += abono + envio + r['costo_tax']
+        sumas['abono'] += abono
+        sumas['usd'] += r['precio_usd']
+        sumas['bs_total'] += r['precio_bs']
+    divisas = _techo5(sumas['divisas']) if sumas['divisas'] > 0 else 0
+    abono = _techo5(sumas['abono'])
+    entrega = divisas - abono
+    if entrega < 0:
+        abono, entrega = divisas, 0
+    total = sumas['bs'] + sumas['iva']
+    return {
+        'sub_total': sumas['bs'], 'iva_total': sumas['iva'], 'total_a_pagar': total,
+        'abona_ya': sumas['abona'], 'y_en_entrega': total - sumas['abona'],
+        'total_usd': sumas['usd'], 'total_bs': sumas['bs_total'],
+        'total_usd_divisas': divisas, 'usd_abono': abono, 'usd_entrega': entrega,
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ARMADO DE ENTRADAS
+# ─────────────────────────────────────────────────────────────────────────────
+def _columnas(cotizacion: dict) -> dict:
+    """Columnas de calcular_items para una cotización del golden."""
+    config, items = cotizacion['config'], cotizacion['items']
+    columnas = {clave: [item[clave] for item in items] for clave in (
+        'cantidad', 'costo_fob', 'costo_handling', 'costo_manejo', 'costo_envio',
+        'impuesto_porcentaje', 'factor_utilidad')}
+    for clave in ('tax_porcentaje', 'diferencial_porcentaje', 'aplicar_iva', 'iva_porcentaje'):
+        columnas[clave] = [config[clave]] * len(items)
+    return columnas
+
+
+def _items_sesion(cotizacion: dict) -> list:
+    """Ítems como los deja analyst_panel en la sesión, con los montos del golden."""
+    config = cotizacion['config']
+    items = []
+    for entrada, esperado in zip(cotizacion['items'], cotizacion['esperado']['items']):
+        items.append({
+            'fob_total': esperado['fob_total'] / 100,
+            'costo_handling': entrada['costo_handling'],
+            'costo_manejo': entrada['costo_manejo'],
+            'costo_impuesto': esperado['costo_impuesto'] / 100,
+            'utilidad_valor': esperado['utilidad_valor'] / 100,
+            'costo_envio': entrada['costo_envio'],
+            'costo_tax': esperado['costo_tax'] / 100,
+            'precio_usd': esperado['precio_usd'] / 100,
+            'precio_bs': esperado['precio_bs'] / 100,
+            'costo_total': esperado['precio_usd'] / 100,
+            'costo_total_bs': esperado['precio_bs'] / 100,
+            'aplicar_iva': config['aplicar_iva'],
+            'iva_valor': esperado['iva_valor'] / 100,
+            'iva_porcentaje': config['iva_porcentaje'],
+            'diferencial_porcentaje': config['diferencial_porcentaje'],
+        })
+    return items
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# GOLDEN
+# ─────────────────────────────────────────────────────────────────────────────
+@pytest.mark.parametrize('cotizacion', COTIZACIONES, ids=_ids(COTIZACIONES))
+def test_golden_coincide_con_referencia(cotizacion):
+    """El golden es la cadena de 9 pasos exacta (no una foto del motor)."""
+    config = cotizacion['config']
+    referencia = [referencia_item(item, config) for item in cotizacion['items']]
+    for r, esperado in zip(referencia, cotizacion['esperado']['items']):
+        assert r == {campo: esperado[campo] for campo in CAMPOS_ITEM}
+    assert referencia_totales(list(zip(cotizacion['items'], referencia)), config) \
+        == cotizacion['esperado']['totales']
+
+
+@pytest.mark.parametrize('cotizacion', COTIZACIONES, ids=_ids(COTIZACIONES))
+def test_calcular_items(cotizacion):
+    resultado = calcular_items(_columnas(cotizacion))
+    for i, esperado in enumerate(cotizacion['esperado']['items']):
+        obtenido = {campo: _c(resultado[campo][i]) for campo in CAMPOS_ITEM}
+        assert obtenido == {campo: esperado[campo] for campo in CAMPOS_ITEM}, \
+            cotizacion['items'][i]['descripcion']
+
+
+@pytest.mark.parametrize('cotizacion', COTIZACIONES, ids=_ids(COTIZACIONES))
+def test_calcular_item_igual_a_vectorizado(cotizacion):
+    """El formulario (un ítem) y los recálculos masivos dan lo mismo."""
+    columnas = _columnas(cotizacion)
+    vectorizado = calcular_items(columnas)
+    for i in range(len(cotizacion['items'])):
+        uno = calcular_item(**{clave: valores[i] for clave, valores in columnas.items()})
+        for campo in CAMPOS_ITEM:
+            assert _c(uno[campo]) == _c(vectorizado[campo][i])
+
+
+@pytest.mark.parametrize('cotizacion', COTIZACIONES, ids=_ids(COTIZACIONES))
+def test_totales_cotizacion(cotizacion):
+    totales = totales_cotizacion(_items_sesion(cotizacion))
+    assert {campo: _c(valor) for campo, valor in totales.items()} \
+        == cotizacion['esperado']['totales']
+
+
+@pytest.mark.parametrize('cotizacion', COTIZACIONES, ids=_ids(COTIZACIONES))
+def test_aportes_guardados(cotizacion):
+    """Aportes desde las columnas de quote_items (conciliación y recálculo)."""
+    items = _items_sesion(cotizacion)
+    columnas = {clave: [item[clave] for item in items] for clave in (
+        'precio_usd', 'precio_bs', 'iva_valor', 'iva_porcentaje', 'aplicar_iva',
+        'costo_envio', 'diferencial_porcentaje')}
+    aportes = aportes_guardados(columnas)
+    esperado = cotizacion['esperado']['aportes_guardados']
+    assert {clave: [int(v) for v in aportes[clave]] for clave in esperado} == esperado
+    # Los totales de cabecera que concilia reconciliation.py
+    totales = cotizacion['esperado']['totales']
+    assert int(aportes['bs_sin_iva'].sum()) == totales['sub_total']
+    assert int(aportes['iva'].sum()) == totales['iva_total']
+    assert int(aportes['total_usd'].sum()) == totales['total_usd']
+    assert int(aportes['abona'].sum()) == totales['abona_ya']
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# BORDES DEL MÚLTIPLO DE 5 Y DEL CENTAVO
+# ─────────────────────────────────────────────────────────────────────────────
+def _item(**cambios) -> dict:
+    entrada = dict(cantidad=1, costo_fob=0.0, costo_handling=0.0, costo_manejo=0.0,
+                   costo_envio=0.0, impuesto_porcentaje=0, factor_utilidad=1.0,
+                   tax_porcentaje=0.0, diferencial_porcentaje=45.0, aplicar_iva=False,
+                   iva_porcentaje=16.0)
+    entrada.update(cambios)
+    return calcular_item(**entrada)
+
+
+@pytest.mark.parametrize('dolares, esperado', [
+    (200.0000001, 20000),
+    (200.00000000000003, 20000),
+    (199.99999999999997, 20000),
+    (200.0, 20000),
+    (200.004, 20000),
+    (200.005, 20500),
+    (200.01, 20500),
+    (0.0, 0),
+    (0.01, 500),
+])
+def test_multiplo_5_sobre_centavos(dolares, esperado):
+    """El múltiplo de 5 se aplica al precio ya redondeado al centavo."""
+    assert int(engine._techo_multiplo(engine._centavos(dolares))) == esperado
+
+
+def test_ruido_flotante_no_salta_al_siguiente_multiplo():
+    # En coma flotante 150.21 + 0.52 + 49.27 = 200.00000000000003 (antes → 205)
+    r = _item(costo_fob=150.21, costo_handling=0.52, costo_manejo=49.27)
+    assert _c(r['precio_usd_sin_redondeo']) == 20000
+    assert _c(r['precio_usd']) == 20000
+    assert _c(r['redondeo_valor']) == 0
+
+
+def test_un_centavo_sobre_el_multiplo_sube_a_205():
+    r = _item(costo_fob=150.21, costo_handling=0.53, costo_manejo=49.27)
+    assert _c(r['precio_usd']) == 20500
+    assert _c(r['redondeo_valor']) == 499
+    # El redondeo se suma a la utilidad
+    assert _c(r['utilidad_valor']) == 499
+
+
+def test_medio_centavo_redondea_hacia_arriba():
+    # 10.10 × 25% = 2.525 → 2.53; 1.005 × 100 no cae en 100.4999…
+    r = _item(costo_fob=10.10, impuesto_porcentaje=25)
+    assert _c(r['costo_impuesto']) == 253
+    assert int(engine._centavos(1.005)) == 101
+
+
+def test_factor_cero_sin_utilidad():
+    r = _item(costo_fob=40.0, cantidad=3, factor_utilidad=0)
+    assert _c(r['utilidad_valor']) == _c(r['redondeo_valor'])
+    assert _c(r['fob_total']) == 12000
+
+
+def test_precio_bs_es_usd_mas_diferencial_mas_iva():
+    r = _item(costo_fob=33.33, cantidad=3, costo_envio=12.5, impuesto_porcentaje=30,
+              factor_utilidad=1.4285, tax_porcentaje=7.0, aplicar_iva=True)
+    assert _c(r['precio_bs']) == (_c(r['precio_usd_sin_redondeo'])
+                                  + _c(r['diferencial_valor']) + _c(r['iva_valor']))
+
+
+def test_aportes_guardados_iva_faltante_en_items_antiguos():
+    """aplicar_iva sin iva_valor guardado: IVA sobre precio_usd al % del ítem (16 por defecto)."""
+    aportes = aportes_guardados({
+        'precio_usd': [100.0, 50.0], 'precio_bs': [145.0, 72.5], 'iva_valor': [0, 0],
+        'iva_porcentaje': [12.0, 0], 'aplicar_iva': [True, True],
+        'costo_envio': [10.0, 0], 'diferencial_porcentaje': [45.0, 45.0],
+    })
+    assert list(aportes['iva']) == [1200, 800]
+    assert list(aportes['bs_sin_iva']) == [14500, 7250]
+    assert list(aportes['abona']) == [13050, 7250]
+
+
+def test_cotizacion_vacia():
+    assert set(totales_cotizacion([]).values()) == {0.0}
+    assert calcular_items({c: np.array([]) for c in engine.COLUMNAS_ENTRADA})['precio_usd'].size == 0
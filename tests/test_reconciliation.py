@@ -0,0 +1,99 @@
+# tests/test_reconciliation.py
+"""
+Conciliación de totales sobre una BD SQLite temporal: la corrección
+confirmada por el administrador aplica lo registrado en SU corrida, no lo
+que encontraría un escaneo nuevo.
+"""
+
+from functools import partial
+
+import pytest
+
+from services import reconciliation
+
+
+def _crear_cotizacion(bd, numero: str, precios: list) -> int:
+    conn = bd.get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO quotes (quote_number, analyst_id, client_name, total_amount, sub_total, "
+        "iva_total, abona_ya, en_entrega) VALUES (?, 1, 'Cliente de prueba', 0, 0, 0, 0, 0)",
+        (numero,))
+    quote_id = cursor.lastrowid
+    for precio in precios:
+        cursor.execute(
+            "INSERT INTO quote_items (quote_id, description, quantity, unit_cost, total_cost, "
+            "precio_usd, precio_bs, iva_porcentaje, aplicar_iva, shipping_cost, "
+            "diferencial_porcentaje) VALUES (?, 'Repuesto', 1, ?, ?, ?, ?, 16, 1, 0, 45)",
+            (quote_id, precio, precio, precio, round(precio * 1.45, 2)))
+    conn.commit()
+    conn.close()
+    return quote_id
+
+
+def _cabecera(bd, quote_id: int) -> dict:
+    conn = bd.get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(reconciliation.CAMPOS)} FROM quotes WHERE id = ?", (quote_id,))
+    fila = cursor.fetchone()
+    conn.close()
+    return dict(zip(reconciliation.CAMPOS, fila))
+
+
+def _alterar(bd, quote_id: int, **campos):
+    conn = bd.get_connection()
+    conn.execute(
+        f"UPDATE quotes SET {', '.join(f'{c} = ?' for c in campos)} WHERE id = ?",
+        (*campos.values(), quote_id))
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def historial(bd_temporal):
+    """Tres cotizaciones con ítems y cabeceras ya conciliadas."""
+    ids = [_crear_cotizacion(bd_temporal, f'2026-0000{i}', precios)
+           for i, precios in enumerate(([200.0], [85.0, 62.5], [142.0, 9.8, 34.9]), 1)]
+    assert reconciliation.escanear(corregir=True)['corregidas'] == 3
+    assert reconciliation.escanear()['con_diferencias'] == 0
+    return bd_temporal, ids
+
+
+def test_contar(historial):
+    assert reconciliation.contar() == 3
+
+
+def test_corrige_solo_lo_revisado_en_la_corrida(historial):
+    bd, (a, b, c) = historial
+    correcto_a, correcto_b = _cabecera(bd, a), _cabecera(bd, b)
+    _alterar(bd, a, sub_total=correcto_a['sub_total'] + 10)
+    _alterar(bd, b, total_amount=correcto_b['total_amount'] + 5)
+
+    escaneo = reconciliation.escanear()
+    assert escaneo['con_diferencias'] == 2
+
+    # Después de la revisión: B se edita otra vez y C se descuadra
+    _alterar(bd, b, total_amount=correcto_b['total_amount'] + 7)
+    _alterar(bd, c, iva_total=1.23)
+
+    resultado = reconciliation.corregir_corrida(escaneo['corrida'])
+    assert (resultado['corregidas'], resultado['omitidas'], resultado['error']) == (1, 1, None)
+
+    assert _cabecera(bd, a) == pytest.approx(correcto_a)
+    assert _cabecera(bd, b)['total_amount'] == pytest.approx(correcto_b['total_amount'] + 7)
+    assert _cabecera(bd, c)['iva_total'] == pytest.approx(1.23)
+
+    reporte = reconciliation.reporte(escaneo['corrida'])
+    assert {f['quote_id'] for f in reporte if f['corregido_en']} == {a}
+
+    # Aplicar dos veces la misma corrida no hace nada
+    assert reconciliation.corregir_corrida(escaneo['corrida'])['corregidas'] == 0
+
+
+def test_progreso_por_bloque(historial, monkeypatch):
+    # Bloques de 2 filas: varias llamadas al callback, hasta el total de contar()
+    monkeypatch.setattr(reconciliation, '_bloques', partial(reconciliation._bloques, 2))
+    avances = []
+    reconciliation.escanear(progreso=avances.append)
+    assert avances[-1] == reconciliation.contar()
+    assert len(avances) > 1 and avances == sorted(avances)
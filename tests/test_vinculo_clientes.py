@@ -0,0 +1,73 @@
+# tests/test_vinculo_clientes.py
+"""
+Vínculo de las cotizaciones históricas con el directorio (quotes.cliente_id):
+una cotización sin cliente no queda descartada para siempre, y la migración
+de clientes desde quotes vincula las cotizaciones de los clientes que crea.
+"""
+
+import pytest
+
+from database.migrar_clientes import migrar_clientes_desde_quotes
+from database.migrations.backfill_quotes_cliente_id import migrate as vincular
+
+
+def _cotizacion(bd, numero: str, nombre: str, telefono: str = '', cedula: str = '',
+                direccion: str = '') -> int:
+    conn = bd.get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO quotes (quote_number, analyst_id, client_name, client_phone, "
+        "client_cedula, client_address) VALUES (?, 1, ?, ?, ?, ?)",
+        (numero, nombre, telefono, cedula, direccion))
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+
+def _cliente(bd, nombre: str) -> int:
+    conn = bd.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO clientes (nombre) VALUES (?)", (nombre,))
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+
+def _cliente_de(bd, quote_id: int):
+    conn = bd.get_connection()
+    fila = conn.execute("SELECT cliente_id FROM quotes WHERE id = ?", (quote_id,)).fetchone()
+    conn.close()
+    return fila[0]
+
+
+@pytest.fixture
+def bd(bd_temporal):
+    from database.cliente_manager import init_clientes_table
+    init_clientes_table()
+    return bd_temporal
+
+
+def test_cotizacion_sin_cliente_se_vincula_en_otra_ejecucion(bd):
+    ana = _cliente(bd, 'Ana Ruiz')
+    q1 = _cotizacion(bd, 'Q1', 'ANA RUIZ')
+    q2 = _cotizacion(bd, 'Q2', 'Luis Gomez')
+
+    assert vincular() == 1
+    assert (_cliente_de(bd, q1), _cliente_de(bd, q2)) == (ana, None)
+
+    # El cliente aparece después (y con acento): la siguiente ejecución lo vincula
+    luis = _cliente(bd, 'Luis Gómez')
+    assert vincular() == 1
+    assert _cliente_de(bd, q2) == luis
+    assert vincular() == 0
+
+
+def test_migrar_clientes_vincula_sus_cotizaciones(bd):
+    q = _cotizacion(bd, 'Q3', 'Pedro Díaz', telefono='0414-5551234',
+                    cedula='V-12345678', direccion='Mérida')
+
+    reporte = migrar_clientes_desde_quotes()
+
+    assert reporte['errores'] == 0 and reporte['migrados'] == 1
+    assert reporte['vinculadas'] == 1
+    assert _cliente_de(bd, q) is not None
@@ -3,12 +3,14 @@
 
 import streamlit as st
 from database.db_manager import DBManager
+from services.pricing.freight import TarifasFlete
 from services.auth_manager import AuthManager
 from datetime import datetime, timedelta
 from database.cliente_manager import (
-    init_clientes_table, get_todos_los_clientes, get_cliente_por_id,
+    init_clientes_table, get_clientes_pagina, get_cliente_por_id,
     actualizar_cliente, eliminar_cliente, detectar_duplicados
 )
+from database.cliente_duplicados import recalcular_duplicados
 from database.migrar_clientes import migrar_clientes_desde_quotes
 
 def show_admin_panel():
@@ -69,7 +71,7 @@ def show_admin_panel():
     st.title("🔧 Panel de Administración")
     
     # Tabs para organizar las secciones
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9, tab10 = st.tabs([
         "👤 Mi Perfil",
         "👥 Gestión de Usuarios",
         "⚙️ Configuración del Sistema",
@@ -78,7 +80,8 @@ def show_admin_panel():
         "👨‍💼 Clientes",
         "🔍 Auditoría",
         "⛔ Anulaciones",
-        "🔐 Logs de Sesión"
+        "🔐 Logs de Sesión",
+        "📦 Exportar Documentos"
     ])
 
     # TAB 1: MI PERFIL
@@ -117,6 +120,10 @@ def show_admin_panel():
     with tab9:
         show_session_logs_panel()
 
+    # TAB 10: EXPORTACIÓN MASIVA DE DOCUMENTOS
+    with tab10:
+        show_document_export_panel()
+
 
 def show_my_profile():
     """Módulo para editar el perfil del usuario actual."""
@@ -554,7 +561,10 @@ def show_system_configuration():
             )
             submit_tax = st.form_submit_button("💾 Guardar", use_container_width=True)
             if submit_tax:
+                # 'american_tax' es la clave del panel; 'tax_percentage' la que lee
+                # el formulario del analista (ConfigHelpers): ambas con el mismo valor
                 DBManager.set_config('american_tax', str(tax_percentage), "TAX de empresa americana - Porcentaje", st.session_state.user_id)
+                DBManager.set_config('tax_percentage', str(tax_percentage), "TAX de empresa americana - clave unificada", st.session_state.user_id)
                 st.success("✅ TAX actualizado")
                 DBManager.log_activity(st.session_state.user_id, "update_config", "Actualizó TAX")
                 st.session_state.pop('_config_cache_ts', None)  # Invalidar caché
@@ -606,7 +616,9 @@ def show_system_configuration():
             )
             submit_iva = st.form_submit_button("💾 Guardar IVA", use_container_width=True)
             if submit_iva:
+                # Igual que el TAX: 'iva_venezuela' es la clave que lee ConfigHelpers
                 DBManager.set_config('venezuela_iva', str(venezuela_iva), "IVA Venezuela - Porcentaje", st.session_state.user_id)
+                DBManager.set_config('iva_venezuela', str(venezuela_iva), "IVA Venezuela - clave unificada", st.session_state.user_id)
                 st.success("✅ IVA actualizado")
                 DBManager.log_activity(st.session_state.user_id, "update_config", "Actualizó IVA")
                 st.session_state.pop('_config_cache_ts', None)  # Invalidar caché
@@ -672,8 +684,8 @@ def show_system_configuration():
                 DBManager.update_freight_rate('Miami', 'Aéreo', miami_air, st.session_state.user_id)
                 st.success("✅ Tarifa actualizada")
                 DBManager.log_activity(st.session_state.user_id, "update_freight_rate", "Actualizó tarifa Miami Aéreo")
-                # Invalidar caché de tarifas para que los analistas vean el cambio inmediatamente
-                st.session_state.pop('_tarifas_cache_ts', None)
+                # Recargar la tabla de tarifas en memoria para que las cotizaciones usen la nueva
+                TarifasFlete.invalidar()
                 st.rerun()
     
     with col2:
@@ -692,8 +704,8 @@ def show_system_configuration():
                 DBManager.update_freight_rate('Miami', 'Marítimo', miami_sea, st.session_state.user_id)
                 st.success("✅ Tarifa actualizada")
                 DBManager.log_activity(st.session_state.user_id, "update_freight_rate", "Actualizó tarifa Miami Marítimo")
-                # Invalidar caché de tarifas para que los analistas vean el cambio inmediatamente
-                st.session_state.pop('_tarifas_cache_ts', None)
+                # Recargar la tabla de tarifas en memoria para que las cotizaciones usen la nueva
+                TarifasFlete.invalidar()
                 st.rerun()
     
     with col3:
@@ -712,10 +724,16 @@ def show_system_configuration():
                 DBManager.update_freight_rate('Madrid', 'Aéreo', madrid_air, st.session_state.user_id)
                 st.success("✅ Tarifa actualizada")
                 DBManager.log_activity(st.session_state.user_id, "update_freight_rate", "Actualizó tarifa Madrid Aéreo")
-                # Invalidar caché de tarifas para que los analistas vean el cambio inmediatamente
-                st.session_state.pop('_tarifas_cache_ts', None)
+                # Recargar la tabla de tarifas en memoria para que las cotizaciones usen la nueva
+                TarifasFlete.invalidar()
                 st.rerun()
     
+    st.markdown("---")
+    _show_repricing_section()
+    
+    st.markdown("---")
+    _show_reconciliation_section()
+    
     st.markdown("---")
     st.markdown("#### Opciones de Garantías")
     
@@ -1332,6 +1350,9 @@ def show_reports_and_stats():
             import traceback
             st.code(traceback.format_exc())
 
+    st.markdown("---")
+    _show_margin_simulator()
+
     st.markdown('</div>', unsafe_allow_html=True)
 
 
@@ -1500,14 +1521,19 @@ def show_clientes_management():
             "copia a la base de datos de clientes. Solo se migran nombres reales (sin números "
             "ni alias). Si un cliente ya existe, no se duplica."
         )
-        st.warning(
-            "⚠️ Esta operación es segura y puede ejecutarse más de una vez sin crear duplicados. "
-            "Se recomienda ejecutarla **una sola vez** al activar esta función por primera vez."
+        st.info(
+            "ℹ️ Esta operación es segura y puede ejecutarse más de una vez sin crear duplicados. "
+            "Procesa por lotes y guarda su avance: si se interrumpe, continúa donde quedó, y al "
+            "re-ejecutarla (p. ej. tras importar cotizaciones) solo revisa las cotizaciones nuevas."
         )
 
         if 'migracion_reporte' not in st.session_state:
             st.session_state.migracion_reporte = None
 
+        _mig_simular = st.checkbox(
+            "🧪 Simulación (no inserta nada; muestra el resultado esperado y el rendimiento)",
+            key="chk_migrar_clientes_simular"
+        )
         if st.button(
             "🚀 EJECUTAR MIGRACIÓN DE CLIENTES HISTÓRICOS",
             type="primary",
@@ -1516,7 +1542,7 @@ def show_clientes_management():
         ):
             with st.spinner("Migrando clientes desde cotizaciones históricas..."):
                 try:
-                    reporte = migrar_clientes_desde_quotes()
+                    reporte = migrar_clientes_desde_quotes(dry_run=_mig_simular)
                     st.session_state.migracion_reporte = reporte
                     # Limpiar caché de duplicados para que se recalcule
                     if 'ac_dups_cache' in st.session_state:
@@ -1532,8 +1558,17 @@ def show_clientes_management():
             mc2.metric("✅ Ya existían", _r['ya_existian'])
             mc3.metric("⏭️ Omitidos",    _r['omitidos'])
             mc4.metric("❌ Errores",     _r['errores'])
+            st.caption(
+                f"📥 {_r.get('leidas', 0)} cotizaciones leídas en {_r.get('lotes', 0)} lote(s) · "
+                f"⏱️ {_r.get('segundos', 0)} s · {_r.get('filas_por_segundo', 0)} filas/s"
+            )
 
-            if _r['migrados'] > 0:
+            if _r.get('dry_run'):
+                st.info(
+                    f"🧪 Simulación: se migrarían {_r['migrados']} cliente(s). "
+                    "No se modificó la base de datos."
+                )
+            elif _r['migrados'] > 0:
                 st.success(
                     f"✅ Migración completada. "
                     f"{_r['migrados']} cliente(s) nuevo(s) agregado(s) a la base de datos."
@@ -1551,170 +1586,200 @@ def show_clientes_management():
     st.markdown("---")
 
     # ── BLOQUE 1: ALERTAS DE DUPLICADOS ──────────────────────────────────────
+    # Lee los grupos precalculados (tabla client_duplicate_groups); el cálculo
+    # se hace al arrancar y de forma incremental en cada alta/edición/eliminación.
     _dups = detectar_duplicados()
     if _dups:
         _total = sum(len(g) for g in _dups)
         st.warning(
-            f"⚠️ **Se detectaron {_total} registros duplicados** "
-            f"({len(_dups)} grupos con misma cédula y teléfono). "
+            f"⚠️ **Se detectaron {_total} registros posiblemente duplicados** "
+            f"({len(_dups)} grupos por cédula, teléfono o nombre similar). "
             "Revisa la lista y elimina los sobrantes."
         )
         with st.expander("👁️ Ver duplicados detectados"):
             for i, grupo in enumerate(_dups, 1):
-                st.markdown(f"**Grupo {i}** — {len(grupo)} registros con misma cédula y teléfono:")
+                _motivos = sorted({cli['motivo'] for cli in grupo if cli.get('motivo')})
+                st.markdown(
+                    f"**Grupo {i}** — {len(grupo)} registros "
+                    f"(coinciden por: {', '.join(_motivos) or '—'}):"
+                )
                 for cli in grupo:
                     st.write(
                         f"  • ID {cli['id']} | **{cli['nombre']}** | "
-                        f"Tel: {cli['telefono']} | C.I.: {cli['ci_rif']} | "
+                        f"Tel: {cli['telefono'] or '—'} | C.I.: {cli['ci_rif'] or '—'} | "
                         f"Dir: {cli['direccion'] or '—'}"
                     )
                 st.markdown("---")
-
-    # ── BLOQUE 2: BUSCADOR Y TABLA DE CLIENTES ───────────────────────────────
+    if st.button("🔄 Recalcular duplicados", key="btn_recalcular_duplicados"):
+        with st.spinner("Recalculando grupos de duplicados..."):
+            recalcular_duplicados()
+        if 'ac_dups_cache' in st.session_state:
+            del st.session_state['ac_dups_cache']
+        st.rerun()
+
+    # ── BLOQUE 2: BUSCADOR, ORDEN Y PAGINACIÓN ───────────────────────────────
+    # Filtro, orden y paginación se resuelven en el servidor
+    # (get_clientes_pagina): solo la página visible se lee de la BD y se
+    # envía al navegador.
     st.markdown("#### 🔍 Buscar y Gestionar Clientes")
 
-    _busqueda = st.text_input(
-        "Buscar por nombre, apellido, teléfono o C.I./RIF",
-        placeholder="Escribe para filtrar...",
-        key="admin_cli_busqueda"
+    _ORDENES = {
+        "Nombre":               'nombre',
+        "Teléfono":             'telefono',
+        "C.I. / RIF":           'ci_rif',
+        "Última actualización": 'actualizado_en',
+        "ID":                   'id',
+    }
+    fc1, fc2, fc3, fc4 = st.columns([3, 2, 1, 1])
+    with fc1:
+        _busqueda = st.text_input(
+            "Buscar por nombre, apellido, teléfono o C.I./RIF",
+            placeholder="Escribe al menos 3 caracteres para filtrar...",
+            key="admin_cli_busqueda"
+        )
+    with fc2:
+        _orden_label = st.selectbox("Ordenar por", list(_ORDENES.keys()), key="admin_cli_orden")
+    with fc3:
+        _desc = st.checkbox("Descendente", key="admin_cli_desc")
+    with fc4:
+        _por_pagina = st.selectbox("Por página", [25, 50, 100, 200], index=1, key="admin_cli_por_pagina")
+
+    # Volver a la página 1 cuando cambian filtro, orden o tamaño de página
+    _firma = (_busqueda.strip(), _orden_label, _desc, _por_pagina)
+    if st.session_state.get('admin_cli_firma') != _firma:
+        st.session_state.admin_cli_firma = _firma
+        st.session_state.admin_cli_pagina = 1
+
+    _res = get_clientes_pagina(
+        pagina=st.session_state.get('admin_cli_pagina', 1),
+        por_pagina=_por_pagina,
+        filtro=_busqueda,
+        orden=_ORDENES[_orden_label],
+        descendente=_desc,
     )
+    st.session_state.admin_cli_pagina = _res['pagina']
 
-    todos = get_todos_los_clientes()
-
-    # Filtrar según búsqueda
-    if _busqueda.strip():
-        _q = _busqueda.strip().lower()
-        todos = [
-            c for c in todos
-            if _q in (c['nombre'] or '').lower()
-            or _q in (c['telefono'] or '').lower()
-            or _q in (c['ci_rif'] or '').lower()
-            or _q in (c['direccion'] or '').lower()
-        ]
-
-    st.caption(f"**{len(todos)}** cliente(s) encontrado(s)")
+    st.caption(
+        f"**{_res['total']}** cliente(s) encontrado(s) — "
+        f"página {_res['pagina']} de {_res['paginas']}"
+    )
 
-    if not todos:
-        st.info("No hay clientes registrados aún. Se irán agregando automáticamente al guardar cotizaciones.")
+    if not _res['clientes']:
+        if _busqueda.strip():
+            st.info("Ningún cliente coincide con la búsqueda.")
+        else:
+            st.info("No hay clientes registrados aún. Se irán agregando automáticamente al guardar cotizaciones.")
         return
 
-    # ── BLOQUE 3: TABLA CON ACCIONES ─────────────────────────────────────────
-    # Inicializar estado de edición
-    if 'admin_cli_editando' not in st.session_state:
-        st.session_state.admin_cli_editando = None
-    # CORRECCIÓN BUG NOMBRE CLIENTE: versión del formulario de edición.
-    # Cada vez que se activa el modo edición para un cliente, se incrementa
-    # este contador para que los keys de los text_input sean únicos y Streamlit
-    # no reutilice el widget con el valor viejo cacheado en su estado interno.
-    if 'admin_cli_edit_version' not in st.session_state:
-        st.session_state.admin_cli_edit_version = 0
-
-    for cliente in todos:
-        cid = cliente['id']
-        with st.expander(
-            f"👤 {cliente['nombre']} "
-            f"{'| Tel: ' + cliente['telefono'] if cliente['telefono'] else ''} "
-            f"{'| C.I.: ' + cliente['ci_rif'] if cliente['ci_rif'] else ''}",
-            expanded=(st.session_state.admin_cli_editando == cid)
-        ):
-            if st.session_state.admin_cli_editando == cid:
-                # ── MODO EDICIÓN ──────────────────────────────────────────────
-                # Usar versión en el key para forzar re-render con los datos actuales
-                _ev = st.session_state.admin_cli_edit_version
-                st.markdown("**✏️ Editando cliente:**")
-                col_e1, col_e2 = st.columns(2)
-                with col_e1:
-                    nuevo_nombre = st.text_input(
-                        "Nombre completo", value=cliente['nombre'],
-                        key=f"cli_edit_nombre_{cid}_v{_ev}"
-                    )
-                    nuevo_tel = st.text_input(
-                        "Teléfono", value=cliente['telefono'],
-                        key=f"cli_edit_tel_{cid}_v{_ev}"
-                    )
-                with col_e2:
-                    nuevo_ci = st.text_input(
-                        "C.I. / RIF", value=cliente['ci_rif'],
-                        key=f"cli_edit_ci_{cid}_v{_ev}"
-                    )
-                    nueva_dir = st.text_input(
-                        "Dirección", value=cliente['direccion'],
-                        key=f"cli_edit_dir_{cid}_v{_ev}"
-                    )
+    # ── BLOQUE 3: TABLA EDITABLE DE LA PÁGINA ACTUAL ─────────────────────────
+    import pandas as _pd
+    _originales = {c['id']: c for c in _res['clientes']}
+    _df = _pd.DataFrame([
+        {
+            'ID':         c['id'],
+            'Nombre':     c['nombre'],
+            'Teléfono':   c['telefono'],
+            'C.I. / RIF': c['ci_rif'],
+            'Dirección':  c['direccion'],
+            'Actualizado': c['actualizado_en'],
+            'Eliminar':   False,
+        }
+        for c in _res['clientes']
+    ])
+    # La key incluye página y firma para que el editor no arrastre ediciones
+    # pendientes de otra página.
+    _editor_key = f"admin_cli_editor_{_res['pagina']}_{hash(_firma)}_{st.session_state.get('admin_cli_edit_version', 0)}"
+    _editado = st.data_editor(
+        _df,
+        key=_editor_key,
+        use_container_width=True,
+        hide_index=True,
+        num_rows="fixed",
+        disabled=['ID', 'Actualizado'],
+        column_config={
+            'ID':          st.column_config.NumberColumn(width="small"),
+            'Nombre':      st.column_config.TextColumn(required=True),
+            'Actualizado': st.column_config.DatetimeColumn(format="DD/MM/YYYY HH:mm"),
+            'Eliminar':    st.column_config.CheckboxColumn(
+                help="Marca los clientes a eliminar y confirma abajo"
+            ),
+        },
+    )
 
-                btn_g1, btn_g2 = st.columns(2)
-                with btn_g1:
-                    if st.button("💾 GUARDAR CAMBIOS", use_container_width=True,
-                                 type="primary", key=f"cli_guardar_{cid}"):
-                        ok = actualizar_cliente(cid, {
-                            'nombre':    nuevo_nombre,
-                            'telefono':  nuevo_tel,
-                            'ci_rif':    nuevo_ci,
-                            'direccion': nueva_dir,
-                        })
-                        if ok:
-                            st.success("✅ Cliente actualizado correctamente.")
-                            st.session_state.admin_cli_editando = None
-                            st.rerun()
-                        else:
-                            st.error("❌ Error al actualizar. Intenta de nuevo.")
-                with btn_g2:
-                    if st.button("❌ CANCELAR", use_container_width=True,
-                                 key=f"cli_cancelar_{cid}"):
-                        st.session_state.admin_cli_editando = None
-                        st.rerun()
+    # Detectar cambios fila a fila contra los datos originales de la página
+    _cambios, _a_eliminar = [], []
+    for _fila in _editado.to_dict('records'):
+        cid = int(_fila['ID'])
+        orig = _originales.get(cid)
+        if orig is None:
+            continue
+        if _fila.get('Eliminar'):
+            _a_eliminar.append(orig)
+            continue
+        nuevos = {
+            'nombre':    str(_fila.get('Nombre') or '').strip(),
+            'telefono':  str(_fila.get('Teléfono') or '').strip(),
+            'ci_rif':    str(_fila.get('C.I. / RIF') or '').strip(),
+            'direccion': str(_fila.get('Dirección') or '').strip(),
+        }
+        if any(nuevos[k] != (orig[k] or '').strip() for k in nuevos):
+            _cambios.append((cid, nuevos))
+
+    # ── Paginación ──
+    pc1, pc2, pc3 = st.columns([1, 2, 1])
+    with pc1:
+        if st.button("⬅️ Anterior", use_container_width=True,
+                     disabled=_res['pagina'] <= 1, key="admin_cli_prev"):
+            st.session_state.admin_cli_pagina = _res['pagina'] - 1
+            st.rerun()
+    with pc2:
+        _ir = st.number_input(
+            "Ir a página", min_value=1, max_value=_res['paginas'],
+            value=_res['pagina'], step=1, key=f"admin_cli_ir_{_res['pagina']}",
+            label_visibility="collapsed"
+        )
+        if _ir != _res['pagina']:
+            st.session_state.admin_cli_pagina = int(_ir)
+            st.rerun()
+    with pc3:
+        if st.button("Siguiente ➡️", use_container_width=True,
+                     disabled=_res['pagina'] >= _res['paginas'], key="admin_cli_next"):
+            st.session_state.admin_cli_pagina = _res['pagina'] + 1
+            st.rerun()
+
+    # ── Guardar ediciones ──
+    if _cambios:
+        st.info(f"✏️ {len(_cambios)} cliente(s) con cambios sin guardar.")
+        if st.button("💾 GUARDAR CAMBIOS", type="primary",
+                     use_container_width=True, key="admin_cli_guardar"):
+            _errores = [cid for cid, datos in _cambios if not datos['nombre']
+                        or not actualizar_cliente(cid, datos)]
+            if _errores:
+                st.error(f"❌ No se pudieron guardar los clientes con ID: {_errores}")
             else:
-                # ── MODO VISTA ────────────────────────────────────────────────
-                col_v1, col_v2 = st.columns(2)
-                with col_v1:
-                    st.write(f"**Nombre:** {cliente['nombre'] or '—'}")
-                    st.write(f"**Teléfono:** {cliente['telefono'] or '—'}")
-                with col_v2:
-                    st.write(f"**C.I. / RIF:** {cliente['ci_rif'] or '—'}")
-                    st.write(f"**Dirección:** {cliente['direccion'] or '—'}")
-
-                if cliente.get('actualizado_en'):
-                    try:
-                        _fecha = cliente['actualizado_en'].strftime('%d/%m/%Y %H:%M')
-                    except Exception:
-                        _fecha = str(cliente['actualizado_en'])
-                    st.caption(f"Última actualización: {_fecha}")
-
-                btn_a1, btn_a2 = st.columns(2)
-                with btn_a1:
-                    if st.button("✏️ EDITAR", use_container_width=True,
-                                 key=f"cli_editar_{cid}"):
-                        st.session_state.admin_cli_editando = cid
-                        # Incrementar versión para forzar re-render de los widgets
-                        # con los datos actuales del cliente (fix bug nombre no cambia)
-                        st.session_state.admin_cli_edit_version = st.session_state.get('admin_cli_edit_version', 0) + 1
-                        st.rerun()
-                with btn_a2:
-                    # Confirmación de eliminación en dos pasos
-                    _confirm_key = f"cli_confirm_del_{cid}"
-                    if st.session_state.get(_confirm_key):
-                        st.error(f"¿Confirmar eliminación de **{cliente['nombre']}**?")
-                        bc1, bc2 = st.columns(2)
-                        with bc1:
-                            if st.button("✅ SÍ, ELIMINAR", use_container_width=True,
-                                         type="primary", key=f"cli_del_confirm_{cid}"):
-                                ok = eliminar_cliente(cid)
-                                if ok:
-                                    st.success("✅ Cliente eliminado.")
-                                    st.session_state[_confirm_key] = False
-                                    st.rerun()
-                                else:
-                                    st.error("❌ Error al eliminar.")
-                        with bc2:
-                            if st.button("❌ CANCELAR", use_container_width=True,
-                                         key=f"cli_del_cancel_{cid}"):
-                                st.session_state[_confirm_key] = False
-                                st.rerun()
-                    else:
-                        if st.button("🗑️ ELIMINAR", use_container_width=True,
-                                     key=f"cli_eliminar_{cid}"):
-                            st.session_state[_confirm_key] = True
-                            st.rerun()
+                st.success(f"✅ {len(_cambios)} cliente(s) actualizado(s) correctamente.")
+                st.session_state.admin_cli_edit_version = st.session_state.get('admin_cli_edit_version', 0) + 1
+                st.rerun()
+
+    # ── Eliminación con confirmación ──
+    if _a_eliminar:
+        _nombres = ", ".join(f"**{c['nombre']}** (ID {c['id']})" for c in _a_eliminar)
+        st.error(f"¿Confirmar eliminación de {_nombres}?")
+        bc1, bc2 = st.columns(2)
+        with bc1:
+            if st.button("✅ SÍ, ELIMINAR", use_container_width=True,
+                         type="primary", key="admin_cli_del_confirm"):
+                _fallidos = [c['id'] for c in _a_eliminar if not eliminar_cliente(c['id'])]
+                if _fallidos:
+                    st.error(f"❌ Error al eliminar los clientes con ID: {_fallidos}")
+                else:
+                    st.success(f"✅ {len(_a_eliminar)} cliente(s) eliminado(s).")
+                st.session_state.admin_cli_edit_version = st.session_state.get('admin_cli_edit_version', 0) + 1
+                st.rerun()
+        with bc2:
+            if st.button("❌ CANCELAR", use_container_width=True, key="admin_cli_del_cancel"):
+                st.session_state.admin_cli_edit_version = st.session_state.get('admin_cli_edit_version', 0) + 1
+                st.rerun()
 
 
 # ==================== TAB 7: AUDITORÍA DE COTIZACIONES ====================
@@ -2161,9 +2226,7 @@ def show_cancellations_panel():
                                 if ok:
                                     st.success(f"✅ Cotización **{qnum}** anulada correctamente. Motivo: {motivo_sel}")
                                     # Invalidar caché de configuraciones si existe
-                                    for key in ['_config_cache_ts', '_tarifas_cache_ts']:
-                                        if key in st.session_state:
-                                            del st.session_state[key]
+                                    st.session_state.pop('_config_cache_ts', None)
                                     st.rerun()
                                 else:
                                     st.error("❌ Error al anular la cotización. Intenta de nuevo.")
@@ -2485,3 +2548,431 @@ def show_session_logs_panel():
         st.dataframe(df_alertas, use_container_width=True, hide_index=True)
     else:
         st.success("✅ No se detectaron sesiones sospechosamente cortas en el período.")
+
+
+def _show_repricing_section():
+    """
+    Recalculo masivo de las cotizaciones abiertas (borrador y enviadas) con
+    el diferencial, TAX e IVA vigentes: primero se muestra el impacto y solo
+    se escribe al confirmar.
+    """
+    from services import repricing
+
+    st.markdown("#### 🔁 Recalcular Cotizaciones Abiertas")
+    st.info(
+        "💡 Tras cambiar el diferencial, el TAX o el IVA, las cotizaciones en borrador y "
+        "enviadas conservan los precios anteriores. Aquí puedes ver el impacto y recalcularlas "
+        "todas de una vez. El costo de envío y el factor de utilidad de cada ítem no cambian."
+    )
+
+    if st.button("🔍 Ver impacto", key="reprice_preview", use_container_width=True):
+        with st.spinner("Calculando impacto..."):
+            st.session_state['_reprice_preview'] = repricing.previsualizar()
+
+    vista = st.session_state.get('_reprice_preview')
+    if not vista:
+        return
+    if vista['error']:
+        st.error(f"❌ Error al calcular el impacto: {vista['error']}")
+        return
+
+    p = vista['parametros']
+    st.caption(
+        f"Parámetros: diferencial {p['diferencial_porcentaje']}% · "
+        f"TAX {p['tax_porcentaje']}% · IVA {p['iva_porcentaje']}%"
+    )
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Revisadas", vista['revisadas'])
+    col2.metric("Cambian", vista['afectadas'])
+    col3.metric("Δ USD", f"${vista['delta_usd']:+,.2f}")
+    col4.metric("Δ Bs (total a pagar)", f"${vista['delta_bs']:+,.2f}")
+    if vista['omitidas']:
+        st.caption(f"⚠️ {vista['omitidas']} cotizaciones sin ítems o con ítems sin FOB/cantidad no se recalculan.")
+
+    if not vista['afectadas']:
+        st.success("✅ Todas las cotizaciones abiertas ya están al día.")
+        st.session_state.pop('_reprice_preview', None)
+        return
+
+    import pandas as pd
+    st.dataframe(
+        pd.DataFrame([
+            {'Analista': f['analista'], 'Cotizaciones': f['cotizaciones'],
+             'Δ USD': f['delta_usd'], 'Δ Bs': f['delta_bs']}
+            for f in vista['por_analista']
+        ]),
+        use_container_width=True, hide_index=True
+    )
+
+    col_ok, col_cancel = st.columns(2)
+    with col_ok:
+        if st.button(f"✅ Aplicar a {vista['afectadas']} cotizaciones", key="reprice_apply",
+                     type="primary", use_container_width=True):
+            barra = st.progress(0.0, text="Recalculando...")
+            total = max(vista['revisadas'], 1)
+            resultado = repricing.aplicar(
+                p, st.session_state.get('user_id'),
+                progreso=lambda n: barra.progress(min(n / total, 1.0), text=f"Recalculando... {n}/{total}")
+            )
+            st.session_state.pop('_reprice_preview', None)
+            if resultado['error']:
+                st.error(
+                    f"❌ Recalculo detenido: {resultado['error']}. "
+                    f"{resultado['afectadas']} cotizaciones quedaron actualizadas."
+                )
+            else:
+                st.success(
+                    f"✅ {resultado['afectadas']} cotizaciones recalculadas "
+                    f"(Δ USD {resultado['delta_usd']:+,.2f}). Sus documentos se regenerarán al abrirlas."
+                )
+    with col_cancel:
+        if st.button("Descartar", key="reprice_discard", use_container_width=True):
+            st.session_state.pop('_reprice_preview', None)
+            st.rerun()
+
+
+def _show_reconciliation_section():
+    """
+    Conciliación de totales: compara la cabecera de todas las cotizaciones
+    con la suma de sus ítems guardados. El escaneo solo reporta; la
+    corrección se aplica al confirmar.
+    """
+    from services import reconciliation
+
+    st.markdown("#### 🧮 Conciliar Totales de Cotizaciones")
+    st.info(
+        "💡 Revisa todo el historial y detecta cotizaciones cuyo subtotal, IVA, abono, "
+        "entrega o total USD no coinciden con sus ítems. Las diferencias quedan registradas; "
+        "las cotizaciones sin ítems solo se reportan."
+    )
+
+    if st.button("🔍 Escanear historial", key="reconcile_scan", use_container_width=True):
+        barra = st.progress(0.0, text="Escaneando...")
+        total = max(reconciliation.contar(), 1)
+        st.session_state['_reconcile_scan'] = reconciliation.escanear(
+            progreso=lambda n: barra.progress(min(n / total, 1.0), text=f"Escaneando... {n}/{total}")
+        )
+        barra.empty()
+
+    escaneo = st.session_state.get('_reconcile_scan')
+    if not escaneo:
+        return
+    if escaneo['error']:
+        st.error(f"❌ Error en la conciliación: {escaneo['error']}")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Revisadas", escaneo['revisadas'])
+    col2.metric("Con diferencias", escaneo['con_diferencias'])
+    col3.metric("Sin ítems", escaneo['sin_items'])
+    col4.metric("Tiempo", f"{escaneo['segundos']:.1f} s")
+
+    if not escaneo['con_diferencias']:
+        st.success("✅ Todos los totales coinciden con sus ítems.")
+        st.session_state.pop('_reconcile_scan', None)
+        return
+
+    import pandas as pd
+    st.caption(" · ".join(f"{campo}: {n}" for campo, n in escaneo['por_campo'].items() if n))
+    st.dataframe(
+        pd.DataFrame([
+            {'Cotización': f['quote_number'], 'Campo': f['campo'], 'Guardado': f['guardado'],
+             'Esperado': f['esperado'], 'Diferencia': f['diferencia'], 'Nota': f['nota'] or ''}
+            for f in reconciliation.reporte(escaneo['corrida'])
+        ]),
+        use_container_width=True, hide_index=True
+    )
+
+    corregibles = escaneo['con_diferencias'] - escaneo['sin_items']
+    col_ok, col_cancel = st.columns(2)
+    with col_ok:
+        if corregibles and st.button(f"✅ Corregir {corregibles} cotizaciones", key="reconcile_fix",
+                                     type="primary", use_container_width=True):
+            with st.spinner("Corrigiendo totales..."):
+                resultado = reconciliation.corregir_corrida(
+                    escaneo['corrida'], usuario_id=st.session_state.get('user_id'))
+            st.session_state.pop('_reconcile_scan', None)
+            if resultado['error']:
+                st.error(
+                    f"❌ Corrección detenida: {resultado['error']}. "
+                    f"{resultado['corregidas']} cotizaciones quedaron corregidas."
+                )
+            else:
+                st.success(
+                    f"✅ {resultado['corregidas']} cotizaciones corregidas. "
+                    f"Sus documentos se regenerarán al abrirlas."
+                )
+                if resultado['omitidas']:
+                    st.warning(
+                        f"⚠️ {resultado['omitidas']} cotizaciones cambiaron después del escaneo "
+                        f"y no se corrigieron. Vuelve a escanear para revisarlas."
+                    )
+    with col_cancel:
+        if st.button("Descartar", key="reconcile_discard", use_container_width=True):
+            st.session_state.pop('_reconcile_scan', None)
+            st.rerun()
+
+
+def _show_margin_simulator():
+    """
+    Simulador "¿qué pasaría si?" de márgenes: aplica factores de utilidad,
+    diferencial, TAX, IVA y manejo propuestos a los ítems históricos con la
+    misma cadena de precios del analista. Solo lee; no cambia la configuración.
+    """
+    from database.config_helpers import ConfigHelpers
+    from services import margin_simulator
+    from services.repricing import parametros_vigentes
+
+    import pandas as pd
+
+    st.subheader("🧪 Simulador de Márgenes")
+    st.caption(
+        "Recalcula los ítems históricos con parámetros propuestos y compara ingresos, utilidad "
+        "y margen ponderado por probabilidad de aprobación (aprobadas = 1, rechazadas/anuladas = 0, "
+        "abiertas = tasa histórica). No modifica la configuración ni las cotizaciones."
+    )
+
+    vigentes = parametros_vigentes()
+    factores = [f for f in ConfigHelpers.get_profit_factors() if f > 0]
+    manejos = ConfigHelpers.get_manejo_options()
+
+    sim_col1, sim_col2 = st.columns(2)
+    with sim_col1:
+        sim_periodo = st.selectbox(
+            "Historial", options=list(margin_simulator.PERIODOS),
+            format_func=lambda x: {
+                'all': 'Todo el tiempo', 'year': 'Último año',
+                'quarter': 'Últimos 3 meses', 'month': 'Último mes'
+            }.get(x, x),
+            key="sim_periodo"
+        )
+    with sim_col2:
+        sim_estados = st.multiselect(
+            "Estados", options=['draft', 'sent', 'approved', 'rejected', 'cancelled'],
+            default=['draft', 'sent', 'approved', 'rejected', 'cancelled'],
+            key="sim_estados"
+        )
+
+    par_col1, par_col2, par_col3, par_col4 = st.columns(4)
+    with par_col1:
+        sim_diferencial = st.number_input("Diferencial (%)", min_value=0.0, step=0.5,
+                                          value=float(vigentes['diferencial_porcentaje']), key="sim_diferencial")
+    with par_col2:
+        sim_tax = st.number_input("TAX (%)", min_value=0.0, step=0.5,
+                                  value=float(vigentes['tax_porcentaje']), key="sim_tax")
+    with par_col3:
+        sim_iva = st.number_input("IVA (%)", min_value=0.0, step=0.5,
+                                  value=float(vigentes['iva_porcentaje']), key="sim_iva")
+    with par_col4:
+        sim_elasticidad = st.number_input(
+            "Elasticidad", min_value=0.0, max_value=10.0, step=0.25, value=0.0, key="sim_elasticidad",
+            help="Cuánto baja la probabilidad de aprobación cuando sube el precio. 0 = no cambia."
+        )
+
+    map_col1, map_col2 = st.columns(2)
+    with map_col1:
+        st.markdown("**Factores de utilidad**")
+        sim_factores = st.data_editor(
+            pd.DataFrame({'Actual': factores, 'Propuesto': factores}),
+            key="sim_factores_editor", hide_index=True, use_container_width=True,
+            num_rows="fixed", disabled=['Actual'],
+            column_config={'Propuesto': st.column_config.NumberColumn(min_value=0.0, step=0.01, format="%.4f")},
+        )
+    with map_col2:
+        st.markdown("**Opciones de manejo ($)**")
+        sim_manejos = st.data_editor(
+            pd.DataFrame({'Actual': manejos, 'Propuesto': manejos}),
+            key="sim_manejos_editor", hide_index=True, use_container_width=True,
+            num_rows="fixed", disabled=['Actual'],
+            column_config={'Propuesto': st.column_config.NumberColumn(min_value=0.0, step=1.0)},
+        )
+
+    sim_btn1, sim_btn2 = st.columns(2)
+    with sim_btn1:
+        simular = st.button("🧪 Simular", key="btn_simular_margenes", use_container_width=True)
+    with sim_btn2:
+        if st.button("🔄 Releer historial", key="btn_recargar_simulador", use_container_width=True):
+            margin_simulator.HistorialItems.invalidar()
+
+    if simular:
+        escenario = {
+            'factores': dict(zip(sim_factores['Actual'], sim_factores['Propuesto'])),
+            'manejos': dict(zip(sim_manejos['Actual'], sim_manejos['Propuesto'])),
+            'diferencial_porcentaje': sim_diferencial,
+            'tax_porcentaje': sim_tax,
+            'iva_porcentaje': sim_iva,
+            'elasticidad': sim_elasticidad,
+        }
+        filtros = {'periodo': sim_periodo, 'estados': sim_estados or None, 'base': vigentes}
+        with st.spinner("Simulando..."):
+            resultado = margin_simulator.simular([escenario], **filtros)
+            curva = margin_simulator.barrer(escenario, [0.5 + 0.1 * i for i in range(11)], **filtros)
+        st.session_state['_sim_margenes'] = (resultado, curva)
+
+    if '_sim_margenes' not in st.session_state:
+        return
+    resultado, curva = st.session_state['_sim_margenes']
+    if resultado is None:
+        st.error("❌ No se pudo leer el historial de ítems.")
+        return
+    actual, propuesto = resultado['actual'], resultado['escenarios'][0]
+    if not actual['items']:
+        st.info("ℹ️ No hay ítems en el historial seleccionado.")
+        return
+
+    st.caption(f"{actual['items']:,} ítems de {actual['cotizaciones']:,} cotizaciones")
+    met1, met2, met3, met4 = st.columns(4)
+    met1.metric("💰 Ingresos (USD)", f"${propuesto['ingresos']:,.2f}",
+                f"{propuesto['ingresos'] - actual['ingresos']:+,.2f}")
+    met2.metric("💹 Utilidad (USD)", f"${propuesto['utilidad']:,.2f}",
+                f"{propuesto['utilidad'] - actual['utilidad']:+,.2f}")
+    met3.metric("🎯 Utilidad esperada", f"${propuesto['utilidad_esperada']:,.2f}",
+                f"{propuesto['utilidad_esperada'] - actual['utilidad_esperada']:+,.2f}")
+    met4.metric("📊 Margen ponderado", f"{propuesto['margen_ponderado'] * 100:.2f}%",
+                f"{(propuesto['margen_ponderado'] - actual['margen_ponderado']) * 100:+.2f} pts")
+
+    st.dataframe(
+        pd.DataFrame([
+            {'Escenario': nombre, 'Ingresos': m['ingresos'], 'Utilidad': m['utilidad'],
+             'Margen %': round(m['margen'] * 100, 2), 'Diferencial': m['diferencial'],
+             'Ingresos esperados': m['ingresos_esperados'], 'Utilidad esperada': m['utilidad_esperada'],
+             'Margen ponderado %': round(m['margen_ponderado'] * 100, 2),
+             'Aprobación esperada %': round(m['aprobacion_esperada'] * 100, 2)}
+            for nombre, m in (('Actual', actual), ('Propuesto', propuesto))
+        ]),
+        use_container_width=True, hide_index=True
+    )
+
+    if curva:
+        st.markdown("##### Utilidad esperada al escalar el margen del escenario")
+        st.line_chart(
+            pd.DataFrame([
+                {'Escala de margen': c['escala'], 'Utilidad esperada': c['utilidad_esperada']}
+                for c in curva
+            ]).set_index('Escala de margen')
+        )
+        st.caption("1.0 = el escenario propuesto; 0.5 = la mitad de su margen sobre el FOB; "
+                   "con elasticidad 0 la curva solo sube.")
+
+
+def show_document_export_panel():
+    """
+    Exportación masiva de documentos (PDF/PNG) en un ZIP, por rango de
+    fechas, analista y estado. El trabajo corre en segundo plano
+    (DocumentExport); aquí solo se lanza y se consulta su avance.
+    """
+    from services.document_export import DocumentExport, TIPOS_EXPORTABLES, contar_cotizaciones
+
+    st.markdown("### 📦 Exportar Documentos")
+    st.caption(
+        "Genera un ZIP con los documentos de todas las cotizaciones del filtro. "
+        "Los documentos ya generados se reutilizan; los que faltan se generan en segundo plano."
+    )
+    st.markdown("---")
+
+    # ── Filtros ──────────────────────────────────────────────────────────────
+    col_desde, col_hasta = st.columns(2)
+    with col_desde:
+        fecha_desde = st.date_input("Desde", value=datetime.now() - timedelta(days=30),
+                                    key="exp_desde")
+    with col_hasta:
+        fecha_hasta = st.date_input("Hasta", value=datetime.now(), key="exp_hasta")
+
+    analistas = DBManager.get_all_analysts()
+    opciones_analista = {"Todos": None}
+    opciones_analista.update({a['full_name'] or a['username']: a['id'] for a in analistas})
+    estados = {
+        "Todos": None, "📝 Borrador": 'draft', "📤 Enviada": 'sent',
+        "✅ Aprobada": 'approved', "❌ Rechazada": 'rejected', "⛔ Anulada": 'cancelled',
+    }
+    col_an, col_est = st.columns(2)
+    with col_an:
+        analista_lbl = st.selectbox("Analista", list(opciones_analista.keys()), key="exp_analista")
+    with col_est:
+        estado_lbl = st.selectbox("Estado", list(estados.keys()), key="exp_estado")
+
+    tipos = st.multiselect(
+        "Documentos a incluir",
+        options=list(TIPOS_EXPORTABLES.keys()),
+        default=['pdf_bcv'],
+        format_func=lambda t: TIPOS_EXPORTABLES[t],
+        key="exp_tipos"
+    )
+
+    filtros = {
+        'fecha_desde': fecha_desde.isoformat(),
+        'fecha_hasta': fecha_hasta.isoformat(),
+        'analyst_id':  opciones_analista[analista_lbl],
+        'status':      estados[estado_lbl],
+        'tipos':       tipos,
+    }
+
+    col_info, col_btn = st.columns([3, 1])
+    with col_info:
+        st.info(f"📋 {contar_cotizaciones(filtros)} cotizaciones cumplen el filtro")
+    with col_btn:
+        if st.button("📦 EXPORTAR", key="exp_iniciar", type="primary",
+                     use_container_width=True, disabled=not tipos):
+            job_id = DocumentExport.iniciar(filtros, st.session_state.get('user_id'))
+            if job_id is None:
+                st.warning("⏳ Ya hay una exportación en curso. Espera a que termine.")
+            else:
+                st.success(f"✅ Exportación #{job_id} iniciada")
+
+    # ── Exportaciones recientes ──────────────────────────────────────────────
+    st.markdown("---")
+    col_tit, col_ref = st.columns([4, 1])
+    with col_tit:
+        st.markdown("#### Exportaciones recientes")
+    with col_ref:
+        if st.button("🔄 Actualizar", key="exp_refresh", use_container_width=True):
+            st.rerun()
+
+    trabajos = DocumentExport.recientes(10)
+    if not trabajos:
+        st.info("ℹ️ Aún no hay exportaciones")
+        return
+
+    for trabajo in trabajos:
+        f = trabajo['filtros']
+        titulo = (f"#{trabajo['id']} — {f.get('fecha_desde', '…')} a {f.get('fecha_hasta', '…')}"
+                  f" — {', '.join(TIPOS_EXPORTABLES.get(t, t) for t in f.get('tipos', []))}")
+        with st.expander(titulo, expanded=trabajo['estado'] in ('queued', 'running')):
+            total = trabajo['total'] or 0
+            procesadas = trabajo['procesadas'] or 0
+            if trabajo['estado'] in ('queued', 'running'):
+                st.progress(min(procesadas / total, 1.0) if total else 0.0,
+                            text=f"⏳ {procesadas} de {total} cotizaciones")
+                if st.button("⛔ Cancelar", key=f"exp_cancelar_{trabajo['id']}"):
+                    DocumentExport.cancelar(trabajo['id'])
+                    st.rerun()
+            elif trabajo['estado'] == 'done':
+                st.success(
+                    f"✅ {procesadas} cotizaciones — {trabajo['documentos']} archivos"
+                    f" — {(trabajo['bytes'] or 0) / (1024 * 1024):.1f} MB"
+                )
+                if trabajo['errores']:
+                    st.warning(f"⚠️ {trabajo['errores']} documentos no se pudieron incluir "
+                               "(detalle en indice.csv dentro del ZIP)")
+                if st.button("📥 Preparar descarga", key=f"exp_preparar_{trabajo['id']}"):
+                    try:
+                        stream = DocumentExport.abrir(trabajo['referencia'])
+                        try:
+                            st.session_state[f"exp_zip_{trabajo['id']}"] = stream.read()
+                        finally:
+                            stream.close()
+                    except Exception as e:
+                        st.error(f"❌ No se pudo leer el ZIP: {e}")
+                contenido = st.session_state.get(f"exp_zip_{trabajo['id']}")
+                if contenido:
+                    st.download_button(
+                        label="⬇️ DESCARGAR ZIP",
+                        data=contenido,
+                        file_name=trabajo['referencia'].rsplit('/', 1)[-1],
+                        mime="application/zip",
+                        key=f"exp_descargar_{trabajo['id']}"
+                    )
+            elif trabajo['estado'] == 'cancelled':
+                st.info(f"⛔ Cancelada ({procesadas} de {total} cotizaciones procesadas)")
+            else:
+                st.error(f"❌ Falló: {trabajo['error']}")
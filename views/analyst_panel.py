@@ -17,15 +17,20 @@ from database.db_manager import DBManager
 from database.config_helpers import ConfigHelpers
 from services.auth_manager import AuthManager
 from services.quote_numbering import QuoteNumberingService
+from services.pricing import TarifasFlete, TotalesIncrementales, calcular_item
+from services.pricing import desglose
 from database.cliente_manager import (
     init_clientes_table, buscar_clientes, guardar_o_actualizar,
     es_nombre_real, detectar_duplicados, buscar_por_telefono_o_cedula
 )
 try:
-    from services.document_generation import PDFQuoteGenerator, PNGQuoteGenerator, clean_text as _clean_text_gen
+    from services.document_generation import PDFQuoteGenerator, PNGQuoteGenerator, DocumentCache, DocumentStore, clean_text as _clean_text_gen
+    from services.document_generation.png_generator import extension_rendicion, mime_rendicion
 except ImportError:
     PDFQuoteGenerator = None
     PNGQuoteGenerator = None
+    DocumentCache = None
+    DocumentStore = None
     _clean_text_gen = None
 try:
     from services.timezone_utils import now_caracas_naive
@@ -38,49 +43,28 @@ except ImportError:
 CANTIDADES = list(range(1, 1001))
 
 # ==========================================
-# FUNCIÓN DE CÁLCULO DE ENVÍO (copiada de v6.2.2)
+# FUNCIÓN DE CÁLCULO DE ENVÍO (motor de flete: services/pricing/freight.py)
 # ==========================================
 
-def calcular_envio(largo_cm, ancho_cm, alto_cm, peso_kg, origen, tipo_envio, tarifas):
+def _puerto_salida(origen):
+    """Puerto de salida (origen de las tarifas) de un país de origen del ítem."""
+    return "Madrid" if str(origen or '').strip().upper() in ["MADRID", "ESPAÑA"] else "Miami"
+
+
+def calcular_envio(largo_cm, ancho_cm, alto_cm, peso_kg, origen, tipo_envio):
     """
     Calcula el costo de envío basado en dimensiones y peso.
+    origen: 'MIAMI'/'EEUU' o 'MADRID'/'ESPAÑA'; tipo_envio: 'AEREO' o 'MARITIMO'.
     Retorna: (total, facturable, unidad, peso_volumetrico, es_minimo)
     """
-    vol_cm3 = largo_cm * ancho_cm * alto_cm
-    peso_vol_kg = vol_cm3 / 5000
-    
-    # Determinar puerto de salida
-    if origen in ["MIAMI", "EEUU"]:
-        puerto = "Miami"
-    elif origen in ["MADRID", "ESPAÑA"]:
-        puerto = "Madrid"
-    else:
-        puerto = "Miami"  # Default
-    
-    if puerto == "Miami":
-        if tipo_envio == "MARITIMO":
-            facturable = vol_cm3 / 28316.8  # Convertir a ft³
-            costo_calc = facturable * tarifas.get("mia_m", 12.0)
-            unidad = "ft³"
-        else:  # Aéreo
-            mayor_kg = max(peso_kg, peso_vol_kg)
-            facturable = mayor_kg * 2.20462  # Convertir a lb
-            costo_calc = facturable * tarifas.get("mia_a", 5.5)
-            unidad = "lb"
-    else:  # Madrid
-        facturable = max(peso_kg, peso_vol_kg)
-        costo_calc = facturable * tarifas.get("mad", 8.0)
-        unidad = "kg"
-    
-    # Aplicar mínimo de $25
-    es_minimo = False
-    if costo_calc < 25.0:
-        total = 25.0
-        es_minimo = True
-    else:
-        total = costo_calc
-    
-    return round(total, 2), round(facturable, 2), unidad, round(peso_vol_kg, 2), es_minimo
+    puerto = _puerto_salida(origen)
+    tipo = "Marítimo" if tipo_envio == "MARITIMO" else "Aéreo"
+    res = TarifasFlete.cotizar(largo_cm, ancho_cm, alto_cm, peso_kg, puerto, tipo)
+    if res['costo'] is None:
+        # Combinación sin tarifa (Madrid Marítimo): se cotiza como aéreo
+        res = TarifasFlete.cotizar(largo_cm, ancho_cm, alto_cm, peso_kg, puerto, "Aéreo")
+    return (res['costo'], round(res['facturable'], 2), res['unidad'],
+            round(res['peso_volumetrico'], 2), res['es_minimo'])
 
 
 # ==========================================
@@ -157,6 +141,21 @@ def cargar_configuraciones():
         }
 
 
+# ==========================================
+# TOTALES INCREMENTALES DE LA COTIZACIÓN EN CURSO
+# ==========================================
+
+def _totales_sesion():
+    """
+    Acumulador de totales de st.session_state.cotizacion_items (uno por
+    sesión). Agregar, reemplazar o quitar ítems a través de él mantiene los
+    totales en O(1) por rerun; si la lista se sustituye, se reconstruye solo.
+    """
+    if '_totales_incrementales' not in st.session_state:
+        st.session_state['_totales_incrementales'] = TotalesIncrementales()
+    return st.session_state['_totales_incrementales']
+
+
 # ==========================================
 # FUNCIÓN PRINCIPAL DEL PANEL
 # ==========================================
@@ -241,22 +240,6 @@ def render_analyst_panel():
             st.session_state['_gep_rerun_count'] = 0
     else:
         st.session_state['_gep_rerun_count'] = 0
-    # ── CACHÉ DE TARIFAS (TTL 5 min) ─────────────────────────────────────────
-    # Evita 3 llamadas a BD en cada render. El admin puede forzar recarga
-    # desde su panel (invalida '_tarifas_cache_ts' en session_state).
-    _tarifas_now = time.time()
-    _tarifas_cached_ts = st.session_state.get('_tarifas_cache_ts', 0)
-    if 'tarifas' not in st.session_state or (_tarifas_now - _tarifas_cached_ts) >= _CONFIG_CACHE_TTL:
-        _mia_a = DBManager.get_freight_rate('Miami', 'Aéreo')
-        _mia_m = DBManager.get_freight_rate('Miami', 'Marítimo')
-        _mad   = DBManager.get_freight_rate('Madrid', 'Aéreo')
-        st.session_state.tarifas = {
-            "mia_a": float(_mia_a) if _mia_a is not None else 9.0,   # Miami Aéreo $/lb
-            "mia_m": float(_mia_m) if _mia_m is not None else 40.0,  # Miami Marítimo $/ft³
-            "mad":   float(_mad)   if _mad   is not None else 25.0,  # Madrid Aéreo $/kg
-        }
-        st.session_state['_tarifas_cache_ts'] = _tarifas_now
-    # ── FIN CACHÉ DE TARIFAS ──────────────────────────────────────────────────
     
     # ==========================================
     # FUNCIONES CALLBACK PARA BOTONES DE ÍTEMS
@@ -304,7 +287,7 @@ def render_analyst_panel():
         """Callback para el botón ELIMINAR de un ítem"""
         items = st.session_state.get('cotizacion_items', [])
         if isinstance(items, list) and idx < len(items):
-            st.session_state.cotizacion_items.pop(idx)
+            _totales_sesion().quitar(items, idx)
         # Si estábamos editando este ítem, cancelar edición
         if st.session_state.get('editing_item_index') == idx:
             if 'editing_item_index' in st.session_state:
@@ -577,72 +560,34 @@ def render_analyst_panel():
             'vehiculo': editing_quote_data.get('client_vehicle', ''),
             'cilindrada': editing_quote_data.get('client_cilindrada', ''),
             'year': editing_quote_data.get('client_year', ''),
-            'vin': editing_quote_data.get('client_vin', '')
+            'vin': editing_quote_data.get('client_vin', ''),
+            'cliente_id': editing_quote_data.get('cliente_id'),
         }
         
         # Cargar ítems con TODOS los campos (incluyendo financieros y de IVA)
         items = editing_quote_data.get('items', [])
         st.session_state.cotizacion_items = []
         for item in items:
-            # Reconstruir campos financieros desde los costos guardados en BD
-            _costo_fob      = float(item.get('unit_cost', 0) or 0)
-            _costo_handling = float(item.get('international_handling', 0) or 0)
-            _costo_manejo   = float(item.get('national_handling', 0) or 0)
-            _costo_envio    = float(item.get('shipping_cost', 0) or 0)
-            _impuesto_pct   = float(item.get('tax_percentage', 0) or 0)
-            _factor_util    = float(item.get('profit_factor', 1.0) or 1.0)
-            _cantidad       = int(item.get('quantity', 1) or 1)
-            _total_cost     = float(item.get('total_cost', 0) or 0)
-
-            # Reconstruir valores derivados que el recalculador de totales necesita
-            _fob_total      = _costo_fob * _cantidad
-            _costo_impuesto = _fob_total * (_impuesto_pct / 100)
-            _utilidad_base  = _fob_total + _costo_handling + _costo_manejo + _costo_impuesto
-            _utilidad_valor = _utilidad_base * (_factor_util - 1.0)
-
-            # IVA: recuperar de los campos extendidos si existen en BD
-            _aplicar_iva    = bool(item.get('aplicar_iva', False))
-            _iva_porcentaje = float(item.get('iva_porcentaje', 16.0) or 16.0)
-            _iva_valor      = float(item.get('iva_valor', 0) or 0)
-            _precio_bs      = float(item.get('precio_bs', _total_cost) or _total_cost)
-            _precio_usd     = float(item.get('precio_usd', _total_cost) or _total_cost)
+            # Campos financieros del desglose guardado (lo que se cotizó)
+            _d = desglose.del_item(item)
 
             st.session_state.cotizacion_items.append({
                 'descripcion':          item.get('description', ''),
                 'parte':                item.get('part_number', ''),
                 'marca':                item.get('marca', ''),
                 'garantia':             item.get('garantia', ''),
-                'cantidad':             _cantidad,
                 'origen':               item.get('origen', ''),
                 'envio_tipo':           item.get('envio_tipo', ''),
                 'tiempo_entrega':       item.get('tiempo_entrega', ''),
                 'fabricacion':          item.get('fabricacion', ''),
                 'link':                 item.get('page_url', ''),
-                # Costos base
-                'costo_fob':            _costo_fob,
-                'costo_handling':       _costo_handling,
-                'costo_manejo':         _costo_manejo,
-                'costo_envio':          _costo_envio,
-                'impuesto_porcentaje':  _impuesto_pct,
-                'factor_utilidad':      _factor_util,
-                # Campos derivados que usa el recalculador de totales
-                'fob_total':            _fob_total,
-                'costo_impuesto':       _costo_impuesto,
-                'utilidad_valor':       _utilidad_valor,
-                'diferencial_valor':    float(item.get('diferencial_valor', 0) or 0),
-                'diferencial_porcentaje': float(item.get('diferencial_porcentaje', 0) or 0),
-                'costo_tax':            float(item.get('costo_tax', 0) or 0),
-                # IVA — CAMPOS CRÍTICOS que antes no se cargaban
-                'aplicar_iva':          _aplicar_iva,
-                'iva_porcentaje':       _iva_porcentaje,
-                'iva_valor':            _iva_valor,
+                # Costos base, derivados e IVA
+                **{campo: _d[campo] for campo in desglose.CAMPOS_ITEM},
                 # Precios finales
-                'costo_unitario':       _costo_fob,
-                'costo_total':          _total_cost,
-                'costo_total_bs':       _precio_bs,
-                'precio_usd':           _precio_usd,
-                'precio_bs':            _precio_bs,
-                'precio_usd_total':     _precio_usd,
+                'costo_unitario':       _d['costo_fob'],
+                'costo_total':          _d['precio_usd'],
+                'costo_total_bs':       _d['precio_bs'],
+                'precio_usd_total':     _d['precio_usd'],
             })
         
         # Marcar como cargado
@@ -685,61 +630,29 @@ def render_analyst_panel():
             'vehiculo':   copying_quote_data.get('client_vehicle', ''),
             'cilindrada': copying_quote_data.get('client_cilindrada', ''),
             'year':       copying_quote_data.get('client_year', ''),
-            'vin':        copying_quote_data.get('client_vin', '')
+            'vin':        copying_quote_data.get('client_vin', ''),
+            'cliente_id': copying_quote_data.get('cliente_id'),
         }
         # Pre-cargar ítems (misma lógica que editing_mode)
         items_copy = copying_quote_data.get('items', [])
         st.session_state.cotizacion_items = []
         for item in items_copy:
-            _costo_fob      = float(item.get('unit_cost', 0) or 0)
-            _costo_handling = float(item.get('international_handling', 0) or 0)
-            _costo_manejo   = float(item.get('national_handling', 0) or 0)
-            _costo_envio    = float(item.get('shipping_cost', 0) or 0)
-            _impuesto_pct   = float(item.get('tax_percentage', 0) or 0)
-            _factor_util    = float(item.get('profit_factor', 1.0) or 1.0)
-            _cantidad       = int(item.get('quantity', 1) or 1)
-            _total_cost     = float(item.get('total_cost', 0) or 0)
-            _fob_total      = _costo_fob * _cantidad
-            _costo_impuesto = _fob_total * (_impuesto_pct / 100)
-            _utilidad_base  = _fob_total + _costo_handling + _costo_manejo + _costo_impuesto
-            _utilidad_valor = _utilidad_base * (_factor_util - 1.0)
-            _aplicar_iva    = bool(item.get('aplicar_iva', False))
-            _iva_porcentaje = float(item.get('iva_porcentaje', 16.0) or 16.0)
-            _iva_valor      = float(item.get('iva_valor', 0) or 0)
-            _precio_bs      = float(item.get('precio_bs', _total_cost) or _total_cost)
-            _precio_usd     = float(item.get('precio_usd', _total_cost) or _total_cost)
+            _d = desglose.del_item(item)
             st.session_state.cotizacion_items.append({
                 'descripcion':            item.get('description', ''),
                 'parte':                  item.get('part_number', ''),
                 'marca':                  item.get('marca', ''),
                 'garantia':               item.get('garantia', ''),
-                'cantidad':               _cantidad,
                 'origen':                 item.get('origen', ''),
                 'envio_tipo':             item.get('envio_tipo', ''),
                 'tiempo_entrega':         item.get('tiempo_entrega', ''),
                 'fabricacion':            item.get('fabricacion', ''),
                 'link':                   item.get('page_url', ''),
-                'costo_fob':              _costo_fob,
-                'costo_handling':         _costo_handling,
-                'costo_manejo':           _costo_manejo,
-                'costo_envio':            _costo_envio,
-                'impuesto_porcentaje':    _impuesto_pct,
-                'factor_utilidad':        _factor_util,
-                'fob_total':              _fob_total,
-                'costo_impuesto':         _costo_impuesto,
-                'utilidad_valor':         _utilidad_valor,
-                'diferencial_valor':      float(item.get('diferencial_valor', 0) or 0),
-                'diferencial_porcentaje': float(item.get('diferencial_porcentaje', 0) or 0),
-                'costo_tax':              float(item.get('costo_tax', 0) or 0),
-                'aplicar_iva':            _aplicar_iva,
-                'iva_porcentaje':         _iva_porcentaje,
-                'iva_valor':              _iva_valor,
-                'costo_unitario':         _costo_fob,
-                'costo_total':            _total_cost,
-                'costo_total_bs':         _precio_bs,
-                'precio_usd':             _precio_usd,
-                'precio_bs':              _precio_bs,
-                'precio_usd_total':       _precio_usd,
+                **{campo: _d[campo] for campo in desglose.CAMPOS_ITEM},
+                'costo_unitario':         _d['costo_fob'],
+                'costo_total':            _d['precio_usd'],
+                'costo_total_bs':         _d['precio_bs'],
+                'precio_usd_total':       _d['precio_usd'],
             })
         st.session_state.copying_data_loaded = True
         # Incrementar reset_key para forzar re-render de los widgets con los datos pre-cargados
@@ -851,13 +764,12 @@ def render_analyst_panel():
         st.markdown("### 📊 Calculadora de Envío")
         st.info("💡 Use esta calculadora para estimar el costo de envío. El resultado es solo una **referencia**.")
         
-        # Mostrar tarifas activas (cargadas desde BD)
-        _t = st.session_state.tarifas
+        # Mostrar tarifas activas (tabla de tarifas en memoria, ver services/pricing/freight.py)
         st.caption(
-            f"📋 Tarifas activas: "
-            f"Miami Aéreo **${_t['mia_a']}/lb** | "
-            f"Miami Marítimo **${_t['mia_m']}/ft³** | "
-            f"Madrid Aéreo **${_t['mad']}/kg**"
+            "📋 Tarifas activas: " + " | ".join(
+                f"{_o} {_tp} **${TarifasFlete.tarifa(_o, _tp)}/{_u.replace('$/', '')}**"
+                for _o, _tp, _u in TarifasFlete.combinaciones()
+            )
         )
         
         # Inicializar contador de reset si no existe
@@ -884,15 +796,26 @@ def render_analyst_panel():
                     
                     total, fact, unidad, pv, es_min = calcular_envio(
                         calc_largo, calc_ancho, calc_alto, calc_peso,
-                        origen_calc, tipo_calc, st.session_state.tarifas
+                        origen_calc, tipo_calc
                     )
                     
+                    # Todas las combinaciones origen/tipo en una sola evaluación
+                    _ev = TarifasFlete.evaluar(calc_largo, calc_ancho, calc_alto, calc_peso)
+                    _mejor = int(_ev['mas_barata'][0])
                     st.session_state.calc_resultado = {
                         'total': total,
                         'facturable': fact,
                         'unidad': unidad,
                         'peso_vol': pv,
-                        'es_minimo': es_min
+                        'es_minimo': es_min,
+                        'opciones': [
+                            {
+                                'Opción': f"{'⭐ ' if j == _mejor else ''}{_o} {_tp}",
+                                'Facturable': f"{_ev['facturable'][0, j]:.2f} {_ev['unidad_facturable'][j]}",
+                                'Costo ($)': round(float(_ev['costo'][0, j]), 2),
+                            }
+                            for j, (_o, _tp, _u) in enumerate(_ev['combinaciones'])
+                        ],
                     }
                 else:
                     st.error("⚠️ Complete todos los campos")
@@ -914,7 +837,93 @@ def render_analyst_panel():
             st.caption(f"⚖️ Peso Vol.: {res['peso_vol']} kg")
             if res['es_minimo']:
                 st.warning("⚠️ Tarifa mínima $25")
+            if res.get('opciones'):
+                st.caption("🚚 Comparativa de opciones (⭐ más barata)")
+                st.dataframe(res['opciones'], hide_index=True, use_container_width=True)
         
+        # ── ENVÍO CONSOLIDADO (services/pricing/packing.py) ──────────────────
+        with st.expander("📦 Envío consolidado", expanded=False):
+            st.caption("Empaca los bultos de la cotización en cajas estándar por origen "
+                       "y compara contra el envío ítem por ítem.")
+            import pandas as _pd
+            _cons_version = st.session_state.get('_consolidado_version', 0)
+            _bultos = _pd.DataFrame(
+                [
+                    {
+                        'Descripción': _it.get('descripcion', ''),
+                        'Origen': _puerto_salida(_it.get('origen')),
+                        'Cantidad': int(_it.get('cantidad') or 1),
+                        'Largo': None, 'Ancho': None, 'Alto': None, 'Peso': None,
+                    }
+                    for _it in st.session_state.get('cotizacion_items', [])
+                ],
+                columns=['Descripción', 'Origen', 'Cantidad', 'Largo', 'Ancho', 'Alto', 'Peso'],
+            )
+            _bultos_editados = st.data_editor(
+                _bultos,
+                key=f"consolidado_editor_{len(_bultos)}_{_cons_version}",
+                hide_index=True,
+                num_rows="dynamic",
+                use_container_width=True,
+                column_config={
+                    'Origen':   st.column_config.SelectboxColumn(
+                        options=sorted({o for o, _, _ in TarifasFlete.combinaciones()}), required=True),
+                    'Cantidad': st.column_config.NumberColumn(min_value=1, step=1),
+                    'Largo':    st.column_config.NumberColumn("L (cm)", min_value=0.0),
+                    'Ancho':    st.column_config.NumberColumn("A (cm)", min_value=0.0),
+                    'Alto':     st.column_config.NumberColumn("H (cm)", min_value=0.0),
+                    'Peso':     st.column_config.NumberColumn("Peso (kg)", min_value=0.0),
+                },
+            )
+            _cc1, _cc2 = st.columns(2)
+            with _cc1:
+                if st.button("📦 Consolidar", use_container_width=True, key="btn_consolidar"):
+                    from services.pricing import consolidar
+                    _paquetes = [
+                        {
+                            'origen': _b.get('Origen'), 'cantidad': _b.get('Cantidad'),
+                            'largo': _b.get('Largo'), 'ancho': _b.get('Ancho'),
+                            'alto': _b.get('Alto'), 'peso': _b.get('Peso'),
+                        }
+                        for _b in _bultos_editados.fillna(0).to_dict('records')
+                    ]
+                    st.session_state.consolidado_resultado = consolidar(_paquetes)
+            with _cc2:
+                if st.button("🧹 Limpiar", use_container_width=True, key="btn_limpiar_consolidado"):
+                    st.session_state['_consolidado_version'] = _cons_version + 1
+                    st.session_state.pop('consolidado_resultado', None)
+
+            _cons = st.session_state.get('consolidado_resultado')
+            if _cons is not None:
+                if not _cons['origenes']:
+                    st.warning("⚠️ Indique medidas (L, A, H) de al menos un bulto")
+                for _origen, _dato in _cons['origenes'].items():
+                    st.markdown(f"**{_origen}** — {len(_dato['cajas'])} caja(s)"
+                                + (f" + {len(_dato['sueltos'])} bulto(s) suelto(s)" if _dato['sueltos'] else ""))
+                    st.caption(f"⚖️ Peso real: {_dato['peso_real']} kg | Peso vol.: {_dato['peso_volumetrico']} kg")
+                    for _c in _dato['cajas']:
+                        st.caption(f"▫️ Caja {_c['caja']} ({_c['largo']}×{_c['ancho']}×{_c['alto']} cm): "
+                                   f"{_c['unidades']} unid., {_c['peso']} kg, {_c['ocupacion']:.0%} ocupada")
+                    st.dataframe(
+                        [
+                            {
+                                'Tipo': f"{'⭐ ' if _op is _dato['mejor'] else ''}{_op['tipo']}",
+                                'Por ítem ($)': _op['individual'],
+                                'Consolidado ($)': _op['consolidado'],
+                                'Ahorro ($)': _op['ahorro'],
+                            }
+                            for _op in _dato['opciones']
+                        ],
+                        hide_index=True, use_container_width=True,
+                    )
+                if _cons['origenes']:
+                    if _cons['ahorro'] > 0:
+                        st.success(f"**💰 Consolidado: ${_cons['consolidado']:.2f}** "
+                                   f"(ahorro ${_cons['ahorro']:.2f} vs ${_cons['individual']:.2f} por ítem)")
+                    else:
+                        st.info(f"Por ítem (${_cons['individual']:.2f}) resulta igual o más barato "
+                                f"que consolidar (${_cons['consolidado']:.2f})")
+
         st.markdown("---")
         st.caption("📌 Copie el monto al campo 'Envío ($)' en el formulario")
     
@@ -972,13 +981,11 @@ def render_analyst_panel():
                             'total_bs':     st.session_state.get('_saved_total_bs', 0),
                             'terminos_condiciones': config.get('terms_conditions', ''),
                         }
-                        _now_b = now_caracas_naive()
-                        _out_dir_b = f'/home/ubuntu/cotizaciones_guardadas/{_now_b.strftime("%Y")}/{_now_b.strftime("%m")}'
-                        os.makedirs(_out_dir_b, exist_ok=True)
                         _pdf_fn_b = f"cotizacion_{st.session_state.saved_quote_number}.pdf"
-                        _pdf_path_b = f"{_out_dir_b}/{_pdf_fn_b}"
-                        if PDFQuoteGenerator.generate(_qdata_b, _pdf_path_b):
-                            with open(_pdf_path_b, 'rb') as _f:
+                        # Render desde DocumentCache + copia durable en DocumentStore
+                        _ref_pdf_b, _rutas_pdf_b = DocumentStore.guardar_pdf(_qdata_b)
+                        if _rutas_pdf_b and os.path.exists(_rutas_pdf_b[0]):
+                            with open(_rutas_pdf_b[0], 'rb') as _f:
                                 st.download_button("📅 Descargar PDF", data=_f, file_name=_pdf_fn_b, mime="application/pdf", use_container_width=True)
                             st.success("✅ PDF generado")
                         else:
@@ -1017,27 +1024,20 @@ def render_analyst_panel():
                             'total_bs':     st.session_state.get('_saved_total_bs', 0),
                             'terminos_condiciones': config.get('terms_conditions', ''),
                         }
-                        import tempfile as _tmpmod_b
-                        _out_dir_b = os.path.join(_tmpmod_b.gettempdir(), 'logipartve_docs')
-                        os.makedirs(_out_dir_b, exist_ok=True)
-                        _png_fn_b = f"cotizacion_{st.session_state.saved_quote_number}.png"
-                        _png_path_b = os.path.join(_out_dir_b, _png_fn_b)
-                        from services.document_generation.png_generator import PNGQuoteGenerator as _PNGGen_b
-                        _png_gen_b = _PNGGen_b()
-                        _result_b = _png_gen_b.generate_quote_png_from_data(_qdata_b, _png_path_b)
-                        if _result_b is None:
+                        _png_fn_b = f"cotizacion_{st.session_state.saved_quote_number}.{extension_rendicion('mensaje')}"
+                        _rutas_b = DocumentCache.imagenes(_qdata_b)
+                        if not _rutas_b:
                             st.error("❌ Error al generar PNG")
                         else:
-                            _rutas_b = [_result_b] if isinstance(_result_b, str) else _result_b
                             if len(_rutas_b) == 1 and os.path.exists(_rutas_b[0]):
                                 with open(_rutas_b[0], 'rb') as _f:
-                                    st.download_button("🖼️ Descargar PNG", data=_f, file_name=_png_fn_b, mime="image/png", use_container_width=True)
+                                    st.download_button("🖼️ Descargar Imagen", data=_f, file_name=_png_fn_b, mime=mime_rendicion('mensaje'), use_container_width=True)
                                 st.success("✅ PNG generado")
                             elif len(_rutas_b) > 1:
                                 for _pi_b, _ruta_b in enumerate(_rutas_b, 1):
-                                    _fn_b_pi = f"cotizacion_{st.session_state.saved_quote_number}_p{_pi_b}.png"
+                                    _fn_b_pi = f"cotizacion_{st.session_state.saved_quote_number}_p{_pi_b}.{extension_rendicion('mensaje')}"
                                     with open(_ruta_b, 'rb') as _f:
-                                        st.download_button(f"🖼️ PNG Pág. {_pi_b}", data=_f, file_name=_fn_b_pi, mime="image/png", use_container_width=True, key=f"dl_blind_png_p{_pi_b}")
+                                        st.download_button(f"🖼️ Imagen Pág. {_pi_b}", data=_f, file_name=_fn_b_pi, mime=mime_rendicion('mensaje'), use_container_width=True, key=f"dl_blind_png_p{_pi_b}")
                                 st.success(f"✅ PNG generado ({len(_rutas_b)} páginas)")
                             else:
                                 st.error("❌ Error al generar PNG")
@@ -1117,38 +1117,31 @@ def render_analyst_panel():
                         'total_bs':          st.session_state.get('_saved_total_bs', 0),
                         'terminos_condiciones': config.get('terms_conditions', 'Términos y condiciones estándar.'),
                     }
-                    import tempfile as _tmpmod_po
-                    _tmp_dir_po  = os.path.join(_tmpmod_po.gettempdir(), 'logipartve_docs')
-                    os.makedirs(_tmp_dir_po, exist_ok=True)
-                    _png_fn_po   = f"cotizacion_{st.session_state.saved_quote_number}_divisas.png"
-                    _png_path_po = os.path.join(_tmp_dir_po, _png_fn_po)
-                    from services.document_generation.png_generator import PNGQuoteGenerator as _PNGGenPO
-                    _png_gen_po = _PNGGenPO()
-                    _result_po  = _png_gen_po.generate_quote_png_divisas(_quote_data_po, _png_path_po)
-                    if _result_po is None:
+                    _png_fn_po   = f"cotizacion_{st.session_state.saved_quote_number}_divisas.{extension_rendicion('mensaje')}"
+                    _rutas_po    = DocumentCache.imagenes(_quote_data_po, modo_divisas=True)
+                    if not _rutas_po:
                         st.error("❌ Error al generar PNG Precio Optimizado")
                     else:
-                        _rutas_po = [_result_po] if isinstance(_result_po, str) else _result_po
                         if len(_rutas_po) == 1:
                             with open(_rutas_po[0], 'rb') as _f:
                                 st.download_button(
-                                    label="💵 Descargar PNG Precio Optimizado",
+                                    label="💵 Descargar Imagen Precio Optimizado",
                                     data=_f,
                                     file_name=_png_fn_po,
-                                    mime="image/png",
+                                    mime=mime_rendicion('mensaje'),
                                     use_container_width=True,
                                     key="dl_png_po_blindaje"
                                 )
                             st.success("✅ PNG Precio Optimizado generado correctamente.")
                         else:
                             for _pi_po, _ruta_pi_po in enumerate(_rutas_po, 1):
-                                _fn_pi_po = f"cotizacion_{st.session_state.saved_quote_number}_divisas_p{_pi_po}.png"
+                                _fn_pi_po = f"cotizacion_{st.session_state.saved_quote_number}_divisas_p{_pi_po}.{extension_rendicion('mensaje')}"
                                 with open(_ruta_pi_po, 'rb') as _f:
                                     st.download_button(
                                         label=f"💵 Descargar Precio Optimizado — Pág. {_pi_po}",
                                         data=_f,
                                         file_name=_fn_pi_po,
-                                        mime="image/png",
+                                        mime=mime_rendicion('mensaje'),
                                         use_container_width=True,
                                         key=f"dl_png_po_blindaje_p{_pi_po}"
                                     )
@@ -1568,7 +1561,7 @@ def render_analyst_panel():
             if _is_admin_here:
                 st.warning(
                     f"⚠️ Se detectaron **{_total_dups} registros duplicados** "
-                    f"(misma cédula y teléfono):\n\n{_dup_detail}\n\n"
+                    f"(por cédula, teléfono o nombre similar):\n\n{_dup_detail}\n\n"
                     f"Elimina el sobrante usando el botón de abajo."
                 )
                 # Botones de eliminación directa para cada duplicado
@@ -1602,7 +1595,7 @@ def render_analyst_panel():
             else:
                 st.warning(
                     f"⚠️ Se detectaron **{_total_dups} registros duplicados** en la base de datos "
-                    f"(misma cédula y teléfono). El administrador puede eliminarlos desde el panel."
+                    f"(por cédula, teléfono o nombre similar). El administrador puede eliminarlos desde el panel."
                 )
 
         cliente_telefono = st.text_input("Teléfono", value=default_telefono, key=f"cliente_telefono_{reset_key}", on_change=_autosave_draft)
@@ -2206,70 +2199,44 @@ def render_analyst_panel():
     # ==========================================
     st.markdown("### 📊 Cálculos Automáticos")
     
-    # PASO 1: FOB TOTAL = FOB × Cantidad
-    # Según Excel: Z20 = Y20 * S20
-    fob_total = costo_fob * item_cantidad
-    
-    # PASO 2: IMPUESTO INTERNACIONAL = FOB_TOTAL × %
-    # Según Excel: AC20 = Z20 * AC16
-    costo_impuesto_total = fob_total * (impuesto_porcentaje / 100)
-    
-    # PASO 3: UTILIDAD = (FOB_TOTAL × Factor) - FOB_TOTAL
-    # Según Excel: AD20 = (Z20 * 1.4285) - Z20
-    if factor_utilidad > 0:
-        utilidad_total = (fob_total * factor_utilidad) - fob_total
-    else:
-        utilidad_total = 0
-    
-    # PASO 4: BASE TAX = FOB_TOTAL + Handling + Manejo + Impuesto + Utilidad + Envío
-    # Según Excel: AF20 = (Z20 + AA20 + AB20 + AC20 + AD20 + AE20) * 7%
-    base_tax_total = fob_total + costo_handling + costo_manejo + costo_impuesto_total + utilidad_total + costo_envio
-    costo_tax_total = base_tax_total * (tax_porcentaje / 100)
-    
-    # PASO 5: PRECIO USD TOTAL (sin diferencial)
-    # Según Excel: Z20 + AA20 + AB20 + AC20 + AD20 + AE20 + AF20
-    precio_usd_total = fob_total + costo_handling + costo_manejo + costo_impuesto_total + utilidad_total + costo_envio + costo_tax_total
-    
-    # PASO 6: DIFERENCIAL = PRECIO_USD_TOTAL × % × Factor_Y30
-    # Según Excel: AG20 = (Z20 + AA20 + AB20 + AD20 + AE20 + AC20 + AF20) * Y30
-    # Nota: Y30 es el factor de diferencial (45% = 0.45)
-    diferencial_total = precio_usd_total * (diferencial_porcentaje / 100)
-    
-    # PASO 7: PRECIO Bs TOTAL (sin IVA) = PRECIO_USD_TOTAL + DIFERENCIAL
-    # Según Excel: AH20 = Z20 + AA20 + AB20 + AD20 + AE20 + AG20 + AC20 + AF20
-    precio_bs_total_sin_iva = precio_usd_total + diferencial_total
-    
-    # PASO 8: IVA VENEZUELA (solo si el analista seleccionó SÍ)
-    if aplicar_iva == "SÍ":
-        iva_total = precio_bs_total_sin_iva * (iva_porcentaje / 100)
-        precio_bs_total = precio_bs_total_sin_iva + iva_total
-    else:
-        iva_total = 0
-        precio_bs_total = precio_bs_total_sin_iva
-
-    # PASO 9: REDONDEO AL MÚLTIPLO DE 5 MÁS CERCANO HACIA ARRIBA (solo precio USD total)
-    # Ejemplo: $198.22 → $200.00  |  $201.01 → $205.00  |  $200.00 → $200.00
-    import math as _math
-    _multiplo = 5
-    precio_usd_total_redondeado = _math.ceil(precio_usd_total / _multiplo) * _multiplo
-    redondeo_total = precio_usd_total_redondeado - precio_usd_total  # siempre >= 0
+    # Cadena de 9 pasos (FOB total → impuesto → utilidad → TAX → precio USD →
+    # diferencial → precio Bs → IVA → redondeo ×5) en el motor de precios,
+    # con redondeo exacto al centavo. Ver services/pricing/engine.py.
+    _calc = calcular_item(
+        cantidad=item_cantidad,
+        costo_fob=costo_fob,
+        costo_handling=costo_handling,
+        costo_manejo=costo_manejo,
+        costo_envio=costo_envio,
+        impuesto_porcentaje=impuesto_porcentaje,
+        factor_utilidad=factor_utilidad,
+        tax_porcentaje=tax_porcentaje,
+        diferencial_porcentaje=diferencial_porcentaje,
+        aplicar_iva=aplicar_iva == "SÍ",
+        iva_porcentaje=iva_porcentaje,
+    )
+    fob_total = _calc['fob_total']
+    costo_impuesto_total = _calc['costo_impuesto']
+    costo_tax_total = _calc['costo_tax']
+    diferencial_total = _calc['diferencial_valor']
+    iva_total = _calc['iva_valor']
+    precio_bs_total = _calc['precio_bs']
+    precio_usd_total_redondeado = _calc['precio_usd']
+    redondeo_total = _calc['redondeo_valor']
     # El diferencial de redondeo se suma visualmente a la utilidad (no modifica el factor)
-    utilidad_total_con_redondeo = utilidad_total + redondeo_total
-
-    # Factor real de utilidad (back-calculate con redondeo incluido)
-    # factor_real = precio_usd_redondeado / fob_total  (solo informativo, no modifica nada)
-    factor_real = round(precio_usd_total_redondeado / fob_total, 4) if fob_total > 0 else factor_utilidad
-
-    # Calcular valores UNITARIOS para mostrar
-    costo_impuesto = costo_impuesto_total / item_cantidad if item_cantidad > 0 else 0
-    utilidad_calculada = utilidad_total_con_redondeo / item_cantidad if item_cantidad > 0 else 0
-    costo_tax = costo_tax_total / item_cantidad if item_cantidad > 0 else 0
-    diferencial_valor = diferencial_total / item_cantidad if item_cantidad > 0 else 0
-    iva_valor = iva_total / item_cantidad if item_cantidad > 0 else 0
-    redondeo_unitario = redondeo_total / item_cantidad if item_cantidad > 0 else 0
-    precio_usd = precio_usd_total_redondeado / item_cantidad if item_cantidad > 0 else 0
-    precio_bs = precio_bs_total / item_cantidad if item_cantidad > 0 else 0
-    precio_bs_sin_iva = precio_bs_total_sin_iva / item_cantidad if item_cantidad > 0 else 0
+    utilidad_total_con_redondeo = _calc['utilidad_valor']
+    # Factor real de utilidad con redondeo incluido (solo informativo)
+    factor_real = _calc['factor_real']
+
+    # Valores UNITARIOS para mostrar
+    costo_impuesto = _calc['costo_impuesto_unitario']
+    utilidad_calculada = _calc['utilidad_valor_unitario']
+    costo_tax = _calc['costo_tax_unitario']
+    diferencial_valor = _calc['diferencial_valor_unitario']
+    iva_valor = _calc['iva_valor_unitario']
+    redondeo_unitario = _calc['redondeo_valor_unitario']
+    precio_usd = _calc['precio_usd_unitario']
+    precio_bs = _calc['precio_bs_unitario']
     
     # Mostrar cálculos intermedios
     if aplicar_iva == "SÍ":
@@ -2407,7 +2374,7 @@ def render_analyst_panel():
                     
                     if editing_item:
                         # ACTUALIZAR ítem existente en session_state
-                        st.session_state.cotizacion_items[editing_item_index] = nuevo_item
+                        _totales_sesion().reemplazar(st.session_state.cotizacion_items, editing_item_index, nuevo_item)
                         # Limpiar estado de edición
                         if 'editing_item_index' in st.session_state:
                             del st.session_state.editing_item_index
@@ -2436,7 +2403,7 @@ def render_analyst_panel():
                         # AGREGAR nuevo ítem — sin límite (multi-página automático)
                         if not hasattr(st.session_state.cotizacion_items, 'append'):
                             st.session_state.cotizacion_items = []
-                        st.session_state.cotizacion_items.append(nuevo_item)
+                        _totales_sesion().agregar(st.session_state.cotizacion_items, nuevo_item)
                         st.session_state.item_agregado_msg = f"✅ Ítem #{len(st.session_state.cotizacion_items)} agregado. Puede agregar otro."
                     
                     # Limpiar campos del ítem para el siguiente (mantener datos del cliente)
@@ -2556,7 +2523,7 @@ def render_analyst_panel():
 
                         if _editing_item_idx_activo is not None:
                             # Estaba editando un ítem específico → reemplazarlo en su posición
-                            st.session_state.cotizacion_items[_editing_item_idx_activo] = nuevo_item
+                            _totales_sesion().reemplazar(st.session_state.cotizacion_items, _editing_item_idx_activo, nuevo_item)
                             if 'editing_item_index' in st.session_state:
                                 del st.session_state['editing_item_index']
                             if 'editing_item_data' in st.session_state:
@@ -2575,13 +2542,13 @@ def render_analyst_panel():
                                     break
                             if _idx_coincide is not None:
                                 # Reemplazar el ítem coincidente con los datos actualizados
-                                st.session_state.cotizacion_items[_idx_coincide] = nuevo_item
+                                _totales_sesion().reemplazar(st.session_state.cotizacion_items, _idx_coincide, nuevo_item)
                             else:
                                 # Es un ítem genuinamente nuevo — agregarlo
-                                st.session_state.cotizacion_items.append(nuevo_item)
+                                _totales_sesion().agregar(st.session_state.cotizacion_items, nuevo_item)
                         else:
                             # Modo creación normal → siempre agregar
-                            st.session_state.cotizacion_items.append(nuevo_item)
+                            _totales_sesion().agregar(st.session_state.cotizacion_items, nuevo_item)
 
                     # Guardar datos del cliente limpiando caracteres de control
                     def _clean(v):
@@ -2608,6 +2575,9 @@ def render_analyst_panel():
                     # Solo si el nombre es real (letras, no números ni alias)
                     try:
                         _resultado_cliente = guardar_o_actualizar(st.session_state.cliente_datos)
+                        # Vínculo quotes.cliente_id: se guarda junto con la cotización
+                        if _resultado_cliente.get('cliente_id'):
+                            st.session_state.cliente_datos['cliente_id'] = _resultado_cliente['cliente_id']
                         if _resultado_cliente['accion'] == 'creado':
                             print(f"✅ Cliente nuevo registrado: {st.session_state.cliente_datos.get('nombre')}")
                         elif _resultado_cliente['accion'] == 'actualizado':
@@ -2631,6 +2601,9 @@ def render_analyst_panel():
                             
                             if success:
                                 st.success("✅ Cotización actualizada correctamente en la base de datos")
+                                # Pre-render en segundo plano del juego de documentos
+                                from services.render_queue import RenderQueue
+                                RenderQueue.encolar_cotizacion(editing_quote_id)
                                 # Capturar número e ID ANTES de limpiar el session_state
                                 _saved_quote_number = st.session_state.get('editing_quote_number', '')
                                 _saved_quote_id     = editing_quote_id
@@ -2703,8 +2676,6 @@ def render_analyst_panel():
         st.markdown("---")
         st.markdown("### 📋 Ítems Agregados")
         
-        total_general_usd = 0
-        total_general_bs = 0
         for i, item in enumerate(st.session_state.cotizacion_items):
             with st.expander(f"Ítem #{i+1}: {item['descripcion']}", expanded=False):
                 col1, col2, col3 = st.columns(3)
@@ -2744,21 +2715,13 @@ def render_analyst_panel():
                 
                 # Botón para eliminar ítem
                 if st.button(f"🗑️ Eliminar Ítem #{i+1}", key=f"del_item_{i}"):
-                    st.session_state.cotizacion_items.pop(i)
+                    _totales_sesion().quitar(st.session_state.cotizacion_items, i)
                     st.rerun()
-            
-            # Manejar valores None o strings en totales
-            try:
-                total_general_usd += float(item.get('costo_total', 0)) if item.get('costo_total') else 0.0
-            except (ValueError, TypeError):
-                total_general_usd += 0.0
-            
-            try:
-                total_bs_item = item.get('costo_total_bs', item.get('costo_total', 0))
-                total_general_bs += float(total_bs_item) if total_bs_item else 0.0
-            except (ValueError, TypeError):
-                total_general_bs += 0.0
         
+        # Totales mantenidos ítem a ítem (O(1) por rerun)
+        _totales_resumen = _totales_sesion().totales(st.session_state.cotizacion_items)
+        total_general_usd = _totales_resumen['total_usd']
+        total_general_bs = _totales_resumen['total_bs']
         st.markdown("---")
         st.success(f"**💵 TOTAL USD: ${total_general_usd:.2f}** | **🇻🇪 TOTAL Bs: ${total_general_bs:.2f}**")
     
@@ -2809,8 +2772,6 @@ def render_analyst_panel():
         st.markdown("---")
         
         # Tabla de ítems
-        total_cotizacion_usd = 0
-        total_cotizacion_bs = 0
         hay_iva = False
         for i, item in enumerate(items):
             st.markdown(f"**Ítem #{i+1}:** {item['descripcion']}")
@@ -2833,92 +2794,25 @@ def render_analyst_panel():
                 else:
                     st.write(f"**🇻🇪 Bs: ${item.get('precio_bs', item['costo_total']):.2f}**")
             
-            total_cotizacion_usd += item['costo_total']
-            total_cotizacion_bs += item.get('costo_total_bs', item['costo_total'])
             st.markdown("---")
         
-        # Calcular totales correctos
-        # IMPORTANTE: Los valores ya vienen calculados con cantidad desde el ítem
-        sub_total = 0
-        iva_total = 0
-        abona_ya = 0
-        total_usd_divisas = 0
-        usd_abono = 0
-        
-        for item in items:
-            cantidad = item.get('cantidad', 1)
-            
-            # Sub-Total = precio_bs del ítem (precio con diferencial, sin IVA)
-            # IMPORTANTE: usar precio_bs es la única fuente de verdad correcta porque:
-            # 1. Es exactamente lo que el PDF muestra en la columna TOTAL de cada ítem
-            # 2. Garantiza que UNIT + TOTAL + SUBTOTAL siempre cuadren entre sí
-            # 3. Evita discrepancias cuando los campos individuales (fob_total, costo_tax, etc.)
-            #    no están guardados en la BD (cotizaciones antiguas)
-            _precio_bs_item = float(item.get('precio_bs', 0) or item.get('costo_total_bs', 0) or item.get('costo_total', 0) or 0)
-            sub_total += _precio_bs_item
-            
-            # IVA - YA VIENE CALCULADO CON CANTIDAD
-            if item.get('aplicar_iva', False):
-                iva_total += item.get('iva_valor', 0)
-            
-            # Abona Ya = (costos base SIN envío ni diferencial) × (1 + diferencial%)
-            # Según Excel: P34 = (Z29+AA29+AB29+AC29+AD29+AF29) + (Z30+AA30+AB30+AC30+AD30+AF30)
-            # Donde fila 30 = fila 29 × Y30 (factor diferencial)
-            costos_base_item = (
-                item.get('fob_total', 0) +
-                item.get('costo_handling', 0) +
-                item.get('costo_manejo', 0) +
-                item.get('costo_impuesto', 0) +
-                item.get('utilidad_valor', 0) +
-                item.get('costo_tax', 0)
-            )
-            # Multiplicar por (1 + diferencial%) para obtener Abona Ya
-            diferencial_factor = item.get('diferencial_porcentaje', 0) / 100
-            abona_item = costos_base_item * (1 + diferencial_factor)
-            abona_ya += abona_item
-            
-            # Total USD Divisas (costos base CON envío) - YA VIENEN CALCULADOS CON CANTIDAD
-            total_usd_item = (
-                item.get('fob_total', 0) +
-                item.get('costo_handling', 0) +
-                item.get('costo_manejo', 0) +
-                item.get('costo_impuesto', 0) +
-                item.get('utilidad_valor', 0) +
-                item.get('costo_envio', 0) +
-                item.get('costo_tax', 0)
-            )
-            total_usd_divisas += total_usd_item
-            
-            # USD Abono = costos base SIN envío ni TAX (lo que se cobra por adelantado en USD)
-            # USD Entrega = Envío + TAX (lo que se cobra al momento de la entrega en USD)
-            usd_abono_item = (
-                item.get('fob_total', 0) +
-                item.get('costo_handling', 0) +
-                item.get('costo_manejo', 0) +
-                item.get('costo_impuesto', 0) +
-                item.get('utilidad_valor', 0)
-            )
-            usd_abono += usd_abono_item
-        
-        # Total a Pagar
-        total_a_pagar = sub_total + iva_total
-        
-        # Y en la Entrega (Bs)
-        y_en_entrega = total_a_pagar - abona_ya
-        
-        # Y en la Entrega USD = Total USD - USD Abono (equivale a Envío + TAX de todos los ítems)
-        # REDONDEO USD: TANTO total_usd_divisas COMO usd_abono se redondean al múltiplo de 5
-        # hacia arriba para que sean consistentes con el cuadro de costos, el PDF divisas
-        # y el mensaje WhatsApp. usd_entrega = diferencia para que la suma cuadre exactamente.
-        # CORRECCIÓN (orden 2026-30367-A): antes solo se redondeaba usd_abono, no el total.
-        import math as _math
-        total_usd_divisas = _math.ceil(total_usd_divisas / 5) * 5 if total_usd_divisas > 0 else 0.0
-        usd_abono = _math.ceil(usd_abono / 5) * 5
-        usd_entrega = total_usd_divisas - usd_abono
-        # Si usd_entrega quedó negativo (caso extremo: abono > total), ajustar
-        if usd_entrega < 0:
-            usd_abono = total_usd_divisas
-            usd_entrega = 0
+        # Totales de la cotización (motor de precios, exactos al centavo).
+        # Sub-Total = Σ precio Bs sin IVA; Abona Ya = (costos base SIN envío ni
+        # diferencial) × (1 + diferencial%), igual que P34 del Excel. Total USD
+        # y USD Abono se redondean al múltiplo de 5 hacia arriba para que
+        # coincidan con el cuadro de costos, el PDF divisas y el mensaje
+        # WhatsApp (orden 2026-30367-A).
+        _totales = _totales_sesion().totales(items)
+        total_cotizacion_usd = _totales['total_usd']
+        total_cotizacion_bs = _totales['total_bs']
+        sub_total = _totales['sub_total']
+        iva_total = _totales['iva_total']
+        total_a_pagar = _totales['total_a_pagar']
+        abona_ya = _totales['abona_ya']
+        y_en_entrega = _totales['y_en_entrega']
+        total_usd_divisas = _totales['total_usd_divisas']
+        usd_abono = _totales['usd_abono']
+        usd_entrega = _totales['usd_entrega']
         
         # Mostrar totales
         st.markdown("### 📊 Totales de la Cotización")
@@ -3205,10 +3099,13 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                                 'iva_total': iva_total,
                                 'abona_ya': abona_ya,
                                 'en_entrega': y_en_entrega,
+                                'desglose': desglose.desglose_totales(_totales),
                                 'terms_conditions': config.get('terms_conditions', ''),
                                 'pdf_path': '',  # Se actualizará cuando se regenere el PDF
                                 'jpeg_path': ''  # Se actualizará cuando se regenere el PNG
                             }
+                            if cliente.get('cliente_id'):
+                                quote_data['cliente_id'] = cliente['cliente_id']
                             
                             print(f"📊 DEBUG - Llamando a DBManager.update_quote()...")
                             # Actualizar cotización en base de datos
@@ -3296,10 +3193,12 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                                     'iva_total': iva_total,
                                     'abona_ya': abona_ya,
                                     'en_entrega': y_en_entrega,
+                                    'desglose': desglose.desglose_totales(_totales),
                                     'terms_conditions': config.get('terms_conditions', ''),
                                     'status': 'draft',
                                     'pdf_path': '',  # Se actualizará cuando se genere el PDF
-                                    'jpeg_path': ''  # Se actualizará cuando se genere el PNG
+                                    'jpeg_path': '',  # Se actualizará cuando se genere el PNG
+                                    'cliente_id': cliente.get('cliente_id'),
                                 }
                                 
                                 print(f"📊 DEBUG - Llamando a DBManager.save_quote()...")
@@ -3331,6 +3230,12 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                                         )
                                         DBManager.log_activity(user_id, 'quote_created', _activity_detail)
 
+                                        # Pre-render en segundo plano (PDF BCV/divisas, PNG,
+                                        # cuadro de costos); si la cola está llena se generan
+                                        # al pedirlos
+                                        from services.render_queue import RenderQueue
+                                        RenderQueue.encolar_cotizacion(quote_id)
+
                                         # Registrar en auditoría si es una copia
                                         if _copy_origin:
                                             try:
@@ -3371,48 +3276,16 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                                         # ══ GUARDAR TOTALES PARA EL PANEL DE BLINDAJE ══
                                         # Estos valores se usan en los botones PDF/PNG del panel
                                         # de éxito que reemplaza al formulario post-guardado.
-                                        try:
-                                            import math as _math_save
-                                            # Recalcular usd_abono y usd_entrega con redondeo
-                                            # para que el mensaje USD del panel blindaje muestre
-                                            # siempre múltiplos de 5
-                                            _usd_abono_raw = sum(
-                                                it.get('fob_total', 0) +
-                                                it.get('costo_handling', 0) +
-                                                it.get('costo_manejo', 0) +
-                                                it.get('costo_impuesto', 0) +
-                                                it.get('utilidad_valor', 0)
-                                                for it in items
-                                            )
-                                            _total_usd_div = sum(
-                                                it.get('fob_total', 0) +
-                                                it.get('costo_handling', 0) +
-                                                it.get('costo_manejo', 0) +
-                                                it.get('costo_impuesto', 0) +
-                                                it.get('utilidad_valor', 0) +
-                                                it.get('costo_envio', 0) +
-                                                it.get('costo_tax', 0)
-                                                for it in items
-                                            )
-                                            _total_usd_div_r = _math_save.ceil(_total_usd_div / 5) * 5
-                                            _usd_abono_r     = _math_save.ceil(_usd_abono_raw / 5) * 5
-                                            _usd_entrega_r   = _total_usd_div_r - _usd_abono_r
-                                            if _usd_entrega_r < 0:
-                                                _usd_abono_r   = _total_usd_div_r
-                                                _usd_entrega_r = 0
-
-                                            st.session_state['_saved_sub_total']     = sub_total
-                                            st.session_state['_saved_iva_total']     = iva_total
-                                            st.session_state['_saved_total_a_pagar'] = total_a_pagar
-                                            st.session_state['_saved_abona_ya']      = abona_ya
-                                            st.session_state['_saved_y_en_entrega']  = y_en_entrega
-                                            st.session_state['_saved_total_usd']     = _total_usd_div_r
-                                            st.session_state['_saved_total_bs']      = total_cotizacion_bs
-                                            # Valores redondeados para el mensaje USD del panel blindaje
-                                            st.session_state['_saved_usd_abono']     = _usd_abono_r
-                                            st.session_state['_saved_usd_entrega']   = _usd_entrega_r
-                                        except Exception:
-                                            pass
+                                        st.session_state['_saved_sub_total']     = sub_total
+                                        st.session_state['_saved_iva_total']     = iva_total
+                                        st.session_state['_saved_total_a_pagar'] = total_a_pagar
+                                        st.session_state['_saved_abona_ya']      = abona_ya
+                                        st.session_state['_saved_y_en_entrega']  = y_en_entrega
+                                        st.session_state['_saved_total_usd']     = total_usd_divisas
+                                        st.session_state['_saved_total_bs']      = total_cotizacion_bs
+                                        # Valores redondeados para el mensaje USD del panel blindaje
+                                        st.session_state['_saved_usd_abono']     = usd_abono
+                                        st.session_state['_saved_usd_entrega']   = usd_entrega
                                         # ═════════════════════════════════════════════
 
                                         st.rerun()
@@ -3470,20 +3343,13 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                             'terminos_condiciones': config.get('terms_conditions', 'Términos y condiciones estándar.')
                         }
                         
-                        # Generar PDF en carpeta permanente
-                        # Crear estructura de carpetas: /home/ubuntu/cotizaciones_guardadas/YYYY/MM/
-                        now = now_caracas_naive()
-                        year = now.strftime("%Y")
-                        month = now.strftime("%m")
-                        
-                        output_dir = f'/home/ubuntu/cotizaciones_guardadas/{year}/{month}'
-                        os.makedirs(output_dir, exist_ok=True)
-                        
-                        # Ruta completa del archivo PDF
+                        # Generar PDF y guardarlo en almacenamiento durable (DocumentStore).
+                        # El render sale de DocumentCache: no se repite si la cotización
+                        # no cambió. En BD se guarda la referencia doc://, no una ruta.
                         pdf_filename = f"cotizacion_{st.session_state.saved_quote_number}.pdf"
-                        pdf_path = f"{output_dir}/{pdf_filename}"
-                        
-                        result = PDFQuoteGenerator.generate(quote_data, pdf_path)
+                        pdf_ref, _rutas_pdf = DocumentStore.guardar_pdf(quote_data)
+                        pdf_path = _rutas_pdf[0] if _rutas_pdf else ''
+                        result = bool(pdf_path) and os.path.exists(pdf_path)
                         
                         if result:
                             # Actualizar ruta del PDF en la base de datos
@@ -3495,11 +3361,11 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                                 if is_postgres:
                                     cursor.execute("""
                                         UPDATE quotes SET pdf_path = %s WHERE id = %s
-                                    """, (pdf_path, st.session_state.saved_quote_id))
+                                    """, (pdf_ref, st.session_state.saved_quote_id))
                                 else:
                                     cursor.execute("""
                                         UPDATE quotes SET pdf_path = ? WHERE id = ?
-                                    """, (pdf_path, st.session_state.saved_quote_id))
+                                    """, (pdf_ref, st.session_state.saved_quote_id))
                                 
                                 conn.commit()
                                 cursor.close()
@@ -3514,7 +3380,7 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                                     mime="application/pdf",
                                     use_container_width=True
                                 )
-                            st.success(f"✅ PDF generado y guardado en: {pdf_path}")
+                            st.success(f"✅ PDF generado y guardado en: {pdf_ref}")
                         else:
                             st.error("❌ Error al generar PDF")
                     except Exception as e:
@@ -3558,28 +3424,19 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                             'terminos_condiciones': config.get('terms_conditions', 'Términos y condiciones estándar.')
                         }
                         
-                        # Generar PNG en directorio temporal (compatible con Streamlit Cloud)
-                        import tempfile as _tmpmod
-                        _tmp_dir_png = os.path.join(_tmpmod.gettempdir(), 'logipartve_docs')
-                        os.makedirs(_tmp_dir_png, exist_ok=True)
-                        
-                        # Ruta base del archivo PNG
-                        png_filename = f"cotizacion_{st.session_state.saved_quote_number}.png"
-                        png_path = os.path.join(_tmp_dir_png, png_filename)
+                        # Generar miniatura + imagen para mensajería en DocumentCache (una
+                        # cotización sin cambios no se re-renderiza) y publicarlas en el
+                        # almacenamiento durable
+                        png_filename = f"cotizacion_{st.session_state.saved_quote_number}.{extension_rendicion('mensaje')}"
+                        _ref_png, _rutas_png = DocumentStore.guardar_imagenes(quote_data)['mensaje']
                         
-                        png_gen = PNGQuoteGenerator()
-                        result = png_gen.generate_quote_png_from_data(quote_data, png_path)
-                        
-                        # result puede ser str (1 pág), list[str] (multi-pág) o None
-                        if result is None:
+                        if not _rutas_png:
                             st.error("❌ Error al generar PNG")
                         else:
-                            # Normalizar a lista
-                            _rutas_png = [result] if isinstance(result, str) else result
                             _primera_ruta = _rutas_png[0] if _rutas_png else None
                             
                             if _primera_ruta and os.path.exists(_primera_ruta):
-                                # Guardar primera ruta en BD (compatibilidad)
+                                # Guardar la referencia durable (doc://) en BD
                                 if st.session_state.get('saved_quote_id'):
                                     conn = DBManager.get_connection()
                                     cursor = conn.cursor()
@@ -3587,11 +3444,11 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                                     if is_postgres:
                                         cursor.execute(
                                             "UPDATE quotes SET jpeg_path = %s WHERE id = %s",
-                                            (_primera_ruta, st.session_state.saved_quote_id))
+                                            (_ref_png, st.session_state.saved_quote_id))
                                     else:
                                         cursor.execute(
                                             "UPDATE quotes SET jpeg_path = ? WHERE id = ?",
-                                            (_primera_ruta, st.session_state.saved_quote_id))
+                                            (_ref_png, st.session_state.saved_quote_id))
                                     conn.commit()
                                     cursor.close()
                                     conn.close()
@@ -3600,22 +3457,22 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                                 if len(_rutas_png) == 1:
                                     with open(_rutas_png[0], 'rb') as f:
                                         st.download_button(
-                                            label="🖼️ Descargar PNG",
+                                            label="🖼️ Descargar Imagen",
                                             data=f,
                                             file_name=png_filename,
-                                            mime="image/png",
+                                            mime=mime_rendicion('mensaje'),
                                             use_container_width=True
                                         )
                                     st.success("✅ PNG generado correctamente.")
                                 else:
                                     for _pi, _ruta_pi in enumerate(_rutas_png, 1):
-                                        _fn_pi = f"cotizacion_{st.session_state.saved_quote_number}_p{_pi}.png"
+                                        _fn_pi = f"cotizacion_{st.session_state.saved_quote_number}_p{_pi}.{extension_rendicion('mensaje')}"
                                         with open(_ruta_pi, 'rb') as f:
                                             st.download_button(
-                                                label=f"🖼️ Descargar PNG — Pág. {_pi}",
+                                                label=f"🖼️ Descargar Imagen — Pág. {_pi}",
                                                 data=f,
                                                 file_name=_fn_pi,
-                                                mime="image/png",
+                                                mime=mime_rendicion('mensaje'),
                                                 use_container_width=True,
                                                 key=f"dl_png_p{_pi}"
                                             )
@@ -3676,40 +3533,32 @@ Cash | Zelle | Binance | Depósito Bancario Cta Divisas 🤝"""
                             'terminos_condiciones': config.get('terms_conditions', 'Términos y condiciones estándar.')
                         }
 
-                        import tempfile as _tmpmod_div
-                        _tmp_dir_div  = os.path.join(_tmpmod_div.gettempdir(), 'logipartve_docs')
-                        os.makedirs(_tmp_dir_div, exist_ok=True)
-                        _png_fn_div   = f"cotizacion_{st.session_state.saved_quote_number}_divisas.png"
-                        _png_path_div = os.path.join(_tmp_dir_div, _png_fn_div)
-
-                        from services.document_generation.png_generator import PNGQuoteGenerator as _PNGGenDiv
-                        _png_gen_div = _PNGGenDiv()
-                        _result_div  = _png_gen_div.generate_quote_png_divisas(quote_data_div, _png_path_div)
+                        _png_fn_div   = f"cotizacion_{st.session_state.saved_quote_number}_divisas.{extension_rendicion('mensaje')}"
+                        _rutas_div    = DocumentCache.imagenes(quote_data_div, modo_divisas=True)
 
-                        if _result_div is None:
+                        if not _rutas_div:
                             st.error("❌ Error al generar PNG Precio Optimizado")
                         else:
-                            _rutas_div = [_result_div] if isinstance(_result_div, str) else _result_div
                             if len(_rutas_div) == 1:
                                 with open(_rutas_div[0], 'rb') as _f:
                                     st.download_button(
-                                        label="💵 Descargar PNG Precio Optimizado",
+                                        label="💵 Descargar Imagen Precio Optimizado",
                                         data=_f,
                                         file_name=_png_fn_div,
-                                        mime="image/png",
+                                        mime=mime_rendicion('mensaje'),
                                         use_container_width=True,
                                         key="dl_png_divisas"
                                     )
                                 st.success("✅ PNG Precio Optimizado generado correctamente.")
                             else:
                                 for _pi_d, _ruta_pi_d in enumerate(_rutas_div, 1):
-                                    _fn_pi_d = f"cotizacion_{st.session_state.saved_quote_number}_divisas_p{_pi_d}.png"
+                                    _fn_pi_d = f"cotizacion_{st.session_state.saved_quote_number}_divisas_p{_pi_d}.{extension_rendicion('mensaje')}"
                                     with open(_ruta_pi_d, 'rb') as _f:
                                         st.download_button(
                                             label=f"💵 Descargar Precio Optimizado — Pág. {_pi_d}",
                                             data=_f,
                                             file_name=_fn_pi_d,
-                                            mime="image/png",
+                                            mime=mime_rendicion('mensaje'),
                                             use_container_width=True,
                                             key=f"dl_png_divisas_p{_pi_d}"
                                         )
@@ -12,10 +12,27 @@ import streamlit as st
 import pandas as pd
 import os
 import tempfile
+import time
 from datetime import datetime, timedelta
 from database.db_manager import DBManager
 from services.auth_manager import AuthManager
-from database.cliente_manager import sincronizar_datos_cliente_en_cotizacion
+from database.cliente_manager import (
+    sincronizar_datos_cliente_en_cotizacion, sincronizar_clientes_en_cotizaciones
+)
+from services.document_generation.quote_adapter import (
+    adaptar_quote_para_generadores as _adaptar_quote_para_generadores,
+    items_para_cuadro_costos
+)
+from services.document_generation.document_storage import DocumentStore
+from services.pricing import desglose
+from services.document_generation.png_generator import extension_rendicion, mime_rendicion
+from services.render_queue import RenderQueue, ESTADOS_PENDIENTES
+
+# Segundos entre consultas a la cola de render mientras se espera un documento
+INTERVALO_POLLING = 2
+
+# Tipo MIME de las descargas según la extensión de la página
+MIME_POR_EXTENSION = {'.png': 'image/png', '.jpg': 'image/jpeg', '.webp': 'image/webp'}
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -62,255 +79,13 @@ def _detectar_rutas_png(jpeg_path: str) -> list:
     Dado el jpeg_path guardado en BD, devuelve la lista COMPLETA de rutas PNG
     de todas las páginas de la cotización.
 
-    El generador PNG puede guardar archivos de dos formas:
-      - 1 página:  base.png          (jpeg_path apunta a base.png)
-      - N páginas: base_p1.png, base_p2.png, ...  (jpeg_path apunta a base_p1.png)
-
-    Esta función detecta ambos casos correctamente.
-    """
-    if not jpeg_path or not os.path.exists(jpeg_path):
-        return []
-
-    base, ext = os.path.splitext(jpeg_path)
-    if not ext:
-        ext = '.png'
-
-    # Caso A: jpeg_path termina en _p1 → multi-página guardada con sufijos
-    # Ej: /tmp/cotizacion_2026-60559-O_p1.png
-    if base.endswith('_p1'):
-        raiz = base[:-3]  # quitar '_p1'
-        rutas = []
-        pg = 1
-        while True:
-            ruta = f"{raiz}_p{pg}{ext}"
-            if os.path.exists(ruta):
-                rutas.append(ruta)
-                pg += 1
-            else:
-                break
-        if rutas:
-            return rutas
-
-    # Caso B: jpeg_path es el archivo base (1 página o multi-página antigua)
-    # Buscar si existen _p1, _p2, ... adicionales
-    rutas = [jpeg_path]
-    pg = 2
-    while True:
-        ruta_extra = f"{base}_p{pg}{ext}"
-        if os.path.exists(ruta_extra):
-            rutas.append(ruta_extra)
-            pg += 1
-        else:
-            break
-    # Verificar si _p1 existe y reemplaza al base
-    ruta_p1 = f"{base}_p1{ext}"
-    if os.path.exists(ruta_p1) and ruta_p1 not in rutas:
-        rutas = [ruta_p1] + rutas[1:]
-
-    return rutas
-
-
-# ─────────────────────────────────────────────────────────────────────────────
-# ADAPTADOR: BD → PDF/PNG generator
-# ─────────────────────────────────────────────────────────────────────────────
-def _adaptar_quote_para_generadores(qd: dict) -> dict:
-    """
-    Convierte el diccionario devuelto por get_quote_full_details()
-    (campos en inglés: description, part_number, quantity…)
-    al formato que espera PDFQuoteGenerator y PNGQuoteGenerator
-    (campos en español: descripcion, parte, cantidad…).
-
-    También recalcula los totales que el PDF necesita.
+    jpeg_path guarda una referencia de DocumentStore (doc://…); la lista de
+    páginas sale de su manifiesto y, si el contenedor es nuevo, se descargan
+    del almacenamiento durable sin volver a renderizar. Rutas antiguas del
+    host se devuelven tal cual si el archivo sigue existiendo.
     """
-    try:
-        from database.config_helpers import ConfigHelpers
-        dif_pct = ConfigHelpers.get_diferencial()
-    except Exception:
-        dif_pct = 45.0
-
-    items_adaptados = []
-    sub_total    = 0.0
-    iva_total    = 0.0
-    abona_ya     = 0.0
-    total_usd    = 0.0
-    total_bs     = 0.0
-
-    for item in qd.get('items', []):
-        cantidad   = int(item.get('quantity', 1) or 1)
-        costo_fob  = float(item.get('unit_cost', 0) or 0)
-        fob_total  = costo_fob * cantidad
-        handling   = float(item.get('international_handling', 0) or 0)
-        manejo     = float(item.get('national_handling', 0) or 0)
-        envio      = float(item.get('shipping_cost', 0) or 0)
-        imp_pct    = float(item.get('tax_percentage', 0) or 0)
-        factor_ut  = float(item.get('profit_factor', 1.0) or 1.0)
-
-        imp_int   = fob_total * (imp_pct / 100)
-        # FÓRMULA CORRECTA: Utilidad = (FOB_Total × Factor) − FOB_Total
-        # El factor se aplica solo sobre el costo FOB, igual que en analyst_panel
-        utilidad  = (fob_total * factor_ut) - fob_total
-        base_tax  = fob_total + handling + manejo + imp_int + utilidad + envio
-        tax_pct   = 7.0
-        costo_tax = base_tax * (tax_pct / 100)
-
-        # Precio USD final (lo que ya está guardado en total_cost)
-        # precio_usd = precio base SIN diferencial, SIN IVA (guardado en total_cost)
-        precio_usd = float(item.get('total_cost', 0) or 0)
-        if precio_usd == 0:
-            precio_usd = base_tax + costo_tax
-
-        # precio_bs = precio CON diferencial, SIN IVA
-        # PRIORIDAD: usar el precio_bs guardado en BD (fuente de verdad exacta del analista)
-        # Solo recalcular si el campo no fue guardado (cotizaciones antiguas con precio_bs=0)
-        _precio_bs_guardado = float(item.get('precio_bs', 0) or 0)
-        if _precio_bs_guardado > 0:
-            # Usar el valor exacto guardado por el analista al crear la cotización
-            precio_bs = _precio_bs_guardado
-            dif_val   = precio_bs - precio_usd
-        else:
-            # Fallback para cotizaciones antiguas sin precio_bs guardado
-            dif_val   = precio_usd * (dif_pct / 100)
-            precio_bs = precio_usd + dif_val
-
-        # Recuperar campos IVA guardados en la BD
-        _aplicar_iva  = bool(item.get('aplicar_iva', False))
-        _iva_pct      = float(item.get('iva_porcentaje', 16.0) or 16.0)
-        # IVA se calcula sobre precio_bs (precio con diferencial, sin IVA)
-        # Igual que Excel: P31 = P30 * 16%  donde P30 = suma de AH (con diferencial)
-        if _aplicar_iva:
-            _iva_val = round(precio_bs * (_iva_pct / 100), 2)
-        else:
-            _iva_val = 0.0
-
-        # Acumuladores para totales del resumen
-        # sub_total = suma de precio_bs (con diferencial, sin IVA) ← igual que P30 del Excel
-        sub_total += precio_bs
-        if _aplicar_iva:
-            iva_total += _iva_val
-        # ABONA YA = precio_bs SIN el costo de envío con diferencial
-        # Igual que Excel P34: (FOB+Handling+Manejo+Impuesto+Utilidad+Tax) × (1+diferencial)
-        # P34 excluye AE (envío) y su diferencial → abona_ya = precio_bs - envio×(1+dif%)
-        envio_con_dif = envio * (1 + dif_pct / 100)
-        abona_ya  += precio_bs - envio_con_dif
-        total_usd += precio_usd
-        total_bs  += precio_bs
-
-        items_adaptados.append({
-            # Campos que usa el PDF generator
-            # precio_bs = precio CON diferencial, SIN IVA ← igual que columna AH/O del Excel
-            'descripcion':         item.get('description', 'N/A'),
-            'parte':               item.get('part_number', ''),
-            'marca':               item.get('marca', ''),
-            'garantia':            item.get('garantia', ''),
-            'cantidad':            cantidad,
-            'envio_tipo':          item.get('envio_tipo', ''),
-            'origen':              item.get('origen', ''),
-            'fabricacion':         item.get('fabricacion', ''),
-            'tiempo_entrega':      item.get('tiempo_entrega', ''),
-            'precio_bs':           precio_bs,   # precio con diferencial, sin IVA (columna TOTAL de la tabla)
-            'precio_usd':          precio_usd,
-            # Campos internos para cálculos
-            'costo_fob':           costo_fob,
-            'fob_total':           fob_total,
-            'costo_handling':      handling,
-            'costo_manejo':        manejo,
-            'costo_impuesto':      imp_int,
-            'impuesto_porcentaje': imp_pct,
-            'factor_utilidad':     factor_ut,
-            'utilidad_valor':      utilidad,
-            'costo_envio':         envio,
-            'costo_tax':           costo_tax,
-            'tax_porcentaje':      tax_pct,
-            'diferencial_valor':   dif_val,
-            'diferencial_porcentaje': dif_pct,
-            'iva_porcentaje':      _iva_pct,
-            'iva_valor':           _iva_val,
-            'aplicar_iva':         _aplicar_iva,
-            'costo_unitario':      precio_usd,
-            'costo_total':         precio_usd,
-            'costo_total_bs':      precio_bs,
-        })
-
-    total_a_pagar = sub_total + iva_total
-    y_en_entrega  = total_a_pagar - abona_ya
-
-    # Totales en USD para modo Precio Optimizado (divisas)
-    # Fórmula aprobada (igual que el mensaje WhatsApp):
-    # Abono = FOB + Handling + Manejo + Impuesto + Utilidad  (SIN envío, SIN TAX)
-    # Total = redondeado al ×5 hacia arriba
-    # Entrega = Total − Abono
-    import math as _math
-    _usd_abono_raw = 0.0
-    for _it_opt in items_adaptados:
-        _fob_opt   = float(_it_opt.get('fob_total', 0) or 0)
-        _hand_opt  = float(_it_opt.get('costo_handling', 0) or 0)
-        _man_opt   = float(_it_opt.get('costo_manejo', 0) or 0)
-        _imp_opt   = float(_it_opt.get('costo_impuesto', 0) or 0)
-        _util_opt  = float(_it_opt.get('utilidad_valor', 0) or 0)
-        _usd_abono_raw += _fob_opt + _hand_opt + _man_opt + _imp_opt + _util_opt
-    total_usd_redondeado = _math.ceil(total_usd / 5) * 5 if total_usd > 0 else 0.0
-    usd_abono   = _math.ceil(_usd_abono_raw / 5) * 5 if _usd_abono_raw > 0 else 0.0
-    usd_entrega = max(0.0, round(total_usd_redondeado - usd_abono, 2))
-
-    # Fecha en formato que espera el PDF
-    try:
-        fecha_str = datetime.fromisoformat(
-            str(qd.get('created_at', ''))
-        ).strftime('%Y-%m-%d')
-    except Exception:
-        fecha_str = datetime.now().strftime('%Y-%m-%d')
-
-    # Términos y condiciones
-    terminos = (
-        qd.get('terms_conditions') or
-        qd.get('terminos_condiciones') or
-        'Términos y condiciones estándar.'
-    )
-
-    return {
-        'quote_number':        qd.get('quote_number', 'N/A'),
-        'numero_cotizacion':   qd.get('quote_number', 'N/A'),
-        'analyst_name':        qd.get('analyst_name', ''),
-        'asesor_ventas':       qd.get('analyst_name', ''),
-        'fecha':               fecha_str,
-        'client': {
-            'nombre':    qd.get('client_name', ''),
-            'telefono':  qd.get('client_phone', ''),
-            'email':     qd.get('client_email', ''),
-            'ci_rif':    qd.get('client_cedula', ''),
-            'direccion': qd.get('client_address', ''),
-            'vehiculo':  qd.get('client_vehicle', ''),
-            'año':       qd.get('client_year', ''),
-            'vin':       qd.get('client_vin', ''),
-            'motor':     '',
-        },
-        'cliente': {
-            'nombre':    qd.get('client_name', ''),
-            'telefono':  qd.get('client_phone', ''),
-            'email':     qd.get('client_email', ''),
-            'ci_rif':    qd.get('client_cedula', ''),
-            'direccion': qd.get('client_address', ''),
-            'vehiculo':  qd.get('client_vehicle', ''),
-            'año':       qd.get('client_year', ''),
-            'vin':       qd.get('client_vin', ''),
-            'motor':     '',
-        },
-        'items':               items_adaptados,
-        'sub_total':           sub_total,
-        'iva_total':           iva_total,
-        'total_a_pagar':       total_a_pagar,
-        'abona_ya':            abona_ya,
-        'y_en_entrega':        y_en_entrega,
-        'total_usd':           total_usd,
-        'total_bs':            total_bs,
-        # CORRECCIÓN (orden 2026-30367-A): usar total_usd_redondeado (múltiplo de 5
-        # hacia arriba) para que el PDF modo divisas y el cuadro de costos muestren
-        # el mismo valor que el mensaje USD. total_usd es el valor crudo sin redondear.
-        'total_usd_divisas':   total_usd_redondeado,
-        'usd_abono':           usd_abono,
-        'usd_entrega':         usd_entrega,
-        'terminos_condiciones': terminos,
-    }
+    from services.document_generation.document_storage import DocumentStore
+    return DocumentStore.paginas(jpeg_path)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -439,6 +214,13 @@ def render_my_quotes_panel():
         st.warning("⚠️ No se encontraron cotizaciones con los criterios indicados.")
         return
 
+    # Datos del directorio de clientes para todos los borradores del listado en
+    # una sola consulta (igual que la vista de solo lectura: solo borradores)
+    _sincronizados = iter(sincronizar_clientes_en_cotizaciones(
+        [q for q in quotes if q.get('status') == 'draft']
+    ))
+    quotes = [next(_sincronizados) if q.get('status') == 'draft' else q for q in quotes]
+
     # ── BLOQUE 3: DROPDOWN DE COINCIDENCIAS ──────────────────────────────
     def _label(q):
         num = q.get('quote_number', 'N/A')
@@ -606,12 +388,6 @@ def _show_quote_readonly(quote_id: int):
     st.markdown(f"🔧 **Ítems ({n_items} repuesto{'s' if n_items != 1 else ''})**")
 
     if items:
-        try:
-            from database.config_helpers import ConfigHelpers
-            dif_pct = ConfigHelpers.get_diferencial()
-        except Exception:
-            dif_pct = 45.0
-
         rows = []
         for idx, item in enumerate(items, 1):
             try:
@@ -621,11 +397,11 @@ def _show_quote_readonly(quote_id: int):
             except Exception:
                 fecha_item = date_display
 
-            cantidad   = int(item.get('quantity', 1) or 1)
-            fob_unit   = float(item.get('unit_cost', 0) or 0)
-            fob_total  = fob_unit * cantidad
-            precio_usd = float(item.get('total_cost', 0) or 0)
-            precio_bs  = precio_usd * (1 + dif_pct / 100)
+            d = desglose.del_item(item)
+            cantidad   = d['cantidad']
+            fob_total  = d['fob_total']
+            precio_usd = d['precio_usd']
+            precio_bs  = d['precio_bs']
 
             rows.append({
                 "#":              idx,
@@ -665,6 +441,12 @@ def _show_acciones(quote_id: int):
         st.warning("⛔ Esta cotización está **anulada**. No se pueden realizar acciones sobre ella. Solo el administrador puede reactivarla si fuera necesario.")
         return
 
+    # Estado de los documentos en la cola de render (un SELECT por rerun)
+    _trabajos = RenderQueue.estado(quote_id)
+
+    def _pendiente(tipo):
+        return _trabajos.get(tipo, {}).get('estado') in ESTADOS_PENDIENTES
+
     a1, a2, a3, a4, a5, a6, a7, a8 = st.columns(8)
 
     # ── EDITAR ────────────────────────────────────────────────────────────────────────────────────────
@@ -709,9 +491,9 @@ def _show_acciones(quote_id: int):
 
     # ── DESCARGAR PDF ───────────────────────────────────────────────────────────────────────────────
     with a3:
-        pdf_path = str(quote.get('pdf_path') or '')
-        if pdf_path and os.path.exists(pdf_path):
-            with open(pdf_path, 'rb') as f:
+        _rutas_pdf = DocumentStore.paginas(str(quote.get('pdf_path') or ''))
+        if _rutas_pdf:
+            with open(_rutas_pdf[0], 'rb') as f:
                 st.download_button(
                     label="📄 DESCARGAR PDF",
                     data=f,
@@ -720,6 +502,9 @@ def _show_acciones(quote_id: int):
                     use_container_width=True,
                     key=f"acc_pdf_{quote_id}"
                 )
+        elif _pendiente('pdf_bcv'):
+            st.button("⏳ GENERANDO PDF", use_container_width=True,
+                      type="secondary", key=f"acc_gen_pdf_{quote_id}", disabled=True)
         else:
             if st.button("📄 GENERAR PDF", use_container_width=True,
                          type="secondary", key=f"acc_gen_pdf_{quote_id}"):
@@ -740,6 +525,9 @@ def _show_acciones(quote_id: int):
                 st.rerun()
             if _total_pags_a4 > 1:
                 st.caption(f"📄 {_total_pags_a4} páginas")
+        elif _pendiente('png'):
+            st.button("⏳ GENERANDO PNG", use_container_width=True,
+                      type="secondary", key=f"acc_gen_png_{quote_id}", disabled=True)
         else:
             if st.button("🖼️ GENERAR PNG", use_container_width=True,
                          type="secondary", key=f"acc_gen_png_{quote_id}"):
@@ -750,19 +538,8 @@ def _show_acciones(quote_id: int):
         if st.button("📊 CUADRO COSTOS", use_container_width=True,
                      type="secondary", key=f"acc_cuadro_{quote_id}"):
             st.session_state.cuadro_costos_quote_id = quote_id
-            # SIEMPRE limpiar el PNG en caché para forzar regeneración con datos frescos
-            st.session_state.pop('cuadro_costos_png_path', None)
-            import tempfile, os as _os2
-            _qb = DBManager.get_quote_by_id(quote_id)
-            if _qb:
-                _qnum = _qb.get('quote_number', str(quote_id))
-                _old_png = _os2.path.join(tempfile.gettempdir(),
-                    f"cuadro_costos_{_qnum.replace('-', '_')}.png")
-                if _os2.path.exists(_old_png):
-                    try:
-                        _os2.remove(_old_png)
-                    except Exception:
-                        pass
+            # El cuadro se busca por contenido (DocumentCache): datos editados
+            # producen una clave nueva, no hace falta borrar PNG anteriores
             st.rerun()
 
     # ── ORDEN APROBADA (FASE 5) ────────────────────────────────────────────────────────────────────────
@@ -776,6 +553,9 @@ def _show_acciones(quote_id: int):
             if st.button("✅ ORDEN APROBADA", use_container_width=True,
                          type="primary", key=f"acc_aprobada_{quote_id}"):
                 st.session_state.mq_aprobar_id = quote_id
+                # Los adjuntos del correo se pre-renderizan mientras el
+                # analista revisa la confirmación y la vista previa
+                RenderQueue.encolar_cotizacion(quote_id)
                 st.rerun()
 
     # ── ELIMINAR ───────────────────────────────────────────────────────────────────────────────
@@ -807,49 +587,43 @@ def _show_acciones(quote_id: int):
         help="Genera cotización con precios en USD (sin diferencial) para clientes que pagan en divisas"
     ):
         try:
-            from services.document_generation.png_generator import PNGQuoteGenerator as _PNGGenOpt
+            from services.document_generation.document_cache import DocumentCache as _DocCacheOpt
             qd_opt = DBManager.get_quote_full_details(quote_id)
             if not qd_opt:
                 st.error("❌ No se pudo cargar la cotización")
             else:
                 datos_opt = _adaptar_quote_para_generadores(qd_opt)
                 quote_number_opt = qd_opt.get('quote_number', str(quote_id))
-                import tempfile as _tmp_opt
-                _dir_opt  = os.path.join(_tmp_opt.gettempdir(), 'logipartve_docs')
-                os.makedirs(_dir_opt, exist_ok=True)
-                _fn_opt   = f"cotizacion_{quote_number_opt}_divisas.png"
-                _path_opt = os.path.join(_dir_opt, _fn_opt)
-                with st.spinner("⏳ Generando PNG Precio Optimizado..."):
-                    _gen_opt    = _PNGGenOpt()
-                    _result_opt = _gen_opt.generate_quote_png_divisas(datos_opt, _path_opt)
-                if _result_opt is None:
-                    st.error("❌ Error al generar PNG Precio Optimizado")
+                _fn_opt   = f"cotizacion_{quote_number_opt}_divisas.{extension_rendicion('mensaje')}"
+                with st.spinner("⏳ Generando imagen Precio Optimizado..."):
+                    _rutas_opt = _DocCacheOpt.imagenes(datos_opt, modo_divisas=True)
+                if not _rutas_opt:
+                    st.error("❌ Error al generar imagen Precio Optimizado")
                 else:
-                    _rutas_opt = [_result_opt] if isinstance(_result_opt, str) else _result_opt
                     if len(_rutas_opt) == 1:
                         with open(_rutas_opt[0], 'rb') as _fopt:
                             st.download_button(
-                                label="⬇️ Descargar PNG Precio Optimizado",
+                                label="⬇️ Descargar Imagen Precio Optimizado",
                                 data=_fopt,
                                 file_name=_fn_opt,
-                                mime="image/png",
+                                mime=mime_rendicion('mensaje'),
                                 use_container_width=True,
                                 key=f"dl_opt_{quote_id}"
                             )
-                        st.success("✅ PNG Precio Optimizado generado correctamente.")
+                        st.success("✅ Imagen Precio Optimizado generada correctamente.")
                     else:
                         for _pi_o, _ruta_pi_o in enumerate(_rutas_opt, 1):
-                            _fn_pi_o = f"cotizacion_{quote_number_opt}_divisas_p{_pi_o}.png"
+                            _fn_pi_o = f"cotizacion_{quote_number_opt}_divisas_p{_pi_o}.{extension_rendicion('mensaje')}"
                             with open(_ruta_pi_o, 'rb') as _fopt:
                                 st.download_button(
                                     label=f"⬇️ Descargar Precio Optimizado — Pág. {_pi_o}",
                                     data=_fopt,
                                     file_name=_fn_pi_o,
-                                    mime="image/png",
+                                    mime=mime_rendicion('mensaje'),
                                     use_container_width=True,
                                     key=f"dl_opt_{quote_id}_p{_pi_o}"
                                 )
-                        st.success(f"✅ PNG Precio Optimizado generado ({len(_rutas_opt)} páginas).")
+                        st.success(f"✅ Imagen Precio Optimizado generada ({len(_rutas_opt)} páginas).")
         except Exception as e:
             import traceback
             st.error(f"❌ Error al generar Precio Optimizado: {str(e)}")
@@ -871,38 +645,15 @@ def _show_acciones(quote_id: int):
 
     # ── POP-UP MENSAJE PAGO USD ───────────────────────────────────────────────
     if st.session_state.get(f'mq_popup_usd_{quote_id}', False):
-        # Fórmula aprobada:
+        # Fórmula aprobada (totales del desglose guardado, los mismos del formulario):
         # Abono = FOB + Handling + Manejo + Impuesto Internacional + Utilidad
-        # Entrega = total_cost - abono  (= Envío + TAX + Diferencial)
-        qd_usd = DBManager.get_quote_full_details(quote_id)
-        items_usd = qd_usd.get('items', []) if qd_usd else []
-        _total_usd = 0.0
-        _usd_abono = 0.0
-        for _it in items_usd:
-            _total_item   = float(_it.get('total_cost', 0) or 0)
-            _qty          = float(_it.get('quantity', 1) or 1)
-            _unit_cost    = float(_it.get('unit_cost', 0) or 0)
-            _handling     = float(_it.get('international_handling', 0) or 0)
-            _manejo       = float(_it.get('national_handling', 0) or 0)
-            _imp_pct      = float(_it.get('tax_percentage', 0) or 0)
-            _factor_util  = float(_it.get('profit_factor', 1.0) or 1.0)
-
-            _fob          = _unit_cost * _qty
-            _imp          = _fob * (_imp_pct / 100)
-            _util         = _fob * (_factor_util - 1.0)
-            # Abono = FOB + Handling + Manejo + Impuesto + Utilidad
-            _abono_item   = _fob + _handling + _manejo + _imp + _util
-
-            _total_usd += _total_item
-            _usd_abono += max(0.0, _abono_item)
-        # Redondeo al múltiplo de 5 hacia arriba (igual que en el formulario de cotización)
-        import math as _math_mq
-        _total_usd   = _math_mq.ceil(_total_usd / 5) * 5
-        _usd_abono   = _math_mq.ceil(_usd_abono / 5) * 5
-        _usd_entrega = _total_usd - _usd_abono
-        if _usd_entrega < 0:
-            _usd_abono   = _total_usd
-            _usd_entrega = 0
+        # Entrega = Total − Abono  (= Envío + TAX), ambos al múltiplo de 5
+        qd_usd = DBManager.get_quote_full_details(quote_id) or {}
+        _totales_usd = desglose.de_cotizacion(
+            qd_usd, [desglose.del_item(_it) for _it in qd_usd.get('items', [])])
+        _total_usd   = _totales_usd['total_usd_divisas']
+        _usd_abono   = _totales_usd['usd_abono']
+        _usd_entrega = _totales_usd['usd_entrega']
 
         with st.container():
             st.markdown("""
@@ -1054,6 +805,8 @@ def _show_acciones(quote_id: int):
     # ── FIN POP-UP MENSAJE BCV ────────────────────────────────────────────────
 
     # ── VISOR PNG DE COTIZACIÓN (multi-página) ────────────────────────────────
+    # jpeg_path apunta a la imagen para mensajería; la vista previa usa la
+    # miniatura y el PNG completo se genera solo si se pide.
     _ver_png_key = f'mq_ver_png_{quote_id}'
     if st.session_state.get(_ver_png_key, False):
         _jpeg_path_v = str(quote.get('jpeg_path') or '')
@@ -1062,6 +815,11 @@ def _show_acciones(quote_id: int):
         if _rutas_v:
             _total_v = len(_rutas_v)
             _qnum_v  = quote.get('quote_number', str(quote_id))
+            _mini_v  = DocumentStore.paginas(DocumentStore.rendicion(_jpeg_path_v, 'miniatura'))
+            if len(_mini_v) != _total_v:
+                _mini_v = _rutas_v   # referencias antiguas: sin miniatura
+            _ref_full_v = DocumentStore.rendicion(_jpeg_path_v, 'png')
+            _full_v = DocumentStore.paginas(_ref_full_v) if _ref_full_v != _jpeg_path_v else []
             st.markdown("---")
             st.markdown(f"### 🖼️ Vista Previa PNG — {_qnum_v} ({_total_v} página{'s' if _total_v > 1 else ''})")
 
@@ -1069,24 +827,48 @@ def _show_acciones(quote_id: int):
                 if os.path.exists(_ruta_v):
                     if _total_v > 1:
                         st.markdown(f"**Página {_iv} de {_total_v}**")
-                    st.image(_ruta_v, use_container_width=True)
+                    st.image(_mini_v[_iv - 1], use_container_width=True)
+                    _ext_v = os.path.splitext(_ruta_v)[1]
                     _fn_v = (
-                        f"cotizacion_{_qnum_v}.png"
+                        f"cotizacion_{_qnum_v}{_ext_v}"
                         if _total_v == 1
-                        else f"cotizacion_{_qnum_v}_p{_iv}.png"
+                        else f"cotizacion_{_qnum_v}_p{_iv}{_ext_v}"
                     )
                     with open(_ruta_v, 'rb') as _fv:
                         st.download_button(
-                            label=f"⬇️ Descargar Pág. {_iv}" if _total_v > 1 else "⬇️ Descargar PNG",
+                            label=f"⬇️ Descargar Pág. {_iv}" if _total_v > 1 else "⬇️ Descargar Imagen",
                             data=_fv,
                             file_name=_fn_v,
-                            mime="image/png",
+                            mime=MIME_POR_EXTENSION.get(_ext_v, 'application/octet-stream'),
                             use_container_width=True,
                             key=f"dl_visor_png_{quote_id}_p{_iv}"
                         )
                     if _iv < _total_v:
                         st.markdown("---")
 
+            # ── PNG en alta resolución (bajo demanda) ────────────────────────
+            if _full_v:
+                for _iv, _ruta_f in enumerate(_full_v, 1):
+                    with open(_ruta_f, 'rb') as _ff:
+                        st.download_button(
+                            label=(f"⬇️ PNG Alta Resolución — Pág. {_iv}" if len(_full_v) > 1
+                                   else "⬇️ PNG Alta Resolución"),
+                            data=_ff,
+                            file_name=(f"cotizacion_{_qnum_v}.png" if len(_full_v) == 1
+                                       else f"cotizacion_{_qnum_v}_p{_iv}.png"),
+                            mime="image/png",
+                            use_container_width=True,
+                            key=f"dl_visor_png_full_{quote_id}_p{_iv}"
+                        )
+            elif _ref_full_v != _jpeg_path_v:
+                if _pendiente('png_full'):
+                    st.button("⏳ GENERANDO PNG ALTA RESOLUCIÓN", use_container_width=True,
+                              type="secondary", key=f"gen_png_full_{quote_id}", disabled=True)
+                elif st.button("🖼️ PNG ALTA RESOLUCIÓN", use_container_width=True,
+                               type="secondary", key=f"gen_png_full_{quote_id}"):
+                    if _encolar_documento(quote_id, 'png_full'):
+                        st.rerun()
+
             st.markdown("---")
             _cv1, _cv2, _cv3 = st.columns([1, 2, 1])
             with _cv2:
@@ -1098,51 +880,52 @@ def _show_acciones(quote_id: int):
             st.warning("⚠️ No hay PNG generado. Usa el botón GENERAR PNG primero.")
     # ── FIN VISOR PNG ─────────────────────────────────────────────────────────
 
+    # ── ESPERA DE DOCUMENTOS EN LA COLA DE RENDER ─────────────────────────────
+    # Tras pulsar GENERAR PDF/PNG la página se re-ejecuta cada
+    # INTERVALO_POLLING segundos hasta que el trabajo termina.
+    _esperando_key = f'mq_render_esperando_{quote_id}'
+    _esperados = st.session_state.get(_esperando_key)
+    if _esperados:
+        if any(_pendiente(t) for t in _esperados):
+            time.sleep(INTERVALO_POLLING)
+            st.rerun()
+        st.session_state.pop(_esperando_key, None)
+        for _tipo in _esperados:
+            _job = _trabajos.get(_tipo, {})
+            if _job.get('estado') == 'failed':
+                st.error(f"❌ Error al generar el documento: {_job.get('error') or 'desconocido'}")
+
 
 # ─────────────────────────────────────────────────────────────────────────────
-# REGENERAR PDF
+# COLA DE RENDER
 # ─────────────────────────────────────────────────────────────────────────────
-def _regenerar_pdf(quote_id: int):
-    """Regenera el PDF de una cotización y actualiza la BD."""
-    try:
-        from services.document_generation.pdf_generator import PDFQuoteGenerator
-
-        qd = DBManager.get_quote_full_details(quote_id)
-        if not qd:
-            st.error("❌ No se pudo cargar la cotización")
-            return
-
-        # Adaptar campos de la BD al formato del generador
-        datos = _adaptar_quote_para_generadores(qd)
-
-        quote_number = qd.get('quote_number', str(quote_id))
-        output_dir   = os.path.join(tempfile.gettempdir(), 'logipartve_docs')
-        os.makedirs(output_dir, exist_ok=True)
-        pdf_path = os.path.join(output_dir, f"cotizacion_{quote_number}.pdf")
+def _encolar_documento(quote_id: int, tipo: str) -> bool:
+    """
+    Encola un documento en RenderQueue y activa el polling de _show_acciones.
+    Si la cola está llena avisa al analista y retorna False (contrapresión).
+    """
+    ids = RenderQueue.encolar(quote_id, (tipo,))
+    if ids is None:
+        en_cola, capacidad = RenderQueue.carga()
+        st.warning(f"⏳ La cola de documentos está llena ({en_cola}/{capacidad}). "
+                   "Intenta de nuevo en unos segundos.")
+        return False
+    esperados = set(st.session_state.get(f'mq_render_esperando_{quote_id}') or ())
+    esperados.add(tipo)
+    st.session_state[f'mq_render_esperando_{quote_id}'] = esperados
+    return True
 
-        with st.spinner("⏳ Generando PDF..."):
-            result = PDFQuoteGenerator.generate(datos, pdf_path)
 
-        if result and os.path.exists(pdf_path):
-            conn   = DBManager.get_connection()
-            cursor = conn.cursor()
-            if DBManager.USE_POSTGRES:
-                cursor.execute("UPDATE quotes SET pdf_path = %s WHERE id = %s",
-                               (pdf_path, quote_id))
-            else:
-                cursor.execute("UPDATE quotes SET pdf_path = ? WHERE id = ?",
-                               (pdf_path, quote_id))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            st.success("✅ PDF generado. Haz clic en DESCARGAR PDF.")
-            st.rerun()
-        else:
-            st.error("❌ Error al generar el PDF")
-    except Exception as e:
-        import traceback
-        st.error(f"❌ Error: {e}")
-        st.code(traceback.format_exc())
+# ─────────────────────────────────────────────────────────────────────────────
+# REGENERAR PDF
+# ─────────────────────────────────────────────────────────────────────────────
+def _regenerar_pdf(quote_id: int):
+    """
+    Encola el PDF de la cotización. Al terminar, RenderQueue guarda la
+    referencia doc:// en quotes.pdf_path y aparece DESCARGAR PDF.
+    """
+    if _encolar_documento(quote_id, 'pdf_bcv'):
+        st.rerun()
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -1150,71 +933,12 @@ def _regenerar_pdf(quote_id: int):
 # ─────────────────────────────────────────────────────────────────────────────
 def _regenerar_png(quote_id: int):
     """
-    Regenera el/los PNG de una cotización y actualiza la BD.
-    Soporta cotizaciones multi-página: guarda la primera página en jpeg_path
-    y las páginas adicionales como _p2, _p3, etc. en el mismo directorio.
+    Encola el/los PNG de una cotización. Al terminar, RenderQueue guarda la
+    referencia doc:// en quotes.jpeg_path (las páginas se leen del manifiesto).
     """
-    try:
-        from services.document_generation.png_generator import PNGQuoteGenerator
-
-        qd = DBManager.get_quote_full_details(quote_id)
-        if not qd:
-            st.error("❌ No se pudo cargar la cotización")
-            return
-
-        # Adaptar campos de la BD al formato del generador
-        datos = _adaptar_quote_para_generadores(qd)
-
-        quote_number = qd.get('quote_number', str(quote_id))
-        output_dir   = os.path.join(tempfile.gettempdir(), 'logipartve_docs')
-        os.makedirs(output_dir, exist_ok=True)
-        png_path = os.path.join(output_dir, f"cotizacion_{quote_number}.png")
-
-        with st.spinner("⏳ Generando PNG..."):
-            gen    = PNGQuoteGenerator()
-            result = gen.generate_quote_png_from_data(datos, png_path)
-
-        # result puede ser: str (1 página) o list[str] (multi-página) o None
-        if result is None:
-            st.error("❌ Error al generar el PNG")
-            return
-
-        # Normalizar a lista
-        if isinstance(result, str):
-            rutas = [result]
-        else:
-            rutas = result
-
-        # La primera página se guarda en jpeg_path (compatibilidad con BD existente)
-        primera_ruta = rutas[0] if rutas else None
-        if not primera_ruta or not os.path.exists(primera_ruta):
-            st.error("❌ Error al generar el PNG")
-            return
-
-        conn   = DBManager.get_connection()
-        cursor = conn.cursor()
-        if DBManager.USE_POSTGRES:
-            cursor.execute("UPDATE quotes SET jpeg_path = %s WHERE id = %s",
-                           (primera_ruta, quote_id))
-        else:
-            cursor.execute("UPDATE quotes SET jpeg_path = ? WHERE id = ?",
-                           (primera_ruta, quote_id))
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-        total_paginas = len(rutas)
-        if total_paginas == 1:
-            st.success("✅ PNG generado. Haz clic en DESCARGAR PNG.")
-        else:
-            st.success(f"✅ PNG generado ({total_paginas} páginas). Haz clic en DESCARGAR PNG para obtener cada página.")
+    if _encolar_documento(quote_id, 'png'):
         st.rerun()
 
-    except Exception as e:
-        import traceback
-        st.error(f"❌ Error: {e}")
-        st.code(traceback.format_exc())
-
 
 # ─────────────────────────────────────────────────────────────────────────────
 # CUADRO DE COSTOS
@@ -1244,156 +968,65 @@ def _show_cuadro_costos(quote_id: int):
         st.warning("⚠️ Esta cotización no tiene ítems registrados")
         return
 
-    # ── Construir items_para_cuadro usando los valores guardados en BD ────────
-    # PRINCIPIO: La BD es la fuente de verdad. Los campos calculados por el
-    # analista (utilidad_valor, fob_total, precio_usd, precio_bs, diferencial_*,
-    # iva_*) se leen directamente de la BD. Solo se recalculan como fallback
-    # para cotizaciones antiguas que no tengan esos campos guardados.
-    # Esto garantiza que el Cuadro de Costos muestre exactamente los mismos
-    # valores que el analista calculó y el cliente aprobó. Crítico para la
-    # integración con el Administrativo.
-    import math as _math_cuadro
-    items_para_cuadro = []
-    for item in items_raw:
-        # ── Campos base (siempre presentes en BD) ──────────────────────────
-        cantidad  = int(item.get('quantity', 1) or 1)
-        costo_fob = float(item.get('unit_cost', 0) or 0)
-        imp_pct   = float(item.get('tax_percentage', 0) or 0)
-        factor_ut = float(item.get('profit_factor', 1.0) or 1.0)
-        handling  = float(item.get('international_handling', 0) or 0)
-        manejo    = float(item.get('national_handling', 0) or 0)
-        envio     = float(item.get('shipping_cost', 0) or 0)
-
-        # ── Campos calculados: leer de BD (fuente de verdad) ───────────────
-        # Si el campo está guardado (> 0), usarlo directamente.
-        # Si no está (cotización antigua), recalcular como fallback.
-        fob_total_bd = float(item.get('fob_total', 0) or 0)
-        fob_total    = fob_total_bd if fob_total_bd > 0 else costo_fob * cantidad
-
-        utilidad_bd  = float(item.get('utilidad_valor', 0) or 0)
-        utilidad     = utilidad_bd if utilidad_bd > 0 else (fob_total * factor_ut) - fob_total
-
-        imp_int_bd   = fob_total * (imp_pct / 100)   # siempre recalcular (es simple y exacto)
-        imp_int      = imp_int_bd
-
-        # costo_tax: leer de BD si existe, sino recalcular
-        # base_tax = fob + handling + manejo + impuesto + utilidad + envio
-        base_tax     = fob_total + handling + manejo + imp_int + utilidad + envio
-        tax_pct      = 7.0
-        costo_tax    = base_tax * (tax_pct / 100)    # recalcular (no se guarda en BD)
-
-        # precio_usd: campo guardado en BD = precio_usd_total_redondeado (múltiplo de 5)
-        # REGLA: precio_usd y total_cost deben ser idénticos (ver db_manager.py).
-        # Si difieren por el bug histórico, usar el MAYOR de los dos:
-        # total_cost es el precio que el cliente aprobó (fuente de verdad definitiva).
-        _pv1 = float(item.get('precio_usd',  0) or 0)
-        _pv2 = float(item.get('total_cost',  0) or 0)
-        if _pv1 > 0 and _pv2 > 0:
-            precio_usd_bd = max(_pv1, _pv2)   # usar el mayor (el que el cliente aprobó)
-        elif _pv2 > 0:
-            precio_usd_bd = _pv2              # solo total_cost disponible
-        elif _pv1 > 0:
-            precio_usd_bd = _pv1              # solo precio_usd disponible
-        else:
-            # Fallback final: recalcular y redondear al múltiplo de 5
-            precio_usd_bd = _math_cuadro.ceil((base_tax + costo_tax) / 5) * 5
-        precio_usd = precio_usd_bd
-
-        # precio_bs: leer de BD (guardado por el analista con diferencial exacto)
-        precio_bs_bd  = float(item.get('precio_bs', 0) or 0)
-        dif_pct_bd    = float(item.get('diferencial_porcentaje', 0) or 0)
-        dif_val_bd    = float(item.get('diferencial_valor', 0) or 0)
-        if precio_bs_bd > 0:
-            precio_bs = precio_bs_bd
-            dif_val   = dif_val_bd if dif_val_bd > 0 else precio_bs_bd - precio_usd
-            dif_pct   = dif_pct_bd if dif_pct_bd > 0 else (
-                round((dif_val / precio_usd * 100), 2) if precio_usd > 0 else 45.0
-            )
-        else:
-            # Fallback para cotizaciones antiguas sin precio_bs guardado
-            try:
-                from database.config_helpers import ConfigHelpers
-                dif_pct = ConfigHelpers.get_diferencial()
-            except Exception:
-                dif_pct = 45.0
-            dif_val   = precio_usd * (dif_pct / 100)
-            precio_bs = precio_usd + dif_val
-
-        # IVA: leer de BD
-        aplicar_iva  = bool(item.get('aplicar_iva', False))
-        iva_pct      = float(item.get('iva_porcentaje', 16.0) or 16.0)
-        iva_val      = float(item.get('iva_valor', 0) or 0)
-
-        items_para_cuadro.append({
-            'descripcion':            item.get('description', 'Ítem'),
-            'parte':                  item.get('part_number', ''),
-            'cantidad':               cantidad,
-            'costo_fob':              costo_fob,
-            'fob_total':              fob_total,
-            'costo_handling':         handling,
-            'costo_manejo':           manejo,
-            'costo_impuesto':         imp_int,
-            'impuesto_porcentaje':    imp_pct,
-            'factor_utilidad':        factor_ut,
-            'utilidad_valor':         utilidad,
-            'costo_envio':            envio,
-            'costo_tax':              costo_tax,
-            'tax_porcentaje':         tax_pct,
-            'diferencial_valor':      dif_val,
-            'diferencial_porcentaje': dif_pct,
-            'precio_usd':             precio_usd,   # ← fuente de verdad (múltiplo de 5)
-            'precio_bs':              precio_bs,    # ← guardado por el analista
-            'aplicar_iva':            aplicar_iva,
-            'iva_porcentaje':         iva_pct,
-            'iva_valor':              iva_val,
-        })
-
-    png_path = st.session_state.get('cuadro_costos_png_path')
-
-    if not png_path or not os.path.exists(str(png_path)):
-        with st.spinner("⏳ Generando Cuadro de Costos..."):
-            try:
-                from services.document_generation.cuadro_costos_generator import (
-                    generar_cuadro_costos_png)
-                tmp_dir      = tempfile.gettempdir()
-                quote_number = quote.get('quote_number', str(quote_id))
-                png_path     = os.path.join(
-                    tmp_dir,
-                    f"cuadro_costos_{quote_number.replace('-', '_')}.png"
-                )
-                if generar_cuadro_costos_png(quote_data=quote,
-                                             items=items_para_cuadro,
-                                             output_path=png_path):
-                    st.session_state.cuadro_costos_png_path = png_path
-                    st.success(f"✅ Cuadro generado — {quote_number}")
-                else:
-                    st.error("❌ Error al generar el Cuadro de Costos")
-                    return
-            except Exception as e:
-                st.error(f"❌ Error: {e}")
+    # Mismos valores que el analista calculó (ver items_para_cuadro_costos)
+    items_para_cuadro = items_para_cuadro_costos(items_raw)
+
+    # El PNG se genera en la cola de render (normalmente ya está pre-renderizado
+    # desde que se guardó la cotización); aquí solo se busca por contenido.
+    from services.document_generation.document_cache import DocumentCache
+    clave = DocumentCache.clave_cuadro_costos(quote, items_para_cuadro)
+    manifiesto = DocumentCache.obtener(clave)
+    rutas_cuadro = manifiesto['rutas'] if manifiesto else []
+
+    if not rutas_cuadro:
+        trabajo = RenderQueue.estado(quote_id).get('cuadro_costos', {})
+        if trabajo.get('estado') == 'failed' and trabajo.get('clave') == clave:
+            st.error(f"❌ Error al generar el Cuadro de Costos: {trabajo.get('error')}")
+            if st.button("🔄 REINTENTAR", key=f"cuadro_reintentar_{quote_id}"):
+                RenderQueue.encolar(quote_id, ('cuadro_costos',))
+                st.rerun()
+            return
+        if trabajo.get('estado') not in ESTADOS_PENDIENTES:
+            if RenderQueue.encolar(quote_id, ('cuadro_costos',)) is None:
+                en_cola, capacidad = RenderQueue.carga()
+                st.warning(f"⏳ La cola de documentos está llena ({en_cola}/{capacidad}). "
+                           "Intenta de nuevo en unos segundos.")
                 return
+        st.info("⏳ Generando Cuadro de Costos...")
+        time.sleep(INTERVALO_POLLING)
+        st.rerun()
 
-    if png_path and os.path.exists(png_path):
+    rutas_cuadro = [r for r in rutas_cuadro if os.path.exists(r)]
+    if rutas_cuadro:
+        total_hojas = len(rutas_cuadro)
         st.markdown("### Vista Previa del Cuadro de Costos")
         st.info("📌 Solo lectura — Para modificar valores, edite la cotización primero.")
-        st.image(png_path, use_container_width=True)
-        st.markdown("---")
-
-        with open(png_path, 'rb') as f:
-            png_bytes = f.read()
+        if total_hojas > 1:
+            st.caption(f"📄 {total_hojas} hojas (los ítems se reparten por ancho)")
 
         quote_number = quote.get('quote_number', str(quote_id))
-        _, dl_col, _ = st.columns([1, 2, 1])
-        with dl_col:
-            st.download_button(
-                label="⬇️ DESCARGAR CUADRO DE COSTOS (PNG)",
-                data=png_bytes,
-                file_name=f"CuadroCostos_{quote_number}.png",
-                mime="image/png",
-                use_container_width=True,
-                type="primary",
-                key=f"dl_cuadro_{quote_id}"
-            )
+        for hoja, png_path in enumerate(rutas_cuadro, 1):
+            if total_hojas > 1:
+                st.markdown(f"**Hoja {hoja} de {total_hojas}**")
+            st.image(png_path, use_container_width=True)
+
+            with open(png_path, 'rb') as f:
+                png_bytes = f.read()
+
+            _, dl_col, _ = st.columns([1, 2, 1])
+            with dl_col:
+                st.download_button(
+                    label=(f"⬇️ DESCARGAR HOJA {hoja} (PNG)" if total_hojas > 1
+                           else "⬇️ DESCARGAR CUADRO DE COSTOS (PNG)"),
+                    data=png_bytes,
+                    file_name=(f"CuadroCostos_{quote_number}_p{hoja}.png" if total_hojas > 1
+                               else f"CuadroCostos_{quote_number}.png"),
+                    mime="image/png",
+                    use_container_width=True,
+                    type="primary",
+                    key=f"dl_cuadro_{quote_id}_p{hoja}"
+                )
+            st.markdown("---")
         st.caption("💡 Descarga el PNG y envíalo al grupo de WhatsApp administrativo.")
 
 
@@ -1531,7 +1164,7 @@ def _show_aprobar_orden(quote_id: int):
         st.info(
             f"**Para:** {cfg.get('to_email', 'N/A')}\n\n"
             f"**Asunto:** Orden de Compra #{quote.get('quote_number', 'N/A')}\n\n"
-            f"**Adjuntos:** PNG Cotización + PNG Cuadro de Costos"
+            f"**Adjuntos:** Imagen Cotización + PNG Cuadro de Costos"
         )
 
         st.markdown("---")
@@ -1686,7 +1319,6 @@ def _enviar_orden_aprobada(quote_id: int):
 
     try:
         from services.email_service import EmailService
-        from services.document_generation.png_generator import PNGQuoteGenerator
 
         cfg   = DBManager.get_all_email_config()
         qd    = DBManager.get_quote_full_details(quote_id)
@@ -1700,28 +1332,27 @@ def _enviar_orden_aprobada(quote_id: int):
         output_dir   = os.path.join(tempfile.gettempdir(), 'logipartve_docs')
         os.makedirs(output_dir, exist_ok=True)
 
-        # ── Generar PNG de la cotización (soporta multi-página) ──────────────
+        # ── Generar imagen de la cotización (soporta multi-página) ──────────
+        # Rendición para mensajería (JPEG/WebP con tamaño objetivo), no el PNG
+        # completo: adjuntos mucho más livianos. Sale de DocumentCache si ya
+        # se generó y la cotización no cambió.
         datos_adaptados  = _adaptar_quote_para_generadores(qd)
-        png_cot_path_base = os.path.join(output_dir, f"cot_{quote_number}.png")
         rutas_cot_png    = []   # lista de rutas de todas las páginas
         try:
-            gen        = PNGQuoteGenerator()
-            _result_cot = gen.generate_quote_png_from_data(datos_adaptados, png_cot_path_base)
-            if _result_cot is None:
-                return False, "Error generando PNG de cotización: el generador devolvió None"
-            # Normalizar a lista
-            rutas_cot_png = [_result_cot] if isinstance(_result_cot, str) else list(_result_cot)
-            # Guardar primera ruta en BD (compatibilidad con campo jpeg_path)
-            _primera_cot = rutas_cot_png[0] if rutas_cot_png else None
-            if _primera_cot:
+            from services.document_generation.document_storage import DocumentStore
+            _ref_cot, rutas_cot_png = DocumentStore.guardar_imagenes(datos_adaptados)['mensaje']
+            if not rutas_cot_png:
+                return False, "Error generando PNG de cotización: el generador no devolvió páginas"
+            # Guardar la referencia durable en BD (campo jpeg_path)
+            if _ref_cot:
                 _conn = DBManager.get_connection()
                 _cur  = _conn.cursor()
                 if DBManager.USE_POSTGRES:
                     _cur.execute("UPDATE quotes SET jpeg_path = %s WHERE id = %s",
-                                 (_primera_cot, quote_id))
+                                 (_ref_cot, quote_id))
                 else:
                     _cur.execute("UPDATE quotes SET jpeg_path = ? WHERE id = ?",
-                                 (_primera_cot, quote_id))
+                                 (_ref_cot, quote_id))
                 _conn.commit()
                 _cur.close()
                 _conn.close()
@@ -1729,9 +1360,8 @@ def _enviar_orden_aprobada(quote_id: int):
             return False, f"Error generando PNG de cotización: {e}"
 
         # ── Generar PNG del cuadro de costos ─────────────────────────────────
-        png_cuadro_path = os.path.join(output_dir, f"cuadro_{quote_number}.png")
         try:
-            _generar_png_cuadro_costos_para_email(quote_id, png_cuadro_path)
+            rutas_cuadro_png = _generar_png_cuadro_costos_para_email(quote_id)
         except Exception as e:
             return False, f"Error generando PNG del Cuadro de Costos: {e}"
 
@@ -1815,29 +1445,36 @@ def _enviar_orden_aprobada(quote_id: int):
         # ── Preparar adjuntos ─────────────────────────────────────────────────
         adjuntos = []
 
-        # Adjuntar todas las páginas del PNG de cotización
+        # Adjuntar todas las páginas de la imagen de cotización
         total_pags_cot = len(rutas_cot_png)
+        _ext_cot = extension_rendicion('mensaje')
         for _pi, _ruta_cot in enumerate(rutas_cot_png, 1):
             if os.path.exists(_ruta_cot):
                 if total_pags_cot == 1:
-                    _nombre_cot = f"cotizacion_{quote_number}.png"
+                    _nombre_cot = f"cotizacion_{quote_number}.{_ext_cot}"
                 else:
-                    _nombre_cot = f"cotizacion_{quote_number}_p{_pi}.png"
+                    _nombre_cot = f"cotizacion_{quote_number}_p{_pi}.{_ext_cot}"
                 with open(_ruta_cot, 'rb') as f:
                     adjuntos.append({
                         "filename": _nombre_cot,
                         "content":  base64.b64encode(f.read()).decode(),
-                        "type":     "image/png",
+                        "type":     mime_rendicion('mensaje'),
                     })
 
-        # Adjuntar PNG del cuadro de costos
-        if os.path.exists(png_cuadro_path):
-            with open(png_cuadro_path, 'rb') as f:
-                adjuntos.append({
-                    "filename": f"cuadro_costos_{quote_number}.png",
-                    "content":  base64.b64encode(f.read()).decode(),
-                    "type":     "image/png",
-                })
+        # Adjuntar todas las hojas del cuadro de costos
+        total_hojas_cuadro = len(rutas_cuadro_png)
+        for _hi, _ruta_cuadro in enumerate(rutas_cuadro_png, 1):
+            if os.path.exists(_ruta_cuadro):
+                if total_hojas_cuadro == 1:
+                    _nombre_cuadro = f"cuadro_costos_{quote_number}.png"
+                else:
+                    _nombre_cuadro = f"cuadro_costos_{quote_number}_p{_hi}.png"
+                with open(_ruta_cuadro, 'rb') as f:
+                    adjuntos.append({
+                        "filename": _nombre_cuadro,
+                        "content":  base64.b64encode(f.read()).decode(),
+                        "type":     "image/png",
+                    })
 
         # ── Enviar con Resend (sin CC para garantizar entrega) ───────────────
         resultado = EmailService.send_approval_email(
@@ -1866,74 +1503,18 @@ def _enviar_orden_aprobada(quote_id: int):
         return False, f"Error inesperado: {e}"
 
 
-def _generar_png_cuadro_costos_para_email(quote_id: int, output_path: str):
-    """Genera el PNG del cuadro de costos para adjuntar al correo.
-    Usa el mismo generador completo que el botón 'Generar PNG' de la app.
+def _generar_png_cuadro_costos_para_email(quote_id: int) -> list:
+    """Obtiene el PNG del cuadro de costos para adjuntar al correo.
+    Usa los mismos ítems que el visor de la app, así que normalmente sale del
+    caché de documentos (pre-renderizado por la cola de render).
+    Retorna las rutas locales de las hojas PNG, en orden.
     """
-    from services.document_generation.cuadro_costos_generator import generar_cuadro_costos_png
-    from database.config_helpers import ConfigHelpers
-
     quote = DBManager.get_quote_by_id(quote_id)
     items_raw = DBManager.get_quote_items(quote_id)
     if not quote or not items_raw:
         raise ValueError("No se encontró la cotización o no tiene ítems")
 
-    try:
-        dif_pct = ConfigHelpers.get_diferencial()
-    except Exception:
-        dif_pct = 45.0
-
-    # Preparar items con el mismo formato que usa el botón Generar PNG
-    items_para_cuadro = []
-    for item in items_raw:
-        cantidad  = int(item.get('quantity', 1) or 1)
-        costo_fob = float(item.get('unit_cost', 0) or 0)
-        fob_total = costo_fob * cantidad
-        handling  = float(item.get('international_handling', 0) or 0)
-        manejo    = float(item.get('national_handling', 0) or 0)
-        envio     = float(item.get('shipping_cost', 0) or 0)
-        imp_pct   = float(item.get('tax_percentage', 0) or 0)
-        factor_ut = float(item.get('profit_factor', 1.0) or 1.0)
-
-        imp_int   = fob_total * (imp_pct / 100)
-        utilidad  = (fob_total * factor_ut) - fob_total
-        base_tax  = fob_total + handling + manejo + imp_int + utilidad + envio
-        tax_pct   = 7.0
-        costo_tax = base_tax * (tax_pct / 100)
-        precio_usd = float(item.get('total_cost', 0) or 0)
-        if precio_usd == 0:
-            precio_usd = base_tax + costo_tax
-        dif_val   = precio_usd * (dif_pct / 100)
-        precio_bs = precio_usd + dif_val
-
-        items_para_cuadro.append({
-            'descripcion':            item.get('description', 'Ítem'),
-            'parte':                  item.get('part_number', ''),
-            'cantidad':               cantidad,
-            'costo_fob':              costo_fob,
-            'fob_total':              fob_total,
-            'costo_handling':         handling,
-            'costo_manejo':           manejo,
-            'costo_impuesto':         imp_int,
-            'impuesto_porcentaje':    imp_pct,
-            'factor_utilidad':        factor_ut,
-            'utilidad_valor':         utilidad,
-            'costo_envio':            envio,
-            'costo_tax':              costo_tax,
-            'tax_porcentaje':         tax_pct,
-            'diferencial_valor':      dif_val,
-            'diferencial_porcentaje': dif_pct,
-            'precio_usd':             precio_usd,
-            'precio_bs':              precio_bs,
-            'iva_porcentaje':         16.0,
-            'iva_valor':              0.0,
-            'aplicar_iva':            False,
-        })
-
-    resultado = generar_cuadro_costos_png(
-        quote_data=quote,
-        items=items_para_cuadro,
-        output_path=output_path
-    )
-    if not resultado:
-        raise ValueError("El generador de Cuadro de Costos retornó False")
+    _ref, rutas = DocumentStore.guardar_cuadro_costos(quote, items_para_cuadro_costos(items_raw))
+    if not rutas:
+        raise ValueError("El generador de Cuadro de Costos no produjo el PNG")
+    return rutas